@@ -0,0 +1,153 @@
+# --- File: bench_splitter.py --- #
+# Benchmark da divisão dos documentos em trechos: vazão (trechos/s) e distribuição dos tamanhos dos trechos,
+# comparando o splitter anterior (2500 caracteres) com o splitter por tokens, sequencial e paralelo.
+#
+# Uso:
+#   python bench_splitter.py                  # PDFs da pasta `arquivos`
+#   python bench_splitter.py --sintetico 2000 # 2000 páginas sintéticas
+#   python bench_splitter.py > bench_output.txt
+
+# --- Libraries --- #
+import time  # Biblioteca para medição do tempo de cada configuração.
+import random  # Biblioteca para geração das páginas sintéticas.
+import argparse  # Biblioteca para leitura dos argumentos da linha de comando.
+import statistics  # Biblioteca para o cálculo das estatísticas dos tamanhos.
+from pathlib import Path  # Manipulação de caminhos de arquivos e diretórios.
+
+import tiktoken  # Tokenizador da OpenAI, usado para medir os trechos gerados.
+# Estrutura de documento utilizada pelo LangChain.
+from langchain_core.documents import Document
+
+from configs import SPLITTER_KWARGS, INGESTAO_KWARGS  # Importa as configurações atuais da ingestão.
+# Importa a extração e a divisão dos documentos.
+from utils_ingestao import CacheExtracao, itera_paginas, itera_trechos, resolve_workers
+
+# --- Attributes --- #
+# Configuração do splitter anterior, em caracteres (inclusive o separador "/n\n" original).
+SPLITTER_ANTERIOR = {
+    "unidade": "caracteres",
+    "chunk_size": 2500,
+    "chunk_overlap": 250,
+    "separators": ["/n\n", "\n", ".", " ", ""]
+}
+# Vocabulário das páginas sintéticas.
+PALAVRAS = ('limite função derivada parcial integral teorema demonstração continuidade sequência série '
+            'convergência vetor matriz espaço conjunto número real complexo cálculo regra cadeia ponto').split()
+
+
+# --- Methods --- #
+
+def gera_paginas_sinteticas(quantidade: int, semente: int = 0) -> list:
+    """
+    Gera páginas de texto com parágrafos, frases e fórmulas, para medições reproduzíveis sem PDFs.
+
+    Parâmetros:
+    \n\t`quantidade (int)`: Quantidade de páginas.
+    \n\t`semente (int)`: Semente do gerador aleatório (padrão: `0`).
+
+    Retorno:
+    \n\t`list`: Documentos, um por página.
+    """
+    aleatorio = random.Random(semente)
+    paginas = []
+    for pagina in range(quantidade):
+        paragrafos = []
+        for _ in range(aleatorio.randint(3, 8)):
+            frases = [' '.join(aleatorio.choices(PALAVRAS, k=aleatorio.randint(6, 25))).capitalize() + '.'
+                      for _ in range(aleatorio.randint(2, 6))]
+            paragrafos.append(' '.join(frases))
+            if aleatorio.random() < 0.3:
+                paragrafos.append('$$f(x) = \\lim_{h \\to 0} \\frac{f(x + h) - f(x)}{h}$$')
+        paginas.append(Document(page_content='\n\n'.join(paragrafos),
+                                metadata={'source': 'sintetico.pdf', 'page': pagina}))
+    return paginas
+
+
+def carrega_paginas(pasta: Path) -> list:
+    """
+    Carrega as páginas dos PDFs de uma pasta, usando o cache de extração.
+
+    Parâmetros:
+    \n\t`pasta (Path)`: Pasta com os PDFs.
+
+    Retorno:
+    \n\t`list`: Documentos, um por página.
+    """
+    from utils_indice import calcula_hash_arquivo
+    arquivos = sorted(pasta.glob('*.pdf'))
+    return list(itera_paginas(arquivos,
+                              hashes=[calcula_hash_arquivo(arquivo) for arquivo in arquivos],
+                              cache=CacheExtracao(),
+                              **INGESTAO_KWARGS))
+
+
+def percentil(valores: list, fracao: float) -> int:
+    """
+    Retorna o percentil de uma lista de valores ordenada.
+
+    Parâmetros:
+    \n\t`valores (list)`: Valores em ordem crescente.
+    \n\t`fracao (float)`: Percentil desejado, entre 0 e 1.
+
+    Retorno:
+    \n\t`int`: Valor do percentil.
+    """
+    return valores[min(len(valores) - 1, int(fracao * len(valores)))]
+
+
+def mede(nome: str, paginas: list, splitter_kwargs: dict, paralela: bool, workers: int) -> None:
+    """
+    Divide as páginas com uma configuração e imprime a vazão e a distribuição dos tamanhos dos trechos.
+
+    Parâmetros:
+    \n\t`nome (str)`: Nome da configuração.
+    \n\t`paginas (list)`: Páginas a dividir.
+    \n\t`splitter_kwargs (dict)`: Parâmetros do splitter.
+    \n\t`paralela (bool)`: Se `True`, divide as páginas no pool de processos.
+    \n\t`workers (int)`: Quantidade de processos.
+    """
+    if paralela:
+        # Aquece o pool, para não medir a criação dos processos.
+        list(itera_trechos(paginas[:1], splitter_kwargs, paralela, workers))
+    inicio = time.perf_counter()
+    trechos = list(itera_trechos(paginas, splitter_kwargs, paralela, workers))
+    duracao = time.perf_counter() - inicio
+
+    codificador = tiktoken.encoding_for_model('text-embedding-ada-002')
+    tokens = sorted(len(codificador.encode(trecho.page_content, disallowed_special=())) for trecho in trechos)
+    caracteres = sorted(len(trecho.page_content) for trecho in trechos)
+    print(f"{nome}")
+    print(f"  trechos: {len(trechos)} em {duracao:.2f}s -> {len(trechos) / duracao:.0f} trechos/s, "
+          f"{len(paginas) / duracao:.0f} páginas/s")
+    if trechos:
+        print(f"  tokens:     min {tokens[0]}, p10 {percentil(tokens, 0.1)}, p50 {percentil(tokens, 0.5)}, "
+              f"p90 {percentil(tokens, 0.9)}, max {tokens[-1]}, média {statistics.mean(tokens):.0f}")
+        print(f"  caracteres: min {caracteres[0]}, p50 {percentil(caracteres, 0.5)}, max {caracteres[-1]}")
+
+
+def main():
+    """
+    Executa o benchmark com as páginas dos PDFs ou com páginas sintéticas.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark da divisão dos documentos em trechos.')
+    parser.add_argument('--pasta', type=Path, default=Path(__file__).parent / 'arquivos',
+                        help='Pasta com os PDFs (padrão: arquivos).')
+    parser.add_argument('--sintetico', type=int, default=0,
+                        help='Usa N páginas sintéticas em vez dos PDFs.')
+    parser.add_argument('--workers', type=int, default=INGESTAO_KWARGS['workers'],
+                        help='Quantidade de processos da divisão paralela (0 utiliza todos os núcleos).')
+    args = parser.parse_args()
+
+    paginas = gera_paginas_sinteticas(args.sintetico) if args.sintetico else carrega_paginas(args.pasta)
+    if not paginas:
+        print('Nenhuma página encontrada. Adicione PDFs à pasta ou use --sintetico.')
+        return
+    print(f"Páginas: {len(paginas)}; processos: {resolve_workers(args.workers)}\n")
+
+    mede('Anterior (2500 caracteres, sequencial)', paginas, SPLITTER_ANTERIOR, False, args.workers)
+    mede('Tokens (SPLITTER_KWARGS, sequencial)', paginas, SPLITTER_KWARGS, False, args.workers)
+    mede('Tokens (SPLITTER_KWARGS, paralelo)', paginas, SPLITTER_KWARGS, True, args.workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+# --- File: bench_sse.py --- #
+# Benchmark da decodificação do streaming de `chat/completions`: compara a decodificação anterior de
+# `nova_mensagem` (linhas de `iter_lines`, prefixo "data: ", `json.loads` e `+=`) com o `LeitorStreamChat`,
+# sobre fluxos gravados, e mede o TTFT e os tokens por segundo de um fluxo real.
+#
+# Uso:
+#   python bench_sse.py                                      # fluxos sintéticos
+#   python bench_sse.py --gravacoes pasta_com_arquivos_sse   # fluxos gravados (*.sse)
+#   python bench_sse.py --grava resposta.sse                 # grava um fluxo real (usa OPENAI_API_KEY)
+#   python bench_sse.py > bench_output.txt
+
+# --- Libraries --- #
+import os  # Biblioteca para acessar variáveis de ambiente do sistema.
+import json  # Biblioteca para geração dos fluxos sintéticos e decodificação anterior.
+import time  # Biblioteca para medição do tempo de cada decodificação.
+import random  # Biblioteca para geração dos fluxos sintéticos e da divisão em pedaços.
+import argparse  # Biblioteca para leitura dos argumentos da linha de comando.
+from pathlib import Path  # Manipulação de caminhos de arquivos e diretórios.
+
+# Importa o decodificador incremental e o cliente HTTP da API da OpenAI.
+from utils_openai import (LeitorStreamChat, MetricasStream, envia_com_retentativas, obtem_sessao_http,
+                          url_api)
+
+# --- Attributes --- #
+# Vocabulário dos fluxos sintéticos.
+PALAVRAS = ('Vamos pensar juntos: o que acontece com f(x) quando x se aproxima de a? A derivada mede a taxa '
+            'de variação instantânea, e o limite formaliza essa ideia. Exemplo: $\\lim_{x \\to 0} \\frac{\\sin x}{x} = 1$.'
+            ).split(' ')
+
+
+# --- Methods --- #
+
+def gera_fluxo_sintetico(tokens: int, semente: int = 0) -> bytes:
+    """
+    Gera os bytes de um fluxo no formato de `chat/completions`, com comentários de keep-alive e `\\r\\n`.
+
+    Parâmetros:
+    \n\t`tokens (int)`: Quantidade de eventos com texto.
+    \n\t`semente (int)`: Semente do gerador aleatório (padrão: `0`).
+
+    Retorno:
+    \n\t`bytes`: O fluxo.
+    """
+    aleatorio = random.Random(semente)
+    partes = []
+    for indice in range(tokens):
+        if aleatorio.random() < 0.01:
+            partes.append(b': keep-alive\r\n\r\n')
+        pedaco = {
+            'id': 'chatcmpl-0', 'object': 'chat.completion.chunk', 'created': 0, 'model': 'gpt-4-turbo',
+            'choices': [{'index': 0, 'delta': {'content': ' ' + aleatorio.choice(PALAVRAS)},
+                         'logprobs': None, 'finish_reason': None}]
+        }
+        partes.append(b'data: ' + json.dumps(pedaco, ensure_ascii=False).encode('utf-8') + b'\r\n\r\n')
+    partes.append(b'data: [DONE]\r\n\r\n')
+    return b''.join(partes)
+
+
+def divide_em_pedacos(fluxo: bytes, maximo: int = 512, semente: int = 0) -> list:
+    """
+    Divide um fluxo em pedaços de tamanhos aleatórios, como chegam da rede.
+
+    Parâmetros:
+    \n\t`fluxo (bytes)`: O fluxo.
+    \n\t`maximo (int)`: Tamanho máximo de cada pedaço (padrão: `512`).
+    \n\t`semente (int)`: Semente do gerador aleatório (padrão: `0`).
+
+    Retorno:
+    \n\t`list`: Pedaços de bytes.
+    """
+    aleatorio = random.Random(semente)
+    pedacos = []
+    inicio = 0
+    while inicio < len(fluxo):
+        fim = inicio + aleatorio.randint(1, maximo)
+        pedacos.append(fluxo[inicio:fim])
+        inicio = fim
+    return pedacos
+
+
+def itera_linhas_anterior(pedacos):
+    """
+    Reproduz `requests.Response.iter_lines` sobre os pedaços do fluxo.
+    """
+    pendente = None
+    for pedaco in pedacos:
+        if pendente is not None:
+            pedaco = pendente + pedaco
+        linhas = pedaco.splitlines()
+        if linhas and linhas[-1] and pedaco and linhas[-1][-1] == pedaco[-1]:
+            pendente = linhas.pop()
+        else:
+            pendente = None
+        yield from linhas
+    if pendente is not None:
+        yield pendente
+
+
+def decodifica_anterior(pedacos) -> str:
+    """
+    Reproduz a decodificação anterior de `nova_mensagem`.
+    """
+    resposta_completa = ""
+    for line in itera_linhas_anterior(pedacos):
+        if not line:
+            continue
+        line = line.decode('utf-8')
+        if not line.startswith("data: "):
+            continue
+        if line.strip() == "data: [DONE]":
+            break
+        try:
+            pedaco = json.loads(line[len("data: "):])
+        except json.JSONDecodeError:
+            continue
+        delta = pedaco.get("choices", [{}])[0].get("delta", {})
+        resposta_completa += delta.get("content", "")
+    return resposta_completa
+
+
+def decodifica_incremental(pedacos) -> str:
+    """
+    Decodifica o fluxo com o `LeitorStreamChat`.
+    """
+    leitor = LeitorStreamChat()
+    partes = []
+    for pedaco in pedacos:
+        partes.extend(leitor.alimenta(pedaco))
+        if leitor.concluido:
+            break
+    leitor.finaliza()
+    return ''.join(partes)
+
+
+def mede(nome: str, decodifica, fluxos: list, repeticoes: int) -> str:
+    """
+    Mede a vazão de uma decodificação e imprime o resultado.
+
+    Parâmetros:
+    \n\t`nome (str)`: Nome da decodificação.
+    \n\t`decodifica (Callable)`: Função que recebe os pedaços de um fluxo e retorna o texto.
+    \n\t`fluxos (list)`: Fluxos, cada um como uma lista de pedaços.
+    \n\t`repeticoes (int)`: Quantidade de repetições.
+
+    Retorno:
+    \n\t`str`: Texto do último fluxo decodificado, para comparação.
+    """
+    total_bytes = sum(len(pedaco) for pedacos in fluxos for pedaco in pedacos)
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        for pedacos in fluxos:
+            texto = decodifica(pedacos)
+    duracao = time.perf_counter() - inicio
+    print(f"{nome}: {repeticoes * total_bytes / duracao / 2 ** 20:.1f} MB/s, "
+          f"{repeticoes * len(fluxos) / duracao:.0f} fluxos/s")
+    return texto
+
+
+def grava_fluxo(arquivo: Path, modelo: str, pergunta: str) -> None:
+    """
+    Grava os bytes de um fluxo real da API e imprime o TTFT e os tokens por segundo.
+
+    Parâmetros:
+    \n\t`arquivo (Path)`: Arquivo de destino.
+    \n\t`modelo (str)`: Modelo de chat.
+    \n\t`pergunta (str)`: Pergunta enviada ao modelo.
+    """
+    headers = {"Authorization": f"Bearer {os.getenv('OPENAI_API_KEY')}", "Content-Type": "application/json"}
+    data = {"model": modelo, "messages": [{"role": "user", "content": pergunta}], "stream": True}
+    metricas = MetricasStream()
+    leitor = LeitorStreamChat(metricas)
+    response = envia_com_retentativas(lambda timeout: obtem_sessao_http().post(
+        url_api('chat/completions'), headers=headers, json=data, stream=True, timeout=timeout))
+    with open(arquivo, 'wb') as saida:
+        for pedaco in response.iter_content(chunk_size=None):
+            saida.write(pedaco)
+            leitor.alimenta(pedaco)
+    leitor.finaliza()
+    print(f"Fluxo gravado em {arquivo}: {metricas.resumo()}")
+
+
+def main():
+    """
+    Executa o benchmark com fluxos gravados ou sintéticos.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark da decodificação do streaming.')
+    parser.add_argument('--gravacoes', type=Path, help='Pasta com fluxos gravados (*.sse).')
+    parser.add_argument('--fluxos', type=int, default=50, help='Quantidade de fluxos sintéticos.')
+    parser.add_argument('--tokens', type=int, default=800, help='Tokens de cada fluxo sintético.')
+    parser.add_argument('--repeticoes', type=int, default=5, help='Repetições de cada decodificação.')
+    parser.add_argument('--grava', type=Path, help='Grava um fluxo real da API neste arquivo e encerra.')
+    parser.add_argument('--modelo', default='gpt-4o-mini', help='Modelo usado por --grava.')
+    parser.add_argument('--pergunta', default='Explique o que é o limite de uma função, com um exemplo.',
+                        help='Pergunta usada por --grava.')
+    args = parser.parse_args()
+
+    if args.grava:
+        grava_fluxo(args.grava, args.modelo, args.pergunta)
+        return
+
+    if args.gravacoes:
+        brutos = [arquivo.read_bytes() for arquivo in sorted(args.gravacoes.glob('*.sse'))]
+    else:
+        brutos = [gera_fluxo_sintetico(args.tokens, semente) for semente in range(args.fluxos)]
+    if not brutos:
+        print('Nenhum fluxo encontrado.')
+        return
+    fluxos = [divide_em_pedacos(bruto, semente=indice) for indice, bruto in enumerate(brutos)]
+    print(f"Fluxos: {len(fluxos)}; {sum(map(len, brutos)) / 2 ** 20:.1f} MB\n")
+
+    texto_anterior = mede('Anterior (iter_lines + json.loads + +=)', decodifica_anterior, fluxos, args.repeticoes)
+    texto_incremental = mede('Incremental (LeitorStreamChat)', decodifica_incremental, fluxos, args.repeticoes)
+    print(f"\nTextos iguais: {texto_anterior == texto_incremental}")
+
+    # Métricas de um fluxo reproduzido com o ritmo de uma resposta real (um pedaço a cada 15 ms).
+    metricas = MetricasStream()
+    leitor = LeitorStreamChat(metricas)
+    for pedaco in divide_em_pedacos(gera_fluxo_sintetico(200), maximo=300):
+        time.sleep(0.015)
+        leitor.alimenta(pedaco)
+    leitor.finaliza()
+    print(f"Métricas de um fluxo reproduzido a 15 ms por pedaço: {metricas.resumo()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -9,7 +9,8 @@ import streamlit as st
 MODELO = 'gpt-4-turbo'
 
 # Configuração do LangChain para recuperação de documentos
-# Tipo de busca usada para recuperação de informações (Maximum Marginal Relevance - MMR).
+# Tipo de busca usada para recuperação de informações: 'similarity', 'mmr' (Maximum Marginal Relevance),
+# 'bm25' (apenas o índice lexical) ou 'hibrido' (BM25 e vetorial combinados por fusão de postos).
 RETRIEVAL_SEARCH_TYPE = 'mmr'
 RETRIEVAL_KWARGS = {
     # Número de documentos mais relevantes a serem recuperados do contexto.
@@ -17,6 +18,223 @@ RETRIEVAL_KWARGS = {
     # Número total de documentos analisados antes de selecionar os `k` mais relevantes.
     "fetch_k": 20
 }
+HIBRIDO_KWARGS = {
+    # Constante da fusão de postos recíprocos (RRF); valores maiores reduzem o peso dos primeiros postos.
+    "rrf_k": 60,
+    # Responde apenas com o BM25, sem o embedding da consulta, as buscas curtas por palavras-chave.
+    "atalho_lexical": True,
+    # Quantidade máxima de termos de uma consulta respondida apenas pelo BM25.
+    "max_termos_atalho": 3,
+    # Saturação da frequência dos termos no BM25.
+    "k1": 1.5,
+    # Peso da normalização pelo tamanho do trecho no BM25.
+    "b": 0.75
+}
+# Reordena os documentos recuperados com uma pontuação local e envia ao modelo apenas os melhores.
+RERANQUEAMENTO_ATIVO = False
+RERANQUEAMENTO_KWARGS = {
+    # Pontuação usada: 'lexico' (sobreposição de termos), 'cross_encoder' (modelo local) ou 'ambos'.
+    "metodo": "lexico",
+    # Quantidade de candidatos recuperados para o reranqueamento (0 utiliza o `fetch_k` de `RETRIEVAL_KWARGS`).
+    "candidatos": 0,
+    # Quantidade de documentos mantidos após o reranqueamento.
+    "top_n": 3,
+    # Tempo máximo, em milissegundos, gasto com o cross-encoder em cada consulta.
+    "orcamento_ms": 150,
+    # Caminho local do cross-encoder (requer a biblioteca sentence-transformers).
+    "caminho_modelo": "",
+    # Quantidade de documentos pontuados por vez pelo cross-encoder.
+    "tamanho_lote": 8,
+    # Peso da pontuação lexical quando o método é 'ambos'.
+    "peso_lexico": 0.3
+}
+CONTEXTO_KWARGS = {
+    # Quantidade máxima de tokens dos documentos inseridos no `{context}` do prompt.
+    "orcamento_tokens": 3000,
+    # Tamanho da janela de contexto do modelo, em tokens.
+    "janela_modelo": 128000,
+    # Tokens reservados para a resposta do modelo.
+    "reserva_resposta": 4096,
+    # Quantidade mínima de tokens para incluir um trecho truncado; trechos menores são descartados.
+    "min_tokens_trecho": 100
+}
+
+# Configuração do índice vetorial (FAISS)
+# Tipo do índice: 'flat' (busca exata), 'ivf' (listas invertidas) ou 'hnsw' (grafo de vizinhança).
+INDICE_TIPO = 'flat'
+INDICE_KWARGS = {
+    # Quantização dos vetores: 'nenhuma', 'sq8', 'sq4' (escalar) ou 'pq' (por produto).
+    "quantizacao": "nenhuma",
+    # Quantidade de listas invertidas do índice IVF.
+    "nlist": 256,
+    # Quantidade de listas visitadas em cada busca no índice IVF.
+    "nprobe": 16,
+    # Quantidade de vizinhos de cada nó do grafo HNSW.
+    "hnsw_m": 32,
+    # Tamanho da lista de candidatos explorada em cada busca no índice HNSW.
+    "ef_search": 64,
+    # Quantidade de subvetores da quantização por produto.
+    "pq_m": 16,
+    # Quantidade de bits por subvetor da quantização por produto.
+    "pq_bits": 8
+}
+
+# Configuração da ingestão de documentos
+# Modelo da OpenAI utilizado para gerar os embeddings dos trechos dos documentos.
+MODELO_EMBEDDING = 'text-embedding-ada-002'
+SPLITTER_KWARGS = {
+    # Unidade de medida dos trechos: 'tokens' (tokenizador do modelo de embedding) ou 'caracteres'.
+    "unidade": "tokens",
+    # Modelo cujo tokenizador mede os trechos quando a unidade é 'tokens'.
+    "modelo_tokenizador": "text-embedding-ada-002",
+    # Tamanho máximo de cada trecho gerado na divisão dos documentos.
+    "chunk_size": 600,
+    # Tamanho da sobreposição entre trechos consecutivos.
+    "chunk_overlap": 60,
+    # Separadores usados, em ordem de prioridade, para quebrar o texto: parágrafos, fórmulas em destaque,
+    # linhas, frases e palavras.
+    "separators": ["\n\n", "\n$$", "\n\\[", "\n", ". ", "? ", "! ", "; ", " ", ""]
+}
+# Divide as páginas em trechos em paralelo, no pool de processos da extração.
+DIVISAO_PARALELA = True
+# Ativa a extração dos PDFs em paralelo, em um pool de processos.
+INGESTAO_PARALELA = True
+INGESTAO_KWARGS = {
+    # Quantidade de processos usados na extração (0 utiliza todos os núcleos da máquina).
+    "workers": 0,
+    # Quantidade máxima de páginas extraídas por tarefa, permitindo dividir PDFs grandes entre processos.
+    "paginas_por_tarefa": 25,
+    # Quantidade máxima de tarefas de extração pendentes (0 utiliza o dobro de `workers`).
+    "tarefas_em_voo": 0
+}
+# Reaproveita o texto já extraído de cada página dos PDFs, evitando abrir os arquivos em reconstruções.
+CACHE_EXTRACAO_ATIVO = True
+# Descarta trechos duplicados ou quase duplicados (cabeçalhos, rodapés, seções repetidas) antes do embedding.
+DEDUPLICACAO_ATIVA = True
+DEDUPLICACAO_KWARGS = {
+    # Similaridade de Jaccard mínima para considerar dois trechos quase duplicados.
+    "limiar": 0.85,
+    # Quantidade de palavras de cada shingle comparado.
+    "tamanho_shingle": 5,
+    # Quantidade de valores da assinatura MinHash de cada trecho.
+    "permutacoes": 64,
+    # Quantidade de bandas do LSH (deve dividir `permutacoes`).
+    "bandas": 16
+}
+# Quantidade de trechos embutidos e adicionados ao índice por vez durante a ingestão em fluxo.
+TAMANHO_LOTE_EMBEDDING = 256
+# Reaproveita embeddings já calculados, guardados em um cache local compartilhado entre sessões.
+CACHE_EMBEDDINGS_ATIVO = True
+EMBEDDING_EXECUTOR_KWARGS = {
+    # Quantidade máxima de tokens enviados em cada requisição de embedding.
+    "tokens_por_lote": 20000,
+    # Quantidade máxima de textos enviados em cada requisição de embedding.
+    "textos_por_lote": 2048,
+    # Quantidade máxima de requisições de embedding simultâneas.
+    "concorrencia": 4,
+    # Orçamento local de tokens por minuto (0 desativa o limite).
+    "tokens_por_minuto": 1000000,
+    # Quantidade máxima de tentativas por requisição em caso de erro transitório.
+    "max_tentativas": 6
+}
+# Reaproveita os embeddings das consultas repetidas, guardados em um cache LRU compartilhado entre sessões.
+CACHE_CONSULTAS_ATIVO = True
+CACHE_CONSULTAS_KWARGS = {
+    # Quantidade máxima de consultas mantidas em memória.
+    "capacidade": 1024,
+    # Persiste as consultas no banco de embeddings, para sobreviverem à reinicialização do servidor.
+    "persistente": True,
+    # Quantidade máxima de consultas mantidas no banco.
+    "capacidade_disco": 20000
+}
+# Reaproveita a resposta de uma primeira pergunta parecida com outra já respondida para o mesmo corpus.
+CACHE_RESPOSTAS_ATIVO = False
+CACHE_RESPOSTAS_KWARGS = {
+    # Similaridade de cosseno mínima entre as perguntas para reaproveitar a resposta.
+    "limiar": 0.95,
+    # Quantidade máxima de respostas mantidas em memória.
+    "capacidade": 512,
+    # Validade de cada resposta, em segundos (0 não expira).
+    "ttl_segundos": 86400
+}
+# Pool de conexões HTTP reaproveitado pelas chamadas diretas à API da OpenAI (chat e transcrições).
+HTTP_KWARGS = {
+    # Endereço base da API ('' utiliza a variável de ambiente OPENAI_BASE_URL ou https://api.openai.com/v1).
+    # Vale também para os modelos de chat e de embedding do LangChain.
+    "base_url": "",
+    # Quantidade de pools mantidos, um por servidor.
+    "conexoes": 4,
+    # Quantidade máxima de conexões mantidas abertas por servidor.
+    "max_conexoes": 16,
+    # Reaproveita as conexões entre as requisições (False abre uma conexão nova a cada requisição).
+    "keep_alive": True,
+    # Aguarda uma conexão livre quando todas estão em uso, em vez de abrir conexões extras descartáveis.
+    "bloqueia": False
+}
+
+# Cliente assíncrono da API da OpenAI, usado no streaming das conversas.
+CLIENTE_ASSINCRONO_KWARGS = {
+    # Quantidade máxima de requisições em andamento por chave de API, somando todas as sessões.
+    "max_concorrentes_por_chave": 8
+}
+# Novas tentativas das chamadas à API da OpenAI (erros 429 e 5xx, erros de conexão e timeouts).
+RETENTATIVAS_KWARGS = {
+    # Quantidade máxima de tentativas de cada chamada.
+    "max_tentativas": 5,
+    # Espera máxima, em segundos, antes da segunda tentativa; dobra a cada tentativa e é sorteada entre zero e
+    # esse valor, para que as sessões não repitam as chamadas ao mesmo tempo.
+    "espera_base": 1,
+    # Limite, em segundos, do backoff exponencial.
+    "espera_maxima": 32,
+    # Limite, em segundos, da espera indicada pelo servidor (Retry-After e x-ratelimit-reset-*).
+    "espera_maxima_servidor": 60,
+    # Códigos HTTP repetidos.
+    "status_retentaveis": [429, 500, 502, 503, 504],
+    # Tempo máximo, em segundos, para estabelecer cada conexão.
+    "timeout_conexao": 10,
+    # Tempo máximo, em segundos, de espera por dados em cada tentativa.
+    "timeout_leitura": 60,
+    # Tempo máximo, em segundos, somando todas as tentativas e esperas de uma chamada.
+    "prazo_total": 120
+}
+# Disjuntor que interrompe as chamadas enquanto a API está fora do ar.
+DISJUNTOR_KWARGS = {
+    # Falhas seguidas do servidor (5xx, erros de conexão e timeouts) que abrem o disjuntor.
+    "limiar_falhas": 5,
+    # Tempo, em segundos, em que as chamadas falham imediatamente antes de uma nova chamada de teste.
+    "tempo_aberto": 30
+}
+
+# Envia uma requisição duplicada quando o primeiro token do streaming demora, usando a que começar primeiro.
+HEDGING_ATIVO = False
+HEDGING_KWARGS = {
+    # Espera, em segundos, pelo primeiro token antes da duplicata (0 utiliza o percentil dos TTFTs observados).
+    "limiar": 0,
+    # Percentil dos TTFTs observados usado como limiar.
+    "percentil": 0.95,
+    # Limiar mínimo, em segundos.
+    "limiar_minimo": 1,
+    # Limiar, em segundos, enquanto não há respostas suficientes para o percentil.
+    "limiar_inicial": 4,
+    # Respostas observadas antes de usar o percentil.
+    "min_amostras": 20,
+    # Quantidade de respostas recentes consideradas no percentil e na taxa de duplicatas.
+    "janela": 200,
+    # Fração máxima de respostas duplicadas na janela, para não multiplicar a carga quando a API está lenta.
+    "taxa_maxima": 0.1
+}
+
+# Condensação da pergunta de acompanhamento com o histórico da conversa, feita antes da recuperação.
+CONDENSACAO_KWARGS = {
+    # "heuristica" pula as perguntas autocontidas, "sempre" condensa todas e "nunca" não condensa nenhuma.
+    "modo": "heuristica",
+    # Modelo, mais rápido que o de chat, usado na condensação ('' utiliza o mesmo modelo do chat).
+    "modelo": "gpt-4o-mini",
+    # Quantidade mínima de palavras de uma pergunta autocontida.
+    "min_palavras": 6,
+    # Quantidade máxima de condensações mantidas em cache (0 desativa o cache).
+    "capacidade_cache": 1024
+}
 
 # Prompt usado para orientar as respostas do agente de IA
 PROMPT = '''Você atuará como um Agente Tutor Inteligente (ATI), projetado especificamente para ser um facilitador amigável no processo de aprendizagem dos alunos. Sua principal função é auxiliar na interpretação e compreensão de documentos fornecidos, utilizando-os como base para reforçar o conhecimento do aluno. Para garantir uma interação eficaz e focada, você deve aderir rigorosamente aos seguintes princípios:
@@ -70,5 +288,61 @@ def get_config(config_name: str):
         return RETRIEVAL_SEARCH_TYPE
     elif config_name.lower() == 'retrieval_kwargs':
         return RETRIEVAL_KWARGS
+    elif config_name.lower() == 'hibrido_kwargs':
+        return HIBRIDO_KWARGS
+    elif config_name.lower() == 'reranqueamento_ativo':
+        return RERANQUEAMENTO_ATIVO
+    elif config_name.lower() == 'reranqueamento_kwargs':
+        return RERANQUEAMENTO_KWARGS
+    elif config_name.lower() == 'contexto_kwargs':
+        return CONTEXTO_KWARGS
     elif config_name.lower() == 'prompt':
         return PROMPT
+    elif config_name.lower() == 'indice_tipo':
+        return INDICE_TIPO
+    elif config_name.lower() == 'indice_kwargs':
+        return INDICE_KWARGS
+    elif config_name.lower() == 'modelo_embedding':
+        return MODELO_EMBEDDING
+    elif config_name.lower() == 'splitter_kwargs':
+        return SPLITTER_KWARGS
+    elif config_name.lower() == 'divisao_paralela':
+        return DIVISAO_PARALELA
+    elif config_name.lower() == 'ingestao_paralela':
+        return INGESTAO_PARALELA
+    elif config_name.lower() == 'ingestao_kwargs':
+        return INGESTAO_KWARGS
+    elif config_name.lower() == 'cache_extracao_ativo':
+        return CACHE_EXTRACAO_ATIVO
+    elif config_name.lower() == 'deduplicacao_ativa':
+        return DEDUPLICACAO_ATIVA
+    elif config_name.lower() == 'deduplicacao_kwargs':
+        return DEDUPLICACAO_KWARGS
+    elif config_name.lower() == 'cache_consultas_ativo':
+        return CACHE_CONSULTAS_ATIVO
+    elif config_name.lower() == 'cache_consultas_kwargs':
+        return CACHE_CONSULTAS_KWARGS
+    elif config_name.lower() == 'cache_respostas_ativo':
+        return CACHE_RESPOSTAS_ATIVO
+    elif config_name.lower() == 'cache_respostas_kwargs':
+        return CACHE_RESPOSTAS_KWARGS
+    elif config_name.lower() == 'http_kwargs':
+        return HTTP_KWARGS
+    elif config_name.lower() == 'cliente_assincrono_kwargs':
+        return CLIENTE_ASSINCRONO_KWARGS
+    elif config_name.lower() == 'retentativas_kwargs':
+        return RETENTATIVAS_KWARGS
+    elif config_name.lower() == 'disjuntor_kwargs':
+        return DISJUNTOR_KWARGS
+    elif config_name.lower() == 'hedging_ativo':
+        return HEDGING_ATIVO
+    elif config_name.lower() == 'hedging_kwargs':
+        return HEDGING_KWARGS
+    elif config_name.lower() == 'condensacao_kwargs':
+        return CONDENSACAO_KWARGS
+    elif config_name.lower() == 'tamanho_lote_embedding':
+        return TAMANHO_LOTE_EMBEDDING
+    elif config_name.lower() == 'cache_embeddings_ativo':
+        return CACHE_EMBEDDINGS_ATIVO
+    elif config_name.lower() == 'embedding_executor_kwargs':
+        return EMBEDDING_EXECUTOR_KWARGS
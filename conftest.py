@@ -0,0 +1,6 @@
+# --- File: conftest.py --- #
+# Configuração do pytest.
+
+# `test_openai.py` é um script manual de verificação da conexão com a API (faz uma chamada real à OpenAI) e
+# não faz parte dos testes automatizados.
+collect_ignore = ['test_openai.py']
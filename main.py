@@ -118,12 +118,8 @@ def tab_tutoria(tab):
             type=['.pdf'],
             accept_multiple_files=True
         )
-        if not uploaded_pdfs is None:
-            for arquivo in PASTA_ARQUIVOS.glob('*.pdf'):
-                arquivo.unlink()
-            for pdf in uploaded_pdfs:
-                with open(PASTA_ARQUIVOS / pdf.name, 'wb') as f:
-                    f.write(pdf.read())
+        # Grava apenas os PDFs novos ou alterados, em vez de reescrever todos a cada execução da página.
+        sincroniza_pdfs_enviados(uploaded_pdfs)
 
     label_botao = 'Inicializar o ATI'
     if 'chain' in st.session_state:
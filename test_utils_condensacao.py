@@ -0,0 +1,77 @@
+# --- File: test_utils_condensacao.py --- #
+# Testes da heurística e do cache da condensação das perguntas (`utils_condensacao.py`).
+#
+# Uso:
+#   python -m pytest -q test_utils_condensacao.py
+
+# --- Libraries --- #
+import unicodedata  # Biblioteca para normalização Unicode, usada para gerar perguntas decompostas.
+
+import pytest  # Framework de testes, usado na parametrização.
+
+from utils_condensacao import CacheCondensacoes, pergunta_autocontida
+
+
+# --- Methods --- #
+# HEURÍSTICA ========================
+
+@pytest.mark.parametrize('pergunta', [
+    'Qual é a definição formal de limite de uma função?',
+    'É possível derivar uma função que não é contínua?',
+    'Onde está definida a função logaritmo natural real?',
+    'Como calcular a integral de x² entre 0 e 1?',
+])
+def test_perguntas_autocontidas(pergunta):
+    """Perguntas completas, inclusive iniciadas por "É" ou com "está", dispensam a condensação."""
+    assert pergunta_autocontida(pergunta)
+
+
+@pytest.mark.parametrize('pergunta', [
+    'E se a função não for contínua nesse ponto?',
+    'Mas por que a derivada da função muda de sinal?',
+    'Então qual seria o valor do limite no infinito?',
+    'Pode explicar melhor isso com mais detalhes, por favor?',
+    'Refaça o último exemplo com a função seno, por favor.',
+    'Esta função tem derivada em todos os pontos reais?',
+    'Por quê?',
+])
+def test_perguntas_de_acompanhamento(pergunta):
+    """Perguntas curtas, que continuam a anterior ou remetem ao que foi dito precisam ser condensadas."""
+    assert not pergunta_autocontida(pergunta)
+
+
+def test_heuristica_normaliza_acentos_decompostos():
+    """Acentos decompostos (NFD) são tratados como os compostos."""
+    pergunta = unicodedata.normalize('NFD', 'É possível derivar uma função que não é contínua?')
+    assert pergunta_autocontida(pergunta)
+    pergunta = unicodedata.normalize('NFD', 'Refaça o último exemplo com a função seno, por favor.')
+    assert not pergunta_autocontida(pergunta)
+
+
+def test_heuristica_respeita_min_palavras():
+    """O mínimo de palavras é configurável."""
+    assert not pergunta_autocontida('O que é limite?')
+    assert pergunta_autocontida('O que é limite?', min_palavras=4)
+
+
+# CACHE DE CONDENSAÇÕES ========================
+
+def test_cache_separa_modelo_historico_e_pergunta():
+    """A chave muda com o modelo, o histórico ou a pergunta."""
+    chave = CacheCondensacoes.calcula_chave('gpt-4o-mini', 'historico', 'pergunta')
+    assert chave == CacheCondensacoes.calcula_chave('gpt-4o-mini', 'historico', 'pergunta')
+    assert chave != CacheCondensacoes.calcula_chave('gpt-4-turbo', 'historico', 'pergunta')
+    assert chave != CacheCondensacoes.calcula_chave('gpt-4o-mini', 'outro historico', 'pergunta')
+    assert chave != CacheCondensacoes.calcula_chave('gpt-4o-mini', 'historico', 'outra pergunta')
+
+
+def test_cache_descarta_as_menos_usadas():
+    """Acima da capacidade, a condensação usada há mais tempo é descartada."""
+    cache = CacheCondensacoes(capacidade=2)
+    cache.grava('a', 'pergunta a')
+    cache.grava('b', 'pergunta b')
+    assert cache.busca('a') == 'pergunta a'
+    cache.grava('c', 'pergunta c')
+    assert cache.busca('b') is None
+    assert cache.busca('a') == 'pergunta a'
+    assert cache.busca('c') == 'pergunta c'
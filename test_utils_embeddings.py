@@ -0,0 +1,256 @@
+# --- File: test_utils_embeddings.py --- #
+# Testes dos caches de embeddings, do limitador de tokens e da execução dos embeddings em lotes
+# (`utils_embeddings.py`).
+#
+# Uso:
+#   python -m pytest -q test_utils_embeddings.py
+
+# --- Libraries --- #
+import threading  # Biblioteca para verificar o limitador de tokens com várias threads.
+import time  # Biblioteca para medir a espera imposta pelo limitador de tokens.
+
+import httpx  # Cliente HTTP da OpenAI, usado para criar os erros transitórios de teste.
+import openai  # Biblioteca da OpenAI, usada para criar os erros transitórios de teste.
+import pytest  # Framework de testes, usado nas fixtures.
+# Interface dos modelos de embedding utilizada pelo LangChain.
+from langchain_core.embeddings import Embeddings
+
+import utils_embeddings
+from utils_embeddings import (CacheConsultas, EmbeddingsComCache, EmbeddingsComCacheDeConsultas, ExecutorEmbeddings,
+                              LimitadorTokens, calcula_chave_embedding, normaliza_consulta)
+
+# --- Attributes --- #
+# Modelo de embedding usado nas chaves do cache.
+MODELO_TESTE = 'text-embedding-ada-002'
+
+
+# --- Methods --- #
+
+class EmbeddingsContadas(Embeddings):
+    """Modelo de embedding de teste que registra os textos embutidos; o vetor depende apenas do texto."""
+
+    def __init__(self):
+        self.textos = []
+
+    def embed_documents(self, texts: list) -> list:
+        self.textos.extend(texts)
+        return [self.vetor(texto) for texto in texts]
+
+    def embed_query(self, text: str) -> list:
+        self.textos.append(text)
+        return self.vetor(text)
+
+    @staticmethod
+    def vetor(texto: str) -> list:
+        return [float(len(texto)), float(sum(map(ord, texto)) % 97), 0.5]
+
+
+# CACHE DE EMBEDDINGS ========================
+
+def test_chave_separa_modelo_e_texto():
+    """A chave muda com o modelo ou com o texto."""
+    chave = calcula_chave_embedding(MODELO_TESTE, 'limite')
+    assert chave == calcula_chave_embedding(MODELO_TESTE, 'limite')
+    assert chave != calcula_chave_embedding('text-embedding-3-small', 'limite')
+    assert chave != calcula_chave_embedding(MODELO_TESTE, 'derivada')
+
+
+def test_cache_embute_apenas_os_textos_ineditos(tmp_path):
+    """Os textos já embutidos vêm do cache; repetidos na mesma chamada são embutidos uma única vez."""
+    base = EmbeddingsContadas()
+    embedding_model = EmbeddingsComCache(base, MODELO_TESTE, tmp_path / 'embeddings.sqlite')
+    assert embedding_model.embed_documents(['limite', 'derivada', 'limite']) == \
+        [base.vetor('limite'), base.vetor('derivada'), base.vetor('limite')]
+    assert base.textos == ['limite', 'derivada']
+    assert embedding_model.embed_documents(['integral', 'limite']) == [base.vetor('integral'), base.vetor('limite')]
+    assert base.textos == ['limite', 'derivada', 'integral']
+    assert embedding_model.estatisticas == {'acertos': 2, 'faltas': 3}
+
+
+def test_cache_persiste_entre_instancias(tmp_path):
+    """Uma nova instância sobre o mesmo banco aproveita os vetores gravados, mas não os de outro modelo."""
+    caminho = tmp_path / 'embeddings.sqlite'
+    EmbeddingsComCache(EmbeddingsContadas(), MODELO_TESTE, caminho).embed_documents(['limite'])
+    base = EmbeddingsContadas()
+    assert EmbeddingsComCache(base, MODELO_TESTE, caminho).embed_documents(['limite']) == [base.vetor('limite')]
+    assert base.textos == []
+    EmbeddingsComCache(base, 'text-embedding-3-small', caminho).embed_documents(['limite'])
+    assert base.textos == ['limite']
+
+
+def test_cache_nao_guarda_as_consultas(tmp_path):
+    """As consultas são delegadas ao modelo base, sem passar pelo cache de documentos."""
+    base = EmbeddingsContadas()
+    embedding_model = EmbeddingsComCache(base, MODELO_TESTE, tmp_path / 'embeddings.sqlite')
+    embedding_model.embed_query('limite')
+    embedding_model.embed_query('limite')
+    assert base.textos == ['limite', 'limite']
+    assert embedding_model.busca_vetores([calcula_chave_embedding(MODELO_TESTE, 'limite')]) == {}
+
+
+# CACHE DE CONSULTAS ========================
+
+def test_normaliza_consulta():
+    """Espaços, maiúsculas e a forma Unicode das consultas são normalizados."""
+    assert normaliza_consulta('  O que é   Limite? ') == 'o que é limite?'
+    assert normaliza_consulta('O que e\u0301 limite?') == normaliza_consulta('o que é limite?')
+
+
+def test_cache_consultas_descarta_as_menos_usadas():
+    """Acima da capacidade em memória, a consulta usada há mais tempo é descartada."""
+    cache = CacheConsultas(capacidade=2)
+    cache.grava('a', [1.0])
+    cache.grava('b', [2.0])
+    assert cache.busca('a') == [1.0]
+    cache.grava('c', [3.0])
+    assert cache.busca('b') is None
+    assert cache.busca('a') == [1.0] and cache.busca('c') == [3.0]
+    assert cache.estatisticas == {'acertos': 3, 'acertos_disco': 0, 'faltas': 1}
+
+
+def test_cache_consultas_persiste_no_banco(tmp_path):
+    """Com persistência, uma consulta descartada da memória, ou de outro processo, vem do banco."""
+    caminho = tmp_path / 'embeddings.sqlite'
+    cache = CacheConsultas(capacidade=1, caminho=caminho)
+    cache.grava('a', [1.0, 0.5])
+    cache.grava('b', [2.0, 0.5])
+    assert cache.busca('a') == [1.0, 0.5]
+    assert cache.estatisticas['acertos_disco'] == 1
+    assert CacheConsultas(caminho=caminho).busca('b') == [2.0, 0.5]
+
+
+def test_cache_consultas_limita_o_banco_pelo_uso(tmp_path, monkeypatch):
+    """Acima da capacidade do banco, as consultas usadas há mais tempo são descartadas, contando os acertos."""
+    agora = [1000.0]
+    monkeypatch.setattr(utils_embeddings.time, 'time', lambda: agora[0])
+    cache = CacheConsultas(capacidade=1, caminho=tmp_path / 'embeddings.sqlite', capacidade_disco=2,
+                           intervalo_usos=3600)
+    for chave in 'ab':
+        agora[0] += 1
+        cache.grava(chave, [1.0])
+    agora[0] += 1
+    # O uso de "a" fica pendente e é gravado antes do descarte.
+    assert cache.busca('a') == [1.0]
+    agora[0] += 1
+    cache.grava('c', [1.0])
+    novo = CacheConsultas(caminho=tmp_path / 'embeddings.sqlite')
+    assert novo.busca('b') is None
+    assert novo.busca('a') == [1.0] and novo.busca('c') == [1.0]
+
+
+def test_embeddings_com_cache_de_consultas():
+    """Consultas iguais após a normalização chamam o modelo base uma única vez."""
+    base = EmbeddingsContadas()
+    embedding_model = EmbeddingsComCacheDeConsultas(base, MODELO_TESTE, CacheConsultas())
+    vetor = embedding_model.embed_query('O que é limite?')
+    assert embedding_model.embed_query('  o que É   LIMITE? ') == vetor
+    assert base.textos == ['O que é limite?']
+    embedding_model.embed_documents(['limite', 'limite'])
+    assert base.textos == ['O que é limite?', 'limite', 'limite']
+
+
+# LIMITADOR DE TOKENS ========================
+
+def test_limitador_sem_orcamento_nao_bloqueia():
+    """Com orçamento `0`, não há limite."""
+    limitador = LimitadorTokens(0)
+    inicio = time.monotonic()
+    for _ in range(1000):
+        limitador.consome(10 ** 9)
+    assert time.monotonic() - inicio < 0.5
+
+
+def test_limitador_recarrega_com_o_tempo(monkeypatch):
+    """O saldo é consumido e recarregado proporcionalmente ao tempo, até a capacidade."""
+    agora = [100.0]
+    monkeypatch.setattr(utils_embeddings.time, 'monotonic', lambda: agora[0])
+    limitador = LimitadorTokens(6000)
+    limitador.consome(6000)
+    assert limitador.saldo == 0
+    agora[0] += 30
+    limitador.consome(1000)
+    assert limitador.saldo == 2000
+    agora[0] += 600
+    limitador.consome(0)
+    assert limitador.saldo == 6000
+
+
+def test_limitador_bloqueia_sem_saldo():
+    """Sem saldo, as threads aguardam a recarga; um lote maior que o orçamento espera o balde encher."""
+    limitador = LimitadorTokens(60000)
+    limitador.consome(60000)
+    inicio = time.monotonic()
+    threads = [threading.Thread(target=limitador.consome, args=(200,)) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert 0.3 < time.monotonic() - inicio < 2
+
+
+# EXECUÇÃO EM LOTES ========================
+
+class CodificadorPorPalavras:
+    """Tokenizador de teste em que cada palavra é um token, dispensando o download das tabelas do tiktoken."""
+
+    def encode(self, texto: str, disallowed_special=()) -> list:
+        return texto.split()
+
+
+class EmbeddingsInstaveis(EmbeddingsContadas):
+    """Modelo de embedding de teste cujas primeiras requisições falham com um erro transitório."""
+
+    def __init__(self, falhas: int):
+        super().__init__()
+        self.falhas = falhas
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts: list) -> list:
+        with self._lock:
+            if self.falhas:
+                self.falhas -= 1
+                raise openai.APIConnectionError(request=httpx.Request('POST', 'https://api.openai.com/v1/embeddings'))
+        return super().embed_documents(texts)
+
+
+@pytest.fixture(autouse=True)
+def executor_isolado(monkeypatch):
+    """Usa o tokenizador de teste, limitadores novos e esperas nulas entre as tentativas."""
+    monkeypatch.setattr(utils_embeddings.tiktoken, 'encoding_for_model', lambda modelo: CodificadorPorPalavras())
+    monkeypatch.setattr(utils_embeddings, '_LIMITADORES_TOKENS', {})
+    monkeypatch.setattr(utils_embeddings.time, 'sleep', lambda segundos: None)
+
+
+def test_monta_lotes_por_tokens_e_textos():
+    """Os lotes respeitam o limite de tokens e de textos, sem alterar a ordem."""
+    executor = ExecutorEmbeddings(EmbeddingsContadas(), MODELO_TESTE, tokens_por_lote=10, textos_por_lote=2)
+    assert executor.monta_lotes([6, 3, 4, 12]) == [[0, 1], [2], [3]]
+    assert executor.monta_lotes([1, 1, 1, 1, 1]) == [[0, 1], [2, 3], [4]]
+
+
+def test_executor_mantem_a_ordem_dos_textos():
+    """Os vetores dos lotes enviados em paralelo voltam na ordem dos textos."""
+    base = EmbeddingsContadas()
+    executor = ExecutorEmbeddings(base, MODELO_TESTE, tokens_por_lote=4, concorrencia=4, tokens_por_minuto=0)
+    textos = [' '.join(['palavra'] * (numero % 3 + 1)) + f' {numero}' for numero in range(50)]
+    assert executor.embed_documents(textos) == [base.vetor(texto) for texto in textos]
+
+
+def test_executor_acumula_as_estatisticas():
+    """As estatísticas das chamadas são somadas, incluindo as novas tentativas dos erros transitórios."""
+    executor = ExecutorEmbeddings(EmbeddingsInstaveis(falhas=2), MODELO_TESTE, tokens_por_lote=4,
+                                  tokens_por_minuto=0)
+    executor.embed_documents(['a b', 'c d', 'e'])
+    executor.embed_documents(['f g h i j'])
+    estatisticas = executor.estatisticas
+    assert (estatisticas['chamadas'], estatisticas['textos'], estatisticas['tokens']) == (2, 4, 10)
+    assert (estatisticas['requisicoes'], estatisticas['tentativas_repetidas']) == (3, 2)
+    assert estatisticas['tokens_por_segundo'] > 0
+
+
+def test_executor_desiste_apos_max_tentativas():
+    """Esgotadas as tentativas, o erro transitório é lançado."""
+    executor = ExecutorEmbeddings(EmbeddingsInstaveis(falhas=3), MODELO_TESTE, max_tentativas=3,
+                                  tokens_por_minuto=0)
+    with pytest.raises(openai.APIConnectionError):
+        executor.embed_documents(['limite'])
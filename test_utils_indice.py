@@ -0,0 +1,303 @@
+# --- File: test_utils_indice.py --- #
+# Testes da identificação dos índices, da atualização incremental, dos tipos de índice e do cache em disco
+# (`utils_indice.py`).
+#
+# Uso:
+#   python -m pytest -q test_utils_indice.py
+
+# --- Libraries --- #
+import os  # Biblioteca para alterar a data de modificação dos diretórios de teste.
+import time  # Biblioteca para calcular as datas de modificação dos diretórios de teste.
+
+import sqlite3  # Biblioteca do SQLite, usada para verificar o modo somente leitura.
+
+import numpy as np  # Biblioteca para geração dos vetores de teste.
+import pytest  # Framework de testes, usado na parametrização.
+# Interface dos modelos de embedding utilizada pelo LangChain.
+from langchain_core.embeddings import Embeddings
+# Estrutura de documento utilizada pelo LangChain.
+from langchain_core.documents import Document
+
+import utils_indice
+from utils_indice import (DocstoreSQLite, calcula_delta_corpus, calcula_fingerprint_corpus, carrega_manifesto,
+                          carrega_vector_store_em_cache, descreve_indice, indexa_trechos_em_fluxo,
+                          limpa_cache_de_indices, lista_indices_em_cache, monta_manifesto,
+                          pontos_treino_necessarios, remove_arquivos_do_vector_store, salva_vector_store_em_cache)
+from utils_recuperacao import busca_mmr_em_lote
+
+# --- Attributes --- #
+# Dimensão dos embeddings de teste.
+DIMENSAO_TESTE = 16
+# Parâmetros pequenos o bastante para treinar todos os tipos de índice com poucos vetores.
+INDICE_KWARGS_TESTE = {'nlist': 4, 'nprobe': 4, 'hnsw_m': 8, 'ef_search': 64, 'pq_m': 4, 'pq_bits': 4}
+
+
+# --- Methods --- #
+# IDENTIFICAÇÃO ========================
+
+def test_fingerprint_independe_da_ordem_dos_arquivos():
+    """A impressão digital depende apenas do conteúdo do corpus, não da ordem de listagem dos arquivos."""
+    assert calcula_fingerprint_corpus({'a.pdf': '1', 'b.pdf': '2'}, 'p') == \
+        calcula_fingerprint_corpus({'b.pdf': '2', 'a.pdf': '1'}, 'p')
+
+
+def test_fingerprint_muda_com_conteudo_ou_parametros():
+    """Alterar um arquivo ou os parâmetros gera outra impressão digital."""
+    base = calcula_fingerprint_corpus({'a.pdf': '1'}, 'p')
+    assert calcula_fingerprint_corpus({'a.pdf': '2'}, 'p') != base
+    assert calcula_fingerprint_corpus({'a.pdf': '1'}, 'q') != base
+
+
+# DELTA DO CORPUS ========================
+
+def test_delta_sem_indice_base_indexa_tudo():
+    """Sem índice base, todos os arquivos são indexados."""
+    assert calcula_delta_corpus({}, {'a.pdf': '1', 'b.pdf': '2'}) == (['a.pdf', 'b.pdf'], [])
+
+
+def test_delta_corpus_inalterado():
+    """Um corpus idêntico ao indexado não gera trabalho."""
+    indexados = {'a.pdf': {'hash': '1', 'ids': ['a.pdf:0']}}
+    assert calcula_delta_corpus(indexados, {'a.pdf': '1'}) == ([], [])
+
+
+def test_delta_arquivo_novo_alterado_e_removido():
+    """Arquivos novos são adicionados, excluídos são removidos e alterados aparecem nas duas listas."""
+    indexados = {
+        'a.pdf': {'hash': '1', 'ids': ['a.pdf:0']},
+        'b.pdf': {'hash': '2', 'ids': ['b.pdf:0']},
+        'c.pdf': {'hash': '3', 'ids': ['c.pdf:0']},
+    }
+    adicionados, removidos = calcula_delta_corpus(indexados, {'a.pdf': '1', 'b.pdf': '20', 'd.pdf': '4'})
+    assert adicionados == ['b.pdf', 'd.pdf']
+    assert removidos == ['b.pdf', 'c.pdf']
+
+
+def test_delta_reindexa_dependentes_de_arquivo_removido():
+    """Um arquivo cujos trechos duplicados foram descartados em favor de um arquivo removido é reindexado."""
+    indexados = {
+        'a.pdf': {'hash': '1', 'ids': ['a.pdf:0']},
+        'b.pdf': {'hash': '2', 'ids': [], 'depende_de': ['a.pdf']},
+        'c.pdf': {'hash': '3', 'ids': ['c.pdf:0']},
+    }
+    adicionados, removidos = calcula_delta_corpus(indexados, {'b.pdf': '2', 'c.pdf': '3'})
+    assert adicionados == ['b.pdf']
+    assert removidos == ['a.pdf', 'b.pdf']
+
+
+def test_delta_segue_cadeias_de_dependencia():
+    """As dependências são seguidas transitivamente: c depende de b, que depende do arquivo removido a."""
+    indexados = {
+        'a.pdf': {'hash': '1', 'ids': ['a.pdf:0']},
+        'b.pdf': {'hash': '2', 'ids': ['b.pdf:0'], 'depende_de': ['a.pdf']},
+        'c.pdf': {'hash': '3', 'ids': ['c.pdf:0'], 'depende_de': ['b.pdf']},
+        'd.pdf': {'hash': '4', 'ids': ['d.pdf:0']},
+    }
+    adicionados, removidos = calcula_delta_corpus(indexados, {'b.pdf': '2', 'c.pdf': '3', 'd.pdf': '4'})
+    assert adicionados == ['b.pdf', 'c.pdf']
+    assert removidos == ['a.pdf', 'b.pdf', 'c.pdf']
+
+
+def test_delta_nao_altera_o_manifesto():
+    """O manifesto do índice base não é modificado pelo cálculo do delta."""
+    indexados = {'a.pdf': {'hash': '1', 'ids': ['a.pdf:0'], 'depende_de': ['x.pdf']}}
+    copia = {'a.pdf': {'hash': '1', 'ids': ['a.pdf:0'], 'depende_de': ['x.pdf']}}
+    calcula_delta_corpus(indexados, {})
+    assert indexados == copia
+
+
+# MANIFESTO ========================
+
+def test_manifesto_registra_ids_e_dependencias():
+    """O manifesto herda os arquivos mantidos, registra os novos e acumula as dependências."""
+    mantidos = {'a.pdf': {'hash': '1', 'ids': ['a.pdf:0']}}
+    manifesto = monta_manifesto(mantidos,
+                                {'b.pdf': ['b.pdf:0', 'b.pdf:1']},
+                                {'a.pdf': '1', 'b.pdf': '2', 'vazio.pdf': '3'},
+                                'p',
+                                {'b.pdf': ['a.pdf']})
+    assert manifesto['parametros'] == 'p'
+    assert manifesto['arquivos']['a.pdf'] == {'hash': '1', 'ids': ['a.pdf:0']}
+    assert manifesto['arquivos']['b.pdf'] == {'hash': '2', 'ids': ['b.pdf:0', 'b.pdf:1'], 'depende_de': ['a.pdf']}
+    assert manifesto['arquivos']['vazio.pdf'] == {'hash': '3', 'ids': []}
+
+
+# TIPOS DE ÍNDICE ========================
+
+class EmbeddingsDeTeste(Embeddings):
+    """Modelo de embedding de teste, que sorteia um vetor fixo para cada texto numérico."""
+
+    def embed_documents(self, texts: list) -> list:
+        return [self.embed_query(texto) for texto in texts]
+
+    def embed_query(self, text: str) -> list:
+        return np.random.default_rng(int(text)).standard_normal(DIMENSAO_TESTE).astype(np.float32).tolist()
+
+
+def cria_trechos(inicio: int, fim: int, source: str) -> list:
+    """Cria trechos cujo texto é um número, de modo que cada trecho tenha um embedding distinto."""
+    return [Document(page_content=str(numero), metadata={'source': source, 'doc_id': f'{source}:{numero}'})
+            for numero in range(inicio, fim)]
+
+
+def indexa_de_teste(indice_tipo: str, quantizacao: str):
+    """Indexa 200 trechos de `a.pdf` e 200 de `b.pdf` em fluxo, em lotes de 64."""
+    trechos = cria_trechos(0, 200, 'a.pdf') + cria_trechos(200, 400, 'b.pdf')
+    return indexa_trechos_em_fluxo(None, iter(trechos), EmbeddingsDeTeste(), 64, indice_tipo,
+                                   {**INDICE_KWARGS_TESTE, 'quantizacao': quantizacao})
+
+
+def vizinho_mais_proximo(vector_store, texto: str) -> str:
+    """Retorna o `doc_id` do trecho mais próximo do embedding de um texto."""
+    return busca_mmr_em_lote(vector_store, [texto], k=1, lambda_mult=1.0,
+                             parametros_busca=INDICE_KWARGS_TESTE)[0][0].metadata['doc_id']
+
+
+def test_descreve_indice():
+    """A descrição segue o formato do `faiss.index_factory` para cada tipo e quantização."""
+    kwargs = {'nlist': 256, 'hnsw_m': 32, 'pq_m': 16, 'pq_bits': 8}
+    assert descreve_indice('flat', {**kwargs, 'quantizacao': 'nenhuma'}) == 'Flat'
+    assert descreve_indice('flat', {**kwargs, 'quantizacao': 'pq'}) == 'PQ16x8'
+    assert descreve_indice('ivf', {**kwargs, 'quantizacao': 'sq4'}) == 'IVF256,SQ4'
+    assert descreve_indice('ivf', {**kwargs, 'quantizacao': 'pq'}, 20000) == 'IVF256,PQ16x8'
+    assert descreve_indice('hnsw', {**kwargs, 'quantizacao': 'sq8'}) == 'HNSW32_SQ8'
+    assert descreve_indice('hnsw', {**kwargs, 'quantizacao': 'pq'}) == 'HNSW32_PQ16x8'
+
+
+def test_descreve_indice_com_poucos_vetores():
+    """Com poucos vetores, o IVF usa menos listas e o PQ é trocado por SQ8."""
+    kwargs = {'nlist': 256, 'pq_m': 16, 'pq_bits': 8, 'quantizacao': 'pq'}
+    assert descreve_indice('ivf', kwargs, 1000) == 'IVF25,PQ16x8'
+    assert descreve_indice('ivf', kwargs, 100) == 'IVF2,SQ8'
+    assert descreve_indice('ivf', kwargs, 10) == 'IVF1,SQ8'
+    assert descreve_indice('flat', kwargs, 100) == 'SQ8'
+    assert descreve_indice('hnsw', {**kwargs, 'hnsw_m': 32}, 100) == 'HNSW32_SQ8'
+
+
+def test_pontos_treino_necessarios():
+    """Apenas o IVF e a quantização precisam de treino, com 39 vetores por centróide."""
+    assert pontos_treino_necessarios('flat', {'quantizacao': 'nenhuma'}) == 0
+    assert pontos_treino_necessarios('hnsw', {'quantizacao': 'nenhuma'}) == 0
+    assert pontos_treino_necessarios('ivf', {'nlist': 256, 'quantizacao': 'nenhuma'}) == 9984
+    assert pontos_treino_necessarios('flat', {'quantizacao': 'sq8'}) == 1000
+    assert pontos_treino_necessarios('hnsw', {'quantizacao': 'pq', 'pq_bits': 4}) == 624
+    assert pontos_treino_necessarios('ivf', {'nlist': 4, 'quantizacao': 'pq', 'pq_bits': 4}) == 624
+
+
+@pytest.mark.parametrize('indice_tipo', ['flat', 'ivf', 'hnsw'])
+@pytest.mark.parametrize('quantizacao', ['nenhuma', 'sq8', 'sq4', 'pq'])
+def test_indexa_em_fluxo_todos_os_tipos(indice_tipo, quantizacao):
+    """A indexação em fluxo cria, treina e preenche cada tipo de índice, que pode então ser buscado."""
+    vector_store, ids_por_arquivo = indexa_de_teste(indice_tipo, quantizacao)
+    assert vector_store.index.ntotal == 400
+    assert ids_por_arquivo['a.pdf'] == [f'a.pdf:{numero}' for numero in range(200)]
+    assert len(ids_por_arquivo['b.pdf']) == 200
+    resultado = vizinho_mais_proximo(vector_store, '250')
+    if quantizacao == 'nenhuma':
+        assert resultado == 'b.pdf:250'
+
+
+def test_indexa_em_fluxo_treina_com_o_que_houver():
+    """Um corpus menor que a amostra de treino recomendada ainda gera um índice treinado."""
+    vector_store, _ = indexa_trechos_em_fluxo(None, iter(cria_trechos(0, 50, 'a.pdf')), EmbeddingsDeTeste(), 16,
+                                              'ivf', {'nlist': 256, 'quantizacao': 'pq', 'pq_m': 4, 'pq_bits': 8})
+    assert vector_store.index.is_trained
+    assert vector_store.index.ntotal == 50
+
+
+@pytest.mark.parametrize('indice_tipo', ['flat', 'ivf'])
+def test_remove_arquivos_mantem_as_posicoes(indice_tipo):
+    """Após remover um arquivo, as buscas continuam retornando os trechos corretos, inclusive no IVF."""
+    vector_store, ids_por_arquivo = indexa_de_teste(indice_tipo, 'nenhuma')
+    arquivos = {nome: {'ids': ids} for nome, ids in ids_por_arquivo.items()}
+    assert remove_arquivos_do_vector_store(vector_store, arquivos, ['a.pdf']) == 200
+    assert vector_store.index.ntotal == 200
+    assert vizinho_mais_proximo(vector_store, '250') == 'b.pdf:250'
+    # Novos trechos recebem posições livres.
+    indexa_trechos_em_fluxo(vector_store, iter(cria_trechos(400, 410, 'c.pdf')), EmbeddingsDeTeste(), 64)
+    assert vizinho_mais_proximo(vector_store, '405') == 'c.pdf:405'
+    assert vizinho_mais_proximo(vector_store, '399') == 'b.pdf:399'
+
+
+def test_remove_arquivos_do_hnsw_exige_reconstrucao():
+    """O HNSW não permite remover vetores: a remoção lança `RuntimeError`, que leva à reconstrução do índice."""
+    vector_store, ids_por_arquivo = indexa_de_teste('hnsw', 'nenhuma')
+    with pytest.raises(RuntimeError):
+        remove_arquivos_do_vector_store(vector_store, {'a.pdf': {'ids': ids_por_arquivo['a.pdf']}}, ['a.pdf'])
+
+
+# CACHE EM DISCO ========================
+
+@pytest.fixture
+def pasta_indices(monkeypatch, tmp_path):
+    """Redireciona o cache de índices para um diretório temporário."""
+    monkeypatch.setattr(utils_indice, 'PASTA_INDICES', tmp_path)
+    return tmp_path
+
+
+def envelhece(pasta, segundos: float) -> None:
+    """Recua a data de modificação de um diretório em `segundos`."""
+    instante = time.time() - segundos
+    os.utime(pasta, (instante, instante))
+
+
+def test_salva_e_carrega_indice_em_cache(pasta_indices):
+    """O índice salvo é carregado mapeado em memória, com os mesmos trechos e o manifesto."""
+    vector_store, _ = indexa_de_teste('flat', 'nenhuma')
+    assert salva_vector_store_em_cache(vector_store, 'corpus', {'parametros': 'p'})
+    carregado = carrega_vector_store_em_cache('corpus', EmbeddingsDeTeste())
+    assert carregado.index.ntotal == 400
+    assert vizinho_mais_proximo(carregado, '123') == 'a.pdf:123'
+    assert carrega_manifesto('corpus') == {'fingerprint': 'corpus', 'parametros': 'p'}
+    assert [pasta.name for pasta in pasta_indices.iterdir()] == ['corpus']
+
+
+def test_limpa_cache_mantem_os_mais_recentes(pasta_indices):
+    """Acima do limite, os índices usados há mais tempo são removidos."""
+    vector_store, _ = indexa_de_teste('flat', 'nenhuma')
+    for idade, fingerprint in enumerate(['recente', 'medio', 'antigo']):
+        salva_vector_store_em_cache(vector_store, fingerprint)
+        envelhece(pasta_indices / fingerprint, 60 * idade)
+    limpa_cache_de_indices(limite=2)
+    assert [pasta.name for pasta in lista_indices_em_cache()] == ['recente', 'medio']
+
+
+def test_limpa_cache_remove_temporarios_abandonados(pasta_indices):
+    """Diretórios temporários antigos são removidos; os recentes, de gravações em andamento, são mantidos."""
+    abandonado = pasta_indices / '.tmp-abandonado'
+    em_andamento = pasta_indices / '.tmp-em-andamento'
+    for pasta in (abandonado, em_andamento):
+        pasta.mkdir()
+        (pasta / 'manifesto.json').write_text('{}')
+    envelhece(abandonado, 2 * utils_indice.IDADE_MAXIMA_TEMPORARIOS)
+    assert lista_indices_em_cache() == []
+    limpa_cache_de_indices()
+    assert not abandonado.exists()
+    assert em_andamento.exists()
+
+
+def test_docstore_sqlite_grava_busca_e_remove(tmp_path):
+    """Os documentos gravados voltam com os metadados; os removidos deixam de ser encontrados."""
+    docstore = DocstoreSQLite(tmp_path / 'documentos.sqlite', somente_leitura=False)
+    documentos = {f'a.pdf:{i}': Document(page_content=f'Página {i} com acentuação',
+                                         metadata={'source': 'a.pdf', 'page': i, 'doc_id': f'a.pdf:{i}'})
+                  for i in range(3)}
+    docstore.add(documentos)
+    docstore.delete(['a.pdf:1'])
+    assert docstore.search('a.pdf:0') == documentos['a.pdf:0']
+    assert docstore.search('a.pdf:1') == 'ID a.pdf:1 not found.'
+    assert docstore.documentos() == {'a.pdf:0': documentos['a.pdf:0'], 'a.pdf:2': documentos['a.pdf:2']}
+    docstore.fecha()
+
+
+def test_docstore_sqlite_somente_leitura(tmp_path):
+    """Aberto em modo somente leitura, o banco é legível, mas recusa escritas."""
+    caminho = tmp_path / 'documentos.sqlite'
+    escrita = DocstoreSQLite(caminho, somente_leitura=False)
+    escrita.add({'a.pdf:0': Document(page_content='a', metadata={'source': 'a.pdf'})})
+    escrita.fecha()
+    leitura = DocstoreSQLite(caminho)
+    assert leitura.search('a.pdf:0').page_content == 'a'
+    with pytest.raises(sqlite3.OperationalError):
+        leitura.delete(['a.pdf:0'])
+    leitura.fecha()
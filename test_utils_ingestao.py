@@ -0,0 +1,205 @@
+# --- File: test_utils_ingestao.py --- #
+# Testes do cache de extração das páginas e da deduplicação dos trechos antes do embedding (`utils_ingestao.py`).
+#
+# Uso:
+#   python -m pytest -q test_utils_ingestao.py
+
+# --- Libraries --- #
+# Tokenizador da OpenAI, substituído nos testes para dispensar o download das tabelas.
+import tiktoken
+# Estrutura de documento utilizada pelo LangChain.
+from langchain_core.documents import Document
+
+import utils_ingestao
+from utils_ingestao import (CacheExtracao, DeduplicadorTrechos, calcula_assinatura_minhash, cria_splitter,
+                            divide_tarefas_de_extracao, itera_lotes, itera_paginas, similaridade_assinaturas)
+
+# --- Attributes --- #
+# Texto longo o bastante para gerar vários shingles.
+TEXTO = ('O limite de uma função f quando x tende a a é o valor L do qual f(x) se aproxima arbitrariamente '
+         'quando x se aproxima de a, sem que x precise ser igual a a, e essa ideia formaliza a continuidade.')
+
+
+# --- Methods --- #
+
+def cria_trecho(texto: str, source: str, indice: int) -> Document:
+    """Cria um trecho com os metadados atribuídos pela ingestão."""
+    return Document(page_content=texto, metadata={'source': source, 'page': 0, 'doc_id': f'{source}:{indice}'})
+
+
+# EXTRAÇÃO PARALELA ========================
+
+def test_divide_arquivo_grande_em_intervalos():
+    """Um arquivo maior que `paginas_por_tarefa` é dividido em intervalos contíguos, o último parcial."""
+    assert divide_tarefas_de_extracao(['livro.pdf'], 100, [250]) == [
+        ('livro.pdf', 0, 100), ('livro.pdf', 100, 200), ('livro.pdf', 200, 250)]
+
+
+def test_divide_tarefas_na_ordem_dos_arquivos():
+    """As tarefas seguem a ordem dos arquivos; arquivos pequenos geram uma tarefa e vazios, nenhuma."""
+    tarefas = divide_tarefas_de_extracao(['a.pdf', 'vazio.pdf', 'b.pdf'], 10, [10, 0, 15])
+    assert tarefas == [('a.pdf', 0, 10), ('b.pdf', 0, 10), ('b.pdf', 10, 15)]
+
+
+# CACHE DE EXTRAÇÃO ========================
+
+def cria_paginas(source: str, textos: list) -> list:
+    """Cria as páginas de um arquivo no formato da extração."""
+    return [Document(page_content=texto, metadata={'source': source, 'page': pagina})
+            for pagina, texto in enumerate(textos)]
+
+
+def test_cache_extracao_grava_e_le_paginas(tmp_path):
+    """As páginas gravadas voltam na ordem, com a origem atual do arquivo, mesmo em outra instância."""
+    cache = CacheExtracao(tmp_path / 'paginas.sqlite')
+    assert not cache.possui('h1')
+    cache.grava_paginas('h1', cria_paginas('antigo.pdf', ['Página um', 'Página dois com acentuação']))
+    assert cache.possui('h1')
+    paginas = list(CacheExtracao(tmp_path / 'paginas.sqlite').le_paginas('h1', 'renomeado.pdf'))
+    assert paginas == cria_paginas('renomeado.pdf', ['Página um', 'Página dois com acentuação'])
+
+
+def test_cache_extracao_remove_arquivos_sem_uso(tmp_path):
+    """Arquivos fora dos mantidos são removidos, inclusive páginas de extrações interrompidas."""
+    cache = CacheExtracao(tmp_path / 'paginas.sqlite')
+    cache.grava_paginas('mantido', cria_paginas('a.pdf', ['a']))
+    cache.grava_paginas('antigo', cria_paginas('b.pdf', ['b']))
+    with cache._conexao:
+        cache._conexao.execute("INSERT INTO paginas (hash_arquivo, pagina, texto) VALUES ('interrompido', 0, x'00')")
+    assert cache.remove_exceto({'mantido'}) == 2
+    assert cache.possui('mantido') and not cache.possui('antigo')
+    assert list(cache.le_paginas('interrompido', 'c.pdf')) == []
+
+
+def test_itera_paginas_reaproveita_o_cache(tmp_path, monkeypatch):
+    """Na segunda passagem, os arquivos já extraídos são lidos do cache, sem nova extração."""
+    extraidos = []
+
+    def extrai_em_fluxo(arquivos, *args):
+        for arquivo in arquivos:
+            extraidos.append(arquivo)
+            yield from cria_paginas(arquivo, [f'{arquivo} página {pagina}' for pagina in range(3)])
+    monkeypatch.setattr(utils_ingestao, '_extrai_em_fluxo', extrai_em_fluxo)
+    cache = CacheExtracao(tmp_path / 'paginas.sqlite')
+    primeira = list(itera_paginas(['a.pdf', 'b.pdf'], hashes=['ha', 'hb'], cache=cache))
+    segunda = list(itera_paginas(['a.pdf', 'b.pdf', 'c.pdf'], hashes=['ha', 'hb', 'hc'], cache=cache))
+    assert extraidos == ['a.pdf', 'b.pdf', 'c.pdf']
+    assert segunda[:6] == primeira
+    assert [pagina.metadata['source'] for pagina in segunda[6:]] == ['c.pdf'] * 3
+    assert cache.estatisticas == {'arquivos_em_cache': 2, 'arquivos_extraidos': 3}
+
+
+def test_itera_paginas_nao_grava_extracao_interrompida(tmp_path, monkeypatch):
+    """Um arquivo cuja extração foi interrompida não é considerado em cache."""
+    monkeypatch.setattr(utils_ingestao, '_extrai_em_fluxo',
+                        lambda arquivos, *args: iter(cria_paginas(arquivos[0], ['um', 'dois'])))
+    cache = CacheExtracao(tmp_path / 'paginas.sqlite')
+    paginas = itera_paginas(['a.pdf'], hashes=['ha'], cache=cache)
+    next(paginas)
+    paginas.close()
+    assert not cache.possui('ha')
+
+
+# SPLITTER ========================
+
+class CodificadorPorPalavras:
+    """Tokenizador de teste em que cada palavra é um token, dispensando o download das tabelas do tiktoken."""
+
+    def encode(self, texto: str, **kwargs) -> list:
+        return texto.split()
+
+
+def test_splitter_em_caracteres_e_reaproveitado(monkeypatch):
+    """O splitter é criado uma vez por configuração e mede os trechos em caracteres por padrão."""
+    monkeypatch.setattr(utils_ingestao, '_SPLITTERS', {})
+    kwargs = {'chunk_size': 30, 'chunk_overlap': 0}
+    splitter = cria_splitter(kwargs)
+    assert cria_splitter({'chunk_overlap': 0, 'chunk_size': 30}) is splitter
+    assert cria_splitter({**kwargs, 'unidade': 'caracteres'}) is not splitter
+    assert all(len(trecho) <= 30 for trecho in splitter.split_text(TEXTO))
+
+
+def test_splitter_em_tokens(monkeypatch):
+    """Com `unidade='tokens'`, `chunk_size` é contado com o tokenizador do modelo de embedding."""
+    monkeypatch.setattr(utils_ingestao, '_SPLITTERS', {})
+    monkeypatch.setattr(tiktoken, 'encoding_for_model', lambda modelo: CodificadorPorPalavras())
+    trechos = cria_splitter({'unidade': 'tokens', 'chunk_size': 10, 'chunk_overlap': 0}).split_text(TEXTO)
+    assert len(trechos) > 1
+    assert all(len(trecho.split()) <= 10 for trecho in trechos)
+    assert ' '.join(trechos).split() == TEXTO.split()
+
+
+# LOTES ========================
+
+def test_itera_lotes_agrupa_na_ordem():
+    """Os itens são agrupados em lotes de até `tamanho_lote`, o último parcial."""
+    assert list(itera_lotes(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(itera_lotes([], 2)) == []
+
+
+def test_itera_lotes_consome_sob_demanda():
+    """Os itens são consumidos apenas à medida que os lotes são pedidos."""
+    consumidos = []
+
+    def gera():
+        for item in range(10):
+            consumidos.append(item)
+            yield item
+    lotes = itera_lotes(gera(), 3)
+    assert next(lotes) == [0, 1, 2]
+    assert consumidos == [0, 1, 2]
+
+
+# ASSINATURAS ========================
+
+def test_assinaturas_de_textos_iguais_sao_identicas():
+    """Textos iguais têm similaridade estimada 1."""
+    assinatura = calcula_assinatura_minhash(TEXTO)
+    assert similaridade_assinaturas(assinatura, calcula_assinatura_minhash(TEXTO)) == 1.0
+
+
+def test_assinaturas_de_textos_diferentes_sao_pouco_similares():
+    """Textos sem shingles em comum têm similaridade estimada baixa."""
+    outro = 'Uma matriz quadrada é invertível se e somente se o seu determinante for diferente de zero sempre.'
+    assert similaridade_assinaturas(calcula_assinatura_minhash(TEXTO), calcula_assinatura_minhash(outro)) < 0.3
+
+
+# DEDUPLICAÇÃO ========================
+
+def test_descarta_duplicata_exata_ignorando_espacos_e_caixa():
+    """Um trecho que difere apenas em espaços e maiúsculas é descartado como duplicata exata."""
+    deduplicador = DeduplicadorTrechos()
+    trechos = [cria_trecho(TEXTO, 'a.pdf', 0), cria_trecho('  ' + TEXTO.upper().replace(' ', '   '), 'b.pdf', 0)]
+    mantidos = list(deduplicador.filtra(trechos))
+    assert [trecho.metadata['doc_id'] for trecho in mantidos] == ['a.pdf:0']
+    assert deduplicador.estatisticas == {'mantidos': 1, 'duplicatas_exatas': 1, 'quase_duplicatas': 0}
+    assert deduplicador.duplicatas == {'a.pdf:0': [{'source': 'b.pdf', 'page': 0}]}
+    assert deduplicador.dependencias == {'b.pdf': {'a.pdf'}}
+
+
+def test_descarta_quase_duplicata():
+    """Um trecho com uma única palavra diferente é descartado como quase duplicata."""
+    deduplicador = DeduplicadorTrechos(limiar=0.7)
+    quase_igual = TEXTO.replace('continuidade', 'derivada')
+    mantidos = list(deduplicador.filtra([cria_trecho(TEXTO, 'a.pdf', 0), cria_trecho(quase_igual, 'a.pdf', 1)]))
+    assert len(mantidos) == 1
+    assert deduplicador.estatisticas['quase_duplicatas'] == 1
+    # Duplicatas no mesmo arquivo não criam dependências.
+    assert deduplicador.dependencias == {}
+
+
+def test_mantem_trechos_distintos_na_ordem_original():
+    """Trechos distintos são todos mantidos, na ordem em que chegam."""
+    deduplicador = DeduplicadorTrechos()
+    outro = 'Uma matriz quadrada é invertível se e somente se o seu determinante for diferente de zero sempre.'
+    trechos = [cria_trecho(TEXTO, 'a.pdf', 0), cria_trecho(outro, 'a.pdf', 1)]
+    assert list(deduplicador.filtra(trechos)) == trechos
+    assert deduplicador.duplicatas == {}
+
+
+def test_descarta_trechos_ja_indexados():
+    """Trechos idênticos a trechos já presentes no índice são descartados."""
+    deduplicador = DeduplicadorTrechos()
+    deduplicador.registra_existentes([cria_trecho(TEXTO, 'a.pdf', 0)])
+    assert list(deduplicador.filtra([cria_trecho(TEXTO, 'b.pdf', 0)])) == []
+    assert deduplicador.dependencias == {'b.pdf': {'a.pdf'}}
@@ -0,0 +1,515 @@
+# --- File: test_utils_openai.py --- #
+# Testes das retentativas, do disjuntor, da decodificação do streaming e do hedging das chamadas à API da
+# OpenAI (`utils_openai.py`).
+#
+# Uso:
+#   python -m pytest -q test_utils_openai.py
+
+# --- Libraries --- #
+import asyncio  # Biblioteca para execução das corrotinas das chamadas simuladas.
+import json  # Biblioteca para geração dos eventos do streaming.
+from datetime import datetime, timedelta, timezone  # Geração de datas para o cabeçalho `Retry-After`.
+from email.utils import format_datetime  # Formatação de datas no padrão dos cabeçalhos HTTP.
+
+import pytest  # Framework de testes, usado na verificação das exceções.
+
+import utils_openai
+from utils_openai import (CircuitoAberto, ControleHedging, DecodificadorSSE, DisjuntorCircuito, LeitorStreamChat,
+                          MetricasStream, PoliticaRetentativas, _semaforo_da_chave, endereco_base_api,
+                          envia_com_retentativas_async, executa_em_segundo_plano, itera_em_segundo_plano, le_duracao,
+                          le_espera_servidor, retorna_resposta_modelo, transmite_resposta_modelo,
+                          transmite_resposta_modelo_async, url_api)
+
+
+# --- Methods --- #
+# RETENTATIVAS ========================
+
+def test_le_duracao():
+    """As durações dos cabeçalhos de limite de requisições são convertidas em segundos."""
+    assert le_duracao('6m0.5s') == 360.5
+    assert le_duracao('20ms') == pytest.approx(0.02)
+    assert le_duracao('1h2m') == 3720
+    assert le_duracao('') == 0
+    assert le_duracao(None) == 0
+
+
+def test_le_espera_servidor_retry_after():
+    """`retry-after-ms` tem precedência sobre `Retry-After`, aceito em segundos ou como data."""
+    assert le_espera_servidor({'retry-after-ms': '1500', 'retry-after': '9'}) == 1.5
+    assert le_espera_servidor({'retry-after': '3'}) == 3.0
+    data = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+    assert 25 < le_espera_servidor({'retry-after': data}) <= 30
+
+
+def test_le_espera_servidor_limites_esgotados():
+    """Sem `Retry-After`, vale a maior espera entre os limites esgotados."""
+    headers = {'x-ratelimit-remaining-requests': '0', 'x-ratelimit-reset-requests': '2s',
+               'x-ratelimit-remaining-tokens': '0', 'x-ratelimit-reset-tokens': '6m0s'}
+    assert le_espera_servidor(headers) == 360
+    headers['x-ratelimit-remaining-tokens'] = '1500'
+    assert le_espera_servidor(headers) == 2
+
+
+def test_le_espera_servidor_sem_indicacao():
+    """Sem indicação do servidor, ou com valores inválidos, a espera é `None`."""
+    assert le_espera_servidor({}) is None
+    assert le_espera_servidor({'retry-after': 'amanhã'}) is None
+    assert le_espera_servidor({'x-ratelimit-remaining-requests': '10', 'x-ratelimit-reset-requests': '2s'}) is None
+
+
+def test_calcula_espera_com_full_jitter():
+    """Sem indicação do servidor, a espera é sorteada entre zero e o backoff exponencial, limitado ao máximo."""
+    politica = PoliticaRetentativas(espera_base=1, espera_maxima=32)
+    esperas = [politica.calcula_espera(3, {}) for _ in range(200)]
+    assert all(0 <= espera <= 8 for espera in esperas)
+    assert len(set(esperas)) > 1
+    assert all(0 <= politica.calcula_espera(10, {}) <= 32 for _ in range(200))
+
+
+def test_calcula_espera_segue_o_servidor():
+    """A espera indicada pelo servidor é respeitada, limitada e acrescida de um pequeno atraso aleatório."""
+    politica = PoliticaRetentativas(espera_maxima_servidor=60)
+    assert all(3 <= politica.calcula_espera(0, {'retry-after': '3'}) <= 3.35 for _ in range(100))
+    assert all(60 <= politica.calcula_espera(0, {'retry-after': '600'}) <= 66.05 for _ in range(100))
+
+
+# DISJUNTOR ========================
+
+@pytest.fixture
+def relogio(monkeypatch):
+    """Substitui o relógio monotônico do módulo por um relógio controlado pelo teste."""
+    agora = [100.0]
+    monkeypatch.setattr(utils_openai.time, 'monotonic', lambda: agora[0])
+    return agora
+
+
+def test_disjuntor_abre_apos_falhas_seguidas(relogio):
+    """O disjuntor abre ao atingir o limiar de falhas e rejeita as chamadas sem requisição."""
+    disjuntor = DisjuntorCircuito(limiar_falhas=3, tempo_aberto=30)
+    for _ in range(2):
+        disjuntor.registra_falha()
+        disjuntor.verifica()
+    disjuntor.registra_falha()
+    with pytest.raises(CircuitoAberto) as erro:
+        disjuntor.verifica()
+    assert erro.value.segundos_restantes == 30
+    assert disjuntor.estatisticas == {'aberturas': 1, 'rejeitadas': 1}
+
+
+def test_disjuntor_sucesso_zera_falhas(relogio):
+    """Um sucesso entre as falhas reinicia a contagem."""
+    disjuntor = DisjuntorCircuito(limiar_falhas=2)
+    disjuntor.registra_falha()
+    disjuntor.registra_sucesso()
+    disjuntor.registra_falha()
+    disjuntor.verifica()
+
+
+def test_disjuntor_meio_aberto_libera_uma_chamada_de_teste(relogio):
+    """Após o tempo aberto, apenas uma chamada de teste é liberada; o sucesso dela fecha o disjuntor."""
+    disjuntor = DisjuntorCircuito(limiar_falhas=1, tempo_aberto=30)
+    disjuntor.registra_falha()
+    relogio[0] += 31
+    disjuntor.verifica()
+    with pytest.raises(CircuitoAberto):
+        disjuntor.verifica()
+    disjuntor.registra_sucesso()
+    disjuntor.verifica()
+    disjuntor.verifica()
+
+
+def test_disjuntor_reabre_se_a_chamada_de_teste_falhar(relogio):
+    """A falha da chamada de teste reabre o disjuntor por mais `tempo_aberto` segundos."""
+    disjuntor = DisjuntorCircuito(limiar_falhas=1, tempo_aberto=30)
+    disjuntor.registra_falha()
+    relogio[0] += 31
+    disjuntor.verifica()
+    disjuntor.registra_falha()
+    relogio[0] += 29
+    with pytest.raises(CircuitoAberto):
+        disjuntor.verifica()
+    assert disjuntor.estatisticas['aberturas'] == 2
+
+
+def test_disjuntor_descarta_chamada_de_teste_sem_resultado(relogio):
+    """Uma chamada de teste que nunca registrou resultado não bloqueia o disjuntor indefinidamente."""
+    disjuntor = DisjuntorCircuito(limiar_falhas=1, tempo_aberto=30)
+    disjuntor.registra_falha()
+    relogio[0] += 31
+    disjuntor.verifica()
+    relogio[0] += 31
+    disjuntor.verifica()
+
+
+# STREAMING (SSE) ========================
+
+def decodifica_em_pedacos(fluxo: bytes, tamanho: int) -> list:
+    """Alimenta um decodificador com o fluxo dividido em pedaços de `tamanho` bytes e retorna os eventos."""
+    decodificador = DecodificadorSSE()
+    eventos = []
+    for inicio in range(0, len(fluxo), tamanho):
+        eventos.extend(decodificador.alimenta(fluxo[inicio:inicio + tamanho]))
+    return [(evento.event, evento.data, evento.id) for evento in eventos]
+
+
+def evento_chat(conteudo: str) -> bytes:
+    """Gera um evento do streaming de `chat/completions` com um pedaço de texto."""
+    return b'data: ' + json.dumps({'choices': [{'delta': {'content': conteudo}}]}).encode('utf-8') + b'\r\n\r\n'
+
+
+def test_sse_independe_da_divisao_em_pedacos():
+    """Os eventos são os mesmos qualquer que seja a divisão do fluxo, inclusive com "\\r\\n" dividido."""
+    fluxo = 'data: um\r\n\r\n: keep-alive\r\n\r\ndata: dois é\r\n\r\ndata: [DONE]\r\n\r\n'.encode('utf-8')
+    esperado = [('message', 'um', None), ('message', 'dois é', None), ('message', '[DONE]', None)]
+    for tamanho in range(1, len(fluxo) + 1):
+        assert decodifica_em_pedacos(fluxo, tamanho) == esperado
+
+
+def test_sse_aceita_cr_isolado_como_terminador():
+    """Um "\\r" isolado termina a linha, mesmo no fim de um pedaço."""
+    decodificador = DecodificadorSSE()
+    assert decodificador.alimenta(b'data: a\r') == []
+    assert [evento.data for evento in decodificador.alimenta(b'\rdata: b\r\r')] == ['a', 'b']
+
+
+def test_sse_une_linhas_de_dados():
+    """As várias linhas `data:` de um evento são unidas por "\\n", com ou sem espaço após os dois-pontos."""
+    eventos = DecodificadorSSE().alimenta(b'data: linha 1\ndata:linha 2\ndata\n\n')
+    assert [evento.data for evento in eventos] == ['linha 1\nlinha 2\n']
+
+
+def test_sse_campos_event_e_id():
+    """Os campos `event` e `id` são lidos, e o tipo do evento volta a `message` após cada evento."""
+    eventos = DecodificadorSSE().alimenta(b'event: erro\nid: 7\ndata: x\n\ndata: y\n\n')
+    assert [(evento.event, evento.data, evento.id) for evento in eventos] == [('erro', 'x', '7'), ('message', 'y', '7')]
+
+
+def test_sse_ignora_comentarios_e_eventos_sem_dados():
+    """Comentários de keep-alive e eventos sem linhas `data:` não geram eventos."""
+    assert DecodificadorSSE().alimenta(b': keep-alive\n\nevent: ping\n\n\n') == []
+
+
+def test_sse_caractere_utf8_dividido_entre_pedacos():
+    """Um caractere UTF-8 dividido entre dois pedaços não é corrompido."""
+    fluxo = 'data: função\n\n'.encode('utf-8')
+    meio = fluxo.index('ç'.encode('utf-8')) + 1
+    decodificador = DecodificadorSSE()
+    assert decodificador.alimenta(fluxo[:meio]) == []
+    assert [evento.data for evento in decodificador.alimenta(fluxo[meio:])] == ['função']
+
+
+def test_sse_finaliza_descarta_evento_incompleto():
+    """Um evento sem a linha vazia final é descartado por `finaliza`, que informa que ele existia."""
+    decodificador = DecodificadorSSE()
+    assert decodificador.alimenta(b'data: a\n\ndata: b\n') != []
+    assert decodificador.finaliza()
+    assert decodificador.alimenta(b'\n') == []
+    assert not decodificador.finaliza()
+    decodificador.alimenta(b'data: c')
+    assert decodificador.finaliza()
+    decodificador.alimenta(b': keep-alive')
+    assert not decodificador.finaliza()
+
+
+def test_leitor_stream_chat_extrai_os_deltas():
+    """O leitor extrai o texto dos eventos, registra um token por delta e para em `[DONE]`."""
+    fluxo = evento_chat('Vamos') + b': keep-alive\r\n\r\n' + evento_chat(' pensar') + \
+        b'data: [DONE]\r\n\r\n' + evento_chat(' ignorado')
+    metricas = MetricasStream()
+    leitor = LeitorStreamChat(metricas)
+    deltas = []
+    for inicio in range(0, len(fluxo), 7):
+        deltas.extend(leitor.alimenta(fluxo[inicio:inicio + 7]))
+    assert ''.join(deltas) == 'Vamos pensar'
+    assert leitor.concluido
+    assert metricas.resumo()['tokens'] == 2
+    assert metricas.fim is not None
+
+
+def test_leitor_stream_chat_conta_eventos_invalidos():
+    """Eventos que não são JSON são contados e ignorados; eventos de erro da API lançam uma exceção."""
+    leitor = LeitorStreamChat()
+    assert leitor.alimenta(b'data: {quebrado\n\n' + evento_chat('ok')) == ['ok']
+    assert leitor.metricas.eventos_invalidos == 1
+    with pytest.raises(Exception, match='limite excedido'):
+        leitor.alimenta(b'data: {"error": {"message": "limite excedido"}}\n\n')
+
+
+# HEDGING ========================
+# Mensagens e chave de API das requisições simuladas.
+MENSAGENS = [{'role': 'user', 'content': 'O que é limite?'}]
+CHAVE = 'chave-de-teste'
+
+
+class RespostaFalsa:
+    """Resposta de streaming simulada, que envia os pedaços após um atraso e registra o seu fechamento."""
+
+    def __init__(self, pedacos: list, atraso: float = 0, intervalo: float = 0, status_code: int = 200):
+        self.pedacos = pedacos
+        self.atraso = atraso
+        self.intervalo = intervalo
+        self.status_code = status_code
+        self.headers = {}
+        self.fechada = False
+
+    def raise_for_status(self):
+        raise Exception(f'Erro {self.status_code}')
+
+    async def aiter_bytes(self):
+        await asyncio.sleep(self.atraso)
+        for pedaco in self.pedacos:
+            yield pedaco
+            await asyncio.sleep(self.intervalo)
+
+    async def aclose(self):
+        self.fechada = True
+
+
+class ClienteFalso:
+    """Cliente HTTP simulado, que devolve as respostas na ordem das requisições."""
+
+    def __init__(self, respostas: list):
+        self.respostas = respostas
+        self.enviadas = []
+
+    def build_request(self, metodo, url, **kwargs):
+        return metodo, url
+
+    async def send(self, requisicao, stream=False):
+        resposta = self.respostas[len(self.enviadas)]
+        self.enviadas.append(resposta)
+        return resposta
+
+
+def fluxo_chat(*conteudos: str) -> list:
+    """Gera os pedaços do streaming de uma resposta com os textos informados, terminada por `[DONE]`."""
+    return [evento_chat(conteudo) for conteudo in conteudos] + [b'data: [DONE]\n\n']
+
+
+@pytest.fixture
+def api_falsa(monkeypatch):
+    """Instala um cliente simulado com as respostas informadas, com um disjuntor novo."""
+    monkeypatch.setattr(utils_openai, '_DISJUNTORES', {})
+
+    def instala(*respostas):
+        cliente = ClienteFalso(list(respostas))
+        monkeypatch.setattr(utils_openai, 'obtem_cliente_assincrono', lambda: cliente)
+        return cliente
+    return instala
+
+
+@pytest.fixture
+def controle_hedging(monkeypatch):
+    """Substitui o controle do hedging do processo por um com limiar fixo e curto."""
+    controle = ControleHedging(ativo=True, limiar=0.05)
+    monkeypatch.setattr(utils_openai, '_CONTROLE_HEDGING', controle)
+    return controle
+
+
+async def consome(gerador) -> tuple:
+    """Consome um gerador assíncrono, retornando os itens e as vagas livres do semáforo da chave ao final."""
+    itens = [item async for item in gerador]
+    return itens, _semaforo_da_chave(CHAVE)._value
+
+
+def test_hedging_usa_a_duplicata_mais_rapida(api_falsa, controle_hedging):
+    """Se a original demora, a duplicata que começa primeiro é usada e a original é cancelada e fechada."""
+    original = RespostaFalsa(fluxo_chat('lenta'), atraso=5)
+    hedge = RespostaFalsa(fluxo_chat('Vamos', ' pensar'))
+    api_falsa(original, hedge)
+    metricas = MetricasStream()
+    itens, vagas = asyncio.run(consome(transmite_resposta_modelo_async(MENSAGENS, CHAVE, metricas=metricas,
+                                                                       hedging=True)))
+    assert itens == ['Vamos', ' pensar']
+    assert metricas.hedge == 'hedge'
+    assert original.fechada and hedge.fechada
+    assert vagas == utils_openai._CONFIG_ASYNC['max_concorrentes_por_chave']
+    assert controle_hedging.estatisticas['vitorias_hedge'] == 1
+
+
+def test_hedging_mantem_a_original_se_ela_comecar_primeiro(api_falsa, controle_hedging):
+    """Se a original começa antes da duplicata já enviada, a duplicata é cancelada e fechada."""
+    original = RespostaFalsa(fluxo_chat('original'), atraso=0.2)
+    hedge = RespostaFalsa(fluxo_chat('duplicada'), atraso=5)
+    api_falsa(original, hedge)
+    metricas = MetricasStream()
+    itens, vagas = asyncio.run(consome(transmite_resposta_modelo_async(MENSAGENS, CHAVE, metricas=metricas,
+                                                                       hedging=True)))
+    assert itens == ['original']
+    assert metricas.hedge == 'original'
+    assert original.fechada and hedge.fechada
+    assert vagas == utils_openai._CONFIG_ASYNC['max_concorrentes_por_chave']
+    assert controle_hedging.estatisticas == {'requisicoes': 1, 'hedges': 1, 'vitorias_hedge': 0,
+                                             'vitorias_original': 1, 'suprimidos': 0}
+
+
+def test_hedging_suprimido_pela_taxa_maxima(api_falsa, controle_hedging):
+    """Com a taxa de duplicatas na janela acima de `taxa_maxima`, nenhuma duplicata é enviada."""
+    controle_hedging.taxa_maxima = 0.5
+    controle_hedging.registra(1.0, True, 'hedge')
+    cliente = api_falsa(RespostaFalsa(fluxo_chat('original'), atraso=0.2))
+    metricas = MetricasStream()
+    itens, _ = asyncio.run(consome(transmite_resposta_modelo_async(MENSAGENS, CHAVE, metricas=metricas,
+                                                                   hedging=True)))
+    assert itens == ['original']
+    assert len(cliente.enviadas) == 1
+    assert metricas.hedge is None
+    assert controle_hedging.estatisticas['suprimidos'] == 1
+
+
+def test_hedging_interrompido_pelo_consumidor(api_falsa, controle_hedging):
+    """Fechar o gerador síncrono de `itera_em_segundo_plano` fecha as duas respostas e libera as vagas."""
+    chave = 'chave-interrompida'
+    original = RespostaFalsa(fluxo_chat('lenta'), atraso=5)
+    hedge = RespostaFalsa(fluxo_chat(*['pedaço'] * 100), intervalo=0.01)
+    api_falsa(original, hedge)
+    deltas = itera_em_segundo_plano(transmite_resposta_modelo_async(MENSAGENS, chave, hedging=True))
+    assert next(deltas) == 'pedaço'
+    deltas.close()
+    assert original.fechada and hedge.fechada
+
+    async def vagas_livres():
+        return _semaforo_da_chave(chave)._value
+    assert executa_em_segundo_plano(vagas_livres()) == utils_openai._CONFIG_ASYNC['max_concorrentes_por_chave']
+
+
+# REQUISIÇÕES ASSÍNCRONAS ========================
+
+def test_semaforo_ocupado_apos_sucesso(api_falsa):
+    """Com sucesso, a vaga permanece ocupada até quem chamou liberá-la."""
+    async def envia_e_conta():
+        semaforo = asyncio.Semaphore(2)
+        resposta = await envia_com_retentativas_async(
+            lambda timeout: asyncio.sleep(0, RespostaFalsa([])), semaforo, 1)
+        return resposta.status_code, semaforo._value
+    assert asyncio.run(envia_e_conta()) == (200, 1)
+
+
+def test_semaforo_liberado_apos_falhas(api_falsa, monkeypatch):
+    """Cada tentativa que falha fecha a resposta e libera a vaga, inclusive a última."""
+    monkeypatch.setattr(utils_openai, '_POLITICA_RETENTATIVAS', PoliticaRetentativas(espera_base=0.01))
+    respostas = [RespostaFalsa([], status_code=503) for _ in range(3)]
+
+    async def envia_e_conta():
+        semaforo = asyncio.Semaphore(2)
+        with pytest.raises(Exception, match='Erro 503 persistente'):
+            await envia_com_retentativas_async(lambda timeout: asyncio.sleep(0, respostas.pop()), semaforo, 3)
+        return semaforo._value
+    assert asyncio.run(envia_e_conta()) == 2
+    assert respostas == []
+
+
+def test_semaforo_liberado_com_erro_nao_repetivel(api_falsa):
+    """Um erro não repetível é lançado sem novas tentativas, com a resposta fechada e a vaga liberada."""
+    resposta = RespostaFalsa([], status_code=401)
+
+    async def envia_e_conta():
+        semaforo = asyncio.Semaphore(2)
+        with pytest.raises(Exception, match='Erro 401'):
+            await envia_com_retentativas_async(lambda timeout: asyncio.sleep(0, resposta), semaforo)
+        return semaforo._value
+    assert asyncio.run(envia_e_conta()) == 2
+    assert resposta.fechada
+
+
+def test_semaforo_liberado_no_cancelamento(api_falsa):
+    """O cancelamento durante a requisição libera a vaga."""
+    async def cancela_e_conta():
+        semaforo = asyncio.Semaphore(2)
+        tarefa = asyncio.ensure_future(envia_com_retentativas_async(lambda timeout: asyncio.sleep(10), semaforo))
+        await asyncio.sleep(0.01)
+        assert semaforo._value == 1
+        tarefa.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await tarefa
+        return semaforo._value
+    assert asyncio.run(cancela_e_conta()) == 2
+
+
+def test_itera_em_segundo_plano_fecha_o_gerador():
+    """Interromper o consumo síncrono fecha o gerador assíncrono no laço de segundo plano."""
+    eventos = []
+
+    async def gerador():
+        try:
+            for numero in range(100):
+                yield numero
+                await asyncio.sleep(0)
+        finally:
+            eventos.append('fechado')
+
+    itens = itera_em_segundo_plano(gerador())
+    assert [next(itens), next(itens)] == [0, 1]
+    itens.close()
+    assert eventos == ['fechado']
+    assert list(itera_em_segundo_plano(gerador())) == list(range(100))
+    assert eventos == ['fechado', 'fechado']
+
+
+# API SÍNCRONA ========================
+
+class RespostaSincronaFalsa:
+    """Resposta simulada da sessão HTTP síncrona, que registra o seu fechamento."""
+
+    def __init__(self, corpo=None, pedacos: list = ()):
+        self.status_code = 200
+        self.headers = {}
+        self.corpo = corpo
+        self.pedacos = pedacos
+        self.fechada = False
+
+    def json(self):
+        return self.corpo
+
+    def iter_content(self, chunk_size=None):
+        yield from self.pedacos
+
+    def close(self):
+        self.fechada = True
+
+
+@pytest.fixture
+def sessao_falsa(monkeypatch):
+    """Substitui a sessão HTTP do processo por uma que devolve a resposta informada e registra as requisições."""
+    monkeypatch.setattr(utils_openai, '_DISJUNTORES', {})
+    requisicoes = []
+
+    def instala(resposta):
+        class SessaoFalsa:
+            def post(self, url, **kwargs):
+                requisicoes.append((url, kwargs))
+                return resposta
+        monkeypatch.setattr(utils_openai, 'obtem_sessao_http', SessaoFalsa)
+        return requisicoes
+    return instala
+
+
+def test_endereco_base_api(monkeypatch):
+    """O endereço configurado tem precedência sobre OPENAI_BASE_URL, que tem precedência sobre o padrão."""
+    monkeypatch.delenv('OPENAI_BASE_URL', raising=False)
+    monkeypatch.setitem(utils_openai._CONFIG_HTTP, 'base_url', '')
+    assert url_api('chat/completions') == 'https://api.openai.com/v1/chat/completions'
+    monkeypatch.setenv('OPENAI_BASE_URL', 'http://ambiente/v1')
+    assert endereco_base_api() == 'http://ambiente/v1'
+    monkeypatch.setitem(utils_openai._CONFIG_HTTP, 'base_url', 'http://proxy/v1/')
+    assert endereco_base_api() == 'http://proxy/v1'
+    assert url_api('/audio/transcriptions') == 'http://proxy/v1/audio/transcriptions'
+
+
+def test_retorna_resposta_modelo_sem_streaming(sessao_falsa):
+    """A resposta completa é retornada diretamente, e não por um gerador."""
+    corpo = {'choices': [{'message': {'role': 'assistant', 'content': 'Vamos pensar juntos.'}}]}
+    requisicoes = sessao_falsa(RespostaSincronaFalsa(corpo))
+    assert retorna_resposta_modelo(MENSAGENS, CHAVE) == corpo
+    assert requisicoes[0][1]['json']['stream'] is False
+
+
+def test_transmite_resposta_modelo(sessao_falsa):
+    """Os pedaços de texto são decodificados do fluxo, e a resposta é fechada ao final."""
+    resposta = RespostaSincronaFalsa(pedacos=fluxo_chat('Vamos', ' pensar'))
+    requisicoes = sessao_falsa(resposta)
+    metricas = MetricasStream()
+    assert list(transmite_resposta_modelo(MENSAGENS, CHAVE, metricas=metricas)) == ['Vamos', ' pensar']
+    assert requisicoes[0][1]['json']['stream'] is True
+    assert resposta.fechada
+    assert metricas.resumo()['tokens'] == 2
@@ -0,0 +1,338 @@
+# --- File: test_utils_recuperacao.py --- #
+# Testes do índice lexical, da busca vetorial restrita, da recuperação híbrida, do orçamento de tokens do contexto
+# e da reordenação (`utils_recuperacao.py`).
+#
+# Uso:
+#   python -m pytest -q test_utils_recuperacao.py
+
+# --- Libraries --- #
+from typing import List  # Tipos usados na declaração do recuperador de teste.
+
+import numpy as np  # Biblioteca para geração dos vetores de teste.
+import pytest  # Framework de testes, usado nas fixtures.
+# Interface dos modelos de embedding utilizada pelo LangChain.
+from langchain_core.embeddings import Embeddings
+# Implementação de referência do MMR, com que o MMR vetorizado é comparado.
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+# Interface de recuperadores utilizada pelas cadeias do LangChain.
+from langchain_core.retrievers import BaseRetriever
+# Interface dos callbacks do LangChain, usada para verificar a propagação aos recuperadores base.
+from langchain_core.callbacks import BaseCallbackHandler
+# Estrutura de documento utilizada pelo LangChain.
+from langchain_core.documents import Document
+
+import utils_recuperacao
+from utils_indice import adiciona_documentos_ao_vector_store, cria_vector_store_vazio, descreve_indice
+from utils_recuperacao import (IndiceBM25, RecuperadorComOrcamentoDeTokens, RecuperadorComReranqueamento,
+                               busca_mmr_em_lote, funde_rrf, mmr_vetorizado, tokeniza_texto)
+
+# --- Attributes --- #
+# Modelo fictício, com um tokenizador em que cada palavra é um token.
+MODELO_TESTE = 'modelo-de-teste'
+# Dimensão dos embeddings de teste.
+DIMENSAO_TESTE = 16
+# Parâmetros pequenos o bastante para treinar todos os tipos de índice com poucos vetores.
+INDICE_KWARGS_TESTE = {'nlist': 4, 'nprobe': 4, 'hnsw_m': 8, 'ef_search': 64, 'pq_m': 4, 'pq_bits': 4}
+# Todas as combinações de tipo de índice e quantização aceitas por `descreve_indice`.
+VARIANTES_INDICE = [(tipo, quantizacao) for tipo in ('flat', 'ivf', 'hnsw')
+                    for quantizacao in ('nenhuma', 'sq8', 'sq4', 'pq')]
+
+
+# --- Methods --- #
+
+def cria_trecho(texto: str, doc_id: str) -> Document:
+    """Cria um trecho com o `doc_id` atribuído pela ingestão."""
+    return Document(page_content=texto, metadata={'source': doc_id.split(':')[0], 'doc_id': doc_id})
+
+
+def cria_indice_bm25() -> IndiceBM25:
+    """Cria um índice lexical com três trechos."""
+    indice_bm25 = IndiceBM25()
+    indice_bm25.adiciona([
+        cria_trecho('A derivada parcial de uma função de várias variáveis.', 'calculo.pdf:0'),
+        cria_trecho('O Teorema 3.2 garante a existência do limite.', 'calculo.pdf:1'),
+        cria_trecho('Uma matriz invertível tem determinante diferente de zero.', 'algebra.pdf:0'),
+    ])
+    return indice_bm25
+
+
+# ÍNDICE LEXICAL ========================
+
+def test_tokeniza_sem_acentos_e_sem_stopwords():
+    """Os termos ficam em minúsculas, sem acentos e sem stopwords, e números com ponto são mantidos."""
+    assert tokeniza_texto('Teorema 3.2: a Função inversa') == ['teorema', '3.2', 'funcao', 'inversa']
+
+
+def test_busca_ordena_pela_pontuacao():
+    """A busca retorna primeiro o trecho que contém os termos da consulta."""
+    resultados = cria_indice_bm25().busca('derivada parcial', 2)
+    assert [doc_id for doc_id, _ in resultados] == ['calculo.pdf:0']
+    assert resultados[0][1] > 0
+
+
+def test_busca_ignora_acentos_da_consulta():
+    """Consultas com e sem acentos encontram os mesmos trechos."""
+    indice_bm25 = cria_indice_bm25()
+    assert indice_bm25.busca('matriz invertivel', 1) == indice_bm25.busca('matriz invertível', 1)
+
+
+def test_busca_restrita_aos_ids_permitidos():
+    """Trechos fora de `ids_permitidos` não são retornados."""
+    resultados = cria_indice_bm25().busca('teorema matriz', 5, ids_permitidos={'algebra.pdf:0'})
+    assert [doc_id for doc_id, _ in resultados] == ['algebra.pdf:0']
+
+
+def test_remove_trechos_e_termos_orfaos():
+    """Remover trechos atualiza o vocabulário e o comprimento total do índice."""
+    indice_bm25 = cria_indice_bm25()
+    indice_bm25.remove(['algebra.pdf:0', 'inexistente.pdf:0'])
+    assert indice_bm25.busca('matriz', 5) == []
+    assert not indice_bm25.conhece_termos(['matriz'])
+    assert indice_bm25.comprimento_total == sum(indice_bm25.comprimentos.values())
+
+
+def test_adiciona_substitui_trecho_existente():
+    """Adicionar um trecho com um `doc_id` já indexado substitui o conteúdo anterior."""
+    indice_bm25 = cria_indice_bm25()
+    indice_bm25.adiciona([cria_trecho('Séries de potências convergentes.', 'calculo.pdf:0')])
+    assert indice_bm25.busca('derivada', 5) == []
+    assert [doc_id for doc_id, _ in indice_bm25.busca('series', 5)] == ['calculo.pdf:0']
+    assert len(indice_bm25.comprimentos) == 3
+
+
+def test_conhece_termos():
+    """Apenas consultas com todos os termos no vocabulário são reconhecidas."""
+    indice_bm25 = cria_indice_bm25()
+    assert indice_bm25.conhece_termos(tokeniza_texto('Teorema 3.2'))
+    assert not indice_bm25.conhece_termos(tokeniza_texto('Teorema 4.1'))
+    assert not indice_bm25.conhece_termos([])
+
+
+def test_salva_e_carrega(tmp_path):
+    """Um índice gravado e lido de volta retorna as mesmas buscas."""
+    indice_bm25 = cria_indice_bm25()
+    indice_bm25.salva(tmp_path / 'bm25.json')
+    carregado = IndiceBM25.carrega(tmp_path / 'bm25.json')
+    assert carregado.busca('derivada teorema', 3) == indice_bm25.busca('derivada teorema', 3)
+    assert carregado.comprimento_total == indice_bm25.comprimento_total
+
+
+# BUSCA VETORIAL ========================
+
+class EmbeddingsDeTeste(Embeddings):
+    """Modelo de embedding de teste, que sorteia um vetor fixo para cada texto numérico."""
+
+    def embed_documents(self, texts: list) -> list:
+        return [self.embed_query(texto) for texto in texts]
+
+    def embed_query(self, text: str) -> list:
+        return np.random.default_rng(int(text)).standard_normal(DIMENSAO_TESTE).astype(np.float32).tolist()
+
+
+class EmbeddingsNormalizadasDeTeste(EmbeddingsDeTeste):
+    """Modelo de embedding de teste com vetores de norma 1, como os da OpenAI."""
+
+    def embed_query(self, text: str) -> list:
+        vetor = np.asarray(super().embed_query(text))
+        return (vetor / np.linalg.norm(vetor)).tolist()
+
+
+def cria_vector_store_de_teste(indice_tipo: str, quantizacao: str, quantidade: int = 400,
+                               embedding_model: Embeddings = None):
+    """Cria um índice do tipo informado com `quantidade` trechos, cujo `doc_id` é a posição no índice."""
+    embedding_model = embedding_model or EmbeddingsDeTeste()
+    documentos = [Document(page_content=str(posicao), metadata={'doc_id': str(posicao), 'source': 'a.pdf'})
+                  for posicao in range(quantidade)]
+    vetores = embedding_model.embed_documents([doc.page_content for doc in documentos])
+    vector_store = cria_vector_store_vazio(embedding_model, vetores, indice_tipo,
+                                           {**INDICE_KWARGS_TESTE, 'quantizacao': quantizacao})
+    adiciona_documentos_ao_vector_store(vector_store, documentos, vetores)
+    return vector_store
+
+
+@pytest.mark.parametrize('indice_tipo,quantizacao', VARIANTES_INDICE)
+@pytest.mark.parametrize('lambda_mult', [0.5, 1.0])
+@pytest.mark.parametrize('restrita', [False, True])
+def test_busca_em_todos_os_tipos_de_indice(indice_tipo, quantizacao, lambda_mult, restrita):
+    """A busca, com MMR ou por similaridade, funciona em todos os tipos de índice, com ou sem escopo."""
+    vector_store = cria_vector_store_de_teste(indice_tipo, quantizacao)
+    posicoes = np.arange(0, 400, 3) if restrita else None
+    resultados = busca_mmr_em_lote(vector_store, ['9', '300'], k=5, fetch_k=20, lambda_mult=lambda_mult,
+                                   posicoes=posicoes, parametros_busca=INDICE_KWARGS_TESTE)
+    assert [len(documentos) for documentos in resultados] == [5, 5]
+    if restrita:
+        assert all(int(doc.metadata['doc_id']) % 3 == 0 for documentos in resultados for doc in documentos)
+    if lambda_mult == 1.0 and quantizacao == 'nenhuma':
+        # Sem quantização, o vizinho mais próximo de um vetor do índice é ele mesmo.
+        assert [documentos[0].metadata['doc_id'] for documentos in resultados] == ['9', '300']
+
+
+def test_mmr_vetorizado_exemplo():
+    """O primeiro selecionado é o mais relevante; o segundo, o mais diverso."""
+    consultas = np.array([[1.0, 0.2]])
+    candidatos = np.array([[[1.0, 0.0], [1.0, 0.1], [0.0, 1.0]]])
+    assert mmr_vetorizado(consultas, candidatos, 2).tolist() == [[1, 2]]
+
+
+@pytest.mark.parametrize('lambda_mult', [0.0, 0.3, 0.5, 1.0])
+def test_mmr_vetorizado_igual_ao_do_langchain(lambda_mult):
+    """Cada consulta do lote seleciona os mesmos candidatos, na mesma ordem, que `maximal_marginal_relevance`."""
+    gerador = np.random.default_rng(0)
+    consultas = gerador.standard_normal((4, 8)).astype(np.float32)
+    candidatos = gerador.standard_normal((4, 30, 8)).astype(np.float32)
+    selecionados = mmr_vetorizado(consultas, candidatos, 6, lambda_mult)
+    assert selecionados.tolist() == [maximal_marginal_relevance(consulta, list(candidatos_consulta), lambda_mult, 6)
+                                     for consulta, candidatos_consulta in zip(consultas, candidatos)]
+
+
+def test_mmr_vetorizado_ignora_candidatos_invalidos():
+    """Candidatos fora da máscara `validos` não são selecionados; as posições que faltam ficam com -1."""
+    gerador = np.random.default_rng(1)
+    candidatos = gerador.standard_normal((2, 5, 4))
+    validos = np.array([[True, False, True, False, True], [False, True, False, False, False]])
+    selecionados = mmr_vetorizado(gerador.standard_normal((2, 4)), candidatos, 4, validos=validos)
+    assert sorted(selecionados[0][:3].tolist()) == [0, 2, 4] and selecionados[0][3] == -1
+    assert selecionados[1].tolist() == [1, -1, -1, -1]
+
+
+@pytest.mark.parametrize('lambda_mult', [0.0, 0.5, 1.0])
+def test_busca_mmr_em_lote_igual_a_do_langchain(lambda_mult):
+    """Com vetores normalizados, a busca em lote retorna os mesmos documentos que o MMR do LangChain."""
+    vector_store = cria_vector_store_de_teste('flat', 'nenhuma', embedding_model=EmbeddingsNormalizadasDeTeste())
+    # Consultas fora do índice, para que nenhuma coincida com um candidato e empate as pontuações.
+    consultas = [str(numero) for numero in range(1000, 1020)]
+    resultados = busca_mmr_em_lote(vector_store, consultas, k=5, fetch_k=20, lambda_mult=lambda_mult)
+    for consulta, documentos in zip(consultas, resultados):
+        esperados = vector_store.max_marginal_relevance_search(consulta, k=5, fetch_k=20, lambda_mult=lambda_mult)
+        assert [doc.metadata['doc_id'] for doc in documentos] == [doc.metadata['doc_id'] for doc in esperados]
+
+
+def test_variantes_de_indice_distintas():
+    """Cada combinação de tipo e quantização gera uma descrição de índice diferente."""
+    descricoes = {descreve_indice(tipo, {**INDICE_KWARGS_TESTE, 'quantizacao': quantizacao}, 400)
+                  for tipo, quantizacao in VARIANTES_INDICE}
+    assert len(descricoes) == len(VARIANTES_INDICE)
+
+
+# FUSÃO ========================
+
+def test_funde_rrf():
+    """Documentos bem colocados em várias listas sobem na fusão."""
+    assert funde_rrf([['a', 'b', 'c'], ['c', 'a']]) == ['a', 'c', 'b']
+    assert funde_rrf([]) == []
+
+
+# ORÇAMENTO DE TOKENS ========================
+
+class CodificadorPorPalavras:
+    """Tokenizador de teste em que cada palavra é um token, dispensando o download das tabelas do tiktoken."""
+
+    def encode(self, texto: str, disallowed_special=()) -> list:
+        return texto.split()
+
+    def decode(self, tokens: list) -> str:
+        return ' '.join(tokens)
+
+
+class RecuperadorFixo(BaseRetriever):
+    """Recuperador de teste que sempre retorna os mesmos documentos."""
+
+    documentos: list
+
+    def _get_relevant_documents(self, query: str, *, run_manager) -> List[Document]:
+        return self.documentos
+
+
+class RegistroRecuperadores(BaseCallbackHandler):
+    """Callback de teste que registra as consultas recebidas por cada recuperador."""
+
+    def __init__(self):
+        self.consultas = []
+
+    def on_retriever_start(self, serialized, query, **kwargs):
+        self.consultas.append(query)
+
+
+class MemoriaFixa:
+    """Memória de conversa de teste, com o histórico já formatado."""
+
+    def __init__(self, buffer_as_str: str):
+        self.buffer_as_str = buffer_as_str
+
+
+@pytest.fixture(autouse=True)
+def codificador_por_palavras(monkeypatch):
+    """Registra o tokenizador de teste para `MODELO_TESTE`."""
+    monkeypatch.setitem(utils_recuperacao._CODIFICADORES, MODELO_TESTE, CodificadorPorPalavras())
+
+
+def cria_recuperador_com_orcamento(tamanhos: list, **kwargs) -> RecuperadorComOrcamentoDeTokens:
+    """Cria um recuperador com orçamento sobre documentos com as quantidades de palavras informadas."""
+    documentos = [Document(page_content=' '.join(['palavra'] * tamanho), metadata={'doc_id': f'a.pdf:{indice}'})
+                  for indice, tamanho in enumerate(tamanhos)]
+    return RecuperadorComOrcamentoDeTokens(base_retriever=RecuperadorFixo(documentos=documentos),
+                                           modelo=MODELO_TESTE, **kwargs)
+
+
+def test_orcamento_inclui_documentos_que_cabem():
+    """Documentos que cabem no orçamento são enviados inteiros, em ordem."""
+    retriever = cria_recuperador_com_orcamento([10, 20], orcamento_tokens=50, min_tokens_trecho=5)
+    documentos = retriever.invoke('limite')
+    assert [doc.metadata['doc_id'] for doc in documentos] == ['a.pdf:0', 'a.pdf:1']
+    assert retriever.estatisticas == {'orcamento': 50, 'tokens_recuperados': 30, 'tokens_enviados': 30,
+                                      'trechos_truncados': 0, 'trechos_descartados': 0}
+
+
+def test_orcamento_trunca_e_descarta():
+    """O documento que não cabe é truncado no espaço restante e os seguintes são descartados."""
+    retriever = cria_recuperador_com_orcamento([30, 30, 30], orcamento_tokens=50, min_tokens_trecho=5)
+    documentos = retriever.invoke('limite')
+    assert len(documentos) == 2
+    assert len(documentos[1].page_content.split()) == 20
+    assert documentos[1].metadata == {'doc_id': 'a.pdf:1', 'truncado': True}
+    assert retriever.estatisticas['tokens_enviados'] == 50
+    assert retriever.estatisticas['trechos_truncados'] == 1
+    assert retriever.estatisticas['trechos_descartados'] == 1
+
+
+def test_orcamento_descarta_sobra_menor_que_o_minimo():
+    """Um espaço restante menor que `min_tokens_trecho` não recebe um documento truncado."""
+    retriever = cria_recuperador_com_orcamento([45, 30], orcamento_tokens=50, min_tokens_trecho=10)
+    assert len(retriever.invoke('limite')) == 1
+    assert retriever.estatisticas['trechos_descartados'] == 1
+
+
+def test_orcamento_propaga_os_callbacks():
+    """Os callbacks da consulta chegam ao recuperador base."""
+    registro = RegistroRecuperadores()
+    cria_recuperador_com_orcamento([5]).invoke('limite', config={'callbacks': [registro]})
+    assert registro.consultas == ['limite', 'limite']
+
+
+def test_orcamento_limitado_pela_janela_do_modelo():
+    """O prompt, o histórico e a reserva da resposta reduzem o orçamento dentro da janela do modelo."""
+    retriever = cria_recuperador_com_orcamento([], orcamento_tokens=3000, janela_modelo=100, reserva_resposta=40,
+                                               prompt='uma duas tres', memory=MemoriaFixa('quatro cinco'))
+    assert retriever.calcula_orcamento() == 55
+    retriever.janela_modelo = 10
+    assert retriever.calcula_orcamento() == 0
+
+
+# REORDENAÇÃO ========================
+
+def test_reranqueamento_lexico():
+    """O método lexical ordena pela sobreposição de termos e mantém `top_n` documentos."""
+    documentos = [cria_trecho('integral definida de funções contínuas', 'a.pdf:0'),
+                  cria_trecho('derivada parcial de funções de várias variáveis', 'a.pdf:1'),
+                  cria_trecho('derivada de funções de uma variável', 'a.pdf:2')]
+    retriever = RecuperadorComReranqueamento(base_retriever=RecuperadorFixo(documentos=documentos), top_n=2)
+    assert [doc.metadata['doc_id'] for doc in retriever.invoke('derivada parcial')] == ['a.pdf:1', 'a.pdf:2']
+    assert retriever.estatisticas['consultas'] == 1
+
+
+def test_reranqueamento_propaga_os_callbacks():
+    """Os callbacks da consulta chegam ao recuperador base."""
+    registro = RegistroRecuperadores()
+    retriever = RecuperadorComReranqueamento(base_retriever=RecuperadorFixo(documentos=[]))
+    retriever.invoke('derivada parcial', config={'callbacks': [registro]})
+    assert registro.consultas == ['derivada parcial', 'derivada parcial']
@@ -0,0 +1,74 @@
+# --- File: test_utils_respostas.py --- #
+# Testes do cache semântico de respostas (`utils_respostas.py`).
+#
+# Uso:
+#   python -m pytest -q test_utils_respostas.py
+
+# --- Libraries --- #
+import utils_respostas
+from utils_respostas import CacheRespostas, calcula_chave_contexto
+
+# --- Attributes --- #
+# Saída da cadeia de conversação gravada nos testes.
+RESPOSTA = {'answer': 'Vamos pensar juntos: o que acontece com f(x) quando x se aproxima de a?',
+            'source_documents': []}
+
+
+# --- Methods --- #
+
+def test_reaproveita_pergunta_parecida():
+    """Uma pergunta com embedding acima do limiar de similaridade reaproveita a resposta."""
+    cache = CacheRespostas(limiar=0.95)
+    cache.grava('corpus', 'contexto', [1.0, 0.0], 'O que é limite?', RESPOSTA)
+    resposta = cache.busca('contexto', [10.0, 0.5])
+    assert resposta == {'question': 'O que é limite?', **RESPOSTA}
+    assert cache.estatisticas['acertos'] == 1
+
+
+def test_ignora_pergunta_abaixo_do_limiar():
+    """Uma pergunta pouco parecida não reaproveita a resposta."""
+    cache = CacheRespostas(limiar=0.95)
+    cache.grava('corpus', 'contexto', [1.0, 0.0], 'O que é limite?', RESPOSTA)
+    assert cache.busca('contexto', [1.0, 1.0]) is None
+    assert cache.estatisticas['faltas'] == 1
+
+
+def test_separa_respostas_por_contexto():
+    """Respostas de outro corpus, prompt ou modelo não são reaproveitadas."""
+    cache = CacheRespostas()
+    chave = calcula_chave_contexto('corpus', 'prompt', 'gpt-4-turbo')
+    cache.grava('corpus', chave, [1.0, 0.0], 'O que é limite?', RESPOSTA)
+    assert cache.busca(calcula_chave_contexto('corpus', 'prompt', 'gpt-4o-mini'), [1.0, 0.0]) is None
+    assert cache.busca(chave, [1.0, 0.0]) is not None
+
+
+def test_descarta_respostas_expiradas(monkeypatch):
+    """Respostas mais antigas que `ttl_segundos` não são reaproveitadas."""
+    agora = [1000.0]
+    monkeypatch.setattr(utils_respostas.time, 'time', lambda: agora[0])
+    cache = CacheRespostas(ttl_segundos=60)
+    cache.grava('corpus', 'contexto', [1.0, 0.0], 'O que é limite?', RESPOSTA)
+    agora[0] += 61
+    assert cache.busca('contexto', [1.0, 0.0]) is None
+
+
+def test_descarta_as_menos_usadas_acima_da_capacidade():
+    """Acima da capacidade, a resposta usada há mais tempo é descartada."""
+    cache = CacheRespostas(capacidade=2)
+    cache.grava('corpus', 'contexto', [1.0, 0.0, 0.0], 'a', RESPOSTA)
+    cache.grava('corpus', 'contexto', [0.0, 1.0, 0.0], 'b', RESPOSTA)
+    cache.busca('contexto', [1.0, 0.0, 0.0])
+    cache.grava('corpus', 'contexto', [0.0, 0.0, 1.0], 'c', RESPOSTA)
+    assert cache.busca('contexto', [0.0, 1.0, 0.0]) is None
+    assert cache.busca('contexto', [1.0, 0.0, 0.0])['question'] == 'a'
+
+
+def test_invalida_respostas_do_corpus():
+    """Invalidar um corpus remove apenas as respostas geradas a partir dele."""
+    cache = CacheRespostas()
+    cache.grava('antigo', 'contexto_antigo', [1.0, 0.0], 'a', RESPOSTA)
+    cache.grava('novo', 'contexto_novo', [1.0, 0.0], 'b', RESPOSTA)
+    assert cache.invalida('antigo') == 1
+    assert cache.busca('contexto_antigo', [1.0, 0.0]) is None
+    assert cache.busca('contexto_novo', [1.0, 0.0]) is not None
+    assert cache.estatisticas['invalidadas'] == 1
@@ -0,0 +1,268 @@
+# --- File: utils_condensacao.py --- #
+
+# --- Libraries --- #
+import re  # Biblioteca de expressões regulares, usada na divisão da pergunta em palavras.
+import hashlib  # Biblioteca para cálculo de hashes criptográficos.
+import threading  # Biblioteca para sincronização entre threads.
+import unicodedata  # Biblioteca para normalização Unicode da pergunta.
+from collections import OrderedDict  # Dicionário ordenado usado como fila LRU.
+from typing import Any, Dict, Optional  # Tipos usados na declaração dos campos e métodos da cadeia.
+
+# Cadeia de chamada ao modelo de linguagem, usada pelo LangChain para condensar a pergunta.
+from langchain.chains.llm import LLMChain
+# Gerenciadores de callbacks repassados pelo LangChain durante a execução da cadeia.
+from langchain_core.callbacks import AsyncCallbackManagerForChainRun, CallbackManagerForChainRun
+# Declaração de campos com valor padrão mutável.
+from langchain_core.pydantic_v1 import Field
+
+# --- Attributes --- #
+# Palavras que remetem a algo dito antes na conversa, comparadas com as palavras da pergunta em minúsculas e
+# com acentos, para que "esta" não coincida com "está".
+MARCADORES_REFERENCIA = frozenset('''
+isso isto aquilo esse essa esses essas este esta estes estas aquele aquela aqueles aquelas
+disso disto daquilo nisso nisto naquilo desse dessa desses dessas deste desta destes destas
+naquele naquela ele ela eles elas dele dela deles delas nele nela neles nelas
+anterior anteriores acima último última últimos últimas ultimo ultima ultimos ultimas outro outra outros outras
+continue continua prossiga resposta respostas exemplo exemplos
+'''.split())
+# Inícios de frase que continuam o raciocínio da mensagem anterior, comparados com a pergunta em minúsculas e
+# com acentos, para que "é" não coincida com "e".
+INICIOS_CONTINUACAO = ('e ', 'mas ', 'então', 'entao', 'e se', 'por que', 'porque', 'ou seja', 'tipo ', 'agora ')
+# Palavras, inclusive números, da pergunta.
+PADRAO_PALAVRA = re.compile(r'\w+')
+# Caches de condensações, compartilhados por todas as sessões do processo.
+_CACHES_CONDENSACAO = {}
+_LOCK_CACHES_CONDENSACAO = threading.Lock()
+
+
+# --- Methods --- #
+# HEURÍSTICA ========================
+
+def pergunta_autocontida(pergunta: str, min_palavras: int = 6) -> bool:
+    """
+    Indica, por uma heurística local, se uma pergunta pode ser respondida sem o histórico da conversa.
+
+    A pergunta é considerada autocontida quando tem pelo menos `min_palavras` palavras, não começa
+    continuando a mensagem anterior ("e se...", "mas...") e não contém pronomes ou termos que remetem ao que
+    já foi dito ("isso", "dele", "o exemplo anterior"). A comparação preserva os acentos, de modo que "É
+    possível..." e "Onde está..." não são confundidas com "e" e "esta".
+
+    Parâmetros:
+    \n\t`pergunta (str)`: Pergunta do aluno.
+    \n\t`min_palavras (int)`: Quantidade mínima de palavras de uma pergunta autocontida (padrão: `6`).
+
+    Retorno:
+    \n\t`bool`: `True` se a pergunta dispensa a condensação.
+
+    Exemplo:
+    >>> pergunta_autocontida('Qual é a definição formal de limite de uma função?')
+    True
+    >>> pergunta_autocontida('E se a função não for contínua nesse ponto?')
+    False
+    >>> pergunta_autocontida('É possível derivar uma função que não é contínua?')
+    True
+    """
+    texto = unicodedata.normalize('NFC', pergunta.lower().strip())
+    palavras = PADRAO_PALAVRA.findall(texto)
+    if len(palavras) < min_palavras:
+        return False
+    if texto.startswith(INICIOS_CONTINUACAO):
+        return False
+    return not MARCADORES_REFERENCIA.intersection(palavras)
+
+
+# CACHE DE CONDENSAÇÕES ========================
+
+class CacheCondensacoes:
+    """
+    Cache LRU das perguntas condensadas, indexado pelo modelo, pelo histórico e pela pergunta originais.
+
+    Exemplo:
+    >>> cache = CacheCondensacoes(capacidade=1024)
+    >>> cache.grava(chave, 'Qual é a derivada de x² em relação a x?')
+    >>> cache.busca(chave)
+    'Qual é a derivada de x² em relação a x?'
+    """
+
+    def __init__(self, capacidade: int = 1024):
+        """
+        Parâmetros:
+        \n\t`capacidade (int)`: Quantidade máxima de condensações mantidas (padrão: `1024`).
+        """
+        self.capacidade = capacidade
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def calcula_chave(modelo: str, historico: str, pergunta: str) -> str:
+        """
+        Calcula a chave de uma condensação.
+
+        Parâmetros:
+        \n\t`modelo (str)`: Modelo que condensa a pergunta.
+        \n\t`historico (str)`: Histórico da conversa, já formatado.
+        \n\t`pergunta (str)`: Pergunta do aluno.
+
+        Retorno:
+        \n\t`str`: Hash hexadecimal da condensação.
+        """
+        return hashlib.sha256(f'{modelo}\0{historico}\0{pergunta}'.encode('utf-8')).hexdigest()
+
+    def busca(self, chave: str):
+        """
+        Busca uma pergunta condensada.
+
+        Parâmetros:
+        \n\t`chave (str)`: Chave calculada por `calcula_chave`.
+
+        Retorno:
+        \n\t`str | None`: Pergunta condensada, ou `None` se não estiver no cache.
+        """
+        with self._lock:
+            if chave not in self._entradas:
+                return None
+            self._entradas.move_to_end(chave)
+            return self._entradas[chave]
+
+    def grava(self, chave: str, pergunta_condensada: str) -> None:
+        """
+        Grava uma pergunta condensada, descartando as menos usadas acima da capacidade.
+
+        Parâmetros:
+        \n\t`chave (str)`: Chave calculada por `calcula_chave`.
+        \n\t`pergunta_condensada (str)`: Pergunta reescrita pelo modelo.
+        """
+        with self._lock:
+            self._entradas[chave] = pergunta_condensada
+            self._entradas.move_to_end(chave)
+            while len(self._entradas) > self.capacidade:
+                self._entradas.popitem(last=False)
+
+
+def obtem_cache_condensacoes(capacidade: int = 1024) -> CacheCondensacoes:
+    """
+    Retorna o cache de condensações do processo, criando-o na primeira chamada.
+
+    Parâmetros:
+    \n\t`capacidade (int)`: Quantidade máxima de condensações mantidas (padrão: `1024`).
+
+    Retorno:
+    \n\t`CacheCondensacoes`: O cache compartilhado.
+    """
+    with _LOCK_CACHES_CONDENSACAO:
+        if capacidade not in _CACHES_CONDENSACAO:
+            _CACHES_CONDENSACAO[capacidade] = CacheCondensacoes(capacidade)
+        return _CACHES_CONDENSACAO[capacidade]
+
+
+# CADEIA DE CONDENSAÇÃO ========================
+
+class CondensadorDePerguntas(LLMChain):
+    """
+    Cadeia que reescreve a pergunta de acompanhamento com o histórico da conversa, usada como
+    `question_generator` da `ConversationalRetrievalChain`.
+
+    A chamada ao modelo é evitada quando possível:
+    \n\t- `modo='heuristica'`: perguntas autocontidas (ver `pergunta_autocontida`) seguem sem alteração.
+    \n\t- `modo='nunca'`: nenhuma pergunta é condensada.
+    \n\t- `modo='sempre'`: toda pergunta de acompanhamento é condensada.
+    \n\tAs condensações feitas pelo modelo são guardadas em `cache`, quando informado.
+
+    Exemplo:
+    >>> condensador = CondensadorDePerguntas(llm=ChatOpenAI(model='gpt-4o-mini'), prompt=CONDENSE_QUESTION_PROMPT)
+    >>> condensador.run(question='Qual é a definição formal de limite de uma função?', chat_history='...')
+    'Qual é a definição formal de limite de uma função?'
+    >>> condensador.estatisticas
+    {'puladas': 1, 'cache': 0, 'modelo': 0, 'ultima': 'pulada'}
+    """
+
+    modo: str = 'heuristica'
+    min_palavras: int = 6
+    cache: Any = None
+    estatisticas: dict = Field(default_factory=lambda: {'puladas': 0, 'cache': 0, 'modelo': 0, 'ultima': ''})
+
+    def _chave_cache(self, inputs: Dict[str, Any]) -> str:
+        """
+        Calcula a chave da condensação de uma pergunta no cache.
+
+        Parâmetros:
+        \n\t`inputs (dict)`: Entradas da cadeia, com as chaves `question` e `chat_history`.
+
+        Retorno:
+        \n\t`str`: Chave da condensação.
+        """
+        modelo = getattr(self.llm, 'model_name', '') or type(self.llm).__name__
+        return CacheCondensacoes.calcula_chave(modelo, str(inputs.get('chat_history', '')), inputs['question'])
+
+    def _dispensa_modelo(self, inputs: Dict[str, Any]):
+        """
+        Resolve a condensação sem o modelo, quando possível, e atualiza as estatísticas.
+
+        Parâmetros:
+        \n\t`inputs (dict)`: Entradas da cadeia, com as chaves `question` e `chat_history`.
+
+        Retorno:
+        \n\t`dict | None`: Saída da cadeia, ou `None` caso a pergunta precise ser condensada pelo modelo.
+        """
+        pergunta = inputs['question']
+        if self.modo == 'nunca' or (self.modo == 'heuristica' and
+                                    pergunta_autocontida(pergunta, self.min_palavras)):
+            self.estatisticas['puladas'] += 1
+            self.estatisticas['ultima'] = 'pulada'
+            return {self.output_key: pergunta}
+        if self.cache is not None:
+            pergunta_condensada = self.cache.busca(self._chave_cache(inputs))
+            if pergunta_condensada is not None:
+                self.estatisticas['cache'] += 1
+                self.estatisticas['ultima'] = 'cache'
+                return {self.output_key: pergunta_condensada}
+        return None
+
+    def _registra_condensacao(self, inputs: Dict[str, Any], saida: Dict[str, Any]) -> None:
+        """
+        Guarda no cache a condensação feita pelo modelo e atualiza as estatísticas.
+
+        Parâmetros:
+        \n\t`inputs (dict)`: Entradas da cadeia.
+        \n\t`saida (dict)`: Saída da cadeia.
+        """
+        self.estatisticas['modelo'] += 1
+        self.estatisticas['ultima'] = 'modelo'
+        if self.cache is not None:
+            self.cache.grava(self._chave_cache(inputs), saida[self.output_key])
+
+    def _call(self, inputs: Dict[str, Any],
+              run_manager: Optional[CallbackManagerForChainRun] = None) -> Dict[str, str]:
+        """
+        Condensa a pergunta, chamando o modelo apenas quando ela não é resolvida pela heurística nem pelo cache.
+
+        Parâmetros:
+        \n\t`inputs (dict)`: Entradas da cadeia, com as chaves `question` e `chat_history`.
+        \n\t`run_manager (CallbackManagerForChainRun)`: Gerenciador de callbacks do LangChain (opcional).
+
+        Retorno:
+        \n\t`dict`: Saída da cadeia, com a pergunta condensada em `output_key`.
+        """
+        saida = self._dispensa_modelo(inputs)
+        if saida is None:
+            saida = super()._call(inputs, run_manager)
+            self._registra_condensacao(inputs, saida)
+        return saida
+
+    async def _acall(self, inputs: Dict[str, Any],
+                     run_manager: Optional[AsyncCallbackManagerForChainRun] = None) -> Dict[str, str]:
+        """
+        Versão assíncrona de `_call`.
+
+        Parâmetros:
+        \n\t`inputs (dict)`: Entradas da cadeia, com as chaves `question` e `chat_history`.
+        \n\t`run_manager (AsyncCallbackManagerForChainRun)`: Gerenciador de callbacks do LangChain (opcional).
+
+        Retorno:
+        \n\t`dict`: Saída da cadeia, com a pergunta condensada em `output_key`.
+        """
+        saida = self._dispensa_modelo(inputs)
+        if saida is None:
+            saida = await super()._acall(inputs, run_manager)
+            self._registra_condensacao(inputs, saida)
+        return saida
@@ -0,0 +1,656 @@
+# --- File: utils_embeddings.py --- #
+
+# --- Libraries --- #
+import time  # Biblioteca para medição de tempo e espera entre tentativas.
+import random  # Biblioteca para sortear a variação (jitter) das esperas.
+import sqlite3  # Banco de dados local usado para persistir os embeddings.
+import hashlib  # Biblioteca para cálculo de hashes criptográficos.
+import threading  # Biblioteca para sincronização entre threads.
+import unicodedata  # Biblioteca para normalização do texto das consultas.
+from collections import OrderedDict  # Dicionário ordenado usado como fila LRU.
+# Executa as requisições de embedding em paralelo.
+from concurrent.futures import ThreadPoolExecutor
+from array import array  # Serialização compacta dos vetores em float32.
+from pathlib import Path  # Manipulação de caminhos de arquivos e diretórios.
+
+import openai  # Biblioteca da OpenAI, usada para identificar erros transitórios da API.
+import tiktoken  # Tokenizador da OpenAI, usado para contar os tokens de cada texto.
+# Interface de modelos de embedding utilizada pelo LangChain.
+from langchain_core.embeddings import Embeddings
+
+# --- Directory Setup --- #
+PASTA_CACHE = Path(__file__).parent / 'cache'
+PASTA_CACHE.mkdir(exist_ok=True)
+
+# --- Attributes --- #
+# Banco SQLite com os embeddings já calculados, compartilhado entre sessões e reconstruções.
+ARQUIVO_CACHE_EMBEDDINGS = PASTA_CACHE / 'embeddings.sqlite'
+# Quantidade máxima de chaves consultadas por comando SQL (limite de parâmetros do SQLite).
+LIMITE_CHAVES_POR_CONSULTA = 500
+# Caches de embeddings de consultas, compartilhados por todas as sessões do processo.
+_CACHES_CONSULTAS = {}
+_LOCK_CACHES_CONSULTAS = threading.Lock()
+# Limitadores de tokens por minuto, compartilhados por todas as sessões do processo, por chave da API e modelo.
+_LIMITADORES_TOKENS = {}
+_LOCK_LIMITADORES_TOKENS = threading.Lock()
+# Erros da API da OpenAI que justificam uma nova tentativa da requisição.
+ERROS_TRANSITORIOS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError
+)
+
+
+# --- Methods --- #
+# CACHE DE EMBEDDINGS ========================
+
+def calcula_chave_embedding(modelo: str, texto: str) -> str:
+    """
+    Calcula a chave de cache de um texto para um modelo de embedding.
+
+    Parâmetros:
+    \n\t`modelo (str)`: Nome do modelo de embedding.
+    \n\t`texto (str)`: Texto a ser embutido.
+
+    Retorno:
+    \n\t`str`: Hash hexadecimal que identifica o par modelo e texto.
+
+    Exemplo:
+    >>> calcula_chave_embedding('text-embedding-ada-002', 'O que é limite?')
+    'b94d27b9934d3e08a52e52d7da7dabfac484efe37a5380ee9088f7ace2efcde9'
+    """
+    return hashlib.sha256(f'{modelo}\0{texto}'.encode('utf-8')).hexdigest()
+
+
+class EmbeddingsComCache(Embeddings):
+    """
+    Modelo de embedding que consulta um cache persistente em SQLite antes de chamar o modelo base.
+
+    Os vetores são indexados por `hash(modelo, texto)`, de modo que uma nova ingestão do mesmo livro, ou de
+    uma edição que compartilhe trechos com outra já indexada, só paga os embeddings dos trechos inéditos.
+
+    Exemplo:
+    >>> embedding_model = EmbeddingsComCache(OpenAIEmbeddings(), 'text-embedding-ada-002')
+    >>> vetores = embedding_model.embed_documents(['O que é limite?'])
+    """
+
+    def __init__(self, base: Embeddings, modelo: str, caminho: Path = ARQUIVO_CACHE_EMBEDDINGS):
+        """
+        Parâmetros:
+        \n\t`base (Embeddings)`: Modelo de embedding chamado para os textos ausentes do cache.
+        \n\t`modelo (str)`: Nome do modelo, usado na chave do cache.
+        \n\t`caminho (Path)`: Caminho do banco SQLite (padrão: `ARQUIVO_CACHE_EMBEDDINGS`).
+        """
+        self.base = base
+        self.modelo = modelo
+        self.caminho = Path(caminho)
+        self.estatisticas = {'acertos': 0, 'faltas': 0}
+        self._local = threading.local()
+        with self._conexao() as conexao:
+            conexao.execute(
+                'CREATE TABLE IF NOT EXISTS embeddings (chave TEXT PRIMARY KEY, vetor BLOB NOT NULL)')
+
+    def _conexao(self) -> sqlite3.Connection:
+        """
+        Retorna a conexão com o banco da thread atual, abrindo-a na primeira chamada.
+
+        Retorno:
+        \n\t`sqlite3.Connection`: Conexão com o banco de embeddings.
+        """
+        conexao = getattr(self._local, 'conexao', None)
+        if conexao is None:
+            conexao = sqlite3.connect(self.caminho, timeout=30)
+            # O modo WAL permite leituras concorrentes enquanto outra sessão grava no cache.
+            conexao.execute('PRAGMA journal_mode=WAL')
+            self._local.conexao = conexao
+        return conexao
+
+    def busca_vetores(self, chaves: list) -> dict:
+        """
+        Busca no cache os vetores de um conjunto de chaves.
+
+        Parâmetros:
+        \n\t`chaves (list)`: Chaves calculadas por `calcula_chave_embedding`.
+
+        Retorno:
+        \n\t`dict`: Dicionário que associa cada chave encontrada ao seu vetor.
+        """
+        encontrados = {}
+        conexao = self._conexao()
+        for inicio in range(0, len(chaves), LIMITE_CHAVES_POR_CONSULTA):
+            lote = chaves[inicio:inicio + LIMITE_CHAVES_POR_CONSULTA]
+            marcadores = ','.join('?' * len(lote))
+            for chave, vetor in conexao.execute(
+                    f'SELECT chave, vetor FROM embeddings WHERE chave IN ({marcadores})', lote):
+                encontrados[chave] = array('f', vetor).tolist()
+        return encontrados
+
+    def grava_vetores(self, vetores: dict) -> None:
+        """
+        Grava vetores no cache.
+
+        Parâmetros:
+        \n\t`vetores (dict)`: Dicionário que associa cada chave ao seu vetor.
+        """
+        with self._conexao() as conexao:
+            conexao.executemany(
+                'INSERT OR REPLACE INTO embeddings (chave, vetor) VALUES (?, ?)',
+                [(chave, array('f', vetor).tobytes()) for chave, vetor in vetores.items()]
+            )
+
+    def embed_documents(self, texts: list) -> list:
+        """
+        Retorna os embeddings de uma lista de textos, chamando o modelo base apenas para os textos ausentes do
+        cache. Textos repetidos na mesma chamada são embutidos uma única vez.
+
+        Parâmetros:
+        \n\t`texts (list)`: Textos a serem embutidos.
+
+        Retorno:
+        \n\t`list`: Lista de vetores, na mesma ordem dos textos.
+        """
+        chaves = [calcula_chave_embedding(self.modelo, texto) for texto in texts]
+        vetores = self.busca_vetores(list(set(chaves)))
+
+        faltantes = {}
+        for chave, texto in zip(chaves, texts):
+            if chave not in vetores:
+                faltantes.setdefault(chave, texto)
+        self.estatisticas['acertos'] += len(texts) - len(faltantes)
+        self.estatisticas['faltas'] += len(faltantes)
+
+        if faltantes:
+            novos = dict(zip(faltantes, self.base.embed_documents(list(faltantes.values()))))
+            self.grava_vetores(novos)
+            vetores.update(novos)
+        return [vetores[chave] for chave in chaves]
+
+    def embed_query(self, text: str) -> list:
+        """
+        Retorna o embedding de uma consulta, delegando ao modelo base.
+
+        Parâmetros:
+        \n\t`text (str)`: Texto da consulta.
+
+        Retorno:
+        \n\t`list`: Vetor da consulta.
+        """
+        return self.base.embed_query(text)
+
+
+# EXECUÇÃO EM LOTES ========================
+
+class LimitadorTokens:
+    """
+    Balde de tokens (token bucket) que limita o consumo de tokens por minuto entre várias threads.
+
+    Exemplo:
+    >>> limitador = LimitadorTokens(1_000_000)
+    >>> limitador.consome(8000)  # Bloqueia até haver saldo suficiente.
+    """
+
+    def __init__(self, tokens_por_minuto: int):
+        """
+        Parâmetros:
+        \n\t`tokens_por_minuto (int)`: Orçamento de tokens por minuto. Se `0`, não há limite.
+        """
+        self.capacidade = tokens_por_minuto
+        self.saldo = float(tokens_por_minuto)
+        self.ultima_recarga = time.monotonic()
+        self._condicao = threading.Condition()
+
+    def consome(self, tokens: int) -> None:
+        """
+        Consome `tokens` do orçamento, aguardando a recarga do balde quando não há saldo suficiente.
+
+        Parâmetros:
+        \n\t`tokens (int)`: Quantidade de tokens a consumir.
+        """
+        if not self.capacidade:
+            return
+        # Um lote maior que o orçamento inteiro espera o balde encher por completo.
+        tokens = min(tokens, self.capacidade)
+        with self._condicao:
+            while True:
+                agora = time.monotonic()
+                self.saldo = min(self.capacidade,
+                                 self.saldo + (agora - self.ultima_recarga) * self.capacidade / 60)
+                self.ultima_recarga = agora
+                if self.saldo >= tokens:
+                    self.saldo -= tokens
+                    return
+                self._condicao.wait((tokens - self.saldo) * 60 / self.capacidade)
+
+
+def obtem_limitador_tokens(chave_api: str, modelo: str, tokens_por_minuto: int) -> LimitadorTokens:
+    """
+    Retorna o limitador de tokens por minuto de uma chave da API e de um modelo, criando-o na primeira chamada.
+
+    O orçamento da API vale para a chave e o modelo, e não para cada instância do executor: as construções
+    de índices e as consultas de todas as sessões do processo consomem do mesmo balde. O orçamento é fixado
+    na criação do limitador.
+
+    Parâmetros:
+    \n\t`chave_api (str)`: Chave da API da OpenAI.
+    \n\t`modelo (str)`: Nome do modelo de embedding.
+    \n\t`tokens_por_minuto (int)`: Orçamento de tokens por minuto. Se `0`, não há limite.
+
+    Retorno:
+    \n\t`LimitadorTokens`: O limitador compartilhado.
+
+    Exemplo:
+    >>> obtem_limitador_tokens(api_key, 'text-embedding-ada-002', 1_000_000) is obtem_limitador_tokens(api_key, 'text-embedding-ada-002', 1_000_000)
+    True
+    """
+    # A chave da API é guardada apenas como hash.
+    chave = (hashlib.sha256((chave_api or '').encode('utf-8')).hexdigest(), modelo)
+    with _LOCK_LIMITADORES_TOKENS:
+        if chave not in _LIMITADORES_TOKENS:
+            _LIMITADORES_TOKENS[chave] = LimitadorTokens(tokens_por_minuto)
+        return _LIMITADORES_TOKENS[chave]
+
+
+class ExecutorEmbeddings(Embeddings):
+    """
+    Modelo de embedding que agrupa os textos em lotes por quantidade de tokens e envia os lotes em paralelo,
+    respeitando o orçamento de tokens por minuto do processo e repetindo as requisições com erros transitórios.
+
+    O modelo base deve ser criado sem novas tentativas próprias (`max_retries=0`) e com `chunk_size` de pelo
+    menos `textos_por_lote`, para que as tentativas não se multipliquem e os lotes não sejam divididos de novo.
+
+    As estatísticas de vazão e de novas tentativas das chamadas de `embed_documents` são acumuladas em
+    `estatisticas`, compartilhadas pelas sessões que usam a mesma instância; as consultas (`embed_query`) são
+    acumuladas à parte, em `estatisticas_consultas`.
+
+    Exemplo:
+    >>> embedding_model = ExecutorEmbeddings(OpenAIEmbeddings(max_retries=0, chunk_size=2048), 'text-embedding-ada-002', concorrencia=8)
+    >>> vetores = embedding_model.embed_documents(textos)
+    >>> embedding_model.estatisticas['tokens_por_segundo']
+    41250.0
+    """
+
+    def __init__(self, base: Embeddings, modelo: str, tokens_por_lote: int = 20000, textos_por_lote: int = 2048,
+                 concorrencia: int = 4, tokens_por_minuto: int = 1000000, max_tentativas: int = 6):
+        """
+        Parâmetros:
+        \n\t`base (Embeddings)`: Modelo de embedding chamado para cada lote.
+        \n\t`modelo (str)`: Nome do modelo, usado para escolher o tokenizador.
+        \n\t`tokens_por_lote (int)`: Quantidade máxima de tokens por requisição (padrão: `20000`).
+        \n\t`textos_por_lote (int)`: Quantidade máxima de textos por requisição (padrão: `2048`).
+        \n\t`concorrencia (int)`: Quantidade máxima de requisições simultâneas (padrão: `4`).
+        \n\t`tokens_por_minuto (int)`: Orçamento de tokens por minuto da chave da API e do modelo, compartilhado
+        pelo processo (ver `obtem_limitador_tokens`). Se `0`, não há limite.
+        \n\t`max_tentativas (int)`: Quantidade máxima de tentativas por lote (padrão: `6`).
+        """
+        self.base = base
+        self.modelo = modelo
+        self.tokens_por_lote = tokens_por_lote
+        # Um lote maior que o `chunk_size` do modelo base seria dividido de novo em várias requisições.
+        self.textos_por_lote = min(textos_por_lote, getattr(base, 'chunk_size', None) or textos_por_lote)
+        self.concorrencia = concorrencia
+        self.max_tentativas = max_tentativas
+        chave_api = getattr(base, 'openai_api_key', None)
+        if hasattr(chave_api, 'get_secret_value'):
+            chave_api = chave_api.get_secret_value()
+        self.limitador = obtem_limitador_tokens(chave_api or '', modelo, tokens_por_minuto)
+        try:
+            self.codificador = tiktoken.encoding_for_model(modelo)
+        except KeyError:
+            self.codificador = tiktoken.get_encoding('cl100k_base')
+        self.estatisticas = {'chamadas': 0, 'textos': 0, 'tokens': 0, 'requisicoes': 0, 'tentativas_repetidas': 0,
+                             'segundos': 0.0, 'tokens_por_segundo': 0.0}
+        self.estatisticas_consultas = {'consultas': 0, 'tokens': 0, 'tentativas_repetidas': 0}
+        self._lock_estatisticas = threading.Lock()
+
+    def conta_tokens(self, texto: str) -> int:
+        """
+        Conta os tokens de um texto com o tokenizador do modelo.
+
+        Parâmetros:
+        \n\t`texto (str)`: Texto a ser contado.
+
+        Retorno:
+        \n\t`int`: Quantidade de tokens.
+        """
+        return len(self.codificador.encode(texto, disallowed_special=()))
+
+    def monta_lotes(self, tokens: list) -> list:
+        """
+        Agrupa os textos, em ordem, em lotes limitados por `tokens_por_lote` e `textos_por_lote`.
+
+        Parâmetros:
+        \n\t`tokens (list)`: Quantidade de tokens de cada texto.
+
+        Retorno:
+        \n\t`list`: Lista de lotes, cada um representado pelos índices dos seus textos.
+
+        Exemplo:
+        >>> ExecutorEmbeddings(base, 'text-embedding-ada-002', tokens_por_lote=10).monta_lotes([6, 3, 4, 12])
+        [[0, 1], [2], [3]]
+        """
+        lotes = []
+        lote, tokens_lote = [], 0
+        for indice, quantidade in enumerate(tokens):
+            if lote and (tokens_lote + quantidade > self.tokens_por_lote or len(lote) >= self.textos_por_lote):
+                lotes.append(lote)
+                lote, tokens_lote = [], 0
+            lote.append(indice)
+            tokens_lote += quantidade
+        if lote:
+            lotes.append(lote)
+        return lotes
+
+    def _embute_lote(self, textos: list, tokens: int, estatisticas: dict) -> list:
+        """
+        Envia um lote ao modelo base, repetindo a requisição com espera exponencial em caso de erro transitório.
+
+        Parâmetros:
+        \n\t`textos (list)`: Textos do lote.
+        \n\t`tokens (int)`: Quantidade total de tokens do lote.
+        \n\t`estatisticas (dict)`: Estatísticas em que as novas tentativas são contadas.
+
+        Retorno:
+        \n\t`list`: Vetores do lote, na ordem dos textos.
+        """
+        for tentativa in range(self.max_tentativas):
+            self.limitador.consome(tokens)
+            try:
+                return self.base.embed_documents(textos)
+            except ERROS_TRANSITORIOS as e:
+                if tentativa + 1 == self.max_tentativas:
+                    raise
+                with self._lock_estatisticas:
+                    estatisticas['tentativas_repetidas'] += 1
+                resposta = getattr(e, 'response', None)
+                espera = resposta.headers.get('retry-after') if resposta is not None else None
+                try:
+                    espera = float(espera)
+                except (TypeError, ValueError):
+                    espera = random.uniform(0, min(60, 2 ** tentativa))
+                print(f"Embeddings: erro transitório ({type(e).__name__}). "
+                      f"Tentativa {tentativa + 1}/{self.max_tentativas}. Aguardando {espera:.1f}s...")
+                time.sleep(espera)
+
+    def embed_documents(self, texts: list) -> list:
+        """
+        Retorna os embeddings de uma lista de textos, enviando os lotes em paralelo.
+
+        Parâmetros:
+        \n\t`texts (list)`: Textos a serem embutidos.
+
+        Retorno:
+        \n\t`list`: Lista de vetores, na mesma ordem dos textos.
+        """
+        inicio = time.monotonic()
+        tokens = [self.conta_tokens(texto) for texto in texts]
+        lotes = self.monta_lotes(tokens)
+
+        vetores = [None] * len(texts)
+        with ThreadPoolExecutor(max_workers=self.concorrencia) as executor:
+            futuros = {executor.submit(self._embute_lote,
+                                       [texts[i] for i in lote],
+                                       sum(tokens[i] for i in lote),
+                                       self.estatisticas): lote
+                       for lote in lotes}
+            for futuro, lote in futuros.items():
+                for indice, vetor in zip(lote, futuro.result()):
+                    vetores[indice] = vetor
+
+        duracao = time.monotonic() - inicio
+        with self._lock_estatisticas:
+            estatisticas = self.estatisticas
+            estatisticas['chamadas'] += 1
+            estatisticas['textos'] += len(texts)
+            estatisticas['tokens'] += sum(tokens)
+            estatisticas['requisicoes'] += len(lotes)
+            estatisticas['segundos'] = round(estatisticas['segundos'] + duracao, 3)
+            estatisticas['tokens_por_segundo'] = round(estatisticas['tokens'] / max(estatisticas['segundos'], 1e-3), 1)
+        return vetores
+
+    def embed_query(self, text: str) -> list:
+        """
+        Retorna o embedding de uma consulta, com o mesmo orçamento de tokens e as mesmas novas tentativas dos
+        lotes, acumulando as estatísticas em `estatisticas_consultas`.
+
+        Parâmetros:
+        \n\t`text (str)`: Texto da consulta.
+
+        Retorno:
+        \n\t`list`: Vetor da consulta.
+        """
+        tokens = self.conta_tokens(text)
+        with self._lock_estatisticas:
+            self.estatisticas_consultas['consultas'] += 1
+            self.estatisticas_consultas['tokens'] += tokens
+        return self._embute_lote([text], tokens, self.estatisticas_consultas)[0]
+
+
+# CACHE DE CONSULTAS ========================
+
+def normaliza_consulta(texto: str) -> str:
+    """
+    Normaliza o texto de uma consulta para a chave do cache: forma Unicode composta, minúsculas e espaços
+    simples, de modo que variações triviais da mesma pergunta compartilhem o embedding.
+
+    Parâmetros:
+    \n\t`texto (str)`: Texto da consulta.
+
+    Retorno:
+    \n\t`str`: Texto normalizado.
+
+    Exemplo:
+    >>> normaliza_consulta('  O que é   Limite? ')
+    'o que é limite?'
+    """
+    return ' '.join(unicodedata.normalize('NFC', texto).casefold().split())
+
+
+class CacheConsultas:
+    """
+    Cache LRU limitado dos embeddings de consultas, opcionalmente persistido em SQLite.
+
+    A memória guarda as `capacidade` consultas usadas mais recentemente. Com persistência, as consultas também
+    são gravadas no banco de embeddings, que guarda até `capacidade_disco` consultas usadas mais recentemente e
+    sobrevive a reinicializações do servidor. Os usos das consultas (acertos na memória ou no banco) são
+    gravados no banco em lote, no máximo a cada `intervalo_usos` segundos e antes de cada descarte.
+
+    Exemplo:
+    >>> cache = CacheConsultas(1024, ARQUIVO_CACHE_EMBEDDINGS)
+    >>> cache.busca(chave) is None
+    True
+    """
+
+    def __init__(self, capacidade: int = 1024, caminho: Path = None, capacidade_disco: int = 20000,
+                 intervalo_usos: float = 30.0):
+        """
+        Parâmetros:
+        \n\t`capacidade (int)`: Quantidade máxima de consultas mantidas em memória (padrão: `1024`).
+        \n\t`caminho (Path)`: Caminho do banco SQLite. Se `None`, o cache fica apenas em memória.
+        \n\t`capacidade_disco (int)`: Quantidade máxima de consultas mantidas no banco (padrão: `20000`).
+        \n\t`intervalo_usos (float)`: Intervalo mínimo, em segundos, entre as gravações dos usos no banco
+        (padrão: `30.0`).
+        """
+        self.capacidade = capacidade
+        self.capacidade_disco = capacidade_disco
+        self.intervalo_usos = intervalo_usos
+        self.caminho = Path(caminho) if caminho is not None else None
+        self.estatisticas = {'acertos': 0, 'acertos_disco': 0, 'faltas': 0}
+        self._vetores = OrderedDict()
+        self._usos_pendentes = {}
+        self._ultima_gravacao_usos = time.monotonic()
+        self._lock = threading.Lock()
+        self._conexao = None
+        if self.caminho is not None:
+            self._conexao = sqlite3.connect(self.caminho, timeout=30, check_same_thread=False)
+            self._conexao.execute('PRAGMA journal_mode=WAL')
+            with self._conexao:
+                self._conexao.execute(
+                    'CREATE TABLE IF NOT EXISTS consultas (chave TEXT PRIMARY KEY, vetor BLOB NOT NULL, usada_em REAL NOT NULL)')
+
+    def busca(self, chave: str):
+        """
+        Busca o vetor de uma consulta, primeiro na memória e depois no banco.
+
+        Parâmetros:
+        \n\t`chave (str)`: Chave calculada por `calcula_chave_embedding`.
+
+        Retorno:
+        \n\t`list | None`: Vetor da consulta ou `None` caso não esteja no cache.
+        """
+        with self._lock:
+            vetor = self._vetores.get(chave)
+            if vetor is not None:
+                self._vetores.move_to_end(chave)
+                self.estatisticas['acertos'] += 1
+                self._registra_uso(chave)
+                return vetor
+            if self._conexao is not None:
+                linha = self._conexao.execute(
+                    'SELECT vetor FROM consultas WHERE chave = ?', (chave,)).fetchone()
+                if linha is not None:
+                    vetor = array('f', linha[0]).tolist()
+                    self._guarda_em_memoria(chave, vetor)
+                    self.estatisticas['acertos_disco'] += 1
+                    self._registra_uso(chave)
+                    return vetor
+            self.estatisticas['faltas'] += 1
+            return None
+
+    def grava(self, chave: str, vetor: list) -> None:
+        """
+        Grava o vetor de uma consulta no cache.
+
+        Parâmetros:
+        \n\t`chave (str)`: Chave calculada por `calcula_chave_embedding`.
+        \n\t`vetor (list)`: Vetor da consulta.
+        """
+        with self._lock:
+            self._guarda_em_memoria(chave, vetor)
+            if self._conexao is not None:
+                self._usos_pendentes.pop(chave, None)
+                # Os usos pendentes são gravados antes do descarte, para que as consultas usadas não sejam descartadas.
+                self._grava_usos()
+                with self._conexao:
+                    self._conexao.execute(
+                        'INSERT OR REPLACE INTO consultas (chave, vetor, usada_em) VALUES (?, ?, ?)',
+                        (chave, array('f', vetor).tobytes(), time.time()))
+                    self._conexao.execute(
+                        'DELETE FROM consultas WHERE chave IN '
+                        '(SELECT chave FROM consultas ORDER BY usada_em DESC LIMIT -1 OFFSET ?)',
+                        (self.capacidade_disco,))
+
+    def _registra_uso(self, chave: str) -> None:
+        """
+        Registra o uso de uma consulta, gravando os usos pendentes no banco quando o intervalo já passou.
+        Chamada com o lock do cache.
+
+        Parâmetros:
+        \n\t`chave (str)`: Chave da consulta.
+        """
+        if self._conexao is None:
+            return
+        self._usos_pendentes[chave] = time.time()
+        if time.monotonic() - self._ultima_gravacao_usos >= self.intervalo_usos:
+            self._grava_usos()
+
+    def _grava_usos(self) -> None:
+        """
+        Atualiza no banco a data de uso das consultas usadas desde a última gravação. Chamada com o lock do cache.
+        """
+        self._ultima_gravacao_usos = time.monotonic()
+        if not self._usos_pendentes:
+            return
+        with self._conexao:
+            self._conexao.executemany(
+                'UPDATE consultas SET usada_em = ? WHERE chave = ?',
+                [(usada_em, chave) for chave, usada_em in self._usos_pendentes.items()])
+        self._usos_pendentes.clear()
+
+    def _guarda_em_memoria(self, chave: str, vetor: list) -> None:
+        """
+        Guarda um vetor na memória, descartando as consultas menos usadas além da capacidade.
+
+        Parâmetros:
+        \n\t`chave (str)`: Chave da consulta.
+        \n\t`vetor (list)`: Vetor da consulta.
+        """
+        self._vetores[chave] = vetor
+        self._vetores.move_to_end(chave)
+        while len(self._vetores) > self.capacidade:
+            self._vetores.popitem(last=False)
+
+
+def obtem_cache_consultas(capacidade: int = 1024, persistente: bool = True, capacidade_disco: int = 20000) -> CacheConsultas:
+    """
+    Retorna o cache de consultas do processo, criando-o na primeira chamada, para que todas as sessões
+    aproveitem as consultas umas das outras.
+
+    Parâmetros:
+    \n\t`capacidade (int)`: Quantidade máxima de consultas mantidas em memória (padrão: `1024`).
+    \n\t`persistente (bool)`: Se `True`, persiste as consultas no banco de embeddings (padrão: `True`).
+    \n\t`capacidade_disco (int)`: Quantidade máxima de consultas mantidas no banco (padrão: `20000`).
+
+    Retorno:
+    \n\t`CacheConsultas`: O cache compartilhado.
+
+    Exemplo:
+    >>> cache = obtem_cache_consultas(**get_config('cache_consultas_kwargs'))
+    """
+    with _LOCK_CACHES_CONSULTAS:
+        chave = (capacidade, persistente, capacidade_disco)
+        if chave not in _CACHES_CONSULTAS:
+            _CACHES_CONSULTAS[chave] = CacheConsultas(
+                capacidade, ARQUIVO_CACHE_EMBEDDINGS if persistente else None, capacidade_disco)
+        return _CACHES_CONSULTAS[chave]
+
+
+class EmbeddingsComCacheDeConsultas(Embeddings):
+    """
+    Modelo de embedding que consulta um cache LRU antes de embutir uma consulta, eliminando a requisição à API
+    quando a mesma pergunta é repetida. Os embeddings de documentos são delegados ao modelo base.
+
+    Exemplo:
+    >>> embedding_model = EmbeddingsComCacheDeConsultas(OpenAIEmbeddings(), 'text-embedding-ada-002', obtem_cache_consultas())
+    >>> vetor = embedding_model.embed_query('O que é limite?')
+    """
+
+    def __init__(self, base: Embeddings, modelo: str, cache: CacheConsultas):
+        """
+        Parâmetros:
+        \n\t`base (Embeddings)`: Modelo de embedding chamado para as consultas ausentes do cache.
+        \n\t`modelo (str)`: Nome do modelo, usado na chave do cache.
+        \n\t`cache (CacheConsultas)`: Cache dos embeddings das consultas.
+        """
+        self.base = base
+        self.modelo = modelo
+        self.cache = cache
+
+    def embed_documents(self, texts: list) -> list:
+        """
+        Retorna os embeddings de uma lista de textos, delegando ao modelo base.
+
+        Parâmetros:
+        \n\t`texts (list)`: Textos a serem embutidos.
+
+        Retorno:
+        \n\t`list`: Lista de vetores, na mesma ordem dos textos.
+        """
+        return self.base.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list:
+        """
+        Retorna o embedding de uma consulta, chamando o modelo base apenas se ela não estiver no cache.
+
+        Parâmetros:
+        \n\t`text (str)`: Texto da consulta.
+
+        Retorno:
+        \n\t`list`: Vetor da consulta.
+        """
+        chave = calcula_chave_embedding(self.modelo, normaliza_consulta(text))
+        vetor = self.cache.busca(chave)
+        if vetor is None:
+            vetor = self.base.embed_query(text)
+            self.cache.grava(chave, vetor)
+        return vetor
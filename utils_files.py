@@ -7,6 +7,7 @@ import re  # Biblioteca para expressões regulares.
 # Biblioteca para serialização e desserialização de objetos Python.
 import pickle
 import json  # Biblioteca para manipulação de arquivos JSON.
+import hashlib  # Biblioteca para comparar o conteúdo dos PDFs enviados com os já salvos.
 import requests  # Biblioteca para fazer requisições HTTP.
 import pydub  # Biblioteca para manipulação de arquivos de áudio.
 
@@ -21,12 +22,6 @@ from langchain.chains.conversational_retrieval.base import ConversationalRetriev
 from langchain.memory import ConversationBufferMemory
 # Permite a criação de templates para estruturar prompts usados nos modelos de IA.
 from langchain.prompts import PromptTemplate
-# Carrega e processa documentos PDF para serem utilizados na recuperação de informações.
-from langchain_community.document_loaders.pdf import PyPDFLoader
-# Utiliza a biblioteca FAISS para armazenar e recuperar embeddings de documentos.
-from langchain_community.vectorstores.faiss import FAISS
-# Divide textos longos em segmentos menores de maneira recursiva para otimizar a recuperação de informações.
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 # Gera embeddings de texto usando modelos da OpenAI.
 from langchain_openai.embeddings import OpenAIEmbeddings
 # Implementa um modelo de chat baseado na OpenAI para geração de respostas contextuais.
@@ -39,11 +34,31 @@ from assets import *  # Importa estilos e scripts auxiliares.
 from moviepy import *  # Biblioteca para manipulação de vídeos.
 # Importa funções auxiliares para integração com OpenAI.
 from utils_openai import *
+# Importa funções de identificação e cache dos índices vetoriais.
+from utils_indice import *
+# Importa funções de extração paralela dos documentos PDF.
+from utils_ingestao import *
+# Importa o cache persistente de embeddings.
+from utils_embeddings import *
+# Importa o índice lexical (BM25) e o recuperador híbrido.
+from utils_recuperacao import *
+# Importa o cache semântico das respostas.
+from utils_respostas import *
+# Importa a condensação das perguntas de acompanhamento.
+from utils_condensacao import *
 from io import BytesIO  # Biblioteca para manipulação de fluxos de bytes.
+# Permite identificar a sessão do Streamlit que está executando o script.
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
 # --- Environment Setup --- #
 # Carrega o arquivo .env que contém as credenciais sensíveis.
 _ = load_dotenv(find_dotenv())
+# Configura o pool de conexões HTTP reaproveitado pelas chamadas à API da OpenAI.
+configura_sessao_http(**get_config('http_kwargs'))
+configura_cliente_assincrono(**get_config('cliente_assincrono_kwargs'))
+configura_retentativas(get_config('retentativas_kwargs'), get_config('disjuntor_kwargs'))
+# O controle do hedging é do processo; a ativação segue a configuração de cada sessão (ver `nova_mensagem`).
+configura_hedging(**get_config('hedging_kwargs'))
 
 # Obtém a chave da API da OpenAI.
 api_key = os.getenv("OPENAI_API_KEY")
@@ -259,89 +274,358 @@ def le_chave() -> str:
 
 # RAG com LANGCHAIN ========================
 
-def importacao_documentos() -> list:
+def sincroniza_pdfs_enviados(pdfs: list) -> bool:
     """
-    Carrega documentos PDF da pasta de arquivos e os transforma em uma lista de documentos processáveis.
+    Sincroniza a pasta de arquivos com os PDFs do campo de upload, gravando apenas os arquivos novos ou
+    alterados e removendo os que saíram da lista.
+
+    Um campo de upload vazio só remove os PDFs da pasta se a sessão já havia enviado arquivos, ou seja, se o
+    aluno removeu todos eles. Assim, os PDFs salvos antes de uma reinicialização do servidor (e o índice em
+    cache correspondente) são preservados quando uma nova sessão abre a página.
+
+    Parâmetros:
+    \n\t`pdfs (list)`: Arquivos retornados pelo `st.file_uploader`.
 
     Retorno:
-    \n\t`list`: Lista de documentos carregados a partir dos arquivos PDF disponíveis.
+    \n\t`bool`: `True` se algum arquivo da pasta foi gravado ou removido.
 
     Exemplo:
-    >>> documentos = importacao_documentos()
-    >>> print(len(documentos))
-    5
-    """
-    documentos = []
+    >>> sincroniza_pdfs_enviados(st.file_uploader('PDFs', type=['.pdf'], accept_multiple_files=True))
+    False
+    """
+    if not pdfs:
+        if not st.session_state.get('pdfs_enviados'):
+            return False
+        st.session_state['pdfs_enviados'] = False
+        arquivos = list(PASTA_ARQUIVOS.glob('*.pdf'))
+        for arquivo in arquivos:
+            arquivo.unlink()
+        return bool(arquivos)
+
+    st.session_state['pdfs_enviados'] = True
+    alterou = False
+    nomes = {pdf.name for pdf in pdfs}
     for arquivo in PASTA_ARQUIVOS.glob('*.pdf'):
-        loader = PyPDFLoader(str(arquivo))
-        documentos_arquivo = loader.load()
-        documentos.extend(documentos_arquivo)
-    return documentos
+        if arquivo.name not in nomes:
+            arquivo.unlink()
+            alterou = True
+    for pdf in pdfs:
+        caminho = PASTA_ARQUIVOS / pdf.name
+        conteudo = pdf.getvalue()
+        if caminho.exists() and caminho.stat().st_size == len(conteudo) and \
+                calcula_hash_arquivo(caminho) == hashlib.sha256(conteudo).hexdigest():
+            continue
+        with open(caminho, 'wb') as f:
+            f.write(conteudo)
+        alterou = True
+    return alterou
+
+
+def cria_modelo_embedding():
+    """
+    Cria o modelo de embedding da OpenAI configurado para o sistema.
+
+    As requisições à API são agrupadas em lotes por quantidade de tokens e enviadas em paralelo, conforme
+    `EMBEDDING_EXECUTOR_KWARGS`, e as novas tentativas ficam a cargo do executor. Quando `CACHE_EMBEDDINGS_ATIVO` está ativo, o modelo consulta o cache local
+    de embeddings antes de chamar a API, de modo que trechos já embutidos em outra sessão ou reconstrução
+    não são enviados novamente. Quando `CACHE_CONSULTAS_ATIVO` está ativo, os embeddings das consultas dos
+    alunos ficam em um cache LRU compartilhado, e perguntas repetidas não chamam a API.
+
+    Retorno:
+    \n\t`Embeddings`: Modelo de embedding utilizado na indexação e nas consultas.
+
+    Exemplo:
+    >>> embedding_model = cria_modelo_embedding()
+    """
+    executor_kwargs = get_config('embedding_executor_kwargs')
+    embedding_model = ExecutorEmbeddings(
+        # Sem novas tentativas no cliente, que se multiplicariam às do executor, e sem dividir os lotes de novo.
+        OpenAIEmbeddings(model=get_config('modelo_embedding'),
+                         base_url=endereco_base_api(),
+                         max_retries=0,
+                         chunk_size=executor_kwargs.get('textos_por_lote', 2048)),
+        get_config('modelo_embedding'),
+        **executor_kwargs
+    )
+    if get_config('cache_embeddings_ativo'):
+        embedding_model = EmbeddingsComCache(embedding_model, get_config('modelo_embedding'))
+    if get_config('cache_consultas_ativo'):
+        embedding_model = EmbeddingsComCacheDeConsultas(
+            embedding_model,
+            get_config('modelo_embedding'),
+            obtem_cache_consultas(**get_config('cache_consultas_kwargs'))
+        )
+    return embedding_model
 
 
-def split_de_documentos(documentos: list) -> list:
+def atualiza_vector_store(hashes_arquivos: dict, hash_parametros: str, embedding_model) -> tuple:
     """
-    Divide documentos longos em trechos menores para facilitar a recuperação de informações.
+    Constrói o índice do corpus atual a partir do índice em cache mais recente com os mesmos parâmetros,
+    embutindo apenas os arquivos novos ou alterados e removendo os vetores dos arquivos excluídos.
+
+    Os arquivos novos passam por um pipeline em fluxo (extração → divisão → deduplicação → índices lexical e
+    de metadados → embedding em lotes → índice vetorial), sem materializar a lista completa de páginas ou de
+    trechos.
 
     Parâmetros:
-    \n\t`documentos (list)`: Lista de documentos a serem fragmentados.
+    \n\t`hashes_arquivos (dict)`: Hashes dos arquivos atuais, calculados por `calcula_hashes_arquivos`.
+    \n\t`hash_parametros (str)`: Hash dos parâmetros, calculado por `calcula_hash_parametros`.
+    \n\t`embedding_model`: Modelo de embedding usado para vetorizar os trechos.
 
     Retorno:
-    \n\t`list`: Lista de documentos segmentados, prontos para processamento.
+    \n\t`tuple`: Tupla `(vector_store, indice_bm25, indice_metadados, manifesto)` com os índices vetorial,
+    lexical e de metadados atualizados e o manifesto correspondente.
 
     Exemplo:
-    >>> documentos = split_de_documentos(importacao_documentos())
-    >>> print(len(documentos))
-    20
-    """
-    recur_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=2500,
-        chunk_overlap=250,
-        separators=["/n\n", "\n", ".", " ", ""]
+    >>> vector_store, indice_bm25, indice_metadados, manifesto = atualiza_vector_store(hashes_arquivos, hash_parametros, cria_modelo_embedding())
+    """
+    vector_store = None
+    indice_bm25 = IndiceBM25()
+    indice_metadados = IndiceMetadados()
+    arquivos_indexados = {}
+    base = localiza_indice_base(hash_parametros)
+    if base is not None:
+        # O índice base é carregado integralmente na memória, pois será modificado.
+        vector_store = carrega_vector_store_em_cache(
+            base['fingerprint'], embedding_model, mmap=False)
+        if vector_store is not None:
+            arquivos_indexados = base['arquivos']
+            indice_bm25 = carrega_indice_bm25_em_cache(
+                base['fingerprint'], vector_store)
+            indice_metadados = carrega_indice_metadados_em_cache(
+                base['fingerprint'], vector_store)
+
+    adicionados, removidos = calcula_delta_corpus(
+        arquivos_indexados, hashes_arquivos)
+    print(f"Atualização incremental: {len(adicionados)} arquivo(s) a indexar, {len(removidos)} a remover.")
+    if removidos:
+        try:
+            remove_arquivos_do_vector_store(
+                vector_store, arquivos_indexados, removidos)
+            ids_removidos = [doc_id for nome in removidos
+                             for doc_id in arquivos_indexados[nome]['ids']]
+            indice_bm25.remove(ids_removidos)
+            indice_metadados.remove(ids_removidos)
+        except RuntimeError as e:
+            # O HNSW não permite remover vetores: o índice é reconstruído.
+            print("O índice não permite remoção, reconstruindo:", e)
+            vector_store = None
+            indice_bm25 = IndiceBM25()
+            indice_metadados = IndiceMetadados()
+            arquivos_indexados = {}
+            adicionados, removidos = calcula_delta_corpus(
+                arquivos_indexados, hashes_arquivos)
+
+    paginas = itera_paginas([PASTA_ARQUIVOS / nome for nome in adicionados],
+                            get_config('ingestao_paralela'),
+                            hashes=[hashes_arquivos[nome] for nome in adicionados],
+                            cache=CacheExtracao() if get_config('cache_extracao_ativo') else None,
+                            **get_config('ingestao_kwargs'))
+    trechos = itera_trechos(paginas,
+                            get_config('splitter_kwargs'),
+                            get_config('divisao_paralela'),
+                            **get_config('ingestao_kwargs'))
+    deduplicador = None
+    if get_config('deduplicacao_ativa'):
+        deduplicador = DeduplicadorTrechos(**get_config('deduplicacao_kwargs'))
+        if vector_store is not None:
+            deduplicador.registra_existentes(
+                vector_store.docstore.search(doc_id)
+                for doc_id in vector_store.index_to_docstore_id.values())
+        trechos = deduplicador.filtra(trechos)
+    trechos = indice_bm25.indexa_em_fluxo(trechos)
+    trechos = indice_metadados.indexa_em_fluxo(trechos)
+    vector_store, ids_por_arquivo = indexa_trechos_em_fluxo(
+        vector_store,
+        trechos,
+        embedding_model,
+        get_config('tamanho_lote_embedding'),
+        get_config('indice_tipo'),
+        get_config('indice_kwargs')
     )
-    documentos = recur_splitter.split_documents(documentos)
 
-    for i, doc in enumerate(documentos):
-        doc.metadata['source'] = doc.metadata['source'].split('/')[-1]
-        doc.metadata['doc_id'] = i
-    return documentos
+    dependencias = {}
+    if deduplicador is not None:
+        print("Deduplicação:", deduplicador.estatisticas)
+        registra_duplicatas_no_vector_store(vector_store, deduplicador.duplicatas)
+        dependencias = deduplicador.dependencias
+
+    arquivos_mantidos = {nome: info for nome, info in arquivos_indexados.items()
+                         if nome not in removidos}
+    manifesto = monta_manifesto(
+        arquivos_mantidos, ids_por_arquivo, hashes_arquivos, hash_parametros, dependencias)
+    return vector_store, indice_bm25, indice_metadados, manifesto
 
 
-def cria_vector_store(documentos: list):
+def obtem_id_sessao() -> str:
     """
-    Cria um armazenamento vetorial utilizando FAISS a partir de uma lista de documentos segmentados.
+    Retorna o identificador da sessão do Streamlit que está executando o script.
+
+    Retorno:
+    \n\t`str`: Identificador da sessão atual.
+
+    Exemplo:
+    >>> obtem_id_sessao()
+    '5b1f3c1e-9a55-4f8e-a0c6-2f1f4c6f6f52'
+    """
+    contexto = get_script_run_ctx()
+    return contexto.session_id if contexto is not None else ''
+
+
+def sessao_ativa(id_sessao: str) -> bool:
+    """
+    Indica se uma sessão do Streamlit ainda está aberta.
 
     Parâmetros:
-    \n\t`documentos (list)`: Lista de documentos processados e divididos em trechos menores.
+    \n\t`id_sessao (str)`: Identificador da sessão.
 
     Retorno:
-    \n\t`FAISS`: Um índice FAISS contendo os embeddings dos documentos para recuperação eficiente de informações.
+    \n\t`bool`: `True` se a sessão está ativa. Na ausência do runtime do Streamlit, considera a sessão ativa.
 
     Exemplo:
-    >>> documentos = split_de_documentos(importacao_documentos())
-    >>> vector_store = cria_vector_store(documentos)
-    >>> print(vector_store)
-    <langchain_community.vectorstores.faiss.FAISS object at 0x...>
+    >>> sessao_ativa(obtem_id_sessao())
+    True
     """
     try:
-        embedding_model = OpenAIEmbeddings()
-        print("Embedding model initialized successfully.")
-        vector_store = FAISS.from_documents(
-            documents=documentos,
-            embedding=embedding_model
-        )
-        print("DEBUG: Tipo de vector_store:", type(vector_store))
-        print("DEBUG: Conteúdo de vector_store:", vector_store)
+        return st.runtime.get_instance().is_active_session(id_sessao)
+    except Exception:
+        return True
 
-        return vector_store
-    except Exception as e:
-        print("Failed to initialize embedding model:", e)
+
+def calcula_fingerprint_atual() -> tuple:
+    """
+    Calcula a impressão digital do corpus formado pelos PDFs de `PASTA_ARQUIVOS` e pelas configurações atuais.
+
+    Retorno:
+    \n\t`tuple`: Tupla `(hashes_arquivos, hash_parametros, fingerprint)`.
+
+    Exemplo:
+    >>> hashes_arquivos, hash_parametros, fingerprint = calcula_fingerprint_atual()
+    """
+    hashes_arquivos = calcula_hashes_arquivos(PASTA_ARQUIVOS.glob('*.pdf'))
+    hash_parametros = calcula_hash_parametros(
+        get_config('splitter_kwargs'),
+        get_config('modelo_embedding'),
+        get_config('indice_tipo'),
+        get_config('indice_kwargs'),
+        get_config('deduplicacao_kwargs') if get_config('deduplicacao_ativa') else None
+    )
+    fingerprint = calcula_fingerprint_corpus(hashes_arquivos, hash_parametros)
+    return hashes_arquivos, hash_parametros, fingerprint
+
+
+def inicializa_chain_do_cache() -> bool:
+    """
+    Inicializa automaticamente a cadeia de conversação quando já existe um índice em cache para os PDFs atuais.
+
+    Como o índice em cache é mapeado em memória, a inicialização é praticamente instantânea, e o aluno pode
+    conversar com o ATI logo após uma reinicialização do servidor, sem precisar reconstruí-lo. A verificação é
+    feita uma única vez por sessão.
+
+    Retorno:
+    \n\t`bool`: `True` se a cadeia foi inicializada a partir do cache.
+
+    Exemplo:
+    >>> inicializa_chain_do_cache()
+    True
+    """
+    if st.session_state.get('chain_do_cache_verificada'):
+        return False
+    st.session_state['chain_do_cache_verificada'] = True
+    if len(list(PASTA_ARQUIVOS.glob('*.pdf'))) == 0:
+        return False
+    _, _, fingerprint = calcula_fingerprint_atual()
+    if not existe_indice_em_cache(fingerprint):
+        return False
+    cria_chain_conversa()
+    return True
+
+
+def cria_retriever(vector_store, indice_bm25, indice_metadados, escopo: dict, memory=None, vetores_prontos: dict = None):
+    """
+    Cria o recuperador de trechos de acordo com o tipo de busca configurado em `RETRIEVAL_SEARCH_TYPE`.
+
+    Os tipos `bm25` e `hibrido` usam o índice lexical local, sozinho ou fundido à busca vetorial; os tipos
+    `mmr` e `similarity` usam a busca do FAISS, com o MMR vetorizado no caso do `mmr`; tipos desconhecidos usam
+    a busca `similarity`, para que o escopo continue valendo. As buscas vetorial e lexical são restritas aos arquivos e páginas do `escopo`, que
+    pode ser alterado entre as perguntas. Quando `RERANQUEAMENTO_ATIVO` está ativo, o recuperador base retorna os `candidatos` de
+    `RERANQUEAMENTO_KWARGS` (ou o `fetch_k` da busca), que são reordenados localmente, e apenas os `top_n`
+    melhores seguem para o prompt. Por fim, o contexto é ajustado ao orçamento de
+    tokens de `CONTEXTO_KWARGS`.
+
+    Parâmetros:
+    \n\t`vector_store (FAISS)`: Índice vetorial do corpus.
+    \n\t`indice_bm25 (IndiceBM25)`: Índice lexical do corpus.
+    \n\t`indice_metadados (IndiceMetadados)`: Índice de arquivos e páginas do corpus.
+    \n\t`escopo (dict)`: Escopo de busca (`fontes` e `paginas`), compartilhado com a página de tutoria.
+    \n\t`memory (ConversationBufferMemory)`: Memória da conversa, descontada do orçamento de tokens (opcional).
+    \n\t`vetores_prontos (dict)`: Embeddings já calculados das perguntas, por texto, compartilhado com
+    `responde_pergunta` (opcional).
+
+    Retorno:
+    \n\t`BaseRetriever`: Recuperador usado pela cadeia de conversação.
+
+    Exemplo:
+    >>> retriever = cria_retriever(vector_store, indice_bm25, indice_metadados, {})
+    """
+    search_type = get_config('retrieval_search_type')
+    search_kwargs = get_config('retrieval_kwargs')
+    reranqueamento_kwargs = dict(get_config('reranqueamento_kwargs'))
+    candidatos = reranqueamento_kwargs.pop('candidatos', 0)
+    if get_config('reranqueamento_ativo'):
+        # O recuperador base retorna um conjunto maior de candidatos, do qual o reranqueamento escolhe os melhores.
+        search_kwargs = {**search_kwargs,
+                         'k': max(candidatos or search_kwargs.get('fetch_k', 20), search_kwargs.get('k', 4))}
+    if search_type in ('bm25', 'hibrido'):
+        retriever = RecuperadorHibrido(
+            vector_store=vector_store,
+            indice_bm25=indice_bm25,
+            search_type=search_type,
+            search_kwargs=search_kwargs,
+            hibrido_kwargs=get_config('hibrido_kwargs'),
+            indice_metadados=indice_metadados,
+            escopo=escopo,
+            parametros_busca=get_config('indice_kwargs'),
+            vetores_prontos=vetores_prontos if vetores_prontos is not None else {}
+        )
+    else:
+        if search_type not in ('mmr', 'similarity'):
+            print(f"Tipo de busca desconhecido ({search_type}), usando 'similarity'.")
+            search_type = 'similarity'
+        retriever = RecuperadorVetorial(
+            vector_store=vector_store,
+            search_type=search_type,
+            search_kwargs=search_kwargs,
+            indice_metadados=indice_metadados,
+            escopo=escopo,
+            parametros_busca=get_config('indice_kwargs'),
+            vetores_prontos=vetores_prontos if vetores_prontos is not None else {}
+        )
+    if get_config('reranqueamento_ativo'):
+        retriever = RecuperadorComReranqueamento(
+            base_retriever=retriever,
+            **reranqueamento_kwargs
+        )
+    return RecuperadorComOrcamentoDeTokens(
+        base_retriever=retriever,
+        modelo=get_config('modelo'),
+        prompt=get_config('prompt'),
+        memory=memory,
+        **get_config('contexto_kwargs')
+    )
 
 
 def cria_chain_conversa():
     """
     Cria a cadeia de conversação utilizando LangChain para recuperação de informações baseada em conversas anteriores e documentos fornecidos.
 
+    O índice vetorial é reaproveitado do cache em disco quando os PDFs, os parâmetros do splitter e o modelo de
+    embedding não mudaram desde a última construção; caso contrário, é atualizado incrementalmente a partir
+    do índice compatível mais recente e salvo no cache.
+
+    O índice carregado é compartilhado por todas as sessões que utilizam o mesmo corpus; apenas a memória da
+    conversa e a cadeia ficam no estado da sessão.
+
     Retorno:
     \n\t`None`: A função não retorna nada explicitamente, mas armazena a cadeia no estado da sessão do Streamlit.
 
@@ -351,20 +635,57 @@ def cria_chain_conversa():
     <langchain.chains.conversational_retrieval.base.ConversationalRetrievalChain object at 0x...>
     """
 
-    documentos = importacao_documentos()
-    documentos = split_de_documentos(documentos)
-    vector_store = cria_vector_store(documentos)
+    hashes_arquivos, hash_parametros, fingerprint = calcula_fingerprint_atual()
 
-    chat = ChatOpenAI(model=get_config('modelo'))
+    def constroi_indices():
+        # O modelo de embedding é criado com o índice e compartilhado com ele pelas sessões.
+        embedding_model = cria_modelo_embedding()
+        vector_store = carrega_vector_store_em_cache(fingerprint, embedding_model)
+        if vector_store is not None:
+            indice_bm25 = carrega_indice_bm25_em_cache(fingerprint, vector_store)
+            indice_metadados = carrega_indice_metadados_em_cache(fingerprint, vector_store)
+        else:
+            vector_store, indice_bm25, indice_metadados, manifesto = atualiza_vector_store(
+                hashes_arquivos, hash_parametros, embedding_model)
+            if salva_vector_store_em_cache(vector_store, fingerprint, manifesto, indice_bm25, indice_metadados):
+                # Reabre o índice salvo mapeado em memória, compartilhando-o com os demais processos.
+                vector_store = carrega_vector_store_em_cache(
+                    fingerprint, embedding_model) or vector_store
+            limpa_cache_de_indices()
+            if get_config('cache_extracao_ativo'):
+                # Mantém no cache de extração apenas os arquivos do corpus atual e dos índices ainda em cache.
+                removidos = CacheExtracao().remove_exceto(
+                    hashes_arquivos_em_cache() | set(hashes_arquivos.values()))
+                print(f"Cache de extração: {removidos} arquivo(s) removido(s).")
+        indice_metadados.vincula(vector_store)
+        return vector_store, indice_bm25, indice_metadados
+
+    vector_store, indice_bm25, indice_metadados = obtem_vector_store_compartilhado(
+        fingerprint, obtem_id_sessao(), constroi_indices, sessao_ativa)
+    fingerprint_anterior = st.session_state.get('fingerprint_corpus')
+    if fingerprint_anterior and fingerprint_anterior != fingerprint and \
+            fingerprint_anterior not in estatisticas_vector_stores_compartilhados():
+        # Nenhuma sessão usa mais o corpus anterior: suas respostas em cache não serão mais aproveitadas.
+        invalida_caches_respostas(fingerprint_anterior)
+    st.session_state['fingerprint_corpus'] = fingerprint
+    st.session_state['chave_contexto_respostas'] = calcula_chave_contexto(
+        fingerprint, get_config('prompt'), get_config('modelo'))
+
+    chat = ChatOpenAI(model=get_config('modelo'), base_url=endereco_base_api())
     memory = ConversationBufferMemory(
         return_messages=True,
         memory_key='chat_history',
         output_key='answer'
     )
-    retriever = vector_store.as_retriever(
-        search_type=get_config('retrieval_search_type'),
-        search_kwargs=get_config('retrieval_kwargs')
-    )
+    # O escopo é alterado pela página de tutoria e lido pelo recuperador a cada pergunta.
+    escopo = {}
+    # Embeddings das perguntas já calculados em `responde_pergunta`, reaproveitados pelo recuperador.
+    vetores_prontos = {}
+    st.session_state['indice_metadados'] = indice_metadados
+    st.session_state['escopo_busca'] = escopo
+    st.session_state['embedding_model'] = vector_store.embeddings
+    st.session_state['vetores_prontos'] = vetores_prontos
+    retriever = cria_retriever(vector_store, indice_bm25, indice_metadados, escopo, memory, vetores_prontos)
     prompt = PromptTemplate.from_template(get_config('prompt'))
     chat_chain = ConversationalRetrievalChain.from_llm(
         llm=chat,
@@ -374,10 +695,88 @@ def cria_chain_conversa():
         verbose=True,
         combine_docs_chain_kwargs={'prompt': prompt}
     )
+    chat_chain.question_generator = cria_condensador(chat_chain.question_generator.prompt)
 
     st.session_state['chain'] = chat_chain
 
 
+def cria_condensador(prompt: PromptTemplate) -> CondensadorDePerguntas:
+    """
+    Cria a cadeia que condensa as perguntas de acompanhamento, conforme `CONDENSACAO_KWARGS`.
+
+    A condensação usa um modelo mais rápido que o do chat, pula as perguntas autocontidas e guarda as
+    condensações em um cache compartilhado, evitando uma chamada ao modelo antes da recuperação.
+
+    Parâmetros:
+    \n\t`prompt (PromptTemplate)`: Prompt de condensação da cadeia de conversação.
+
+    Retorno:
+    \n\t`CondensadorDePerguntas`: A cadeia de condensação.
+
+    Exemplo:
+    >>> chain.question_generator = cria_condensador(chain.question_generator.prompt)
+    """
+    condensacao_kwargs = get_config('condensacao_kwargs')
+    capacidade_cache = condensacao_kwargs.get('capacidade_cache', 0)
+    return CondensadorDePerguntas(
+        llm=ChatOpenAI(model=condensacao_kwargs.get('modelo') or get_config('modelo'), temperature=0,
+                       base_url=endereco_base_api()),
+        prompt=prompt,
+        modo=condensacao_kwargs.get('modo', 'heuristica'),
+        min_palavras=condensacao_kwargs.get('min_palavras', 6),
+        cache=obtem_cache_condensacoes(capacidade_cache) if capacidade_cache else None
+    )
+
+
+def responde_pergunta(chain, pergunta: str) -> dict:
+    """
+    Responde a uma pergunta do aluno com a cadeia de conversação, consultando antes o cache semântico de
+    respostas quando `CACHE_RESPOSTAS_ATIVO` está ativo.
+
+    Apenas a primeira pergunta de cada conversa, sem escopo de busca, usa o cache, pois as seguintes dependem
+    do histórico e as com escopo dependem dos arquivos selecionados. Uma
+    pergunta parecida o suficiente com outra já respondida para o mesmo corpus, prompt e modelo recebe a
+    resposta e os documentos armazenados, sem condensação, recuperação nem geração. Em caso de falta, o
+    embedding da pergunta é reaproveitado pela recuperação.
+
+    Parâmetros:
+    \n\t`chain (ConversationalRetrievalChain)`: Cadeia de conversação da sessão.
+    \n\t`pergunta (str)`: Pergunta do aluno.
+
+    Retorno:
+    \n\t`dict`: Saída da cadeia, com as chaves `question`, `chat_history`, `answer` e `source_documents`.
+
+    Exemplo:
+    >>> resposta = responde_pergunta(st.session_state['chain'], 'O que é limite?')
+    >>> resposta['answer']
+    'Vamos pensar juntos: o que acontece com f(x) quando x se aproxima de a?'
+    """
+    cache = None
+    vetores_prontos = st.session_state.get('vetores_prontos', {})
+    if get_config('cache_respostas_ativo') and not chain.memory.chat_memory.messages and \
+            not st.session_state.get('escopo_busca'):
+        cache = obtem_cache_respostas(**get_config('cache_respostas_kwargs'))
+        chave_contexto = st.session_state['chave_contexto_respostas']
+        vetor = st.session_state['embedding_model'].embed_query(pergunta)
+        resposta = cache.busca(chave_contexto, vetor)
+        if resposta is not None:
+            chain.memory.save_context({'question': pergunta}, {'answer': resposta['answer']})
+            return {**resposta,
+                    'question': pergunta,
+                    'chat_history': chain.memory.load_memory_variables({})['chat_history']}
+        # Sem histórico, a pergunta chega ao recuperador sem condensação e é buscada com este mesmo vetor.
+        vetores_prontos[pergunta] = vetor
+
+    try:
+        resposta = chain.invoke({'question': pergunta})
+    finally:
+        # Descarta o vetor não usado (por exemplo, de uma consulta respondida apenas pelo BM25).
+        vetores_prontos.clear()
+    if cache is not None:
+        cache.grava(st.session_state['fingerprint_corpus'], chave_contexto, vetor, pergunta, resposta)
+    return resposta
+
+
 # FUNÇÕES ==================================================
 
 
@@ -445,11 +844,11 @@ def nova_mensagem(prompt: str, mensagens: list, flag: bool = False, placeholder=
 
     """
     Processa a mensagem do usuário e obtém a resposta do assistente via streaming,
-    usando a função retorna_resposta_modelo().
+    usando a função transmite_resposta_modelo_async(), consumida por itera_em_segundo_plano().
 
     - Adiciona a mensagem do usuário ao histórico.
-    - Faz a chamada à API em modo streaming.
-    - Para cada chunk recebido, o token é acumulado e yieldado.
+    - Faz a chamada à API em modo streaming, no laço de eventos de segundo plano.
+    - Para cada pedaço de texto recebido, o pedaço é acumulado e yieldado.
     - Ao final, adiciona a resposta completa (do assistente) ao histórico,
       salva e atualiza o st.session_state.
 
@@ -457,42 +856,35 @@ def nova_mensagem(prompt: str, mensagens: list, flag: bool = False, placeholder=
     """
 
     """
-    Recebe o prompt do usuário, chama retorna_resposta_modelo() em modo streaming,
-    yieldando pedaços de texto do assistente.
-    Não exibe nada no Streamlit. A exibição fica no pg_conversas().
+    Recebe o prompt do usuário, chama transmite_resposta_modelo_async() em modo streaming,
+    yieldando pedaços de texto do assistente, e guarda as métricas do fluxo em
+    st.session_state['metricas_stream'].
+    Não exibe nada no Streamlit. A exibição fica no pg_conversas() e as métricas, no pg_analise().
     """
     # Adiciona mensagem do usuário ao histórico
     nova_msg_usuario = {"role": "user", "content": prompt}
     mensagens.append(nova_msg_usuario)
 
-    resposta_completa = ""
+    partes_resposta = []
+    metricas = MetricasStream()
     try:
-        # Chamamos retorna_resposta_modelo com stream=True
-        for line in retorna_resposta_modelo(
+        # O streaming é feito pelo cliente assíncrono, no laço de eventos de segundo plano.
+        for content in itera_em_segundo_plano(transmite_resposta_modelo_async(
             mensagens,
             st.session_state['api_key'],
             modelo=st.session_state['modelo'],
-            stream=True
-        ):
-            if not line.startswith("data: "):
-                continue
-            if line.strip() == "data: [DONE]":
-                break
-
-            conteudo_json = line[len("data: "):]
-            try:
-                pedaco = json.loads(conteudo_json)
-            except json.JSONDecodeError:
-                continue
-
-            delta = pedaco.get("choices", [{}])[0].get("delta", {})
-            content = delta.get("content", "")
-            resposta_completa += content
+            metricas=metricas,
+            hedging=get_config('hedging_ativo')
+        )):
+            partes_resposta.append(content)
             yield content
 
     except Exception as e:
         yield f"[ERRO]: {e}"
 
+    resposta_completa = ''.join(partes_resposta)
+    st.session_state['metricas_stream'] = metricas.resumo()
+
     # Ao final, adiciona a resposta ao histórico
     nova_msg_assistente = {"role": "assistant", "content": resposta_completa}
     mensagens.append(nova_msg_assistente)
@@ -669,17 +1061,24 @@ def transcreve_audio(caminho_audio: str, prompt: str, headers: dict, _return: bo
         #     }
         # )
         # headers['Content-Type'] = m.content_type
+        # Os bytes (e não um BytesIO) permitem reenviar o arquivo nas novas tentativas.
         files = {
-            'file': ('audio.mp3', BytesIO(audio_bytes), 'audio/mpeg'),
+            'file': ('audio.mp3', audio_bytes, 'audio/mpeg'),
             'model': (None, 'whisper-1'),
             'language': (None, 'pt'),
             'response_format': (None, 'text'),
             'prompt': (None, prompt)
         }
 
-        response = requests.post(
-            # "https://api.openai.com/v1/audio/transcriptions", headers=headers, data=m)
-            "https://api.openai.com/v1/audio/transcriptions", headers=headers, files=files)
+        try:
+            response = envia_com_retentativas(lambda timeout: obtem_sessao_http().post(
+                # "https://api.openai.com/v1/audio/transcriptions", headers=headers, data=m)
+                url_api('audio/transcriptions'), headers=headers, files=files, timeout=timeout))
+        except requests.HTTPError as erro:
+            response = erro.response
+        except Exception as erro:
+            print(f"Erro: {erro}")
+            return st.error(f"Erro ao acessar a API da OpenAI: {erro}")
 
         try:
             if response.status_code == 200:
@@ -876,16 +1275,24 @@ def transcreve_audio_recebido():
         if arquivo_audio is not None and st.session_state['transcricao'] == '':
             audio_bytes = arquivo_audio.read()
 
+            # Os bytes (e não um BytesIO) permitem reenviar o arquivo nas novas tentativas.
             files = {
-                'file': ('audio.mp3', BytesIO(audio_bytes), 'audio/mpeg'),
+                'file': ('audio.mp3', audio_bytes, 'audio/mpeg'),
                 'model': (None, 'whisper-1'),
                 'language': (None, 'pt'),
                 'response_format': (None, 'text'),
                 'prompt': (None, prompt_input)
             }
             with st.spinner('Processando o áudio...'):
-                response = requests.post(
-                    "https://api.openai.com/v1/audio/transcriptions", headers=headers, files=files)
+                try:
+                    response = envia_com_retentativas(lambda timeout: obtem_sessao_http().post(
+                        url_api('audio/transcriptions'), headers=headers, files=files, timeout=timeout))
+                except requests.HTTPError as erro:
+                    response = erro.response
+                except Exception as erro:
+                    print(f"Erro: {erro}")
+                    st.error(f"Erro ao acessar a API da OpenAI: {erro}")
+                    return
 
                 try:
                     if response.status_code == 200:
@@ -1579,6 +1986,7 @@ def config_page() -> None:
     Operações:
     \n\t- Exibe os campos de entrada para alteração do modelo de IA.
     \n\t- Permite modificar o tipo de busca e parâmetros de recuperação de informações.
+    \n\t- Permite escolher o tipo de índice vetorial (flat, IVF ou HNSW), a quantização e os seus parâmetros.
     \n\t- Exibe e permite a edição do prompt base utilizado pelo chatbot.
     \n\t- Atualiza os valores na sessão do Streamlit e reinicia o chatbot se necessário.
 
@@ -1593,21 +2001,40 @@ def config_page() -> None:
     model = st.text_input('Modifique o modelo',
                           value=get_config('modelo'))
 
-    retrieval_search_type = st.text_input('Modifique o tipo de retrieval',
-                                          value=get_config('retrieval_search_type'))
+    tipos_retrieval = ['similarity', 'mmr', 'bm25', 'hibrido']
+    retrieval_search_type = st.selectbox('Modifique o tipo de retrieval',
+                                         tipos_retrieval,
+                                         index=tipos_retrieval.index(get_config('retrieval_search_type'))
+                                         if get_config('retrieval_search_type') in tipos_retrieval else 0)
 
     retrieval_kwargs = st.text_input('Modifique os parâmetros de retrieval',
                                      value=json.dumps(get_config('retrieval_kwargs')))
 
+    hibrido_kwargs = st.text_input('Modifique os parâmetros da busca lexical e híbrida',
+                                   value=json.dumps(get_config('hibrido_kwargs')))
+
+    tipos_indice = ['flat', 'ivf', 'hnsw']
+    indice_tipo = st.selectbox('Modifique o tipo de índice vetorial',
+                               tipos_indice,
+                               index=tipos_indice.index(get_config('indice_tipo')))
+
+    indice_kwargs = st.text_input('Modifique os parâmetros do índice vetorial (quantizacao: nenhuma, sq8, sq4 ou pq)',
+                                  value=json.dumps(get_config('indice_kwargs')))
+
     prompt = st.text_area('Modifique o prompt padrão',
                           height=300,
                           value=get_config('prompt'))
 
     if st.button('Salvar parâmetros', use_container_width=True):
         retrieval_kwargs = json.loads(retrieval_kwargs.replace("'", '"'))
+        hibrido_kwargs = json.loads(hibrido_kwargs.replace("'", '"'))
+        indice_kwargs = json.loads(indice_kwargs.replace("'", '"'))
         st.session_state['modelo'] = model
         st.session_state['retrieval_search_type'] = retrieval_search_type
         st.session_state['retrieval_kwargs'] = retrieval_kwargs
+        st.session_state['hibrido_kwargs'] = hibrido_kwargs
+        st.session_state['indice_tipo'] = indice_tipo
+        st.session_state['indice_kwargs'] = indice_kwargs
         st.session_state['prompt'] = prompt
         st.info('Parâmetros salvos com sucesso!')
         st.rerun()
@@ -1624,12 +2051,53 @@ def config_page() -> None:
 
 # Página de Tutoria =========================
 
+def seleciona_escopo_busca() -> None:
+    """
+    Exibe os controles que restringem as perguntas a alguns PDFs e, para um único PDF, a um intervalo de
+    páginas, atualizando o escopo de busca lido pelo recuperador.
+
+    Retorno:
+    \n\t`None`: Apenas exibe os controles e atualiza `st.session_state['escopo_busca']`.
+
+    Exemplo:
+    >>> seleciona_escopo_busca()
+    """
+    indice_metadados = st.session_state.get('indice_metadados')
+    escopo = st.session_state.get('escopo_busca')
+    if indice_metadados is None or escopo is None:
+        return
+
+    with st.expander('🔎 Escopo da pergunta'):
+        fontes = st.multiselect('Restrinja a busca a alguns PDFs',
+                                indice_metadados.fontes(),
+                                default=[fonte for fonte in escopo.get('fontes', [])
+                                         if fonte in indice_metadados.fontes()])
+        intervalo = None
+        if len(fontes) == 1:
+            paginas = indice_metadados.paginas(fontes[0])
+            if paginas and paginas[-1] > paginas[0]:
+                # As páginas são exibidas a partir de 1.
+                inicio, fim = st.slider('Intervalo de páginas',
+                                        paginas[0] + 1, paginas[-1] + 1,
+                                        value=(paginas[0] + 1, paginas[-1] + 1))
+                if (inicio - 1, fim - 1) != (paginas[0], paginas[-1]):
+                    intervalo = [inicio - 1, fim - 1]
+
+    # O dicionário é alterado no lugar, pois é o mesmo objeto usado pelo recuperador.
+    escopo.clear()
+    if fontes:
+        escopo['fontes'] = fontes
+    if intervalo:
+        escopo['paginas'] = intervalo
+
+
 def pg_tutoria() -> None:
     """
     Exibe a página de tutoria do chatbot, permitindo interações com documentos previamente carregados.
 
     Operações:
     \n\t- Exibe um cabeçalho e um aviso se nenhum documento for carregado.
+    \n\t- Permite restringir as perguntas a alguns PDFs ou a um intervalo de páginas.
     \n\t- Recupera o histórico de conversas do chatbot e exibe as mensagens.
     \n\t- Permite ao usuário interagir com o chatbot enviando novas mensagens.
     \n\t- Exibe respostas do chatbot com base nos documentos processados.
@@ -1643,11 +2111,15 @@ def pg_tutoria() -> None:
     st.header('🎓 ATI - Agente Tutor Inteligente', divider=True)
 
     if not 'chain' in st.session_state or st.session_state['chain'] == '':
+        if inicializa_chain_do_cache():
+            st.rerun()
         st.error('Faça o upload de PDFs para começar!')
     else:
         chain = st.session_state['chain']
         memory = chain.memory
 
+        seleciona_escopo_busca()
+
         mensagens = memory.load_memory_variables({})['chat_history']
 
         container = st.container()
@@ -1664,7 +2136,7 @@ def pg_tutoria() -> None:
             # chat.markdown('▌ ')  # Gerando resposta
             chat.markdown("<span>▌</span>", unsafe_allow_html=True)
 
-            resposta = chain.invoke({'question': nova_mensagem})
+            resposta = responde_pergunta(chain, nova_mensagem)
             st.session_state['ultima_resposta'] = resposta
             st.rerun()
 
@@ -1886,6 +2358,19 @@ def pg_analise() -> None:
 
     st.header('📇 Página de debug', divider=True)
 
+    if st.session_state.get('metricas_stream'):
+        metricas = st.session_state['metricas_stream']
+        st.caption(f"Última resposta transmitida: {metricas['tokens']} pedaço(s) de texto em "
+                   f"{metricas['duracao']:.2f} s; primeiro token em {metricas['ttft'] or 0:.2f} s, "
+                   f"{metricas['tokens_por_segundo'] or 0:.1f} pedaço(s) por segundo, "
+                   f"intervalo p95 de {metricas['intervalo_p95'] or 0:.3f} s e "
+                   f"{metricas['eventos_invalidos']} evento(s) inválido(s).")
+    if get_config('hedging_ativo'):
+        estatisticas = estatisticas_hedging()
+        st.caption(f"Hedging (processo): {estatisticas['hedges']} duplicata(s) em {estatisticas['requisicoes']} "
+                   f"resposta(s), {estatisticas['vitorias_hedge']} vencida(s) pela duplicata e "
+                   f"{estatisticas['suprimidos']} suprimida(s); limiar atual de {estatisticas['limiar']:.2f} s.")
+
     prompt_template = get_config('prompt')
     prompt_template = PromptTemplate.from_template(prompt_template)
 
@@ -1902,6 +2387,18 @@ def pg_analise() -> None:
         memory = chain.memory
         chat_history = memory.buffer_as_str
 
+        if isinstance(chain.retriever, RecuperadorComOrcamentoDeTokens) and chain.retriever.estatisticas:
+            estatisticas = chain.retriever.estatisticas
+            st.caption(f"Contexto: {estatisticas['tokens_enviados']} de {estatisticas['tokens_recuperados']} tokens "
+                       f"recuperados (orçamento de {estatisticas['orcamento']}); "
+                       f"{estatisticas['trechos_truncados']} trecho(s) truncado(s) e "
+                       f"{estatisticas['trechos_descartados']} descartado(s).")
+        if isinstance(chain.question_generator, CondensadorDePerguntas):
+            estatisticas = chain.question_generator.estatisticas
+            st.caption(f"Condensação da pergunta: {estatisticas['puladas']} pulada(s), "
+                       f"{estatisticas['cache']} do cache e {estatisticas['modelo']} pelo modelo "
+                       f"(última: {estatisticas['ultima'] or 'primeira pergunta'}).")
+
         with st.container(border=True):
             prompt = prompt_template.format(
                 chat_history=chat_history,
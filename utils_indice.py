@@ -0,0 +1,981 @@
+# --- File: utils_indice.py --- #
+
+# --- Libraries --- #
+import os  # Biblioteca para manipulação de arquivos e diretórios.
+import json  # Biblioteca para manipulação de arquivos JSON.
+import shutil  # Biblioteca para remoção recursiva de diretórios.
+import hashlib  # Biblioteca para cálculo de hashes criptográficos.
+import tempfile  # Biblioteca para criação de diretórios temporários.
+import sqlite3  # Banco de dados local usado para armazenar os documentos dos índices.
+import threading  # Biblioteca para sincronizar o acesso aos índices compartilhados.
+import time  # Biblioteca para verificar a idade dos diretórios temporários.
+from pathlib import Path  # Manipulação de caminhos de arquivos e diretórios.
+
+import faiss  # Biblioteca de busca vetorial usada para construir os índices.
+import numpy as np  # Biblioteca para manipulação dos vetores de embedding.
+# Utiliza a biblioteca FAISS para armazenar e recuperar embeddings de documentos.
+from langchain_community.vectorstores.faiss import FAISS
+# Armazena em memória os documentos associados aos vetores do índice.
+from langchain_community.docstore.in_memory import InMemoryDocstore
+# Interfaces de docstore utilizadas pelo FAISS do LangChain.
+from langchain_community.docstore.base import AddableMixin, Docstore
+# Estrutura de documento utilizada pelo LangChain.
+from langchain_core.documents import Document
+# Importa o agrupamento em lotes usado na indexação em fluxo.
+from utils_ingestao import itera_lotes
+# Importa os índices lexical e de metadados salvos junto a cada índice vetorial e a reconstrução dos vetores.
+from utils_recuperacao import IndiceBM25, IndiceMetadados, extrai_indice_ivf, reconstroi_vetores
+
+# --- Directory Setup --- #
+PASTA_INDICES = Path(__file__).parent / 'indices'
+PASTA_INDICES.mkdir(exist_ok=True)
+
+# --- Attributes --- #
+# Tamanho dos blocos lidos de cada arquivo durante o cálculo do hash.
+TAMANHO_BLOCO_HASH = 1024 * 1024
+# Nome do arquivo com os metadados de cada índice armazenado em cache.
+ARQUIVO_MANIFESTO = 'manifesto.json'
+# Arquivos que compõem cada índice armazenado em cache.
+ARQUIVO_INDICE = 'indice.faiss'
+ARQUIVO_DOCUMENTOS = 'documentos.sqlite'
+ARQUIVO_IDS = 'ids.json'
+ARQUIVO_BM25 = 'bm25.json'
+ARQUIVO_METADADOS = 'metadados.json'
+# Quantidade máxima de índices mantidos no cache em disco.
+LIMITE_INDICES_EM_CACHE = 5
+# Prefixo dos diretórios temporários das gravações em andamento.
+PREFIXO_TEMPORARIO = '.tmp-'
+# Idade, em segundos, a partir da qual um diretório temporário é considerado abandonado.
+IDADE_MAXIMA_TEMPORARIOS = 3600
+# Índices carregados em memória, compartilhados por todas as sessões do processo.
+# Cada entrada associa a impressão digital do corpus ao índice e às sessões que o utilizam.
+_VECTOR_STORES_COMPARTILHADOS = {}
+_LOCK_VECTOR_STORES = threading.Lock()
+# Parâmetros do índice que só afetam a busca e, portanto, não exigem reconstruí-lo.
+PARAMETROS_BUSCA_INDICE = ('nprobe', 'ef_search')
+
+
+# --- Methods --- #
+# IDENTIFICAÇÃO DO CORPUS ========================
+
+def calcula_hash_arquivo(caminho: Path) -> str:
+    """
+    Calcula o hash SHA-256 do conteúdo de um arquivo, lendo-o em blocos para não carregá-lo inteiro na memória.
+
+    Parâmetros:
+    \n\t`caminho (Path)`: Caminho do arquivo.
+
+    Retorno:
+    \n\t`str`: Hash hexadecimal do conteúdo do arquivo.
+
+    Exemplo:
+    >>> calcula_hash_arquivo(PASTA_ARQUIVOS / 'calculo.pdf')
+    '9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08'
+    """
+    sha = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(TAMANHO_BLOCO_HASH), b''):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+
+def calcula_hashes_arquivos(arquivos: list) -> dict:
+    """
+    Calcula o hash do conteúdo de cada arquivo do corpus.
+
+    Parâmetros:
+    \n\t`arquivos (list)`: Lista de caminhos dos arquivos PDF do corpus.
+
+    Retorno:
+    \n\t`dict`: Dicionário que associa o nome de cada arquivo ao hash do seu conteúdo.
+
+    Exemplo:
+    >>> calcula_hashes_arquivos(PASTA_ARQUIVOS.glob('*.pdf'))
+    {'calculo.pdf': '9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08'}
+    """
+    return {Path(arquivo).name: calcula_hash_arquivo(arquivo) for arquivo in sorted(arquivos)}
+
+
+def calcula_hash_parametros(splitter_kwargs: dict, modelo_embedding: str, indice_tipo: str = 'flat', indice_kwargs: dict = None,
+                            deduplicacao_kwargs: dict = None) -> str:
+    """
+    Calcula o hash dos parâmetros que determinam os vetores gerados para um mesmo documento.
+
+    Índices com o mesmo hash de parâmetros podem ser atualizados incrementalmente entre si, pois um mesmo
+    PDF produz neles os mesmos trechos, os mesmos embeddings e a mesma estrutura de índice. Os parâmetros
+    que só afetam a busca (`PARAMETROS_BUSCA_INDICE`) não entram no hash.
+
+    Parâmetros:
+    \n\t`splitter_kwargs (dict)`: Parâmetros utilizados na divisão dos documentos.
+    \n\t`modelo_embedding (str)`: Nome do modelo de embedding.
+    \n\t`indice_tipo (str)`: Tipo do índice FAISS (padrão: `'flat'`).
+    \n\t`indice_kwargs (dict)`: Parâmetros de construção do índice (opcional).
+    \n\t`deduplicacao_kwargs (dict)`: Parâmetros da deduplicação de trechos, se ativa (opcional).
+
+    Retorno:
+    \n\t`str`: Hash hexadecimal dos parâmetros.
+
+    Exemplo:
+    >>> calcula_hash_parametros(SPLITTER_KWARGS, MODELO_EMBEDDING)
+    'c0535e4be2b79ffd93291305436bf889314e4a3faec05ecffcbb7df31ad9e51a'
+    """
+    parametros = {
+        'splitter_kwargs': splitter_kwargs,
+        'modelo_embedding': modelo_embedding
+    }
+    # O índice plano padrão mantém o hash dos índices construídos antes da escolha do tipo de índice.
+    if indice_tipo != 'flat' or (indice_kwargs or {}).get('quantizacao', 'nenhuma') != 'nenhuma':
+        parametros['indice'] = {
+            'tipo': indice_tipo,
+            **{chave: valor for chave, valor in (indice_kwargs or {}).items()
+               if chave not in PARAMETROS_BUSCA_INDICE}
+        }
+    if deduplicacao_kwargs is not None:
+        parametros['deduplicacao'] = deduplicacao_kwargs
+    conteudo = json.dumps(parametros, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(conteudo.encode('utf-8')).hexdigest()
+
+
+def calcula_fingerprint_corpus(hashes_arquivos: dict, hash_parametros: str) -> str:
+    """
+    Calcula a impressão digital (fingerprint) de um corpus de documentos.
+
+    A impressão digital combina o nome e o conteúdo de cada PDF, os parâmetros do splitter e o modelo de
+    embedding, de modo que qualquer alteração em um desses itens gere um índice diferente.
+
+    Parâmetros:
+    \n\t`hashes_arquivos (dict)`: Hashes dos arquivos, calculados por `calcula_hashes_arquivos`.
+    \n\t`hash_parametros (str)`: Hash dos parâmetros, calculado por `calcula_hash_parametros`.
+
+    Retorno:
+    \n\t`str`: Hash hexadecimal que identifica o corpus.
+
+    Exemplo:
+    >>> calcula_fingerprint_corpus(hashes_arquivos, hash_parametros)
+    '3a7bd3e2360a3d29eea436fcfb7e44c735d117c42d1c1835420b6b9942dd4f1b'
+    """
+    identificacao = {
+        'arquivos': sorted(hashes_arquivos.items()),
+        'parametros': hash_parametros
+    }
+    conteudo = json.dumps(identificacao, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(conteudo.encode('utf-8')).hexdigest()
+
+
+# CACHE DE ÍNDICES ========================
+
+class DocstoreSQLite(Docstore, AddableMixin):
+    """
+    Docstore que lê os documentos de um banco SQLite sob demanda, em vez de carregá-los todos na memória.
+
+    As páginas do banco ficam no cache de páginas do sistema operacional e são compartilhadas entre os
+    processos que abrem o mesmo índice. A conexão é aberta na criação e mantida aberta, de modo que o banco
+    continua legível mesmo que o índice seja removido do cache em disco enquanto está em uso.
+
+    Exemplo:
+    >>> docstore = DocstoreSQLite(PASTA_INDICES / fingerprint / ARQUIVO_DOCUMENTOS)
+    >>> docstore.search('calculo.pdf:0').metadata
+    {'source': 'calculo.pdf', 'page': 0, 'doc_id': 'calculo.pdf:0'}
+    """
+
+    def __init__(self, caminho: Path, somente_leitura: bool = True):
+        """
+        Parâmetros:
+        \n\t`caminho (Path)`: Caminho do banco SQLite.
+        \n\t`somente_leitura (bool)`: Se `True`, abre o banco em modo somente leitura (padrão: `True`).
+        """
+        modo = 'ro' if somente_leitura else 'rwc'
+        self._conexao = sqlite3.connect(
+            f'file:{Path(caminho).as_posix()}?mode={modo}', uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+        if not somente_leitura:
+            with self._lock, self._conexao:
+                self._conexao.execute(
+                    'CREATE TABLE IF NOT EXISTS documentos (id TEXT PRIMARY KEY, conteudo TEXT NOT NULL, metadados TEXT NOT NULL)')
+
+    def search(self, search: str):
+        """
+        Busca um documento pelo identificador.
+
+        Parâmetros:
+        \n\t`search (str)`: Identificador do documento.
+
+        Retorno:
+        \n\t`Document | str`: O documento ou, seguindo o `InMemoryDocstore`, uma mensagem caso não exista.
+        """
+        with self._lock:
+            linha = self._conexao.execute(
+                'SELECT conteudo, metadados FROM documentos WHERE id = ?', (search,)).fetchone()
+        if linha is None:
+            return f"ID {search} not found."
+        return Document(page_content=linha[0], metadata=json.loads(linha[1]))
+
+    def add(self, texts: dict) -> None:
+        """
+        Adiciona documentos ao banco.
+
+        Parâmetros:
+        \n\t`texts (dict)`: Dicionário que associa cada identificador ao seu documento.
+        """
+        with self._lock, self._conexao:
+            self._conexao.executemany(
+                'INSERT OR REPLACE INTO documentos (id, conteudo, metadados) VALUES (?, ?, ?)',
+                [(id_doc, doc.page_content, json.dumps(doc.metadata, ensure_ascii=False))
+                 for id_doc, doc in texts.items()]
+            )
+
+    def delete(self, ids: list) -> None:
+        """
+        Remove documentos do banco.
+
+        Parâmetros:
+        \n\t`ids (list)`: Identificadores dos documentos a remover.
+        """
+        with self._lock, self._conexao:
+            self._conexao.executemany(
+                'DELETE FROM documentos WHERE id = ?', [(id_doc,) for id_doc in ids])
+
+    def fecha(self) -> None:
+        """
+        Fecha a conexão com o banco.
+        """
+        self._conexao.close()
+
+    def documentos(self) -> dict:
+        """
+        Lê todos os documentos do banco.
+
+        Retorno:
+        \n\t`dict`: Dicionário que associa cada identificador ao seu documento.
+        """
+        with self._lock:
+            linhas = self._conexao.execute(
+                'SELECT id, conteudo, metadados FROM documentos').fetchall()
+        return {id_doc: Document(page_content=conteudo, metadata=json.loads(metadados))
+                for id_doc, conteudo, metadados in linhas}
+
+
+def le_indice_faiss(caminho: Path, mmap: bool = True):
+    """
+    Lê um índice FAISS do disco, mapeando-o em memória quando possível.
+
+    Com o mapeamento, as listas invertidas dos índices IVF não são copiadas para a memória do processo: são
+    lidas sob demanda, no primeiro acesso, e compartilhadas entre processos pelo cache de páginas do sistema
+    operacional. Índices que o FAISS não consegue mapear são lidos integralmente.
+
+    Parâmetros:
+    \n\t`caminho (Path)`: Caminho do arquivo do índice.
+    \n\t`mmap (bool)`: Se `True`, tenta mapear o índice em memória em modo somente leitura (padrão: `True`).
+
+    Retorno:
+    \n\t`faiss.Index`: O índice lido.
+
+    Exemplo:
+    >>> indice = le_indice_faiss(PASTA_INDICES / fingerprint / ARQUIVO_INDICE)
+    """
+    if mmap:
+        try:
+            return faiss.read_index(str(caminho), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError as e:
+            print("Índice não suporta mapeamento em memória, lendo integralmente:", e)
+    return faiss.read_index(str(caminho))
+
+
+def existe_indice_em_cache(fingerprint: str) -> bool:
+    """
+    Indica se há um índice em cache para uma impressão digital de corpus.
+
+    Parâmetros:
+    \n\t`fingerprint (str)`: Impressão digital do corpus.
+
+    Retorno:
+    \n\t`bool`: `True` se o índice existe no cache em disco.
+
+    Exemplo:
+    >>> existe_indice_em_cache(fingerprint)
+    True
+    """
+    return (PASTA_INDICES / fingerprint / ARQUIVO_MANIFESTO).exists()
+
+
+def carrega_vector_store_em_cache(fingerprint: str, embedding_model, mmap: bool = True):
+    """
+    Carrega do disco o índice FAISS e o docstore associados a uma impressão digital de corpus.
+
+    Com `mmap=True`, o índice é mapeado em memória e os documentos são lidos sob demanda do SQLite, o que
+    torna o carregamento praticamente instantâneo; o índice resultante é somente leitura. Para atualizar o
+    índice, use `mmap=False`, que carrega índice e documentos integralmente na memória.
+
+    Parâmetros:
+    \n\t`fingerprint (str)`: Impressão digital do corpus, calculada por `calcula_fingerprint_corpus`.
+    \n\t`embedding_model`: Modelo de embedding usado para vetorizar as consultas.
+    \n\t`mmap (bool)`: Se `True`, carrega o índice mapeado em memória e somente leitura (padrão: `True`).
+
+    Retorno:
+    \n\t`FAISS | None`: O índice carregado ou `None` caso não exista em cache ou não possa ser lido.
+
+    Exemplo:
+    >>> vector_store = carrega_vector_store_em_cache(fingerprint, OpenAIEmbeddings())
+    """
+    pasta = PASTA_INDICES / fingerprint
+    if not existe_indice_em_cache(fingerprint):
+        return None
+    try:
+        if not (pasta / ARQUIVO_INDICE).exists():
+            # Índices gravados no formato padrão do LangChain (index.faiss e index.pkl).
+            vector_store = FAISS.load_local(
+                str(pasta),
+                embedding_model,
+                allow_dangerous_deserialization=True
+            )
+        else:
+            with open(pasta / ARQUIVO_IDS, 'r', encoding='utf-8') as f:
+                index_to_docstore_id = {int(posicao): id_doc
+                                        for posicao, id_doc in json.load(f).items()}
+            docstore = DocstoreSQLite(pasta / ARQUIVO_DOCUMENTOS)
+            if not mmap:
+                docstore = InMemoryDocstore(docstore.documentos())
+            vector_store = FAISS(
+                embedding_function=embedding_model,
+                index=le_indice_faiss(pasta / ARQUIVO_INDICE, mmap),
+                docstore=docstore,
+                index_to_docstore_id=index_to_docstore_id
+            )
+        # Atualiza a data de modificação para manter o índice entre os mais recentes.
+        os.utime(pasta)
+        return vector_store
+    except Exception as e:
+        print("Falha ao carregar o índice em cache:", e)
+        return None
+
+
+def salva_vector_store_em_cache(vector_store, fingerprint: str, manifesto: dict = None, indice_bm25=None,
+                                indice_metadados=None) -> bool:
+    """
+    Persiste o índice FAISS e o docstore no disco, endereçados pela impressão digital do corpus.
+
+    O índice é gravado no formato nativo do FAISS, que pode ser mapeado em memória, e os documentos em um
+    banco SQLite lido sob demanda. A gravação é feita em um diretório temporário que só é renomeado ao final,
+    evitando que uma gravação interrompida deixe um índice incompleto no cache.
+
+    Parâmetros:
+    \n\t`vector_store (FAISS)`: Índice a ser salvo.
+    \n\t`fingerprint (str)`: Impressão digital do corpus.
+    \n\t`manifesto (dict)`: Metadados adicionais salvos junto ao índice (opcional).
+    \n\t`indice_bm25 (IndiceBM25)`: Índice lexical do mesmo corpus (opcional).
+    \n\t`indice_metadados (IndiceMetadados)`: Índice de arquivos e páginas do mesmo corpus (opcional).
+
+    Retorno:
+    \n\t`bool`: `True` se o índice foi salvo, `False` caso contrário.
+
+    Exemplo:
+    >>> salva_vector_store_em_cache(vector_store, fingerprint)
+    True
+    """
+    if vector_store is None:
+        return False
+    pasta = PASTA_INDICES / fingerprint
+    pasta_temp = Path(tempfile.mkdtemp(prefix=PREFIXO_TEMPORARIO, dir=PASTA_INDICES))
+    try:
+        faiss.write_index(vector_store.index, str(pasta_temp / ARQUIVO_INDICE))
+        docstore = DocstoreSQLite(pasta_temp / ARQUIVO_DOCUMENTOS, somente_leitura=False)
+        docstore.add({id_doc: vector_store.docstore.search(id_doc)
+                      for id_doc in vector_store.index_to_docstore_id.values()})
+        docstore.fecha()
+        with open(pasta_temp / ARQUIVO_IDS, 'w', encoding='utf-8') as f:
+            json.dump({str(posicao): id_doc for posicao, id_doc in vector_store.index_to_docstore_id.items()},
+                      f, ensure_ascii=False)
+        if indice_bm25 is not None:
+            indice_bm25.salva(pasta_temp / ARQUIVO_BM25)
+        if indice_metadados is not None:
+            indice_metadados.salva(pasta_temp / ARQUIVO_METADADOS)
+        with open(pasta_temp / ARQUIVO_MANIFESTO, 'w', encoding='utf-8') as f:
+            json.dump({'fingerprint': fingerprint, **(manifesto or {})},
+                      f, ensure_ascii=False)
+        if pasta.exists():
+            shutil.rmtree(pasta)
+        os.replace(pasta_temp, pasta)
+        return True
+    except Exception as e:
+        print("Falha ao salvar o índice em cache:", e)
+        shutil.rmtree(pasta_temp, ignore_errors=True)
+        return False
+
+
+def _carrega_indice_auxiliar_em_cache(fingerprint: str, classe, arquivo: str, vector_store=None):
+    """
+    Carrega um índice auxiliar (lexical ou de metadados) salvo junto a um índice vetorial em cache.
+
+    Índices gravados antes da existência do índice auxiliar não o possuem: nesse caso, se o índice vetorial
+    for informado, o índice auxiliar é reconstruído a partir dos seus documentos.
+
+    Parâmetros:
+    \n\t`fingerprint (str)`: Impressão digital do corpus.
+    \n\t`classe (type)`: Classe do índice auxiliar, com os métodos `carrega` e `adiciona`.
+    \n\t`arquivo (str)`: Nome do arquivo do índice auxiliar.
+    \n\t`vector_store (FAISS)`: Índice vetorial do mesmo corpus, usado na reconstrução (opcional).
+
+    Retorno:
+    \n\t`IndiceBM25 | IndiceMetadados | None`: O índice ou `None` caso não exista e não possa ser reconstruído.
+    """
+    caminho = PASTA_INDICES / fingerprint / arquivo
+    if caminho.exists():
+        try:
+            return classe.carrega(caminho)
+        except Exception as e:
+            print(f"Falha ao carregar {arquivo} em cache:", e)
+    if vector_store is None:
+        return None
+    indice = classe()
+    indice.adiciona(vector_store.docstore.search(doc_id)
+                    for doc_id in vector_store.index_to_docstore_id.values())
+    return indice
+
+
+def carrega_indice_bm25_em_cache(fingerprint: str, vector_store=None):
+    """
+    Carrega o índice lexical salvo junto a um índice vetorial em cache, reconstruindo-o a partir do índice
+    vetorial caso não exista.
+
+    Parâmetros:
+    \n\t`fingerprint (str)`: Impressão digital do corpus.
+    \n\t`vector_store (FAISS)`: Índice vetorial do mesmo corpus, usado na reconstrução (opcional).
+
+    Retorno:
+    \n\t`IndiceBM25 | None`: O índice lexical ou `None` caso não exista e não possa ser reconstruído.
+
+    Exemplo:
+    >>> indice_bm25 = carrega_indice_bm25_em_cache(fingerprint, vector_store)
+    """
+    return _carrega_indice_auxiliar_em_cache(fingerprint, IndiceBM25, ARQUIVO_BM25, vector_store)
+
+
+def carrega_indice_metadados_em_cache(fingerprint: str, vector_store=None):
+    """
+    Carrega o índice de arquivos e páginas salvo junto a um índice vetorial em cache, reconstruindo-o a partir
+    do índice vetorial caso não exista.
+
+    Parâmetros:
+    \n\t`fingerprint (str)`: Impressão digital do corpus.
+    \n\t`vector_store (FAISS)`: Índice vetorial do mesmo corpus, usado na reconstrução (opcional).
+
+    Retorno:
+    \n\t`IndiceMetadados | None`: O índice de metadados ou `None` caso não exista e não possa ser reconstruído.
+
+    Exemplo:
+    >>> indice_metadados = carrega_indice_metadados_em_cache(fingerprint, vector_store)
+    """
+    return _carrega_indice_auxiliar_em_cache(fingerprint, IndiceMetadados, ARQUIVO_METADADOS, vector_store)
+
+
+def carrega_manifesto(fingerprint: str) -> dict:
+    """
+    Lê o manifesto de um índice armazenado em cache.
+
+    Parâmetros:
+    \n\t`fingerprint (str)`: Impressão digital do corpus.
+
+    Retorno:
+    \n\t`dict | None`: Manifesto do índice ou `None` caso não exista.
+
+    Exemplo:
+    >>> carrega_manifesto(fingerprint)['arquivos']
+    {'calculo.pdf': {'hash': '9f86...', 'ids': ['calculo.pdf:0', 'calculo.pdf:1']}}
+    """
+    caminho = PASTA_INDICES / fingerprint / ARQUIVO_MANIFESTO
+    if not caminho.exists():
+        return None
+    with open(caminho, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def lista_indices_em_cache() -> list:
+    """
+    Lista os índices armazenados em cache, ordenados do uso mais recente para o mais antigo.
+
+    Retorno:
+    \n\t`list`: Lista dos diretórios dos índices em cache.
+
+    Exemplo:
+    >>> lista_indices_em_cache()
+    [PosixPath('indices/3a7bd3e2...'), PosixPath('indices/c0535e4b...')]
+    """
+    pastas = [pasta for pasta in PASTA_INDICES.iterdir()
+              if not pasta.name.startswith(PREFIXO_TEMPORARIO) and (pasta / ARQUIVO_MANIFESTO).exists()]
+    return sorted(pastas, key=lambda item: item.stat().st_mtime_ns, reverse=True)
+
+
+def localiza_indice_base(hash_parametros: str) -> dict:
+    """
+    Localiza o índice em cache mais recente gerado com os mesmos parâmetros, para servir de base a uma
+    atualização incremental.
+
+    Parâmetros:
+    \n\t`hash_parametros (str)`: Hash dos parâmetros, calculado por `calcula_hash_parametros`.
+
+    Retorno:
+    \n\t`dict | None`: Manifesto do índice encontrado ou `None` caso não exista nenhum compatível.
+
+    Exemplo:
+    >>> localiza_indice_base(hash_parametros)['fingerprint']
+    '3a7bd3e2360a3d29eea436fcfb7e44c735d117c42d1c1835420b6b9942dd4f1b'
+    """
+    for pasta in lista_indices_em_cache():
+        manifesto = carrega_manifesto(pasta.name)
+        if manifesto and manifesto.get('parametros') == hash_parametros:
+            return manifesto
+    return None
+
+
+def limpa_cache_de_indices(limite: int = LIMITE_INDICES_EM_CACHE,
+                           idade_temporarios: float = IDADE_MAXIMA_TEMPORARIOS) -> None:
+    """
+    Remove os índices em cache menos usados recentemente, mantendo no máximo `limite` índices, e os diretórios
+    temporários deixados por gravações interrompidas (ver `salva_vector_store_em_cache`).
+
+    Parâmetros:
+    \n\t`limite (int)`: Quantidade máxima de índices mantidos (padrão: `LIMITE_INDICES_EM_CACHE`).
+    \n\t`idade_temporarios (float)`: Idade mínima, em segundos, dos diretórios temporários removidos, para não
+    remover gravações em andamento (padrão: `IDADE_MAXIMA_TEMPORARIOS`).
+
+    Exemplo:
+    >>> limpa_cache_de_indices()
+    """
+    for pasta in lista_indices_em_cache()[limite:]:
+        shutil.rmtree(pasta, ignore_errors=True)
+    agora = time.time()
+    for pasta in PASTA_INDICES.glob(f'{PREFIXO_TEMPORARIO}*'):
+        try:
+            abandonada = agora - pasta.stat().st_mtime >= idade_temporarios
+        except FileNotFoundError:
+            # A gravação terminou e renomeou o diretório.
+            continue
+        if abandonada:
+            shutil.rmtree(pasta, ignore_errors=True)
+
+
+def hashes_arquivos_em_cache() -> set:
+    """
+    Retorna os hashes dos arquivos registrados nos manifestos dos índices em cache.
+
+    Retorno:
+    \n\t`set`: Hashes do conteúdo dos arquivos de todos os índices em cache.
+
+    Exemplo:
+    >>> hashes_arquivos_em_cache()
+    {'9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08'}
+    """
+    hashes = set()
+    for pasta in lista_indices_em_cache():
+        manifesto = carrega_manifesto(pasta.name) or {}
+        hashes.update(info['hash'] for info in manifesto.get('arquivos', {}).values())
+    return hashes
+
+
+# ATUALIZAÇÃO INCREMENTAL ========================
+
+def calcula_delta_corpus(arquivos_indexados: dict, hashes_arquivos: dict) -> tuple:
+    """
+    Compara os arquivos presentes em um índice com os arquivos atuais do corpus.
+
+    Um arquivo cujo conteúdo mudou aparece nas duas listas: seus vetores antigos são removidos e o
+    novo conteúdo é indexado. O mesmo vale para arquivos cujos trechos duplicados foram descartados em favor
+    de trechos de um arquivo removido (`depende_de` no manifesto), para que esse conteúdo não se perca.
+
+    Parâmetros:
+    \n\t`arquivos_indexados (dict)`: Seção `arquivos` do manifesto do índice base.
+    \n\t`hashes_arquivos (dict)`: Hashes dos arquivos atuais, calculados por `calcula_hashes_arquivos`.
+
+    Retorno:
+    \n\t`tuple`: Par `(adicionados, removidos)` com os nomes dos arquivos a indexar e a remover.
+
+    Exemplo:
+    >>> calcula_delta_corpus({'a.pdf': {'hash': '1', 'ids': []}}, {'a.pdf': '1', 'b.pdf': '2'})
+    (['b.pdf'], [])
+    """
+    adicionados = [nome for nome, hash_arquivo in hashes_arquivos.items()
+                   if arquivos_indexados.get(nome, {}).get('hash') != hash_arquivo]
+    removidos = [nome for nome, info in arquivos_indexados.items()
+                 if hashes_arquivos.get(nome) != info['hash']]
+
+    alterou = True
+    while alterou:
+        alterou = False
+        for nome, info in arquivos_indexados.items():
+            if nome not in removidos and set(info.get('depende_de', [])) & set(removidos):
+                adicionados.append(nome)
+                removidos.append(nome)
+                alterou = True
+    return sorted(adicionados), sorted(removidos)
+
+
+def remove_arquivos_do_vector_store(vector_store, arquivos_indexados: dict, nomes: list) -> int:
+    """
+    Remove do índice os vetores e documentos de um conjunto de arquivos.
+
+    O `FAISS.delete` do LangChain supõe que as posições dos vetores restantes são renumeradas após a remoção,
+    o que o IVF não faz. Nos índices IVF, os vetores mantidos são reconstruídos e adicionados de novo ao
+    índice, que mantém o treino. Índices que não permitem remover vetores (como o HNSW) lançam `RuntimeError`
+    e precisam ser reconstruídos.
+
+    Parâmetros:
+    \n\t`vector_store (FAISS)`: Índice a ser atualizado.
+    \n\t`arquivos_indexados (dict)`: Seção `arquivos` do manifesto do índice.
+    \n\t`nomes (list)`: Nomes dos arquivos a remover.
+
+    Retorno:
+    \n\t`int`: Quantidade de trechos removidos.
+
+    Exemplo:
+    >>> remove_arquivos_do_vector_store(vector_store, manifesto['arquivos'], ['capitulo1.pdf'])
+    42
+    """
+    ids = [id_trecho for nome in nomes for id_trecho in arquivos_indexados[nome]['ids']]
+    if not ids:
+        return 0
+    if extrai_indice_ivf(vector_store.index) is None:
+        vector_store.delete(ids)
+        return len(ids)
+    removidos = set(ids)
+    mantidas = np.array([posicao for posicao, doc_id in sorted(vector_store.index_to_docstore_id.items())
+                         if doc_id not in removidos], dtype=np.int64)
+    vetores = reconstroi_vetores(vector_store.index, mantidas)
+    ids_mantidos = [vector_store.index_to_docstore_id[int(posicao)] for posicao in mantidas]
+    vector_store.index.reset()
+    if len(vetores):
+        vector_store.index.add(vetores)
+    vector_store.index_to_docstore_id = dict(enumerate(ids_mantidos))
+    vector_store.docstore.delete(ids)
+    return len(ids)
+
+
+def adiciona_documentos_ao_vector_store(vector_store, documentos: list, vetores: list) -> None:
+    """
+    Adiciona ao índice trechos de documentos já embutidos, usando o `doc_id` de cada trecho como identificador.
+
+    Parâmetros:
+    \n\t`vector_store (FAISS)`: Índice a ser atualizado.
+    \n\t`documentos (list)`: Trechos gerados por `itera_trechos`, com o `doc_id` nos metadados.
+    \n\t`vetores (list)`: Embeddings dos trechos, na mesma ordem.
+
+    Exemplo:
+    >>> adiciona_documentos_ao_vector_store(vector_store, documentos, embedding_model.embed_documents(textos))
+    """
+    vector_store.add_embeddings(
+        zip([doc.page_content for doc in documentos], vetores),
+        metadatas=[doc.metadata for doc in documentos],
+        ids=[doc.metadata['doc_id'] for doc in documentos]
+    )
+
+
+# TIPOS DE ÍNDICE ========================
+
+def pontos_treino_necessarios(indice_tipo: str, indice_kwargs: dict) -> int:
+    """
+    Retorna a quantidade de vetores recomendada para treinar um índice antes de usá-lo.
+
+    Parâmetros:
+    \n\t`indice_tipo (str)`: Tipo do índice (`'flat'`, `'ivf'` ou `'hnsw'`).
+    \n\t`indice_kwargs (dict)`: Parâmetros de construção do índice.
+
+    Retorno:
+    \n\t`int`: Quantidade de vetores de treino. `0` indica que o índice não precisa de treino.
+
+    Exemplo:
+    >>> pontos_treino_necessarios('ivf', {'nlist': 256, 'quantizacao': 'nenhuma'})
+    9984
+    """
+    pontos = 0
+    if indice_tipo == 'ivf':
+        # O FAISS recomenda ao menos 39 vetores por centróide.
+        pontos = max(pontos, 39 * indice_kwargs.get('nlist', 256))
+    quantizacao = indice_kwargs.get('quantizacao', 'nenhuma')
+    if quantizacao == 'pq':
+        pontos = max(pontos, 39 * 2 ** indice_kwargs.get('pq_bits', 8))
+    elif quantizacao in ('sq8', 'sq4'):
+        pontos = max(pontos, 1000)
+    return pontos
+
+
+def descreve_indice(indice_tipo: str, indice_kwargs: dict, pontos_treino: int = None) -> str:
+    """
+    Monta a descrição do índice no formato do `faiss.index_factory`, ajustando-a à quantidade de vetores
+    disponível para o treino.
+
+    Quando há menos vetores que o necessário, a quantidade de listas do IVF é reduzida e a quantização por
+    produto (PQ), que exige ao menos `2 ** pq_bits` vetores, é substituída por SQ8.
+
+    Parâmetros:
+    \n\t`indice_tipo (str)`: Tipo do índice (`'flat'`, `'ivf'` ou `'hnsw'`).
+    \n\t`indice_kwargs (dict)`: Parâmetros de construção do índice.
+    \n\t`pontos_treino (int)`: Quantidade de vetores disponíveis para o treino (opcional).
+
+    Retorno:
+    \n\t`str`: Descrição do índice, por exemplo `'IVF256,PQ16x8'`.
+
+    Exemplo:
+    >>> descreve_indice('hnsw', {'hnsw_m': 32, 'quantizacao': 'sq8'})
+    'HNSW32_SQ8'
+    """
+    quantizacao = indice_kwargs.get('quantizacao', 'nenhuma')
+    pq_m = indice_kwargs.get('pq_m', 16)
+    pq_bits = indice_kwargs.get('pq_bits', 8)
+    nlist = indice_kwargs.get('nlist', 256)
+    if pontos_treino is not None:
+        if quantizacao == 'pq' and pontos_treino < 2 ** pq_bits:
+            quantizacao = 'sq8'
+        nlist = max(1, min(nlist, pontos_treino // 39))
+
+    if indice_tipo == 'ivf':
+        codificacao = {'nenhuma': 'Flat', 'sq8': 'SQ8', 'sq4': 'SQ4',
+                       'pq': f'PQ{pq_m}x{pq_bits}'}[quantizacao]
+        return f'IVF{nlist},{codificacao}'
+    if indice_tipo == 'hnsw':
+        codificacao = {'nenhuma': '', 'sq8': '_SQ8', 'sq4': '_SQ4',
+                       'pq': f'_PQ{pq_m}x{pq_bits}'}[quantizacao]
+        return f"HNSW{indice_kwargs.get('hnsw_m', 32)}{codificacao}"
+    return {'nenhuma': 'Flat', 'sq8': 'SQ8', 'sq4': 'SQ4',
+            'pq': f'PQ{pq_m}x{pq_bits}'}[quantizacao]
+
+
+def aplica_parametros_busca(vector_store, indice_kwargs: dict) -> None:
+    """
+    Aplica ao índice os parâmetros que só afetam a busca: `nprobe` (IVF) e `ef_search` (HNSW).
+
+    Usada apenas na criação do índice, para gravar valores padrão com ele: depois de carregado, o índice é
+    compartilhado pelas sessões, e cada busca recebe os seus parâmetros de `cria_parametros_busca`.
+
+    Parâmetros:
+    \n\t`vector_store (FAISS)`: Índice a ser ajustado.
+    \n\t`indice_kwargs (dict)`: Parâmetros do índice.
+
+    Exemplo:
+    >>> aplica_parametros_busca(vector_store, {'nprobe': 16, 'ef_search': 64})
+    """
+    indice = faiss.downcast_index(vector_store.index)
+    try:
+        faiss.extract_index_ivf(indice).nprobe = indice_kwargs.get('nprobe', 16)
+    except RuntimeError:
+        pass
+    if hasattr(indice, 'hnsw'):
+        indice.hnsw.efSearch = indice_kwargs.get('ef_search', 64)
+
+
+def cria_vector_store_vazio(embedding_model, vetores_treino: list, indice_tipo: str = 'flat', indice_kwargs: dict = None):
+    """
+    Cria um índice vazio do tipo configurado, treinando-o com os vetores fornecidos quando necessário.
+
+    Parâmetros:
+    \n\t`embedding_model`: Modelo de embedding usado para vetorizar as consultas.
+    \n\t`vetores_treino (list)`: Vetores usados para definir a dimensão e treinar o índice.
+    \n\t`indice_tipo (str)`: Tipo do índice (`'flat'`, `'ivf'` ou `'hnsw'`, padrão: `'flat'`).
+    \n\t`indice_kwargs (dict)`: Parâmetros do índice (opcional).
+
+    Retorno:
+    \n\t`FAISS`: Índice vazio, treinado e pronto para receber vetores.
+
+    Exemplo:
+    >>> vector_store = cria_vector_store_vazio(embedding_model, vetores, 'ivf', {'nlist': 256, 'quantizacao': 'pq'})
+    """
+    indice_kwargs = indice_kwargs or {}
+    amostra = np.asarray(vetores_treino, dtype=np.float32)
+    descricao = descreve_indice(indice_tipo, indice_kwargs, len(amostra))
+    indice = faiss.index_factory(amostra.shape[1], descricao, faiss.METRIC_L2)
+    if not indice.is_trained:
+        print(f"Treinando o índice {descricao} com {len(amostra)} vetores...")
+        indice.train(amostra)
+    vector_store = FAISS(
+        embedding_function=embedding_model,
+        index=indice,
+        docstore=InMemoryDocstore(),
+        index_to_docstore_id={}
+    )
+    aplica_parametros_busca(vector_store, indice_kwargs)
+    return vector_store
+
+
+def indexa_trechos_em_fluxo(vector_store, trechos, embedding_model, tamanho_lote: int = 256,
+                            indice_tipo: str = 'flat', indice_kwargs: dict = None) -> tuple:
+    """
+    Embute e adiciona trechos ao índice em lotes, à medida que são gerados.
+
+    Apenas um lote de trechos e de embeddings fica em memória fora do índice por vez, de modo que o pico de
+    memória da ingestão não depende do tamanho dos PDFs, apenas do tamanho final do índice. Quando um novo
+    índice precisa de treino (IVF, PQ, SQ), os primeiros lotes são retidos até formar a amostra de treino
+    indicada por `pontos_treino_necessarios`; o índice é então treinado e recebe os lotes retidos.
+
+    Parâmetros:
+    \n\t`vector_store (FAISS | None)`: Índice a ser atualizado. Se `None`, um novo índice é criado.
+    \n\t`trechos (Iterable[Document])`: Trechos gerados por `itera_trechos`.
+    \n\t`embedding_model`: Modelo de embedding usado para vetorizar os trechos.
+    \n\t`tamanho_lote (int)`: Quantidade de trechos embutidos e adicionados por vez (padrão: `256`).
+    \n\t`indice_tipo (str)`: Tipo do índice criado quando `vector_store` é `None` (padrão: `'flat'`).
+    \n\t`indice_kwargs (dict)`: Parâmetros do índice criado quando `vector_store` é `None` (opcional).
+
+    Retorno:
+    \n\t`tuple`: Par `(vector_store, ids_por_arquivo)` com o índice atualizado e os `doc_id` adicionados
+    de cada arquivo.
+
+    Exemplo:
+    >>> vector_store, ids_por_arquivo = indexa_trechos_em_fluxo(None, trechos, OpenAIEmbeddings())
+    """
+    indice_kwargs = indice_kwargs or {}
+    pontos_treino = pontos_treino_necessarios(indice_tipo, indice_kwargs)
+    retidos = []
+    ids_por_arquivo = {}
+    for lote in itera_lotes(trechos, tamanho_lote):
+        vetores = embedding_model.embed_documents(
+            [trecho.page_content for trecho in lote])
+        for trecho in lote:
+            ids_por_arquivo.setdefault(
+                trecho.metadata['source'], []).append(trecho.metadata['doc_id'])
+        if vector_store is not None:
+            adiciona_documentos_ao_vector_store(vector_store, lote, vetores)
+            continue
+        retidos.append((lote, vetores))
+        if sum(len(lote_retido) for lote_retido, _ in retidos) >= pontos_treino:
+            vector_store = _cria_com_lotes_retidos(
+                embedding_model, retidos, indice_tipo, indice_kwargs)
+            retidos = []
+    if retidos:
+        # O corpus terminou antes de completar a amostra: o índice é treinado com o que houver.
+        vector_store = _cria_com_lotes_retidos(
+            embedding_model, retidos, indice_tipo, indice_kwargs)
+    return vector_store, ids_por_arquivo
+
+
+def _cria_com_lotes_retidos(embedding_model, retidos: list, indice_tipo: str, indice_kwargs: dict):
+    """
+    Cria e treina um índice com os vetores dos lotes retidos e adiciona esses lotes a ele.
+
+    Parâmetros:
+    \n\t`embedding_model`: Modelo de embedding usado para vetorizar as consultas.
+    \n\t`retidos (list)`: Pares `(lote, vetores)` aguardando a criação do índice.
+    \n\t`indice_tipo (str)`: Tipo do índice.
+    \n\t`indice_kwargs (dict)`: Parâmetros do índice.
+
+    Retorno:
+    \n\t`FAISS`: O índice criado, já contendo os lotes retidos.
+    """
+    vector_store = cria_vector_store_vazio(
+        embedding_model,
+        [vetor for _, vetores in retidos for vetor in vetores],
+        indice_tipo,
+        indice_kwargs
+    )
+    for lote, vetores in retidos:
+        adiciona_documentos_ao_vector_store(vector_store, lote, vetores)
+    return vector_store
+
+
+def registra_duplicatas_no_vector_store(vector_store, duplicatas: dict) -> None:
+    """
+    Registra nos metadados dos trechos mantidos as origens dos trechos duplicados descartados.
+
+    Parâmetros:
+    \n\t`vector_store (FAISS)`: Índice cujos documentos serão atualizados.
+    \n\t`duplicatas (dict)`: Dicionário que associa o `doc_id` de cada trecho mantido às origens
+    (`source` e `page`) dos trechos descartados.
+
+    Exemplo:
+    >>> registra_duplicatas_no_vector_store(vector_store, deduplicador.duplicatas)
+    """
+    for doc_id, origens in duplicatas.items():
+        doc = vector_store.docstore.search(doc_id)
+        if isinstance(doc, Document):
+            doc.metadata.setdefault('duplicatas', []).extend(origens)
+
+
+def monta_manifesto(arquivos_mantidos: dict, ids_por_arquivo: dict, hashes_arquivos: dict, hash_parametros: str,
+                    dependencias: dict = None) -> dict:
+    """
+    Monta o manifesto de um índice, registrando os trechos que pertencem a cada arquivo.
+
+    Parâmetros:
+    \n\t`arquivos_mantidos (dict)`: Arquivos herdados do índice base sem alteração.
+    \n\t`ids_por_arquivo (dict)`: `doc_id` dos trechos recém-indexados de cada arquivo.
+    \n\t`hashes_arquivos (dict)`: Hashes dos arquivos atuais do corpus.
+    \n\t`hash_parametros (str)`: Hash dos parâmetros usados na indexação.
+    \n\t`dependencias (dict)`: Arquivos dos quais cada arquivo recém-indexado depende por ter trechos
+    duplicados descartados (opcional).
+
+    Retorno:
+    \n\t`dict`: Manifesto com as chaves `parametros` e `arquivos`.
+
+    Exemplo:
+    >>> monta_manifesto({}, {'calculo.pdf': ['calculo.pdf:0']}, hashes_arquivos, hash_parametros)
+    {'parametros': 'c053...', 'arquivos': {'calculo.pdf': {'hash': '9f86...', 'ids': ['calculo.pdf:0']}}}
+    """
+    arquivos = {}
+    for nome, hash_arquivo in hashes_arquivos.items():
+        if nome in arquivos_mantidos:
+            arquivos[nome] = dict(arquivos_mantidos[nome])
+        else:
+            # Arquivos sem texto extraível também são registrados, para não serem reprocessados.
+            arquivos[nome] = {'hash': hash_arquivo, 'ids': []}
+    for nome, ids in ids_por_arquivo.items():
+        arquivos[nome]['ids'].extend(ids)
+    for nome, arquivos_mantenedores in (dependencias or {}).items():
+        arquivos[nome]['depende_de'] = sorted(
+            set(arquivos[nome].get('depende_de', [])) | set(arquivos_mantenedores))
+    return {'parametros': hash_parametros, 'arquivos': arquivos}
+
+
+# ÍNDICES COMPARTILHADOS ENTRE SESSÕES ========================
+
+def obtem_vector_store_compartilhado(fingerprint: str, id_sessao: str, constroi, sessao_ativa=None):
+    """
+    Retorna o índice de um corpus a partir do registro compartilhado pelo processo, construindo-o apenas se
+    nenhuma sessão o tiver carregado.
+
+    O índice é contado por referência: a sessão é registrada como usuária do corpus e deixa de usar o corpus
+    anterior. Índices sem nenhuma sessão são descartados da memória. Sessões simultâneas que pedem o mesmo
+    corpus aguardam uma única construção, enquanto corpora diferentes são construídos em paralelo.
+
+    Parâmetros:
+    \n\t`fingerprint (str)`: Impressão digital do corpus.
+    \n\t`id_sessao (str)`: Identificador da sessão que está solicitando o índice.
+    \n\t`constroi (Callable[[], Any])`: Função que carrega ou constrói o índice (ou os índices) do corpus
+    quando ele não está em memória.
+    \n\t`sessao_ativa (Callable[[str], bool])`: Função que indica se uma sessão ainda está aberta, usada para
+    liberar as referências de sessões encerradas (opcional).
+
+    Retorno:
+    \n\t`Any`: O valor retornado por `constroi`, compartilhado entre as sessões.
+
+    Exemplo:
+    >>> vector_store = obtem_vector_store_compartilhado(fingerprint, 'sessao-1', lambda: carrega_vector_store_em_cache(fingerprint, embedding_model))
+    """
+    with _LOCK_VECTOR_STORES:
+        for outro_fingerprint, entrada in list(_VECTOR_STORES_COMPARTILHADOS.items()):
+            entrada['sessoes'].discard(id_sessao)
+            if sessao_ativa is not None:
+                entrada['sessoes'] = {sessao for sessao in entrada['sessoes']
+                                      if sessao_ativa(sessao)}
+            if not entrada['sessoes'] and outro_fingerprint != fingerprint and not entrada['lock'].locked():
+                del _VECTOR_STORES_COMPARTILHADOS[outro_fingerprint]
+        entrada = _VECTOR_STORES_COMPARTILHADOS.setdefault(
+            fingerprint, {'vector_store': None, 'sessoes': set(), 'lock': threading.Lock()})
+        entrada['sessoes'].add(id_sessao)
+
+    # A construção ocorre fora do lock global, para não bloquear sessões de outros corpora.
+    with entrada['lock']:
+        if entrada['vector_store'] is None:
+            entrada['vector_store'] = constroi()
+        return entrada['vector_store']
+
+
+def estatisticas_vector_stores_compartilhados() -> dict:
+    """
+    Retorna, para cada índice em memória, a quantidade de sessões que o utilizam.
+
+    Retorno:
+    \n\t`dict`: Dicionário que associa a impressão digital do corpus à quantidade de sessões.
+
+    Exemplo:
+    >>> estatisticas_vector_stores_compartilhados()
+    {'3a7bd3e2360a3d29eea436fcfb7e44c735d117c42d1c1835420b6b9942dd4f1b': 10}
+    """
+    with _LOCK_VECTOR_STORES:
+        return {fingerprint: len(entrada['sessoes'])
+                for fingerprint, entrada in _VECTOR_STORES_COMPARTILHADOS.items()}
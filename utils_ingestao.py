@@ -0,0 +1,706 @@
+# --- File: utils_ingestao.py --- #
+
+# --- Libraries --- #
+import os  # Biblioteca para consultar a quantidade de núcleos disponíveis.
+import json  # Biblioteca usada para identificar os splitters já criados em cada processo.
+import zlib  # Biblioteca de compressão do texto das páginas em cache.
+import sqlite3  # Banco de dados local usado no cache de extração das páginas.
+import hashlib  # Biblioteca para cálculo de hashes usados na deduplicação.
+from array import array  # Armazenamento compacto das assinaturas MinHash.
+import threading  # Biblioteca para sincronizar a criação do pool de processos.
+# Executa tarefas em paralelo em processos separados.
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing  # Biblioteca para selecionar o método de criação dos processos.
+from collections import deque  # Fila usada para limitar as tarefas em andamento.
+from itertools import islice, groupby  # Permite consumir iteradores em lotes e em grupos.
+from pathlib import Path  # Manipulação de caminhos de arquivos e diretórios.
+
+# Biblioteca para leitura e extração de texto de arquivos PDF.
+from pypdf import PdfReader
+# Estrutura de documento utilizada pelo LangChain.
+from langchain_core.documents import Document
+# Carrega e processa documentos PDF para serem utilizados na recuperação de informações.
+from langchain_community.document_loaders.pdf import PyPDFLoader
+# Divide textos longos em segmentos menores de maneira recursiva para otimizar a recuperação de informações.
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+# --- Directory Setup --- #
+PASTA_CACHE = Path(__file__).parent / 'cache'
+PASTA_CACHE.mkdir(exist_ok=True)
+
+# --- Attributes --- #
+# Banco SQLite com o texto extraído de cada página dos PDFs já processados.
+ARQUIVO_CACHE_PAGINAS = PASTA_CACHE / 'paginas.sqlite'
+# Pool de processos compartilhado pelas ingestões, criado sob demanda.
+_POOL_PROCESSOS = None
+_POOL_WORKERS = 0
+_POOL_LOCK = threading.Lock()
+# Splitters já criados no processo, por configuração.
+_SPLITTERS = {}
+
+
+# --- Methods --- #
+# POOL DE PROCESSOS ========================
+
+def resolve_workers(workers: int = 0) -> int:
+    """
+    Resolve a quantidade de processos a utilizar.
+
+    Parâmetros:
+    \n\t`workers (int)`: Quantidade configurada. Se `0`, utiliza a quantidade de núcleos da máquina.
+
+    Retorno:
+    \n\t`int`: Quantidade efetiva de processos.
+
+    Exemplo:
+    >>> resolve_workers(0)
+    8
+    """
+    return workers or os.cpu_count() or 1
+
+
+def obtem_pool_processos(workers: int = 0) -> ProcessPoolExecutor:
+    """
+    Retorna o pool de processos usado na ingestão, criando-o na primeira chamada.
+
+    O pool é mantido entre as execuções para que o custo de criação dos processos seja pago uma única vez.
+    Os processos são criados com o método `spawn`, seguro para uso a partir das threads do Streamlit.
+    A quantidade de processos é uma configuração do processo: é fixada na criação do pool, e pedidos
+    posteriores com outra quantidade recebem o mesmo pool, pois substituí-lo cancelaria as ingestões de
+    outras sessões em andamento.
+
+    Parâmetros:
+    \n\t`workers (int)`: Quantidade de processos, usada apenas na criação do pool. Se `0`, utiliza a
+    quantidade de núcleos da máquina.
+
+    Retorno:
+    \n\t`ProcessPoolExecutor`: Pool de processos compartilhado.
+
+    Exemplo:
+    >>> pool = obtem_pool_processos(8)
+    """
+    global _POOL_PROCESSOS, _POOL_WORKERS
+    with _POOL_LOCK:
+        if _POOL_PROCESSOS is None:
+            _POOL_WORKERS = resolve_workers(workers)
+            _POOL_PROCESSOS = ProcessPoolExecutor(
+                max_workers=_POOL_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        elif resolve_workers(workers) != _POOL_WORKERS:
+            print(f"Pool de processos já criado com {_POOL_WORKERS} processo(s); "
+                  f"a quantidade {resolve_workers(workers)} será ignorada.")
+        return _POOL_PROCESSOS
+
+
+# EXTRAÇÃO DE PDFs ========================
+
+def _conta_paginas(caminho: str) -> int:
+    """
+    Retorna a quantidade de páginas de um arquivo PDF.
+
+    Parâmetros:
+    \n\t`caminho (str)`: Caminho do arquivo PDF.
+
+    Retorno:
+    \n\t`int`: Quantidade de páginas do arquivo.
+    """
+    return len(PdfReader(caminho).pages)
+
+
+def _extrai_paginas(caminho: str, inicio: int, fim: int) -> list:
+    """
+    Extrai o texto de um intervalo de páginas de um PDF. Executada nos processos do pool.
+
+    O texto e os metadados seguem o mesmo formato produzido pelo `PyPDFLoader`.
+
+    Parâmetros:
+    \n\t`caminho (str)`: Caminho do arquivo PDF.
+    \n\t`inicio (int)`: Índice da primeira página do intervalo.
+    \n\t`fim (int)`: Índice posterior à última página do intervalo.
+
+    Retorno:
+    \n\t`list`: Lista de tuplas `(texto, metadados)`, uma por página, na ordem do arquivo.
+    """
+    leitor = PdfReader(caminho)
+    return [(leitor.pages[pagina].extract_text(), {'source': caminho, 'page': pagina})
+            for pagina in range(inicio, fim)]
+
+
+def divide_tarefas_de_extracao(arquivos: list, paginas_por_tarefa: int, quantidades_paginas: list) -> list:
+    """
+    Divide a extração de um conjunto de PDFs em tarefas de intervalos de páginas.
+
+    Parâmetros:
+    \n\t`arquivos (list)`: Caminhos dos arquivos PDF, na ordem em que devem ser carregados.
+    \n\t`paginas_por_tarefa (int)`: Quantidade máxima de páginas extraídas por tarefa.
+    \n\t`quantidades_paginas (list)`: Quantidade de páginas de cada arquivo.
+
+    Retorno:
+    \n\t`list`: Lista de tuplas `(caminho, inicio, fim)`, ordenadas por arquivo e página.
+
+    Exemplo:
+    >>> divide_tarefas_de_extracao(['livro.pdf'], 100, [250])
+    [('livro.pdf', 0, 100), ('livro.pdf', 100, 200), ('livro.pdf', 200, 250)]
+    """
+    tarefas = []
+    for arquivo, quantidade in zip(arquivos, quantidades_paginas):
+        for inicio in range(0, quantidade, paginas_por_tarefa):
+            tarefas.append((str(arquivo), inicio, min(inicio + paginas_por_tarefa, quantidade)))
+    return tarefas
+
+
+def _extrai_em_fluxo(arquivos: list, paralela: bool, workers: int, paginas_por_tarefa: int, tarefas_em_voo: int):
+    """
+    Extrai as páginas de um conjunto de PDFs com o pypdf, uma a uma, na ordem dos arquivos e das páginas.
+
+    No modo paralelo, arquivos e intervalos de páginas de arquivos grandes são extraídos em um pool de
+    processos. No máximo `tarefas_em_voo` tarefas ficam pendentes ao mesmo tempo, o que limita a memória
+    ocupada por páginas já extraídas e ainda não consumidas. As páginas são geradas em ordem determinística
+    (ordem dos arquivos e, dentro de cada arquivo, ordem das páginas), idêntica à do carregamento sequencial.
+
+    Parâmetros:
+    \n\t`arquivos (list)`: Caminhos dos arquivos PDF a carregar.
+    \n\t`paralela (bool)`: Se `True`, extrai as páginas em um pool de processos.
+    \n\t`workers (int)`: Quantidade de processos. Se `0`, utiliza a quantidade de núcleos da máquina.
+    \n\t`paginas_por_tarefa (int)`: Quantidade máxima de páginas extraídas por tarefa.
+    \n\t`tarefas_em_voo (int)`: Quantidade máxima de tarefas pendentes. Se `0`, utiliza o dobro de `workers`.
+
+    Retorno:
+    \n\t`Generator[Document]`: Documentos, um por página.
+    """
+    if not paralela:
+        for arquivo in arquivos:
+            yield from PyPDFLoader(arquivo).lazy_load()
+        return
+    if not arquivos:
+        return
+
+    pool = obtem_pool_processos(workers)
+    quantidades_paginas = list(pool.map(_conta_paginas, arquivos))
+    tarefas = iter(divide_tarefas_de_extracao(
+        arquivos, paginas_por_tarefa, quantidades_paginas))
+    tarefas_em_voo = tarefas_em_voo or 2 * _POOL_WORKERS
+
+    pendentes = deque(pool.submit(_extrai_paginas, *tarefa)
+                      for tarefa in islice(tarefas, tarefas_em_voo))
+    try:
+        while pendentes:
+            # As tarefas são consumidas na ordem de submissão, independentemente da ordem de conclusão.
+            paginas = pendentes.popleft().result()
+            for tarefa in islice(tarefas, 1):
+                pendentes.append(pool.submit(_extrai_paginas, *tarefa))
+            for texto, metadados in paginas:
+                yield Document(page_content=texto, metadata=metadados)
+    finally:
+        for futuro in pendentes:
+            futuro.cancel()
+
+
+class CacheExtracao:
+    """
+    Cache do texto extraído de cada página dos PDFs, indexado pelo hash do arquivo e pelo número da página.
+
+    O texto é gravado comprimido em um banco SQLite. Um arquivo só é considerado em cache depois que todas as
+    suas páginas foram gravadas, o que evita reaproveitar uma extração interrompida. Como a chave é o
+    conteúdo do arquivo, um PDF renomeado ou enviado novamente também é reaproveitado. Os arquivos que não
+    pertencem mais a nenhum índice nem ao corpus atual são removidos por `remove_exceto`.
+
+    Exemplo:
+    >>> cache = CacheExtracao()
+    >>> cache.possui(hash_arquivo)
+    True
+    """
+
+    def __init__(self, caminho: Path = ARQUIVO_CACHE_PAGINAS):
+        """
+        Parâmetros:
+        \n\t`caminho (Path)`: Caminho do banco SQLite (padrão: `ARQUIVO_CACHE_PAGINAS`).
+        """
+        self.caminho = Path(caminho)
+        self.estatisticas = {'arquivos_em_cache': 0, 'arquivos_extraidos': 0}
+        self._conexao = sqlite3.connect(self.caminho, timeout=30, check_same_thread=False)
+        self._conexao.execute('PRAGMA journal_mode=WAL')
+        self._lock = threading.Lock()
+        with self._lock, self._conexao:
+            self._conexao.execute(
+                'CREATE TABLE IF NOT EXISTS paginas (hash_arquivo TEXT NOT NULL, pagina INTEGER NOT NULL, '
+                'texto BLOB NOT NULL, PRIMARY KEY (hash_arquivo, pagina))')
+            self._conexao.execute(
+                'CREATE TABLE IF NOT EXISTS arquivos (hash_arquivo TEXT PRIMARY KEY, paginas INTEGER NOT NULL)')
+
+    def possui(self, hash_arquivo: str) -> bool:
+        """
+        Indica se todas as páginas de um arquivo estão no cache.
+
+        Parâmetros:
+        \n\t`hash_arquivo (str)`: Hash do conteúdo do arquivo.
+
+        Retorno:
+        \n\t`bool`: `True` se o arquivo foi extraído por completo.
+        """
+        with self._lock:
+            return self._conexao.execute(
+                'SELECT 1 FROM arquivos WHERE hash_arquivo = ?', (hash_arquivo,)).fetchone() is not None
+
+    def le_paginas(self, hash_arquivo: str, caminho: str):
+        """
+        Gera as páginas de um arquivo a partir do cache, no mesmo formato da extração.
+
+        Parâmetros:
+        \n\t`hash_arquivo (str)`: Hash do conteúdo do arquivo.
+        \n\t`caminho (str)`: Caminho atual do arquivo, usado como `source` nos metadados.
+
+        Retorno:
+        \n\t`Generator[Document]`: Documentos, um por página, na ordem do arquivo.
+        """
+        with self._lock:
+            linhas = self._conexao.execute(
+                'SELECT pagina, texto FROM paginas WHERE hash_arquivo = ? ORDER BY pagina', (hash_arquivo,)).fetchall()
+        for pagina, texto in linhas:
+            yield Document(page_content=zlib.decompress(texto).decode('utf-8'),
+                           metadata={'source': caminho, 'page': pagina})
+
+    def grava_paginas(self, hash_arquivo: str, paginas: list) -> None:
+        """
+        Grava todas as páginas de um arquivo e o marca como extraído.
+
+        Parâmetros:
+        \n\t`hash_arquivo (str)`: Hash do conteúdo do arquivo.
+        \n\t`paginas (list)`: Documentos de todas as páginas do arquivo.
+        """
+        with self._lock, self._conexao:
+            self._conexao.executemany(
+                'INSERT OR REPLACE INTO paginas (hash_arquivo, pagina, texto) VALUES (?, ?, ?)',
+                [(hash_arquivo, pagina.metadata['page'], zlib.compress(pagina.page_content.encode('utf-8')))
+                 for pagina in paginas])
+            self._conexao.execute(
+                'INSERT OR REPLACE INTO arquivos (hash_arquivo, paginas) VALUES (?, ?)', (hash_arquivo, len(paginas)))
+
+    def remove_exceto(self, hashes_mantidos: set) -> int:
+        """
+        Remove do cache as páginas dos arquivos cujos hashes não estão em `hashes_mantidos`, inclusive as de
+        extrações interrompidas.
+
+        Parâmetros:
+        \n\t`hashes_mantidos (set)`: Hashes dos arquivos que permanecem no cache.
+
+        Retorno:
+        \n\t`int`: Quantidade de arquivos removidos.
+
+        Exemplo:
+        >>> cache.remove_exceto(hashes_arquivos_em_cache() | set(hashes_arquivos.values()))
+        2
+        """
+        with self._lock, self._conexao:
+            removidos = [hash_arquivo for (hash_arquivo,) in self._conexao.execute(
+                'SELECT hash_arquivo FROM arquivos UNION SELECT hash_arquivo FROM paginas') if hash_arquivo not in hashes_mantidos]
+            self._conexao.executemany('DELETE FROM paginas WHERE hash_arquivo = ?',
+                                      [(hash_arquivo,) for hash_arquivo in removidos])
+            self._conexao.executemany('DELETE FROM arquivos WHERE hash_arquivo = ?',
+                                      [(hash_arquivo,) for hash_arquivo in removidos])
+        return len(removidos)
+
+
+def itera_paginas(arquivos: list, paralela: bool = True, workers: int = 0, paginas_por_tarefa: int = 25,
+                  tarefas_em_voo: int = 0, hashes: list = None, cache: CacheExtracao = None):
+    """
+    Gera as páginas de um conjunto de PDFs, uma a uma, sem materializar o corpus inteiro na memória.
+
+    No modo paralelo, arquivos e intervalos de páginas de arquivos grandes são extraídos em um pool de
+    processos. As páginas são geradas em ordem determinística (ordem dos arquivos e, dentro de cada arquivo,
+    ordem das páginas), idêntica à do carregamento sequencial.
+
+    Com um `cache` de extração e os `hashes` dos arquivos, os arquivos já extraídos são lidos do cache, sem
+    abrir os PDFs, e os demais são gravados no cache ao fim da extração de cada arquivo.
+
+    Parâmetros:
+    \n\t`arquivos (list)`: Caminhos dos arquivos PDF a carregar.
+    \n\t`paralela (bool)`: Se `True`, extrai as páginas em um pool de processos (padrão: `True`).
+    \n\t`workers (int)`: Quantidade de processos. Se `0`, utiliza a quantidade de núcleos da máquina.
+    \n\t`paginas_por_tarefa (int)`: Quantidade máxima de páginas extraídas por tarefa (padrão: `25`).
+    \n\t`tarefas_em_voo (int)`: Quantidade máxima de tarefas pendentes. Se `0`, utiliza o dobro de `workers`.
+    \n\t`hashes (list)`: Hash do conteúdo de cada arquivo, na ordem de `arquivos` (opcional).
+    \n\t`cache (CacheExtracao)`: Cache de extração das páginas (opcional).
+
+    Retorno:
+    \n\t`Generator[Document]`: Documentos, um por página.
+
+    Exemplo:
+    >>> for pagina in itera_paginas(sorted(PASTA_ARQUIVOS.glob('*.pdf')), workers=8):
+    >>>     print(pagina.metadata)
+    {'source': '.../arquivos/calculo.pdf', 'page': 0}
+    """
+    arquivos = [str(Path(arquivo)) for arquivo in arquivos]
+    if cache is None or hashes is None:
+        yield from _extrai_em_fluxo(arquivos, paralela, workers, paginas_por_tarefa, tarefas_em_voo)
+        return
+
+    # Arquivos consecutivos fora do cache são extraídos juntos, preservando o paralelismo entre arquivos.
+    for em_cache, grupo in groupby(zip(arquivos, hashes), key=lambda par: cache.possui(par[1])):
+        grupo = list(grupo)
+        if em_cache:
+            for arquivo, hash_arquivo in grupo:
+                cache.estatisticas['arquivos_em_cache'] += 1
+                yield from cache.le_paginas(hash_arquivo, arquivo)
+            continue
+
+        hash_por_arquivo = dict(grupo)
+        arquivo_atual, paginas_arquivo = None, []
+        for pagina in _extrai_em_fluxo([arquivo for arquivo, _ in grupo], paralela, workers,
+                                       paginas_por_tarefa, tarefas_em_voo):
+            if pagina.metadata['source'] != arquivo_atual:
+                if arquivo_atual is not None:
+                    cache.grava_paginas(hash_por_arquivo[arquivo_atual], paginas_arquivo)
+                    cache.estatisticas['arquivos_extraidos'] += 1
+                arquivo_atual, paginas_arquivo = pagina.metadata['source'], []
+            paginas_arquivo.append(pagina)
+            yield pagina
+        if arquivo_atual is not None:
+            cache.grava_paginas(hash_por_arquivo[arquivo_atual], paginas_arquivo)
+            cache.estatisticas['arquivos_extraidos'] += 1
+
+
+# DIVISÃO EM TRECHOS ========================
+
+def atribui_ids_trechos(trechos: list, posicoes: dict) -> list:
+    """
+    Normaliza a origem dos trechos e atribui a cada um o `doc_id` estável `<arquivo>:<posição no arquivo>`.
+
+    Parâmetros:
+    \n\t`trechos (list)`: Trechos gerados pelo splitter, na ordem do arquivo.
+    \n\t`posicoes (dict)`: Próxima posição livre de cada arquivo, atualizada pela função entre chamadas.
+
+    Retorno:
+    \n\t`list`: Os mesmos trechos, com os metadados `source` e `doc_id` preenchidos.
+
+    Exemplo:
+    >>> atribui_ids_trechos(trechos, {})[0].metadata['doc_id']
+    'calculo.pdf:0'
+    """
+    for trecho in trechos:
+        trecho.metadata['source'] = trecho.metadata['source'].split('/')[-1]
+        posicao = posicoes.get(trecho.metadata['source'], 0)
+        posicoes[trecho.metadata['source']] = posicao + 1
+        trecho.metadata['doc_id'] = f"{trecho.metadata['source']}:{posicao}"
+    return trechos
+
+
+def cria_splitter(splitter_kwargs: dict) -> RecursiveCharacterTextSplitter:
+    """
+    Cria o splitter descrito por `SPLITTER_KWARGS`, medindo os trechos em tokens ou em caracteres.
+
+    Com `unidade='tokens'`, `chunk_size` e `chunk_overlap` são contados com o tokenizador de
+    `modelo_tokenizador`, o mesmo usado na cobrança dos embeddings. Os splitters são reaproveitados dentro de
+    cada processo.
+
+    Parâmetros:
+    \n\t`splitter_kwargs (dict)`: Parâmetros do splitter, com as chaves opcionais `unidade` ('tokens' ou
+    'caracteres') e `modelo_tokenizador`; as demais são repassadas ao `RecursiveCharacterTextSplitter`.
+
+    Retorno:
+    \n\t`RecursiveCharacterTextSplitter`: O splitter configurado.
+
+    Exemplo:
+    >>> cria_splitter({'unidade': 'tokens', 'chunk_size': 600, 'chunk_overlap': 60}).split_text(texto)
+    """
+    chave = json.dumps(splitter_kwargs, sort_keys=True)
+    if chave not in _SPLITTERS:
+        kwargs = dict(splitter_kwargs)
+        unidade = kwargs.pop('unidade', 'caracteres')
+        modelo_tokenizador = kwargs.pop('modelo_tokenizador', 'text-embedding-ada-002')
+        if unidade == 'tokens':
+            _SPLITTERS[chave] = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+                model_name=modelo_tokenizador, **kwargs)
+        else:
+            _SPLITTERS[chave] = RecursiveCharacterTextSplitter(**kwargs)
+    return _SPLITTERS[chave]
+
+
+def _divide_paginas(paginas: list, splitter_kwargs: dict) -> list:
+    """
+    Divide um lote de páginas em trechos. Executada nos processos do pool.
+
+    Parâmetros:
+    \n\t`paginas (list)`: Lista de tuplas `(texto, metadados)`, uma por página.
+    \n\t`splitter_kwargs (dict)`: Parâmetros do splitter, no formato de `cria_splitter`.
+
+    Retorno:
+    \n\t`list`: Para cada página, a lista de textos dos seus trechos.
+    """
+    splitter = cria_splitter(splitter_kwargs)
+    return [splitter.split_text(texto) for texto, _ in paginas]
+
+
+def itera_trechos(paginas, splitter_kwargs: dict, paralela: bool = False, workers: int = 0,
+                  paginas_por_tarefa: int = 25, tarefas_em_voo: int = 0):
+    """
+    Divide as páginas em trechos à medida que são geradas, sem acumular o corpus na memória.
+
+    Como o splitter trata cada página de forma independente, os trechos gerados são idênticos aos produzidos
+    pela divisão da lista completa de páginas. No modo paralelo, lotes de páginas são divididos no pool de
+    processos da extração, com no máximo `tarefas_em_voo` lotes pendentes, e os trechos são gerados na ordem
+    das páginas.
+
+    Parâmetros:
+    \n\t`paginas (Iterable[Document])`: Páginas geradas por `itera_paginas`.
+    \n\t`splitter_kwargs (dict)`: Parâmetros do splitter, no formato de `cria_splitter`.
+    \n\t`paralela (bool)`: Se `True`, divide as páginas em um pool de processos (padrão: `False`).
+    \n\t`workers (int)`: Quantidade de processos. Se `0`, utiliza a quantidade de núcleos da máquina.
+    \n\t`paginas_por_tarefa (int)`: Quantidade de páginas divididas por tarefa (padrão: `25`).
+    \n\t`tarefas_em_voo (int)`: Quantidade máxima de tarefas pendentes. Se `0`, utiliza o dobro de `workers`.
+
+    Retorno:
+    \n\t`Generator[Document]`: Trechos com os metadados `source` e `doc_id` preenchidos.
+
+    Exemplo:
+    >>> trechos = itera_trechos(itera_paginas(arquivos), SPLITTER_KWARGS)
+    """
+    posicoes = {}
+    if not paralela:
+        splitter = cria_splitter(splitter_kwargs)
+        for pagina in paginas:
+            yield from atribui_ids_trechos(splitter.split_documents([pagina]), posicoes)
+        return
+
+    pool = obtem_pool_processos(workers)
+    tarefas_em_voo = tarefas_em_voo or 2 * _POOL_WORKERS
+    lotes = itera_lotes(((pagina.page_content, pagina.metadata) for pagina in paginas), paginas_por_tarefa)
+    pendentes = deque((lote, pool.submit(_divide_paginas, lote, splitter_kwargs))
+                      for lote in islice(lotes, tarefas_em_voo))
+    try:
+        while pendentes:
+            lote, futuro = pendentes.popleft()
+            textos_por_pagina = futuro.result()
+            for proximo in islice(lotes, 1):
+                pendentes.append((proximo, pool.submit(_divide_paginas, proximo, splitter_kwargs)))
+            for (_, metadados), textos in zip(lote, textos_por_pagina):
+                yield from atribui_ids_trechos(
+                    [Document(page_content=texto, metadata=dict(metadados)) for texto in textos], posicoes)
+    finally:
+        for _, futuro in pendentes:
+            futuro.cancel()
+
+
+def itera_lotes(iteravel, tamanho_lote: int):
+    """
+    Agrupa os itens de um iterável em listas de até `tamanho_lote` itens.
+
+    Parâmetros:
+    \n\t`iteravel (Iterable)`: Itens a agrupar.
+    \n\t`tamanho_lote (int)`: Quantidade máxima de itens por lote.
+
+    Retorno:
+    \n\t`Generator[list]`: Lotes de itens, na ordem original.
+
+    Exemplo:
+    >>> list(itera_lotes(range(5), 2))
+    [[0, 1], [2, 3], [4]]
+    """
+    iterador = iter(iteravel)
+    while True:
+        lote = list(islice(iterador, tamanho_lote))
+        if not lote:
+            return
+        yield lote
+
+
+# DEDUPLICAÇÃO DE TRECHOS ========================
+
+def normaliza_texto_trecho(texto: str) -> str:
+    """
+    Normaliza o texto de um trecho para comparação, ignorando caixa e diferenças de espaçamento.
+
+    Parâmetros:
+    \n\t`texto (str)`: Texto do trecho.
+
+    Retorno:
+    \n\t`str`: Texto normalizado.
+
+    Exemplo:
+    >>> normaliza_texto_trecho('  Exercícios\n  Propostos ')
+    'exercícios propostos'
+    """
+    return ' '.join(texto.lower().split())
+
+
+def calcula_assinatura_minhash(texto: str, tamanho_shingle: int = 5, permutacoes: int = 64) -> tuple:
+    """
+    Calcula a assinatura MinHash de um texto a partir dos seus shingles de palavras.
+
+    Utiliza o MinHash de permutação única: cada shingle é embaralhado uma única vez e distribuído entre
+    `permutacoes` compartimentos, guardando o menor valor de cada um. A fração de compartimentos iguais entre
+    duas assinaturas estima a similaridade de Jaccard entre os textos.
+
+    Parâmetros:
+    \n\t`texto (str)`: Texto normalizado do trecho.
+    \n\t`tamanho_shingle (int)`: Quantidade de palavras de cada shingle (padrão: `5`).
+    \n\t`permutacoes (int)`: Quantidade de compartimentos da assinatura (padrão: `64`).
+
+    Retorno:
+    \n\t`tuple`: Assinatura com `permutacoes` valores. Compartimentos vazios valem `-1`.
+
+    Exemplo:
+    >>> len(calcula_assinatura_minhash('a derivada parcial de uma função de várias variáveis'))
+    64
+    """
+    palavras = texto.split()
+    assinatura = [-1] * permutacoes
+    for inicio in range(max(1, len(palavras) - tamanho_shingle + 1)):
+        shingle = ' '.join(palavras[inicio:inicio + tamanho_shingle])
+        valor = int.from_bytes(hashlib.blake2b(
+            shingle.encode('utf-8'), digest_size=8).digest(), 'little')
+        compartimento, valor = valor % permutacoes, valor // permutacoes
+        if assinatura[compartimento] == -1 or valor < assinatura[compartimento]:
+            assinatura[compartimento] = valor
+    return tuple(assinatura)
+
+
+def similaridade_assinaturas(assinatura_a: tuple, assinatura_b: tuple) -> float:
+    """
+    Estima a similaridade de Jaccard entre dois textos a partir das suas assinaturas MinHash.
+
+    Parâmetros:
+    \n\t`assinatura_a (tuple)`: Assinatura do primeiro texto.
+    \n\t`assinatura_b (tuple)`: Assinatura do segundo texto.
+
+    Retorno:
+    \n\t`float`: Similaridade estimada, entre `0` e `1`.
+
+    Exemplo:
+    >>> similaridade_assinaturas((1, 2, 3, -1), (1, 2, 4, -1))
+    0.6666666666666666
+    """
+    comparados = iguais = 0
+    for valor_a, valor_b in zip(assinatura_a, assinatura_b):
+        if valor_a == -1 and valor_b == -1:
+            continue
+        comparados += 1
+        iguais += valor_a == valor_b
+    return iguais / comparados if comparados else 1.0
+
+
+class DeduplicadorTrechos:
+    """
+    Elimina trechos duplicados e quase duplicados antes do embedding.
+
+    Duplicatas exatas são detectadas pelo hash do texto normalizado e quase duplicatas por MinHash com LSH
+    (Locality-Sensitive Hashing): a assinatura é dividida em `bandas`, e apenas trechos que coincidem em ao
+    menos uma banda têm a similaridade estimada. Cada trecho descartado é registrado em `duplicatas`, junto
+    ao `doc_id` do trecho mantido, e em `dependencias`, que indica de quais arquivos cada arquivo passou a
+    depender para manter o seu conteúdo no índice.
+
+    Exemplo:
+    >>> deduplicador = DeduplicadorTrechos(limiar=0.85)
+    >>> trechos = deduplicador.filtra(itera_trechos(paginas, SPLITTER_KWARGS))
+    """
+
+    def __init__(self, limiar: float = 0.85, tamanho_shingle: int = 5, permutacoes: int = 64, bandas: int = 16):
+        """
+        Parâmetros:
+        \n\t`limiar (float)`: Similaridade mínima para considerar dois trechos quase duplicados (padrão: `0.85`).
+        \n\t`tamanho_shingle (int)`: Quantidade de palavras de cada shingle (padrão: `5`).
+        \n\t`permutacoes (int)`: Quantidade de compartimentos da assinatura MinHash (padrão: `64`).
+        \n\t`bandas (int)`: Quantidade de bandas do LSH; deve dividir `permutacoes` (padrão: `16`).
+        """
+        self.limiar = limiar
+        self.tamanho_shingle = tamanho_shingle
+        self.permutacoes = permutacoes
+        self.bandas = bandas
+        self.linhas_por_banda = permutacoes // bandas
+        self._hashes_exatos = {}
+        self._baldes = {}
+        self._assinaturas = {}
+        self.duplicatas = {}
+        self.dependencias = {}
+        self.estatisticas = {'mantidos': 0, 'duplicatas_exatas': 0, 'quase_duplicatas': 0}
+
+    def registra_existentes(self, documentos) -> None:
+        """
+        Registra os trechos já presentes no índice, para que trechos novos idênticos a eles sejam descartados.
+
+        Apenas duplicatas exatas são detectadas contra os trechos existentes, o que evita recalcular as
+        assinaturas MinHash de todo o índice a cada atualização.
+
+        Parâmetros:
+        \n\t`documentos (Iterable[Document])`: Trechos já indexados.
+        """
+        for doc in documentos:
+            chave = hashlib.sha1(normaliza_texto_trecho(
+                doc.page_content).encode('utf-8')).hexdigest()
+            self._hashes_exatos.setdefault(
+                chave, (doc.metadata['doc_id'], doc.metadata['source']))
+
+    def _registra_duplicata(self, trecho, doc_id_mantido: str, arquivo_mantido: str) -> None:
+        """
+        Registra um trecho descartado e a dependência entre o seu arquivo e o arquivo do trecho mantido.
+
+        Parâmetros:
+        \n\t`trecho (Document)`: Trecho descartado.
+        \n\t`doc_id_mantido (str)`: `doc_id` do trecho mantido no índice.
+        \n\t`arquivo_mantido (str)`: Arquivo do trecho mantido.
+        """
+        self.duplicatas.setdefault(doc_id_mantido, []).append(
+            {'source': trecho.metadata['source'], 'page': trecho.metadata.get('page')})
+        if arquivo_mantido != trecho.metadata['source']:
+            self.dependencias.setdefault(
+                trecho.metadata['source'], set()).add(arquivo_mantido)
+
+    def _busca_quase_duplicata(self, assinatura: tuple, chaves_bandas: list):
+        """
+        Busca, entre os trechos que compartilham alguma banda do LSH, um trecho quase duplicado.
+
+        Parâmetros:
+        \n\t`assinatura (tuple)`: Assinatura MinHash do trecho.
+        \n\t`chaves_bandas (list)`: Chaves das bandas da assinatura.
+
+        Retorno:
+        \n\t`tuple | None`: Par `(doc_id, arquivo)` do trecho quase duplicado, ou `None`.
+        """
+        verificados = set()
+        for chave in chaves_bandas:
+            for doc_id in self._baldes.get(chave, ()):
+                if doc_id in verificados:
+                    continue
+                verificados.add(doc_id)
+                assinatura_candidato, arquivo = self._assinaturas[doc_id]
+                if similaridade_assinaturas(assinatura, assinatura_candidato) >= self.limiar:
+                    return doc_id, arquivo
+        return None
+
+    def filtra(self, trechos):
+        """
+        Gera apenas os trechos que não são duplicatas de trechos já vistos.
+
+        Parâmetros:
+        \n\t`trechos (Iterable[Document])`: Trechos gerados por `itera_trechos`.
+
+        Retorno:
+        \n\t`Generator[Document]`: Trechos mantidos, na ordem original.
+        """
+        for trecho in trechos:
+            texto = normaliza_texto_trecho(trecho.page_content)
+            chave_exata = hashlib.sha1(texto.encode('utf-8')).hexdigest()
+            if chave_exata in self._hashes_exatos:
+                self._registra_duplicata(trecho, *self._hashes_exatos[chave_exata])
+                self.estatisticas['duplicatas_exatas'] += 1
+                continue
+
+            assinatura = calcula_assinatura_minhash(
+                texto, self.tamanho_shingle, self.permutacoes)
+            # As chaves das bandas são reduzidas a um inteiro; colisões são descartadas na verificação.
+            chaves_bandas = [hash((banda, assinatura[banda * self.linhas_por_banda:(banda + 1) * self.linhas_por_banda]))
+                             for banda in range(self.bandas)]
+            semelhante = self._busca_quase_duplicata(assinatura, chaves_bandas)
+            if semelhante is not None:
+                self._registra_duplicata(trecho, *semelhante)
+                self.estatisticas['quase_duplicatas'] += 1
+                continue
+
+            doc_id = trecho.metadata['doc_id']
+            self._hashes_exatos[chave_exata] = (doc_id, trecho.metadata['source'])
+            self._assinaturas[doc_id] = (array('q', assinatura), trecho.metadata['source'])
+            for chave in chaves_bandas:
+                self._baldes.setdefault(chave, []).append(doc_id)
+            self.estatisticas['mantidos'] += 1
+            yield trecho
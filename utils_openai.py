@@ -4,6 +4,22 @@
 # Biblioteca para realizar requisições HTTP, usada para enviar dados à API da OpenAI.
 import requests
 import time
+import json  # Biblioteca para decodificar os eventos do streaming.
+import re  # Biblioteca de expressões regulares, usada na leitura dos cabeçalhos de limite de requisições.
+import random  # Biblioteca para o sorteio das esperas entre as tentativas.
+import socket  # Biblioteca de sockets, usada para ativar o keep-alive do TCP.
+import threading  # Biblioteca para manter uma sessão HTTP por thread.
+import asyncio  # Biblioteca de programação assíncrona, usada pelo cliente assíncrono.
+import hashlib  # Biblioteca para identificar as chaves de API sem guardá-las.
+import weakref  # Biblioteca para associar clientes e semáforos aos laços de eventos sem mantê-los vivos.
+from collections import deque  # Janela dos TTFTs observados, usada no limiar do hedging.
+import httpx  # Cliente HTTP assíncrono (dependência da biblioteca da OpenAI).
+from email.utils import parsedate_to_datetime  # Leitura do cabeçalho Retry-After no formato de data.
+from datetime import datetime, timezone  # Cálculo da espera indicada por uma data do servidor.
+# Adaptador que mantém o pool de conexões reaproveitadas pelas sessões HTTP.
+from requests.adapters import HTTPAdapter
+# Opções de socket padrão das conexões HTTP.
+from urllib3.connection import HTTPConnection
 # Biblioteca para carregar variáveis de ambiente do arquivo .env.
 from dotenv import load_dotenv, find_dotenv
 import os  # Biblioteca para acessar variáveis de ambiente do sistema.
@@ -12,29 +28,530 @@ import os  # Biblioteca para acessar variáveis de ambiente do sistema.
 # Carrega o arquivo .env que contém as credenciais sensíveis.
 _ = load_dotenv(find_dotenv())
 
+# --- Attributes --- #
+# Endereço padrão da API da OpenAI, usado quando nem `configura_sessao_http` nem a variável de ambiente
+# OPENAI_BASE_URL informam outro.
+URL_BASE_PADRAO = 'https://api.openai.com/v1'
+# Configuração do pool de conexões, alterada por `configura_sessao_http`.
+_CONFIG_HTTP = {'base_url': '', 'conexoes': 4, 'max_conexoes': 16, 'keep_alive': True, 'bloqueia': False}
+# Adaptador compartilhado por todas as sessões e geração da configuração atual.
+_ADAPTADOR_HTTP = None
+_GERACAO_HTTP = 0
+_LOCK_HTTP = threading.Lock()
+# Sessão HTTP de cada thread, já que `requests.Session` não é segura entre threads.
+_SESSOES_HTTP = threading.local()
+# Configuração do cliente assíncrono, alterada por `configura_cliente_assincrono`.
+_CONFIG_ASYNC = {'max_concorrentes_por_chave': 8}
+_GERACAO_ASYNC = 0
+# Cliente HTTP e semáforos de cada laço de eventos.
+_CLIENTES_ASYNC = weakref.WeakKeyDictionary()
+_SEMAFOROS_ASYNC = weakref.WeakKeyDictionary()
+# Laço de eventos de segundo plano, usado pelo código síncrono.
+_LACO_SEGUNDO_PLANO = None
+# Marca o fim de um gerador assíncrono consumido pelo código síncrono.
+_FIM_GERADOR = object()
+# Tempo máximo, em segundos, para fechar um gerador assíncrono interrompido.
+_TIMEOUT_FECHAMENTO = 5
+# Durações dos cabeçalhos de limite de requisições da OpenAI, como "6m0s" ou "20ms".
+PADRAO_DURACAO = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+SEGUNDOS_POR_UNIDADE = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+# Decodificador dos eventos JSON do streaming.
+_DECODIFICADOR_JSON = json.JSONDecoder()
+# Disjuntores de cada endereço base da API.
+_DISJUNTORES = {}
+
 
 # --- Methods --- #
+# SESSÃO HTTP ================================================
+
+class AdaptadorHTTPKeepAlive(HTTPAdapter):
+    """
+    Adaptador HTTP que ativa o keep-alive do TCP nas conexões do pool, evitando que conexões ociosas entre
+    as mensagens sejam derrubadas por proxies e firewalls.
+    """
+
+    def __init__(self, keep_alive: bool = True, **kwargs):
+        """
+        Parâmetros:
+        \n\t`keep_alive (bool)`: Se `True`, ativa o keep-alive do TCP nas conexões (padrão: `True`).
+        \n\t`**kwargs`: Parâmetros do `HTTPAdapter`, como `pool_connections` e `pool_maxsize`.
+        """
+        self.keep_alive = keep_alive
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        if self.keep_alive:
+            kwargs['socket_options'] = HTTPConnection.default_socket_options + [
+                (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+        super().init_poolmanager(*args, **kwargs)
+
+
+def configura_sessao_http(base_url: str = '', conexoes: int = 4, max_conexoes: int = 16,
+                          keep_alive: bool = True, bloqueia: bool = False) -> None:
+    """
+    Configura o pool de conexões HTTP compartilhado pelas chamadas à API da OpenAI.
+
+    As sessões das threads são recriadas na próxima chamada a `obtem_sessao_http`, passando a usar o novo pool.
+
+    Parâmetros:
+    \n\t`base_url (str)`: Endereço base da API. Se vazio, utiliza a variável de ambiente OPENAI_BASE_URL ou
+    `URL_BASE_PADRAO`.
+    \n\t`conexoes (int)`: Quantidade de pools mantidos, um por servidor (padrão: `4`).
+    \n\t`max_conexoes (int)`: Quantidade máxima de conexões mantidas abertas por servidor (padrão: `16`).
+    \n\t`keep_alive (bool)`: Se `True`, reaproveita as conexões entre as requisições e ativa o keep-alive do TCP;
+    se `False`, cada requisição abre e fecha a sua conexão (padrão: `True`).
+    \n\t`bloqueia (bool)`: Se `True`, as requisições aguardam uma conexão livre quando todas as `max_conexoes`
+    estão em uso, em vez de abrir conexões extras descartáveis (padrão: `False`).
+
+    Exemplo:
+    >>> configura_sessao_http(**get_config('http_kwargs'))
+    """
+    global _ADAPTADOR_HTTP, _GERACAO_HTTP
+    with _LOCK_HTTP:
+        _CONFIG_HTTP.update(base_url=base_url, conexoes=conexoes, max_conexoes=max_conexoes,
+                            keep_alive=keep_alive, bloqueia=bloqueia)
+        if _ADAPTADOR_HTTP is not None:
+            _ADAPTADOR_HTTP.close()
+        _ADAPTADOR_HTTP = None
+        _GERACAO_HTTP += 1
+
+
+def obtem_sessao_http() -> requests.Session:
+    """
+    Retorna a sessão HTTP da thread atual, criando-a na primeira chamada.
+
+    As sessões de todas as threads montam o mesmo adaptador, de modo que compartilham (com segurança entre
+    threads) o pool de conexões: as requisições seguintes reaproveitam as conexões já abertas e não pagam
+    novamente o handshake TCP e TLS.
+
+    Retorno:
+    \n\t`requests.Session`: Sessão HTTP da thread.
+
+    Exemplo:
+    >>> obtem_sessao_http().post(url_api('chat/completions'), headers=headers, json=data)
+    <Response [200]>
+    """
+    global _ADAPTADOR_HTTP
+    sessao = getattr(_SESSOES_HTTP, 'sessao', None)
+    if sessao is not None and _SESSOES_HTTP.geracao == _GERACAO_HTTP:
+        return sessao
+    with _LOCK_HTTP:
+        if _ADAPTADOR_HTTP is None:
+            _ADAPTADOR_HTTP = AdaptadorHTTPKeepAlive(keep_alive=_CONFIG_HTTP['keep_alive'],
+                                                     pool_connections=_CONFIG_HTTP['conexoes'],
+                                                     pool_maxsize=_CONFIG_HTTP['max_conexoes'],
+                                                     pool_block=_CONFIG_HTTP['bloqueia'])
+        sessao = requests.Session()
+        sessao.mount('https://', _ADAPTADOR_HTTP)
+        sessao.mount('http://', _ADAPTADOR_HTTP)
+        if not _CONFIG_HTTP['keep_alive']:
+            sessao.headers['Connection'] = 'close'
+        _SESSOES_HTTP.sessao = sessao
+        _SESSOES_HTTP.geracao = _GERACAO_HTTP
+    return sessao
+
+
+def endereco_base_api() -> str:
+    """
+    Retorna o endereço base da API da OpenAI: o configurado em `configura_sessao_http`, a variável de ambiente
+    OPENAI_BASE_URL ou o endereço padrão, nessa ordem.
+
+    Retorno:
+    \n\t`str`: Endereço base, sem a barra final.
+
+    Exemplo:
+    >>> ChatOpenAI(model='gpt-4o-mini', base_url=endereco_base_api())
+    """
+    return (_CONFIG_HTTP['base_url'] or os.getenv('OPENAI_BASE_URL') or URL_BASE_PADRAO).rstrip('/')
+
+
+def url_api(caminho: str) -> str:
+    """
+    Monta o endereço de um recurso da API da OpenAI a partir do endereço base configurado.
+
+    Parâmetros:
+    \n\t`caminho (str)`: Caminho do recurso, relativo ao endereço base.
+
+    Retorno:
+    \n\t`str`: Endereço completo do recurso.
+
+    Exemplo:
+    >>> url_api('audio/transcriptions')
+    'https://api.openai.com/v1/audio/transcriptions'
+    """
+    return f"{endereco_base_api()}/{caminho.lstrip('/')}"
+
+
+# RETENTATIVAS ================================================
+
+class CircuitoAberto(Exception):
+    """
+    Erro lançado, sem nenhuma requisição, enquanto o disjuntor da API está aberto.
+    """
+
+    def __init__(self, segundos_restantes: float):
+        """
+        Parâmetros:
+        \n\t`segundos_restantes (float)`: Tempo até a próxima requisição de teste.
+        """
+        self.segundos_restantes = segundos_restantes
+        super().__init__(f"A API da OpenAI está indisponível. Nova tentativa em {segundos_restantes:.0f}s.")
+
+
+def le_duracao(valor: str) -> float:
+    """
+    Converte uma duração dos cabeçalhos de limite de requisições da OpenAI em segundos.
+
+    Parâmetros:
+    \n\t`valor (str)`: Duração, como `'6m0s'`, `'1.5s'` ou `'20ms'`.
+
+    Retorno:
+    \n\t`float`: Duração em segundos, ou `0` se o valor não for reconhecido.
+
+    Exemplo:
+    >>> le_duracao('6m0.5s')
+    360.5
+    """
+    return sum(float(numero) * SEGUNDOS_POR_UNIDADE[unidade]
+               for numero, unidade in PADRAO_DURACAO.findall(valor or ''))
+
+
+def le_espera_servidor(headers) -> float:
+    """
+    Lê dos cabeçalhos de uma resposta a espera indicada pelo servidor antes da próxima requisição.
+
+    São considerados, nesta ordem, `retry-after-ms`, `Retry-After` (em segundos ou como data) e, quando o
+    limite de requisições ou de tokens se esgotou, `x-ratelimit-reset-requests` e `x-ratelimit-reset-tokens`.
+
+    Parâmetros:
+    \n\t`headers (Mapping)`: Cabeçalhos da resposta, sem distinção de maiúsculas.
+
+    Retorno:
+    \n\t`float | None`: Espera em segundos, ou `None` se o servidor não indicou nenhuma.
+
+    Exemplo:
+    >>> le_espera_servidor({'retry-after': '3'})
+    3.0
+    """
+    try:
+        if headers.get('retry-after-ms'):
+            return max(0.0, float(headers['retry-after-ms']) / 1000)
+        if headers.get('retry-after'):
+            valor = headers['retry-after']
+            try:
+                return max(0.0, float(valor))
+            except ValueError:
+                return max(0.0, (parsedate_to_datetime(valor) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        pass
+    esperas = [le_duracao(headers.get(f'x-ratelimit-reset-{limite}'))
+               for limite in ('requests', 'tokens')
+               if headers.get(f'x-ratelimit-remaining-{limite}') == '0']
+    return max(esperas) if esperas else None
+
+
+class PoliticaRetentativas:
+    """
+    Política de novas tentativas das chamadas à API da OpenAI.
+
+    Os erros de limite de requisições (429), os erros temporários do servidor (5xx), as conexões recusadas ou
+    interrompidas e os timeouts são repetidos. A espera segue a indicação do servidor, quando há, com um
+    pequeno acréscimo aleatório; caso contrário, é sorteada entre zero e o backoff exponencial ("full
+    jitter"), de modo que as sessões não repitam as requisições ao mesmo tempo.
+
+    Exemplo:
+    >>> politica = PoliticaRetentativas(espera_base=1, espera_maxima=32)
+    >>> politica.calcula_espera(3, {})  # Sorteada entre 0 e 8 segundos.
+    5.82
+    """
+
+    def __init__(self, max_tentativas: int = 5, espera_base: float = 1, espera_maxima: float = 32,
+                 espera_maxima_servidor: float = 60, status_retentaveis: list = (429, 500, 502, 503, 504),
+                 timeout_conexao: float = 10, timeout_leitura: float = 60, prazo_total: float = 120):
+        """
+        Parâmetros:
+        \n\t`max_tentativas (int)`: Quantidade máxima de tentativas de cada chamada (padrão: `5`).
+        \n\t`espera_base (float)`: Espera máxima, em segundos, antes da segunda tentativa; dobra a cada
+        tentativa (padrão: `1`).
+        \n\t`espera_maxima (float)`: Limite, em segundos, do backoff exponencial (padrão: `32`).
+        \n\t`espera_maxima_servidor (float)`: Limite, em segundos, da espera indicada pelo servidor (padrão: `60`).
+        \n\t`status_retentaveis (list)`: Códigos HTTP repetidos (padrão: `429`, `500`, `502`, `503` e `504`).
+        \n\t`timeout_conexao (float)`: Tempo máximo, em segundos, para estabelecer cada conexão (padrão: `10`).
+        \n\t`timeout_leitura (float)`: Tempo máximo, em segundos, de espera por dados em cada tentativa
+        (padrão: `60`).
+        \n\t`prazo_total (float)`: Tempo máximo, em segundos, somando todas as tentativas e esperas; uma espera
+        que ultrapassaria o prazo não é feita (padrão: `120`).
+        """
+        self.max_tentativas = max_tentativas
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+        self.espera_maxima_servidor = espera_maxima_servidor
+        self.status_retentaveis = frozenset(status_retentaveis)
+        self.timeout_conexao = timeout_conexao
+        self.timeout_leitura = timeout_leitura
+        self.prazo_total = prazo_total
+
+    def calcula_espera(self, tentativa: int, headers) -> float:
+        """
+        Calcula a espera antes da próxima tentativa.
+
+        Parâmetros:
+        \n\t`tentativa (int)`: Índice da tentativa que falhou, a partir de `0`.
+        \n\t`headers (Mapping)`: Cabeçalhos da resposta que falhou (vazios em erros de conexão).
+
+        Retorno:
+        \n\t`float`: Espera em segundos.
+        """
+        espera_servidor = le_espera_servidor(headers)
+        if espera_servidor is not None:
+            espera = min(espera_servidor, self.espera_maxima_servidor)
+            return espera + random.uniform(0, 0.1 * espera + 0.05)
+        return random.uniform(0, min(self.espera_maxima, self.espera_base * 2 ** tentativa))
+
+
+class DisjuntorCircuito:
+    """
+    Disjuntor ("circuit breaker") das chamadas à API da OpenAI.
+
+    Após `limiar_falhas` falhas seguidas do servidor (5xx, erros de conexão ou timeouts), o disjuntor abre e
+    as chamadas falham imediatamente com `CircuitoAberto` durante `tempo_aberto` segundos. Em seguida, uma
+    única chamada de teste é liberada: se tiver sucesso, o disjuntor fecha; se falhar, abre novamente.
+
+    Exemplo:
+    >>> disjuntor = DisjuntorCircuito(limiar_falhas=5, tempo_aberto=30)
+    >>> disjuntor.verifica()  # Lança CircuitoAberto se o disjuntor estiver aberto.
+    """
+
+    def __init__(self, limiar_falhas: int = 5, tempo_aberto: float = 30):
+        """
+        Parâmetros:
+        \n\t`limiar_falhas (int)`: Falhas seguidas que abrem o disjuntor (padrão: `5`).
+        \n\t`tempo_aberto (float)`: Tempo, em segundos, em que o disjuntor permanece aberto (padrão: `30`).
+        """
+        self.limiar_falhas = limiar_falhas
+        self.tempo_aberto = tempo_aberto
+        self.estatisticas = {'aberturas': 0, 'rejeitadas': 0}
+        self._falhas = 0
+        self._aberto_ate = None
+        self._teste_desde = None
+        self._lock = threading.Lock()
+
+    def verifica(self) -> None:
+        """
+        Libera uma chamada, ou lança `CircuitoAberto` se o disjuntor estiver aberto ou já houver uma chamada de
+        teste em andamento.
+        """
+        with self._lock:
+            if self._aberto_ate is None:
+                return
+            agora = time.monotonic()
+            # Uma chamada de teste sem resultado (por exemplo, cancelada) é descartada após `tempo_aberto`.
+            testando = self._teste_desde is not None and agora - self._teste_desde < self.tempo_aberto
+            if agora < self._aberto_ate or testando:
+                self.estatisticas['rejeitadas'] += 1
+                raise CircuitoAberto(max(self._aberto_ate - agora, 0))
+            self._teste_desde = agora
+
+    def registra_sucesso(self) -> None:
+        """
+        Registra uma resposta do servidor, fechando o disjuntor.
+        """
+        with self._lock:
+            self._falhas = 0
+            self._aberto_ate = None
+            self._teste_desde = None
+
+    def registra_falha(self) -> None:
+        """
+        Registra uma falha do servidor, abrindo o disjuntor ao atingir o limiar ou se a chamada era de teste.
+        """
+        with self._lock:
+            self._falhas += 1
+            if self._teste_desde is not None or self._falhas >= self.limiar_falhas:
+                if self._aberto_ate is None or self._teste_desde is not None:
+                    self.estatisticas['aberturas'] += 1
+                self._aberto_ate = time.monotonic() + self.tempo_aberto
+                self._teste_desde = None
+
+
+_POLITICA_RETENTATIVAS = PoliticaRetentativas()
+_CONFIG_DISJUNTOR = {'limiar_falhas': 5, 'tempo_aberto': 30}
+
+
+def configura_retentativas(politica_kwargs: dict = None, disjuntor_kwargs: dict = None) -> None:
+    """
+    Configura a política de novas tentativas e os disjuntores das chamadas à API da OpenAI.
+
+    Parâmetros:
+    \n\t`politica_kwargs (dict)`: Parâmetros da `PoliticaRetentativas`.
+    \n\t`disjuntor_kwargs (dict)`: Parâmetros do `DisjuntorCircuito`.
+
+    Exemplo:
+    >>> configura_retentativas(get_config('retentativas_kwargs'), get_config('disjuntor_kwargs'))
+    """
+    global _POLITICA_RETENTATIVAS
+    with _LOCK_HTTP:
+        _POLITICA_RETENTATIVAS = PoliticaRetentativas(**(politica_kwargs or {}))
+        _CONFIG_DISJUNTOR.update(disjuntor_kwargs or {})
+        _DISJUNTORES.clear()
+
+
+def obtem_disjuntor() -> DisjuntorCircuito:
+    """
+    Retorna o disjuntor do endereço base atual da API, compartilhado por todas as sessões.
+
+    Retorno:
+    \n\t`DisjuntorCircuito`: O disjuntor.
+    """
+    base_url = url_api('')
+    with _LOCK_HTTP:
+        if base_url not in _DISJUNTORES:
+            _DISJUNTORES[base_url] = DisjuntorCircuito(**_CONFIG_DISJUNTOR)
+        return _DISJUNTORES[base_url]
+
+
+def _avalia_resposta(response, politica: PoliticaRetentativas, disjuntor: DisjuntorCircuito) -> bool:
+    """
+    Registra no disjuntor o resultado de uma tentativa e indica se ela deve ser repetida.
+
+    Respostas de sucesso retornam `False`; erros não repetíveis são lançados.
+
+    Parâmetros:
+    \n\t`response (requests.Response | httpx.Response)`: Resposta da tentativa.
+    \n\t`politica (PoliticaRetentativas)`: Política de novas tentativas.
+    \n\t`disjuntor (DisjuntorCircuito)`: Disjuntor da API.
+
+    Retorno:
+    \n\t`bool`: `True` se a tentativa falhou e pode ser repetida.
+    """
+    if response.status_code >= 500:
+        disjuntor.registra_falha()
+    else:
+        disjuntor.registra_sucesso()
+    if response.status_code == 200:
+        return False
+    if response.status_code not in politica.status_retentaveis:
+        response.raise_for_status()
+    return True
+
+
+def _erro_persistente(falha: str) -> Exception:
+    """
+    Cria o erro lançado quando as tentativas de uma chamada se esgotam.
+    """
+    return Exception(f"{falha} persistente: número máximo de tentativas atingido. Tente novamente mais tarde.")
+
+
+def envia_com_retentativas(envia, max_tentativas: int = None):
+    """
+    Envia uma requisição síncrona à API seguindo a política de novas tentativas e o disjuntor.
+
+    Parâmetros:
+    \n\t`envia (Callable)`: Função que recebe o timeout `(conexão, leitura)` e envia a requisição, retornando
+    a `requests.Response`.
+    \n\t`max_tentativas (int)`: Substitui a quantidade máxima de tentativas da política (padrão: `None`).
+
+    Retorno:
+    \n\t`requests.Response`: Resposta de sucesso (código 200).
+
+    Exemplo:
+    >>> response = envia_com_retentativas(
+    ...     lambda timeout: obtem_sessao_http().post(url_api('audio/transcriptions'), files=files, timeout=timeout))
+    """
+    politica = _POLITICA_RETENTATIVAS
+    disjuntor = obtem_disjuntor()
+    tentativas = max_tentativas or politica.max_tentativas
+    inicio = time.monotonic()
+    for tentativa in range(tentativas):
+        disjuntor.verifica()
+        try:
+            response = envia((politica.timeout_conexao, politica.timeout_leitura))
+        except (requests.ConnectionError, requests.Timeout) as erro:
+            disjuntor.registra_falha()
+            falha, headers = f"Erro de conexão ({type(erro).__name__})", {}
+        else:
+            if not _avalia_resposta(response, politica, disjuntor):
+                return response
+            falha, headers = f"Erro {response.status_code}", response.headers
+            response.close()
+        espera = politica.calcula_espera(tentativa, headers)
+        if tentativa + 1 == tentativas or time.monotonic() - inicio + espera > politica.prazo_total:
+            break
+        print(f"{falha}. Tentativa {tentativa + 1}/{tentativas}. Aguardando {espera:.1f}s...")
+        time.sleep(espera)
+    raise _erro_persistente(falha)
+
+
+async def envia_com_retentativas_async(envia, semaforo: asyncio.Semaphore, max_tentativas: int = None):
+    """
+    Versão assíncrona de `envia_com_retentativas`.
+
+    A vaga do semáforo é ocupada em cada tentativa e liberada durante as esperas. Quando a resposta é de
+    sucesso, a vaga permanece ocupada e deve ser liberada por quem chamou, após consumir a resposta.
+
+    Parâmetros:
+    \n\t`envia (Callable)`: Corrotina que recebe o `httpx.Timeout` e envia a requisição, retornando a
+    `httpx.Response`.
+    \n\t`semaforo (asyncio.Semaphore)`: Semáforo que limita as requisições em andamento.
+    \n\t`max_tentativas (int)`: Substitui a quantidade máxima de tentativas da política (padrão: `None`).
+
+    Retorno:
+    \n\t`httpx.Response`: Resposta de sucesso (código 200).
+    """
+    politica = _POLITICA_RETENTATIVAS
+    disjuntor = obtem_disjuntor()
+    tentativas = max_tentativas or politica.max_tentativas
+    timeout = httpx.Timeout(politica.timeout_leitura, connect=politica.timeout_conexao)
+    inicio = time.monotonic()
+    for tentativa in range(tentativas):
+        disjuntor.verifica()
+        await semaforo.acquire()
+        sucesso = False
+        try:
+            response = await envia(timeout)
+            try:
+                sucesso = not _avalia_resposta(response, politica, disjuntor)
+            except BaseException:
+                await response.aclose()
+                raise
+            if sucesso:
+                return response
+            falha, headers = f"Erro {response.status_code}", response.headers
+            await response.aclose()
+        except httpx.TransportError as erro:
+            disjuntor.registra_falha()
+            falha, headers = f"Erro de conexão ({type(erro).__name__})", {}
+        finally:
+            if not sucesso:
+                semaforo.release()
+        espera = politica.calcula_espera(tentativa, headers)
+        if tentativa + 1 == tentativas or time.monotonic() - inicio + espera > politica.prazo_total:
+            break
+        print(f"{falha}. Tentativa {tentativa + 1}/{tentativas}. Aguardando {espera:.1f}s...")
+        await asyncio.sleep(espera)
+    raise _erro_persistente(falha)
+
+
 # API OPENAI ================================================
 
-def retorna_resposta_modelo(mensagens: list, openai_key: str, modelo: str = 'gpt-4-turbo', temperatura: float = 0, stream: bool = False, max_retries: int = 5):
+def retorna_resposta_modelo(mensagens: list, openai_key: str, modelo: str = 'gpt-4-turbo', temperatura: float = 0, max_retries: int = None) -> dict:
     """
     Envia uma solicitação para a API da OpenAI e retorna a resposta gerada pelo modelo.
 
-    A função agora inclui um mecanismo de retry automático em caso de erro 429 (Too Many Requests), 
-    implementando exponential backoff para evitar sobrecarga na API.
+    As falhas temporárias (erro 429, erros 5xx, erros de conexão e timeouts) são repetidas conforme a política
+    configurada em `configura_retentativas`, respeitando a espera indicada pelo servidor e o disjuntor da API.
+    Para obter a resposta em tempo real, utilize `transmite_resposta_modelo`.
 
     Parâmetros:
     \n\t`mensagens (list)`: Lista de mensagens de entrada. Cada mensagem deve ser um dicionário com as chaves 'role' (identificando o remetente) e 'content' (conteúdo da mensagem).
     \n\t`openai_key (str)`: Chave da API da OpenAI usada para autenticação e autorização no serviço.
     \n\t`modelo (str)`: Nome do modelo a ser utilizado (padrão: 'gpt-4-turbo').
     \n\t`temperatura (float)`: Controla a aleatoriedade das respostas geradas. Valores altos (ex: 1.0) tornam as respostas mais criativas, enquanto valores baixos (ex: 0.2) tornam-nas mais focadas e determinísticas.
-    \n\t`stream (bool)`: Se `True`, ativa o modo de transmissão contínua para obter resultados parciais em tempo real (padrão: `False`, retornando a resposta completa de uma vez).
-    \n\t`max_retries (int)`: Número máximo de tentativas em caso de erro 429 (Too Many Requests). A cada tentativa, o tempo de espera dobra (Exponential Backoff). O padrão é `5`.
+    \n\t`max_retries (int)`: Número máximo de tentativas. Se `None`, utiliza o da política de novas tentativas (padrão: `None`).
 
     Retorno:
-    \n\t- Se `stream` for `True`, retorna um gerador que produz respostas parciais em tempo real.
-    \n\t- Caso contrário, retorna a resposta completa do modelo como um JSON.
-    \n\t- Se o erro 429 persistir após `max_retries`, uma exceção é lançada.
+    \n\t- A resposta completa do modelo como um JSON.
+    \n\t- Se a falha persistir após `max_retries` tentativas, uma exceção é lançada; se o disjuntor estiver aberto, `CircuitoAberto` é lançada sem nenhuma requisição.
 
     Exemplo:
     >>> mensagens = [{"role": "user", "content": "Qual a capital da França?"}]
@@ -42,6 +559,439 @@ def retorna_resposta_modelo(mensagens: list, openai_key: str, modelo: str = 'gpt
     >>> print(resposta)
     {"choices": [{"message": {"role": "assistant", "content": "A capital da França é Paris."}}]}
     """
+    headers, data = _monta_requisicao_chat(mensagens, openai_key, modelo, temperatura, False)
+    response = envia_com_retentativas(
+        lambda timeout: obtem_sessao_http().post(
+            url_api('chat/completions'), headers=headers, json=data, timeout=timeout),
+        max_retries)
+    return response.json()
+
+
+# STREAMING (SSE) ================================================
+
+class EventoSSE:
+    """
+    Evento de um fluxo Server-Sent Events.
+
+    Exemplo:
+    >>> EventoSSE(data='[DONE]').data
+    '[DONE]'
+    """
+
+    __slots__ = ('event', 'data', 'id')
+
+    def __init__(self, event: str = 'message', data: str = '', id: str = None):
+        """
+        Parâmetros:
+        \n\t`event (str)`: Tipo do evento (padrão: `'message'`).
+        \n\t`data (str)`: Dados do evento; as linhas `data:` de um mesmo evento são unidas por `\\n`.
+        \n\t`id (str)`: Identificador do evento (padrão: `None`).
+        """
+        self.event = event
+        self.data = data
+        self.id = id
+
+    def __repr__(self) -> str:
+        return f'EventoSSE(event={self.event!r}, data={self.data!r})'
+
+
+class DecodificadorSSE:
+    """
+    Decodificador incremental de um fluxo Server-Sent Events, alimentado com os pedaços de bytes na ordem
+    em que chegam da rede.
+
+    Segue a especificação do formato: as linhas terminam em `\\n`, `\\r\\n` ou `\\r` (inclusive quando o
+    terminador é dividido entre dois pedaços), um evento termina em uma linha vazia, as várias linhas `data:`
+    de um evento são unidas por `\\n` e as linhas de comentário (`:`), usadas como keep-alive, são ignoradas.
+    Os dados só são convertidos em texto quando o evento termina, de modo que um caractere UTF-8 dividido
+    entre pedaços não é corrompido.
+
+    Exemplo:
+    >>> decodificador = DecodificadorSSE()
+    >>> decodificador.alimenta(b'data: {"a"')
+    []
+    >>> decodificador.alimenta(b': 1}\\n\\n: keep-alive\\n\\ndata: [DONE]\\n\\n')
+    [EventoSSE(event='message', data='{"a": 1}'), EventoSSE(event='message', data='[DONE]')]
+    """
+
+    def __init__(self):
+        self._resto = b''
+        self._cr_pendente = False
+        self._event = ''
+        self._dados = []
+        self._id = None
+
+    def _processa_linha_campo(self, linha: bytes) -> None:
+        """
+        Processa uma linha de campo diferente de `data: ...`.
+
+        Parâmetros:
+        \n\t`linha (bytes)`: Linha, sem o terminador.
+        """
+        campo, separador, valor = linha.partition(b':')
+        if separador and valor[:1] == b' ':
+            valor = valor[1:]
+        if campo == b'data':
+            self._dados.append(valor)
+        elif campo == b'event':
+            self._event = valor.decode('utf-8', 'replace')
+        elif campo == b'id':
+            self._id = valor.decode('utf-8', 'replace')
+
+    def alimenta(self, pedaco: bytes) -> list:
+        """
+        Processa um pedaço do fluxo.
+
+        Parâmetros:
+        \n\t`pedaco (bytes)`: Bytes recebidos.
+
+        Retorno:
+        \n\t`list`: Eventos concluídos por este pedaço (`EventoSSE`).
+        """
+        if self._cr_pendente and pedaco[:1] == b'\n':
+            # Segunda metade de um "\r\n" dividido entre dois pedaços.
+            pedaco = pedaco[1:]
+        dados = self._resto + pedaco if self._resto else pedaco
+        if not dados:
+            return []
+        linhas = dados.splitlines()
+        ultimo = dados[-1]
+        self._cr_pendente = ultimo == 0x0D
+        if ultimo == 0x0A or ultimo == 0x0D:
+            self._resto = b''
+        else:
+            # A última linha ainda não terminou.
+            self._resto = linhas.pop()
+
+        eventos = []
+        for linha in linhas:
+            if linha.startswith(b'data: '):
+                self._dados.append(linha[6:])
+            elif not linha:
+                if self._dados:
+                    eventos.append(EventoSSE(self._event or 'message',
+                                             b'\n'.join(self._dados).decode('utf-8', 'replace'), self._id))
+                    self._dados = []
+                self._event = ''
+            elif linha[:1] != b':':
+                self._processa_linha_campo(linha)
+        return eventos
+
+    def finaliza(self) -> bool:
+        """
+        Conclui o fluxo. Como na especificação, um evento não terminado por uma linha vazia é descartado.
+
+        Retorno:
+        \n\t`bool`: `True` se havia um evento incompleto.
+        """
+        incompleto = bool(self._dados) or (bool(self._resto) and self._resto[:1] != b':')
+        self._resto = b''
+        self._cr_pendente = False
+        self._event = ''
+        self._dados = []
+        return incompleto
+
+
+class MetricasStream:
+    """
+    Tempos de uma resposta transmitida: tempo até o primeiro token (TTFT), intervalos entre os tokens e
+    tokens por segundo. Cada pedaço de texto (delta) recebido conta como um token; os tokens que chegam no
+    mesmo pedaço do fluxo recebem o mesmo instante.
+
+    Exemplo:
+    >>> metricas = MetricasStream()
+    >>> for delta in itera_em_segundo_plano(transmite_resposta_modelo_async(mensagens, chave, metricas=metricas)):
+    ...     pass
+    >>> metricas.resumo()
+    {'ttft': 0.41, 'tokens': 182, 'tokens_por_segundo': 61.3, 'intervalo_medio': 0.016, ...}
+    """
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.instantes = []
+        self.fim = None
+        self.eventos_invalidos = 0
+        # Requisição usada quando houve hedging ('original' ou 'hedge').
+        self.hedge = None
+
+    def registra_tokens(self, quantidade: int = 1) -> None:
+        """
+        Registra a chegada de tokens recebidos juntos, no mesmo pedaço do fluxo.
+
+        Parâmetros:
+        \n\t`quantidade (int)`: Quantidade de tokens (padrão: `1`).
+        """
+        if quantidade:
+            self.instantes.extend([time.perf_counter()] * quantidade)
+
+    def finaliza(self) -> None:
+        """
+        Registra o fim do fluxo.
+        """
+        self.fim = time.perf_counter()
+
+    @property
+    def ttft(self):
+        """
+        `float | None`: Tempo, em segundos, entre o envio da requisição e o primeiro token.
+        """
+        return self.instantes[0] - self.inicio if self.instantes else None
+
+    @property
+    def intervalos(self) -> list:
+        """
+        `list`: Intervalos, em segundos, entre tokens consecutivos.
+        """
+        return [depois - antes for antes, depois in zip(self.instantes, self.instantes[1:])]
+
+    @property
+    def tokens_por_segundo(self):
+        """
+        `float | None`: Tokens por segundo depois do primeiro token.
+        """
+        if len(self.instantes) < 2:
+            return None
+        return (len(self.instantes) - 1) / ((self.instantes[-1] - self.instantes[0]) or 1e-9)
+
+    def resumo(self) -> dict:
+        """
+        Resume as métricas do fluxo.
+
+        Retorno:
+        \n\t`dict`: TTFT, quantidade de tokens, tokens por segundo, intervalos médio, p95 e máximo entre os
+        tokens, duração total (em segundos), eventos inválidos e a requisição usada no hedging.
+        """
+        intervalos = sorted(self.intervalos)
+        return {
+            'ttft': self.ttft,
+            'tokens': len(self.instantes),
+            'tokens_por_segundo': self.tokens_por_segundo,
+            'intervalo_medio': sum(intervalos) / len(intervalos) if intervalos else None,
+            'intervalo_p95': intervalos[min(len(intervalos) - 1, int(0.95 * len(intervalos)))] if intervalos else None,
+            'intervalo_maximo': intervalos[-1] if intervalos else None,
+            'duracao': (self.fim or time.perf_counter()) - self.inicio,
+            'eventos_invalidos': self.eventos_invalidos,
+            'hedge': self.hedge
+        }
+
+
+class LeitorStreamChat:
+    """
+    Converte os bytes do streaming de `chat/completions` nos pedaços de texto da resposta, registrando as
+    métricas do fluxo.
+
+    Eventos que não são JSON válido são contados em `MetricasStream.eventos_invalidos` e informados no
+    terminal; um evento de erro da API lança uma exceção.
+
+    Exemplo:
+    >>> leitor = LeitorStreamChat()
+    >>> leitor.alimenta(b'data: {"choices": [{"delta": {"content": "Par"}}]}\\n\\n')
+    ['Par']
+    >>> leitor.alimenta(b'data: [DONE]\\n\\n'), leitor.concluido
+    ([], True)
+    """
+
+    def __init__(self, metricas: MetricasStream = None):
+        """
+        Parâmetros:
+        \n\t`metricas (MetricasStream)`: Métricas do fluxo (padrão: `None`, cria novas métricas).
+        """
+        self.decodificador = DecodificadorSSE()
+        self.metricas = metricas if metricas is not None else MetricasStream()
+        self.concluido = False
+
+    def _processa_eventos(self, eventos: list) -> list:
+        """
+        Extrai os pedaços de texto de uma lista de eventos.
+
+        Parâmetros:
+        \n\t`eventos (list)`: Eventos decodificados.
+
+        Retorno:
+        \n\t`list`: Pedaços de texto da resposta.
+        """
+        deltas = []
+        for evento in eventos:
+            dados = evento.data
+            if dados == '[DONE]':
+                self.concluido = True
+                break
+            try:
+                pedaco, fim = _DECODIFICADOR_JSON.raw_decode(dados)
+                if fim != len(dados):
+                    pedaco = json.loads(dados)
+            except json.JSONDecodeError:
+                self.metricas.eventos_invalidos += 1
+                print(f"Evento inválido no streaming: {dados[:200]!r}")
+                continue
+            if not isinstance(pedaco, dict):
+                continue
+            if 'error' in pedaco:
+                erro = pedaco['error']
+                raise Exception(f"Erro da API no streaming: {erro.get('message', erro) if isinstance(erro, dict) else erro}")
+            for escolha in pedaco.get('choices') or ():
+                conteudo = (escolha.get('delta') or {}).get('content')
+                if conteudo:
+                    deltas.append(conteudo)
+        self.metricas.registra_tokens(len(deltas))
+        if self.concluido:
+            self.metricas.finaliza()
+        return deltas
+
+    def alimenta(self, pedaco: bytes) -> list:
+        """
+        Processa um pedaço de bytes do fluxo.
+
+        Parâmetros:
+        \n\t`pedaco (bytes)`: Bytes recebidos.
+
+        Retorno:
+        \n\t`list`: Pedaços de texto concluídos por estes bytes.
+        """
+        if self.concluido:
+            return []
+        return self._processa_eventos(self.decodificador.alimenta(pedaco))
+
+    def finaliza(self) -> None:
+        """
+        Conclui o fluxo, informando no terminal se ele terminou antes do evento `[DONE]`.
+        """
+        if not self.concluido:
+            incompleto = self.decodificador.finaliza()
+            print(f"Streaming encerrado antes de [DONE]{' com um evento incompleto' if incompleto else ''}.")
+        if self.metricas.fim is None:
+            self.metricas.finaliza()
+
+
+def itera_deltas(pedacos, metricas: MetricasStream = None):
+    """
+    Converte um fluxo de bytes de `chat/completions` (por exemplo, gravado em arquivo) nos pedaços de texto
+    da resposta.
+
+    Parâmetros:
+    \n\t`pedacos (Iterable[bytes])`: Pedaços de bytes do fluxo.
+    \n\t`metricas (MetricasStream)`: Métricas do fluxo (padrão: `None`).
+
+    Retorno:
+    \n\t`Generator[str]`: Pedaços de texto da resposta.
+
+    Exemplo:
+    >>> ''.join(itera_deltas(response.iter_content(chunk_size=None)))
+    'A capital da França é Paris.'
+    """
+    leitor = LeitorStreamChat(metricas)
+    for pedaco in pedacos:
+        yield from leitor.alimenta(pedaco)
+        if leitor.concluido:
+            break
+    leitor.finaliza()
+
+
+def transmite_resposta_modelo(mensagens: list, openai_key: str, modelo: str = 'gpt-4-turbo', temperatura: float = 0,
+                              max_retries: int = None, metricas: MetricasStream = None):
+    """
+    Versão de `retorna_resposta_modelo` com streaming: produz os pedaços de texto da resposta à medida que
+    chegam, decodificados dos bytes do fluxo por `itera_deltas`.
+
+    Parâmetros:
+    \n\t`mensagens (list)`: Lista de mensagens de entrada, com as chaves 'role' e 'content'.
+    \n\t`openai_key (str)`: Chave da API da OpenAI.
+    \n\t`modelo (str)`: Nome do modelo a ser utilizado (padrão: 'gpt-4-turbo').
+    \n\t`temperatura (float)`: Aleatoriedade das respostas geradas (padrão: `0`).
+    \n\t`max_retries (int)`: Número máximo de tentativas. Se `None`, utiliza o da política (padrão: `None`).
+    \n\t`metricas (MetricasStream)`: Recebe o TTFT e os intervalos entre os tokens (padrão: `None`).
+
+    Retorno:
+    \n\t`Generator[str]`: Pedaços de texto da resposta.
+
+    Exemplo:
+    >>> for delta in transmite_resposta_modelo(mensagens, "sua_api_key"):
+    ...     print(delta, end='')
+    A capital da França é Paris.
+    """
+    headers, data = _monta_requisicao_chat(mensagens, openai_key, modelo, temperatura, True)
+    response = envia_com_retentativas(
+        lambda timeout: obtem_sessao_http().post(
+            url_api('chat/completions'), headers=headers, json=data, stream=True, timeout=timeout),
+        max_retries)
+    try:
+        yield from itera_deltas(response.iter_content(chunk_size=None), metricas)
+    finally:
+        # Devolve a conexão ao pool (ou a descarta, se a leitura foi interrompida).
+        response.close()
+
+
+# CLIENTE ASSÍNCRONO ================================================
+
+def configura_cliente_assincrono(max_concorrentes_por_chave: int = 8) -> None:
+    """
+    Configura o cliente assíncrono da API da OpenAI.
+
+    Parâmetros:
+    \n\t`max_concorrentes_por_chave (int)`: Quantidade máxima de requisições em andamento por chave de API,
+    somando todas as sessões do processo (padrão: `8`).
+
+    Exemplo:
+    >>> configura_cliente_assincrono(**get_config('cliente_assincrono_kwargs'))
+    """
+    global _GERACAO_ASYNC
+    with _LOCK_HTTP:
+        _CONFIG_ASYNC.update(max_concorrentes_por_chave=max_concorrentes_por_chave)
+        _GERACAO_ASYNC += 1
+
+
+def obtem_cliente_assincrono() -> httpx.AsyncClient:
+    """
+    Retorna o cliente HTTP assíncrono do laço de eventos atual, criando-o na primeira chamada.
+
+    O cliente mantém o pool de conexões do laço, dimensionado por `configura_sessao_http`. Deve ser chamada
+    de dentro de uma corrotina.
+
+    Retorno:
+    \n\t`httpx.AsyncClient`: Cliente do laço de eventos.
+    """
+    laco = asyncio.get_running_loop()
+    geracao = (_GERACAO_HTTP, _GERACAO_ASYNC)
+    geracao_cliente, cliente = _CLIENTES_ASYNC.get(laco, (None, None))
+    if cliente is None or geracao_cliente != geracao:
+        if cliente is not None:
+            laco.create_task(cliente.aclose())
+        max_conexoes = _CONFIG_HTTP['max_conexoes']
+        cliente = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_conexoes,
+                                max_keepalive_connections=max_conexoes if _CONFIG_HTTP['keep_alive'] else 0),
+            timeout=httpx.Timeout(_POLITICA_RETENTATIVAS.timeout_leitura,
+                                  connect=_POLITICA_RETENTATIVAS.timeout_conexao))
+        _CLIENTES_ASYNC[laco] = (geracao, cliente)
+    return cliente
+
+
+def _semaforo_da_chave(openai_key: str) -> asyncio.Semaphore:
+    """
+    Retorna o semáforo que limita as requisições em andamento de uma chave de API no laço de eventos atual.
+
+    Parâmetros:
+    \n\t`openai_key (str)`: Chave da API da OpenAI.
+
+    Retorno:
+    \n\t`asyncio.Semaphore`: Semáforo da chave.
+    """
+    laco = asyncio.get_running_loop()
+    semaforos = _SEMAFOROS_ASYNC.setdefault(laco, {})
+    # Apenas o hash da chave é guardado.
+    chave = (hashlib.sha256(openai_key.encode('utf-8')).hexdigest(), _CONFIG_ASYNC['max_concorrentes_por_chave'])
+    if chave not in semaforos:
+        semaforos[chave] = asyncio.Semaphore(chave[1])
+    return semaforos[chave]
+
+
+def _monta_requisicao_chat(mensagens: list, openai_key: str, modelo: str, temperatura: float, stream: bool):
+    """
+    Monta os cabeçalhos e o corpo de uma requisição de chat.
+
+    Retorno:
+    \n\t`tuple`: Cabeçalhos e corpo da requisição.
+    """
     headers = {
         "Authorization": f"Bearer {openai_key}",
         "Content-Type": "application/json"
@@ -52,32 +1002,402 @@ def retorna_resposta_modelo(mensagens: list, openai_key: str, modelo: str = 'gpt
         "temperature": temperatura,
         "stream": stream
     }
+    return headers, data
 
-    wait_time = 2  # Começa com 2 segundos de espera
-    retries = 0
 
-    while retries < max_retries:
-        response = requests.post(
-            "https://api.openai.com/v1/chat/completions", headers=headers, json=data, stream=stream
-        )
+async def retorna_resposta_modelo_async(mensagens: list, openai_key: str, modelo: str = 'gpt-4-turbo',
+                                        temperatura: float = 0, max_retries: int = None) -> dict:
+    """
+    Versão assíncrona de `retorna_resposta_modelo` sem streaming.
 
-        if response.status_code == 200:
-            if stream:
-                for line in response.iter_lines():
-                    if line:
-                        yield line.decode('utf-8')
-            else:
-                return response.json()
+    As requisições de uma mesma chave de API em andamento no processo são limitadas por um semáforo, e a
+    espera entre as tentativas (ver `PoliticaRetentativas`) não bloqueia a thread: o semáforo é liberado
+    durante a espera.
+    O cancelamento da tarefa interrompe a requisição ou a espera em andamento.
+
+    Parâmetros:
+    \n\t`mensagens (list)`: Lista de mensagens de entrada, com as chaves 'role' e 'content'.
+    \n\t`openai_key (str)`: Chave da API da OpenAI.
+    \n\t`modelo (str)`: Nome do modelo a ser utilizado (padrão: 'gpt-4-turbo').
+    \n\t`temperatura (float)`: Aleatoriedade das respostas geradas (padrão: `0`).
+    \n\t`max_retries (int)`: Número máximo de tentativas. Se `None`, utiliza o da política (padrão: `None`).
 
-        elif response.status_code == 429:
-            print(
-                f"Erro 429: Muitas requisições. Tentativa {retries + 1}/{max_retries}. Aguardando {wait_time}s...")
-            time.sleep(wait_time)
-            wait_time *= 2  # Dobra o tempo de espera
-            retries += 1
+    Retorno:
+    \n\t`dict`: Resposta completa do modelo.
+
+    Exemplo:
+    >>> resposta = await retorna_resposta_modelo_async(mensagens, "sua_api_key")
+    >>> resposta['choices'][0]['message']['content']
+    'A capital da França é Paris.'
+    """
+    headers, data = _monta_requisicao_chat(mensagens, openai_key, modelo, temperatura, False)
+    cliente = obtem_cliente_assincrono()
+    semaforo = _semaforo_da_chave(openai_key)
+    response = await envia_com_retentativas_async(
+        lambda timeout: cliente.post(url_api('chat/completions'), headers=headers, json=data, timeout=timeout),
+        semaforo, max_retries)
+    semaforo.release()
+    return response.json()
+
+
+async def _transmite_resposta_async(mensagens: list, openai_key: str, modelo: str, temperatura: float,
+                                   max_retries: int, metricas: MetricasStream):
+    """
+    Envia uma requisição de chat com streaming e produz os pedaços de texto da resposta.
+
+    A vaga do semáforo da chave fica ocupada enquanto o fluxo é lido. Fechar o gerador (ou cancelar a tarefa
+    que o consome) encerra a conexão e libera a vaga.
+    """
+    leitor = LeitorStreamChat(metricas)
+    headers, data = _monta_requisicao_chat(mensagens, openai_key, modelo, temperatura, True)
+    cliente = obtem_cliente_assincrono()
+    semaforo = _semaforo_da_chave(openai_key)
+    response = await envia_com_retentativas_async(
+        lambda timeout: cliente.send(cliente.build_request('POST', url_api('chat/completions'), headers=headers,
+                                                           json=data, timeout=timeout), stream=True),
+        semaforo, max_retries)
+    try:
+        async for pedaco in response.aiter_bytes():
+            for delta in leitor.alimenta(pedaco):
+                yield delta
+            if leitor.concluido:
+                break
+        leitor.finaliza()
+    finally:
+        await response.aclose()
+        semaforo.release()
 
-        else:
-            response.raise_for_status()  # Levanta exceções para outros erros HTTP
 
-    raise Exception(
-        "Erro 429 persistente: Número máximo de tentativas atingido. Tente novamente mais tarde.")
+async def transmite_resposta_modelo_async(mensagens: list, openai_key: str, modelo: str = 'gpt-4-turbo',
+                                          temperatura: float = 0, max_retries: int = None,
+                                          metricas: MetricasStream = None, hedging: bool = None):
+    """
+    Versão assíncrona de `transmite_resposta_modelo`: produz os pedaços de texto da resposta,
+    decodificados dos bytes do fluxo por `LeitorStreamChat`.
+
+    Com o hedging ativo, se o primeiro token demorar mais que o limiar de `ControleHedging`, uma requisição
+    duplicada é enviada e a resposta que começar primeiro é usada (ver `_transmite_com_hedging`).
+
+    Parâmetros:
+    \n\t`mensagens (list)`: Lista de mensagens de entrada, com as chaves 'role' e 'content'.
+    \n\t`openai_key (str)`: Chave da API da OpenAI.
+    \n\t`modelo (str)`: Nome do modelo a ser utilizado (padrão: 'gpt-4-turbo').
+    \n\t`temperatura (float)`: Aleatoriedade das respostas geradas (padrão: `0`).
+    \n\t`max_retries (int)`: Número máximo de tentativas. Se `None`, utiliza o da política (padrão: `None`).
+    \n\t`metricas (MetricasStream)`: Recebe o TTFT e os intervalos entre os tokens, medidos a partir desta
+    chamada (padrão: `None`).
+    \n\t`hedging (bool)`: Ativa o hedging. Se `None`, segue `configura_hedging` (padrão: `None`).
+
+    Retorno:
+    \n\t`AsyncGenerator[str]`: Pedaços de texto da resposta.
+
+    Exemplo:
+    >>> async for delta in transmite_resposta_modelo_async(mensagens, "sua_api_key"):
+    ...     print(delta, end='')
+    A capital da França é Paris.
+    """
+    if metricas is None:
+        metricas = MetricasStream()
+    if hedging is None:
+        hedging = _CONTROLE_HEDGING.ativo
+    if hedging:
+        gerador = _transmite_com_hedging(mensagens, openai_key, modelo, temperatura, max_retries, metricas)
+    else:
+        gerador = _transmite_resposta_async(mensagens, openai_key, modelo, temperatura, max_retries, metricas)
+    try:
+        async for delta in gerador:
+            yield delta
+    finally:
+        await gerador.aclose()
+
+
+# HEDGING ================================================
+
+class ControleHedging:
+    """
+    Controle das requisições duplicadas ("hedged requests") do streaming.
+
+    O limiar de espera pelo primeiro token é fixo (`limiar`) ou, se `limiar=0`, o percentil `percentil` dos
+    TTFTs observados nas últimas `janela` respostas; enquanto não há `min_amostras` respostas, utiliza
+    `limiar_inicial`. Para não multiplicar a carga quando a API inteira está lenta, nenhuma duplicata é
+    enviada se a fração de respostas duplicadas na janela já atingiu `taxa_maxima`.
+
+    Exemplo:
+    >>> controle = ControleHedging(ativo=True, limiar=0, percentil=0.95)
+    >>> controle.calcula_limiar()
+    4.0
+    >>> controle.resumo()
+    {'requisicoes': 0, 'hedges': 0, 'vitorias_hedge': 0, 'vitorias_original': 0, 'suprimidos': 0, ...}
+    """
+
+    def __init__(self, ativo: bool = False, limiar: float = 0, percentil: float = 0.95, limiar_minimo: float = 1,
+                 limiar_inicial: float = 4, min_amostras: int = 20, janela: int = 200, taxa_maxima: float = 0.1):
+        """
+        Parâmetros:
+        \n\t`ativo (bool)`: Ativa o hedging nas chamadas que não o definem (padrão: `False`).
+        \n\t`limiar (float)`: Espera, em segundos, pelo primeiro token antes da duplicata. Se `0`, é calculada
+        pelos TTFTs observados (padrão: `0`).
+        \n\t`percentil (float)`: Percentil dos TTFTs usado como limiar (padrão: `0.95`).
+        \n\t`limiar_minimo (float)`: Limiar mínimo, em segundos (padrão: `1`).
+        \n\t`limiar_inicial (float)`: Limiar, em segundos, antes de `min_amostras` respostas (padrão: `4`).
+        \n\t`min_amostras (int)`: Respostas observadas antes de usar o percentil (padrão: `20`).
+        \n\t`janela (int)`: Quantidade de respostas recentes consideradas (padrão: `200`).
+        \n\t`taxa_maxima (float)`: Fração máxima de respostas duplicadas na janela (padrão: `0.1`).
+        """
+        self.ativo = ativo
+        self.limiar = limiar
+        self.percentil = percentil
+        self.limiar_minimo = limiar_minimo
+        self.limiar_inicial = limiar_inicial
+        self.min_amostras = min_amostras
+        self.taxa_maxima = taxa_maxima
+        self.estatisticas = {'requisicoes': 0, 'hedges': 0, 'vitorias_hedge': 0, 'vitorias_original': 0,
+                             'suprimidos': 0}
+        self._ttfts = deque(maxlen=janela)
+        self._duplicadas = deque(maxlen=janela)
+        self._lock = threading.Lock()
+
+    def calcula_limiar(self) -> float:
+        """
+        Calcula a espera pelo primeiro token antes de enviar a duplicata.
+
+        Retorno:
+        \n\t`float`: Limiar em segundos.
+        """
+        if self.limiar:
+            return self.limiar
+        with self._lock:
+            if len(self._ttfts) < self.min_amostras:
+                return max(self.limiar_inicial, self.limiar_minimo)
+            ttfts = sorted(self._ttfts)
+        return max(ttfts[min(len(ttfts) - 1, int(self.percentil * len(ttfts)))], self.limiar_minimo)
+
+    def permite_hedge(self) -> bool:
+        """
+        Indica se a taxa de duplicatas na janela permite enviar mais uma, registrando a supressão se não.
+
+        Retorno:
+        \n\t`bool`: `True` se a duplicata pode ser enviada.
+        """
+        with self._lock:
+            if self._duplicadas and sum(self._duplicadas) / len(self._duplicadas) >= self.taxa_maxima:
+                self.estatisticas['suprimidos'] += 1
+                return False
+            return True
+
+    def registra(self, ttft_original: float, duplicada: bool, vencedora: str) -> None:
+        """
+        Registra o resultado de uma resposta.
+
+        Parâmetros:
+        \n\t`ttft_original (float)`: TTFT da requisição original, em segundos. Quando ela foi cancelada, um
+        limite inferior (o tempo até a resposta vencedora começar).
+        \n\t`duplicada (bool)`: Se uma duplicata foi enviada.
+        \n\t`vencedora (str)`: `'original'` ou `'hedge'`.
+        """
+        with self._lock:
+            self.estatisticas['requisicoes'] += 1
+            self.estatisticas['hedges'] += duplicada
+            self.estatisticas[f'vitorias_{vencedora}'] += duplicada
+            self._ttfts.append(ttft_original)
+            self._duplicadas.append(duplicada)
+
+    def resumo(self) -> dict:
+        """
+        Resume as estatísticas do hedging.
+
+        Retorno:
+        \n\t`dict`: Contadores, taxa de duplicatas (`taxa_hedge`), fração de duplicatas que venceram
+        (`taxa_vitorias_hedge`) e o limiar atual, em segundos.
+        """
+        with self._lock:
+            estatisticas = dict(self.estatisticas)
+        estatisticas['taxa_hedge'] = estatisticas['hedges'] / (estatisticas['requisicoes'] or 1)
+        estatisticas['taxa_vitorias_hedge'] = estatisticas['vitorias_hedge'] / (estatisticas['hedges'] or 1)
+        estatisticas['limiar'] = self.calcula_limiar()
+        return estatisticas
+
+
+_CONTROLE_HEDGING = ControleHedging()
+
+
+def configura_hedging(**hedging_kwargs) -> None:
+    """
+    Configura o hedging do streaming, reiniciando as estatísticas.
+
+    Parâmetros:
+    \n\t`**hedging_kwargs`: Parâmetros do `ControleHedging`.
+
+    Exemplo:
+    >>> configura_hedging(ativo=get_config('hedging_ativo'), **get_config('hedging_kwargs'))
+    """
+    global _CONTROLE_HEDGING
+    _CONTROLE_HEDGING = ControleHedging(**hedging_kwargs)
+
+
+def estatisticas_hedging() -> dict:
+    """
+    Retorna as estatísticas do hedging do processo (ver `ControleHedging.resumo`).
+
+    Retorno:
+    \n\t`dict`: As estatísticas.
+    """
+    return _CONTROLE_HEDGING.resumo()
+
+
+async def _encerra_tentativa(tarefa: asyncio.Task, gerador) -> None:
+    """
+    Cancela a espera pelo primeiro token de uma requisição e fecha o seu gerador, liberando a conexão.
+    """
+    if not tarefa.done():
+        tarefa.cancel()
+    await asyncio.gather(tarefa, return_exceptions=True)
+    await gerador.aclose()
+
+
+async def _transmite_com_hedging(mensagens: list, openai_key: str, modelo: str, temperatura: float,
+                                 max_retries: int, metricas: MetricasStream):
+    """
+    Produz os pedaços de texto da resposta, enviando uma requisição duplicada se o primeiro token da original
+    não chegar dentro do limiar. A resposta cujo primeiro token chegar primeiro é usada e a outra, cancelada.
+
+    As métricas da resposta usada são copiadas para `metricas`, cujo TTFT é medido a partir do envio da
+    requisição original.
+    """
+    controle = _CONTROLE_HEDGING
+    inicio = time.perf_counter()
+    metricas_original = MetricasStream()
+    original = _transmite_resposta_async(mensagens, openai_key, modelo, temperatura, max_retries,
+                                         metricas_original)
+    tentativas = {asyncio.ensure_future(_proximo_item(original)): ('original', original, metricas_original)}
+    duplicada = False
+    vencedora = None
+    try:
+        feitas, _ = await asyncio.wait(set(tentativas), timeout=controle.calcula_limiar())
+        if not feitas and controle.permite_hedge():
+            duplicada = True
+            metricas_hedge = MetricasStream()
+            hedge = _transmite_resposta_async(mensagens, openai_key, modelo, temperatura, max_retries,
+                                              metricas_hedge)
+            tentativas[asyncio.ensure_future(_proximo_item(hedge))] = ('hedge', hedge, metricas_hedge)
+
+        pendentes = set(tentativas)
+        while vencedora is None:
+            feitas, pendentes = await asyncio.wait(pendentes, return_when=asyncio.FIRST_COMPLETED)
+            for tarefa in feitas:
+                # Uma requisição que falhou só é usada se não houver outra em andamento.
+                if tarefa.exception() is None or not pendentes:
+                    vencedora = tarefa
+                    break
+    finally:
+        for tarefa, (_, gerador, _) in tentativas.items():
+            if tarefa is not vencedora:
+                await _encerra_tentativa(tarefa, gerador)
+
+    nome, gerador, metricas_vencedora = tentativas[vencedora]
+    try:
+        primeiro = vencedora.result()
+        ttft = time.perf_counter() - inicio
+        controle.registra(metricas_original.ttft or ttft, duplicada, nome)
+        metricas.hedge = nome if duplicada else None
+        if primeiro is not _FIM_GERADOR:
+            yield primeiro
+            async for delta in gerador:
+                yield delta
+    finally:
+        await gerador.aclose()
+        # O TTFT e os intervalos da resposta usada, com o início da requisição original.
+        metricas.instantes = metricas_vencedora.instantes
+        metricas.eventos_invalidos = metricas_vencedora.eventos_invalidos
+        metricas.fim = metricas_vencedora.fim
+
+
+# PONTE COM O CÓDIGO SÍNCRONO ================================================
+
+def obtem_laco_segundo_plano() -> asyncio.AbstractEventLoop:
+    """
+    Retorna o laço de eventos executado em uma thread de segundo plano, compartilhado por todas as sessões,
+    criando-o na primeira chamada.
+
+    Retorno:
+    \n\t`asyncio.AbstractEventLoop`: O laço de eventos.
+    """
+    global _LACO_SEGUNDO_PLANO
+    with _LOCK_HTTP:
+        if _LACO_SEGUNDO_PLANO is None or _LACO_SEGUNDO_PLANO.is_closed():
+            _LACO_SEGUNDO_PLANO = asyncio.new_event_loop()
+            threading.Thread(target=_LACO_SEGUNDO_PLANO.run_forever, name='cliente-openai-async',
+                             daemon=True).start()
+        return _LACO_SEGUNDO_PLANO
+
+
+def executa_em_segundo_plano(corrotina, timeout: float = None):
+    """
+    Executa uma corrotina no laço de segundo plano e aguarda o seu resultado. Se a espera for interrompida,
+    a corrotina é cancelada.
+
+    Parâmetros:
+    \n\t`corrotina (Coroutine)`: Corrotina a executar.
+    \n\t`timeout (float)`: Tempo máximo de espera, em segundos (padrão: `None`, sem limite).
+
+    Retorno:
+    \n\t`Any`: Resultado da corrotina.
+
+    Exemplo:
+    >>> executa_em_segundo_plano(retorna_resposta_modelo_async(mensagens, "sua_api_key"))
+    {"choices": [{"message": {"role": "assistant", "content": "A capital da França é Paris."}}]}
+    """
+    futuro = asyncio.run_coroutine_threadsafe(corrotina, obtem_laco_segundo_plano())
+    try:
+        return futuro.result(timeout)
+    except BaseException:
+        futuro.cancel()
+        raise
+
+
+async def _proximo_item(gerador):
+    """
+    Retorna o próximo item de um gerador assíncrono, ou `_FIM_GERADOR` quando ele termina.
+    """
+    try:
+        return await gerador.__anext__()
+    except StopAsyncIteration:
+        return _FIM_GERADOR
+
+
+def itera_em_segundo_plano(gerador):
+    """
+    Consome um gerador assíncrono no laço de segundo plano, produzindo os seus itens de forma síncrona.
+
+    Se o consumo for interrompido (o gerador síncrono é fechado ou a espera é interrompida), o gerador
+    assíncrono é cancelado e fechado, liberando a conexão e a vaga do semáforo.
+
+    Parâmetros:
+    \n\t`gerador (AsyncGenerator)`: Gerador assíncrono a consumir.
+
+    Retorno:
+    \n\t`Generator`: Os itens do gerador assíncrono.
+
+    Exemplo:
+    >>> for delta in itera_em_segundo_plano(transmite_resposta_modelo_async(mensagens, "sua_api_key")):
+    ...     print(delta, end='')
+    Vamos pensar juntos: o que acontece com f(x) quando x se aproxima de a?
+    """
+    laco = obtem_laco_segundo_plano()
+    futuro = None
+    terminou = False
+    try:
+        while True:
+            futuro = asyncio.run_coroutine_threadsafe(_proximo_item(gerador), laco)
+            item = futuro.result()
+            if item is _FIM_GERADOR:
+                terminou = True
+                return
+            yield item
+    finally:
+        if not terminou:
+            if futuro is not None and not futuro.done():
+                # O cancelamento da tarefa em andamento encerra o gerador.
+                futuro.cancel()
+            else:
+                asyncio.run_coroutine_threadsafe(gerador.aclose(), laco).result(_TIMEOUT_FECHAMENTO)
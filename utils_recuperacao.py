@@ -0,0 +1,1133 @@
+# --- File: utils_recuperacao.py --- #
+
+# --- Libraries --- #
+import re  # Biblioteca de expressões regulares, usada na tokenização.
+import math  # Biblioteca matemática, usada no cálculo do IDF.
+import json  # Biblioteca para manipulação de arquivos JSON.
+import time  # Biblioteca para controle do orçamento de tempo do reranqueamento.
+import heapq  # Biblioteca para seleção dos documentos de maior pontuação.
+import threading  # Biblioteca para sincronizar o carregamento dos modelos de reranqueamento.
+import unicodedata  # Biblioteca para remoção de acentos dos termos.
+from pathlib import Path  # Manipulação de caminhos de arquivos e diretórios.
+from typing import Any, List  # Tipos usados na declaração dos campos do recuperador.
+
+import faiss  # Biblioteca de busca vetorial, usada na busca pré-filtrada.
+import numpy as np  # Biblioteca para o cálculo vetorizado do MMR.
+import tiktoken  # Tokenizador da OpenAI, usado para medir o contexto enviado ao modelo.
+# Interface de recuperadores utilizada pelas cadeias do LangChain.
+from langchain_core.retrievers import BaseRetriever
+# Gerenciador de callbacks repassado pelo LangChain durante a recuperação.
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+# Estrutura de documento utilizada pelo LangChain.
+from langchain_core.documents import Document
+# Declaração de campos com valor padrão mutável.
+from langchain_core.pydantic_v1 import Field
+
+# --- Attributes --- #
+# Números (inclusive com ponto ou vírgula, como "3.2") e palavras formam os termos do índice lexical.
+PADRAO_TERMO = re.compile(r'\d+(?:[.,]\d+)*|\w+')
+# Palavras muito frequentes em português, ignoradas na indexação e nas consultas.
+STOPWORDS = frozenset('''
+a ao aos as com como da das de do dos e em entre essa esse esta este isso isto mais mas na nas no nos o os
+ou para pela pelas pelo pelos por qual quais que quem se sem sobre sua suas seu seus um uma umas uns
+'''.split())
+
+
+# Modelos de reranqueamento (cross-encoders) já carregados, por caminho.
+_CROSS_ENCODERS = {}
+_LOCK_CROSS_ENCODERS = threading.Lock()
+# Custo estimado, em segundos, da pontuação de um par (consulta, documento) por cada cross-encoder.
+_CUSTOS_PAR_CROSS_ENCODERS = {}
+# Tokenizadores já carregados, por modelo.
+_CODIFICADORES = {}
+# Sincroniza a criação do mapa direto dos índices IVF, usado na reconstrução dos candidatos.
+_LOCK_MAPAS_DIRETOS = threading.Lock()
+
+
+# --- Methods --- #
+# ÍNDICE LEXICAL ========================
+
+def tokeniza_texto(texto: str) -> list:
+    """
+    Divide um texto nos termos usados pelo índice lexical, sem acentos, em minúsculas e sem stopwords.
+
+    Parâmetros:
+    \n\t`texto (str)`: Texto a ser tokenizado.
+
+    Retorno:
+    \n\t`list`: Termos do texto, na ordem em que aparecem.
+
+    Exemplo:
+    >>> tokeniza_texto('Teorema 3.2: a derivada parcial')
+    ['teorema', '3.2', 'derivada', 'parcial']
+    """
+    texto = unicodedata.normalize('NFKD', texto.lower())
+    texto = ''.join(caractere for caractere in texto
+                    if not unicodedata.combining(caractere))
+    return [termo for termo in PADRAO_TERMO.findall(texto) if termo not in STOPWORDS]
+
+
+class IndiceBM25:
+    """
+    Índice invertido local que pontua os trechos de uma consulta pelo BM25.
+
+    O índice guarda apenas a frequência de cada termo em cada trecho e o tamanho dos trechos, de modo que os
+    parâmetros `k1` e `b` são aplicados na busca e podem ser alterados sem reconstruí-lo. Os trechos são
+    identificados pelo mesmo `doc_id` usado no índice vetorial.
+
+    Exemplo:
+    >>> indice_bm25 = IndiceBM25()
+    >>> indice_bm25.adiciona(trechos)
+    >>> indice_bm25.busca('derivada parcial', 5)
+    [('calculo.pdf:12', 7.91), ('calculo.pdf:13', 5.02), ...]
+    """
+
+    def __init__(self):
+        self.postings = {}
+        self.comprimentos = {}
+        self.comprimento_total = 0
+
+    def adiciona(self, documentos) -> None:
+        """
+        Adiciona trechos ao índice, substituindo os que já estiverem indexados com o mesmo `doc_id`.
+
+        Parâmetros:
+        \n\t`documentos (Iterable[Document])`: Trechos com `doc_id` nos metadados.
+        """
+        documentos = list(documentos)
+        self.remove([doc.metadata['doc_id'] for doc in documentos
+                     if doc.metadata['doc_id'] in self.comprimentos])
+        for doc in documentos:
+            doc_id = doc.metadata['doc_id']
+            termos = tokeniza_texto(doc.page_content)
+            for termo in termos:
+                frequencias = self.postings.setdefault(termo, {})
+                frequencias[doc_id] = frequencias.get(doc_id, 0) + 1
+            self.comprimentos[doc_id] = len(termos)
+            self.comprimento_total += len(termos)
+
+    def indexa_em_fluxo(self, trechos):
+        """
+        Adiciona ao índice os trechos de um fluxo à medida que são consumidos, repassando-os adiante.
+
+        Parâmetros:
+        \n\t`trechos (Iterable[Document])`: Trechos gerados pela ingestão.
+
+        Retorno:
+        \n\t`Generator[Document]`: Os mesmos trechos, na ordem original.
+        """
+        for trecho in trechos:
+            self.adiciona([trecho])
+            yield trecho
+
+    def remove(self, ids) -> None:
+        """
+        Remove trechos do índice.
+
+        Parâmetros:
+        \n\t`ids (Iterable[str])`: `doc_id` dos trechos a remover.
+        """
+        ids = {doc_id for doc_id in ids if doc_id in self.comprimentos}
+        if not ids:
+            return
+        for termo in list(self.postings):
+            frequencias = self.postings[termo]
+            for doc_id in ids.intersection(frequencias):
+                del frequencias[doc_id]
+            if not frequencias:
+                del self.postings[termo]
+        for doc_id in ids:
+            self.comprimento_total -= self.comprimentos.pop(doc_id)
+
+    def conhece_termos(self, termos: list) -> bool:
+        """
+        Indica se todos os termos aparecem em algum trecho indexado.
+
+        Parâmetros:
+        \n\t`termos (list)`: Termos gerados por `tokeniza_texto`.
+
+        Retorno:
+        \n\t`bool`: `True` se todos os termos estão no vocabulário do índice.
+        """
+        return bool(termos) and all(termo in self.postings for termo in termos)
+
+    def busca(self, consulta: str, k: int, k1: float = 1.5, b: float = 0.75, ids_permitidos: set = None) -> list:
+        """
+        Busca os trechos de maior pontuação BM25 para uma consulta.
+
+        Parâmetros:
+        \n\t`consulta (str)`: Texto da consulta.
+        \n\t`k (int)`: Quantidade de trechos retornados.
+        \n\t`k1 (float)`: Saturação da frequência dos termos (padrão: `1.5`).
+        \n\t`b (float)`: Peso da normalização pelo tamanho do trecho (padrão: `0.75`).
+        \n\t`ids_permitidos (set)`: Restringe a busca a esses `doc_id` (opcional).
+
+        Retorno:
+        \n\t`list`: Pares `(doc_id, pontuação)`, da maior para a menor pontuação.
+        """
+        quantidade = len(self.comprimentos)
+        if quantidade == 0:
+            return []
+        comprimento_medio = self.comprimento_total / quantidade or 1
+        pontuacoes = {}
+        for termo in set(tokeniza_texto(consulta)):
+            frequencias = self.postings.get(termo)
+            if not frequencias:
+                continue
+            idf = math.log(1 + (quantidade - len(frequencias) + 0.5) / (len(frequencias) + 0.5))
+            for doc_id, frequencia in frequencias.items():
+                if ids_permitidos is not None and doc_id not in ids_permitidos:
+                    continue
+                normalizacao = k1 * (1 - b + b * self.comprimentos[doc_id] / comprimento_medio)
+                pontuacoes[doc_id] = pontuacoes.get(doc_id, 0.0) + \
+                    idf * frequencia * (k1 + 1) / (frequencia + normalizacao)
+        return heapq.nlargest(k, pontuacoes.items(), key=lambda item: item[1])
+
+    def salva(self, caminho: Path) -> None:
+        """
+        Grava o índice em um arquivo JSON.
+
+        Parâmetros:
+        \n\t`caminho (Path)`: Caminho do arquivo.
+        """
+        with open(caminho, 'w', encoding='utf-8') as f:
+            json.dump({'postings': self.postings, 'comprimentos': self.comprimentos},
+                      f, ensure_ascii=False)
+
+    @classmethod
+    def carrega(cls, caminho: Path):
+        """
+        Lê um índice gravado por `salva`.
+
+        Parâmetros:
+        \n\t`caminho (Path)`: Caminho do arquivo.
+
+        Retorno:
+        \n\t`IndiceBM25`: O índice lido.
+        """
+        with open(caminho, 'r', encoding='utf-8') as f:
+            dados = json.load(f)
+        indice_bm25 = cls()
+        indice_bm25.postings = dados['postings']
+        indice_bm25.comprimentos = dados['comprimentos']
+        indice_bm25.comprimento_total = sum(dados['comprimentos'].values())
+        return indice_bm25
+
+
+# ÍNDICE DE METADADOS ========================
+
+class IndiceMetadados:
+    """
+    Índice dos trechos por arquivo e página, usado para restringir a busca a livros ou capítulos.
+
+    Depois de vinculado a um índice vetorial, converte um escopo de busca nas posições dos vetores do FAISS,
+    usadas para filtrar a busca vetorial antes do cálculo das distâncias.
+
+    Exemplo:
+    >>> indice_metadados = IndiceMetadados()
+    >>> indice_metadados.adiciona(trechos)
+    >>> indice_metadados.ids({'fontes': ['calculo.pdf'], 'paginas': [10, 20]})
+    {'calculo.pdf:31', 'calculo.pdf:32', ...}
+    """
+
+    def __init__(self):
+        self.paginas_por_fonte = {}
+        self._posicoes = {}
+
+    def adiciona(self, documentos) -> None:
+        """
+        Adiciona trechos ao índice.
+
+        Parâmetros:
+        \n\t`documentos (Iterable[Document])`: Trechos com `doc_id`, `source` e `page` nos metadados.
+        """
+        for doc in documentos:
+            paginas = self.paginas_por_fonte.setdefault(doc.metadata['source'], {})
+            paginas.setdefault(doc.metadata.get('page', 0), []).append(doc.metadata['doc_id'])
+
+    def indexa_em_fluxo(self, trechos):
+        """
+        Adiciona ao índice os trechos de um fluxo à medida que são consumidos, repassando-os adiante.
+
+        Parâmetros:
+        \n\t`trechos (Iterable[Document])`: Trechos gerados pela ingestão.
+
+        Retorno:
+        \n\t`Generator[Document]`: Os mesmos trechos, na ordem original.
+        """
+        for trecho in trechos:
+            self.adiciona([trecho])
+            yield trecho
+
+    def remove(self, ids) -> None:
+        """
+        Remove trechos do índice.
+
+        Parâmetros:
+        \n\t`ids (Iterable[str])`: `doc_id` dos trechos a remover.
+        """
+        ids = set(ids)
+        for fonte in list(self.paginas_por_fonte):
+            paginas = self.paginas_por_fonte[fonte]
+            for pagina in list(paginas):
+                paginas[pagina] = [doc_id for doc_id in paginas[pagina] if doc_id not in ids]
+                if not paginas[pagina]:
+                    del paginas[pagina]
+            if not paginas:
+                del self.paginas_por_fonte[fonte]
+
+    def fontes(self) -> list:
+        """
+        Retorna os arquivos indexados.
+
+        Retorno:
+        \n\t`list`: Nomes dos arquivos, em ordem alfabética.
+        """
+        return sorted(self.paginas_por_fonte)
+
+    def paginas(self, fonte: str) -> list:
+        """
+        Retorna as páginas de um arquivo que possuem trechos indexados.
+
+        Parâmetros:
+        \n\t`fonte (str)`: Nome do arquivo.
+
+        Retorno:
+        \n\t`list`: Números das páginas (a partir de 0), em ordem crescente.
+        """
+        return sorted(self.paginas_por_fonte.get(fonte, {}))
+
+    def ids(self, escopo: dict) -> set:
+        """
+        Retorna os trechos de um escopo de busca.
+
+        Parâmetros:
+        \n\t`escopo (dict)`: Escopo com as chaves opcionais `fontes` (lista de arquivos) e `paginas` (intervalo
+        `[inicio, fim]`, inclusivo e a partir de 0). Chaves ausentes ou vazias não restringem a busca.
+
+        Retorno:
+        \n\t`set | None`: `doc_id` dos trechos do escopo, ou `None` se o escopo não restringe a busca.
+        """
+        fontes = (escopo or {}).get('fontes')
+        intervalo = (escopo or {}).get('paginas')
+        if not fontes and not intervalo:
+            return None
+        ids = set()
+        for fonte in fontes or self.paginas_por_fonte:
+            for pagina, ids_pagina in self.paginas_por_fonte.get(fonte, {}).items():
+                if not intervalo or intervalo[0] <= pagina <= intervalo[1]:
+                    ids.update(ids_pagina)
+        return ids
+
+    def vincula(self, vector_store) -> None:
+        """
+        Associa o índice às posições dos vetores de um índice vetorial.
+
+        Parâmetros:
+        \n\t`vector_store (FAISS)`: Índice vetorial do mesmo corpus.
+        """
+        self._posicoes = {doc_id: posicao
+                          for posicao, doc_id in vector_store.index_to_docstore_id.items()}
+
+    def posicoes(self, escopo: dict):
+        """
+        Retorna as posições, no índice vetorial vinculado, dos vetores de um escopo de busca.
+
+        Parâmetros:
+        \n\t`escopo (dict)`: Escopo de busca, no formato de `ids`.
+
+        Retorno:
+        \n\t`np.ndarray | None`: Posições dos vetores, ou `None` se o escopo não restringe a busca.
+        """
+        ids = self.ids(escopo)
+        if ids is None:
+            return None
+        return np.fromiter((self._posicoes[doc_id] for doc_id in ids if doc_id in self._posicoes),
+                           dtype=np.int64)
+
+    def salva(self, caminho: Path) -> None:
+        """
+        Grava o índice em um arquivo JSON.
+
+        Parâmetros:
+        \n\t`caminho (Path)`: Caminho do arquivo.
+        """
+        with open(caminho, 'w', encoding='utf-8') as f:
+            json.dump(self.paginas_por_fonte, f, ensure_ascii=False)
+
+    @classmethod
+    def carrega(cls, caminho: Path):
+        """
+        Lê um índice gravado por `salva`.
+
+        Parâmetros:
+        \n\t`caminho (Path)`: Caminho do arquivo.
+
+        Retorno:
+        \n\t`IndiceMetadados`: O índice lido.
+        """
+        with open(caminho, 'r', encoding='utf-8') as f:
+            dados = json.load(f)
+        indice_metadados = cls()
+        # O JSON grava as páginas como texto.
+        indice_metadados.paginas_por_fonte = {fonte: {int(pagina): ids for pagina, ids in paginas.items()}
+                                              for fonte, paginas in dados.items()}
+        return indice_metadados
+
+
+def extrai_indice_ivf(index):
+    """
+    Retorna o índice IVF contido em um índice FAISS, quando houver.
+
+    Parâmetros:
+    \n\t`index (faiss.Index)`: Índice FAISS.
+
+    Retorno:
+    \n\t`faiss.IndexIVF | None`: O índice IVF, ou `None` se o índice não for do tipo IVF.
+    """
+    try:
+        return faiss.extract_index_ivf(faiss.downcast_index(index))
+    except RuntimeError:
+        return None
+
+
+def cria_parametros_busca(index, posicoes: np.ndarray = None, parametros_busca: dict = None):
+    """
+    Cria os parâmetros de uma busca no FAISS: `nprobe` (IVF), `efSearch` (HNSW) e, opcionalmente, a restrição
+    a um conjunto de vetores.
+
+    Os parâmetros valem apenas para a busca em que são passados, sem alterar o índice, que é compartilhado
+    pelas sessões que usam o mesmo corpus. Parâmetros ausentes de `parametros_busca` mantêm os valores do
+    índice. O filtro é aplicado durante a busca, de modo que os `k` resultados pertencem todos ao conjunto, em
+    vez de serem filtrados depois de uma busca em todo o corpus.
+
+    O índice PQ sem IVF não aceita o filtro (ver `aceita_seletor`) e é buscado por `busca_exaustiva_no_escopo`.
+
+    Parâmetros:
+    \n\t`index (faiss.Index)`: Índice FAISS.
+    \n\t`posicoes (np.ndarray)`: Posições dos vetores permitidos (opcional).
+    \n\t`parametros_busca (dict)`: Parâmetros do índice com as chaves `nprobe` e `ef_search` (opcional).
+
+    Retorno:
+    \n\t`faiss.SearchParameters | None`: Parâmetros a passar para `index.search`, ou `None` quando a busca
+    não precisa de nenhum.
+
+    Exemplo:
+    >>> cria_parametros_busca(vector_store.index, parametros_busca={'nprobe': 32}).nprobe
+    32
+    """
+    parametros_busca = parametros_busca or {}
+    index = faiss.downcast_index(index)
+    seletor = None
+    if posicoes is not None:
+        seletor = faiss.IDSelectorBatch(np.ascontiguousarray(posicoes, dtype=np.int64))
+    indice_ivf = extrai_indice_ivf(index)
+    if indice_ivf is not None:
+        parametros = faiss.SearchParametersIVF(nprobe=parametros_busca.get('nprobe', indice_ivf.nprobe))
+    elif hasattr(index, 'hnsw'):
+        parametros = faiss.SearchParametersHNSW(
+            efSearch=parametros_busca.get('ef_search', index.hnsw.efSearch))
+    elif seletor is None:
+        return None
+    else:
+        parametros = faiss.SearchParameters()
+    if seletor is not None:
+        parametros.sel = seletor
+        # Mantém o seletor vivo enquanto os parâmetros forem usados.
+        parametros.referenced_objects = [seletor]
+    return parametros
+
+
+def aceita_seletor(index) -> bool:
+    """
+    Indica se um índice FAISS aceita restringir a busca a um conjunto de vetores (`SearchParameters.sel`).
+
+    Parâmetros:
+    \n\t`index (faiss.Index)`: Índice FAISS.
+
+    Retorno:
+    \n\t`bool`: `False` para o índice PQ sem IVF, que recusa o filtro.
+    """
+    return not isinstance(faiss.downcast_index(index), faiss.IndexPQ)
+
+
+def busca_exaustiva_no_escopo(index, vetores_consultas: np.ndarray, posicoes: np.ndarray, k: int,
+                              tamanho_bloco: int = 16384) -> np.ndarray:
+    """
+    Busca os `k` vizinhos mais próximos de cada consulta entre os vetores de `posicoes`, reconstruídos em blocos.
+
+    Usada nos índices que não aceitam filtro na busca. No índice PQ sem IVF, cuja busca já é exaustiva, a
+    distância aos vetores reconstruídos é a mesma calculada pelo índice.
+
+    Parâmetros:
+    \n\t`index (faiss.Index)`: Índice FAISS.
+    \n\t`vetores_consultas (np.ndarray)`: Embeddings das consultas, com forma `(m, d)`.
+    \n\t`posicoes (np.ndarray)`: Posições dos vetores permitidos.
+    \n\t`k (int)`: Quantidade de vizinhos por consulta.
+    \n\t`tamanho_bloco (int)`: Quantidade de vetores reconstruídos por vez (padrão: `16384`).
+
+    Retorno:
+    \n\t`np.ndarray`: Posições dos vizinhos, com forma `(m, k)`, do mais para o menos próximo; posições `-1`
+    indicam que não havia vetores suficientes.
+    """
+    m = len(vetores_consultas)
+    posicoes = np.asarray(posicoes, dtype=np.int64)
+    distancias = np.empty((m, 0), dtype=np.float32)
+    candidatos = np.empty((m, 0), dtype=np.int64)
+    for inicio in range(0, len(posicoes), tamanho_bloco):
+        bloco = posicoes[inicio:inicio + tamanho_bloco]
+        distancias_bloco = faiss.pairwise_distances(vetores_consultas, index.reconstruct_batch(bloco),
+                                                    index.metric_type)
+        if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+            distancias_bloco = -distancias_bloco
+        distancias = np.hstack([distancias, distancias_bloco])
+        candidatos = np.hstack([candidatos, np.broadcast_to(bloco, (m, len(bloco)))])
+        if distancias.shape[1] > k:
+            melhores = np.argpartition(distancias, k, axis=1)[:, :k]
+            distancias = np.take_along_axis(distancias, melhores, axis=1)
+            candidatos = np.take_along_axis(candidatos, melhores, axis=1)
+    ordem = np.argsort(distancias, axis=1, kind='stable')
+    candidatos = np.take_along_axis(candidatos, ordem, axis=1)
+    if candidatos.shape[1] < k:
+        candidatos = np.hstack([candidatos, np.full((m, k - candidatos.shape[1]), -1, dtype=np.int64)])
+    return candidatos
+
+
+def reconstroi_vetores(index, posicoes: np.ndarray) -> np.ndarray:
+    """
+    Reconstrói os vetores de um índice FAISS a partir das suas posições.
+
+    Nos índices IVF, cria na primeira chamada o mapa direto (em tabela hash, que ainda permite remover vetores)
+    que localiza cada vetor nas listas invertidas. O mapa não altera os resultados das buscas.
+
+    Parâmetros:
+    \n\t`index (faiss.Index)`: Índice FAISS.
+    \n\t`posicoes (np.ndarray)`: Posições dos vetores, de qualquer forma; posições `-1` são ignoradas.
+
+    Retorno:
+    \n\t`np.ndarray`: Vetores com forma `posicoes.shape + (d,)`, nulos nas posições `-1`.
+    """
+    indice_ivf = extrai_indice_ivf(index)
+    if indice_ivf is not None:
+        with _LOCK_MAPAS_DIRETOS:
+            if indice_ivf.direct_map.type == faiss.DirectMap.NoMap:
+                indice_ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+    vetores = np.zeros(posicoes.shape + (index.d,), dtype=np.float32)
+    validas = posicoes >= 0
+    if validas.any():
+        vetores[validas] = index.reconstruct_batch(np.ascontiguousarray(posicoes[validas], dtype=np.int64))
+    return vetores
+
+
+# MMR VETORIZADO ========================
+
+def normaliza_vetores(vetores: np.ndarray) -> np.ndarray:
+    """
+    Normaliza os vetores ao longo do último eixo, para que o produto interno seja a similaridade de cosseno.
+
+    Parâmetros:
+    \n\t`vetores (np.ndarray)`: Vetores a normalizar.
+
+    Retorno:
+    \n\t`np.ndarray`: Vetores de norma 1 (vetores nulos permanecem nulos).
+    """
+    normas = np.linalg.norm(vetores, axis=-1, keepdims=True)
+    return vetores / np.where(normas == 0, 1, normas)
+
+
+def mmr_vetorizado(vetores_consultas: np.ndarray, vetores_candidatos: np.ndarray, k: int,
+                   lambda_mult: float = 0.5, validos: np.ndarray = None) -> np.ndarray:
+    """
+    Seleciona, para várias consultas ao mesmo tempo, os `k` candidatos pela Maximal Marginal Relevance.
+
+    A matriz de similaridade entre os candidatos é calculada uma única vez e, a cada passo, a similaridade
+    máxima de cada candidato com os já selecionados é atualizada com a linha do último selecionado, em vez
+    de ser recalculada contra todo o conjunto selecionado.
+
+    Parâmetros:
+    \n\t`vetores_consultas (np.ndarray)`: Embeddings das consultas, com forma `(m, d)`.
+    \n\t`vetores_candidatos (np.ndarray)`: Embeddings dos candidatos de cada consulta, com forma `(m, n, d)`.
+    \n\t`k (int)`: Quantidade de candidatos selecionados por consulta.
+    \n\t`lambda_mult (float)`: Peso da relevância frente à diversidade, entre 0 e 1 (padrão: `0.5`).
+    \n\t`validos (np.ndarray)`: Máscara `(m, n)` dos candidatos existentes (opcional).
+
+    Retorno:
+    \n\t`np.ndarray`: Posições dos candidatos selecionados, com forma `(m, min(k, n))`, na ordem de seleção;
+    posições `-1` indicam que não havia candidatos válidos suficientes.
+
+    Exemplo:
+    >>> mmr_vetorizado(np.array([[1.0, 0.2]]), np.array([[[1.0, 0.0], [1.0, 0.1], [0.0, 1.0]]]), 2)
+    array([[1, 2]])
+    """
+    consultas = normaliza_vetores(np.asarray(vetores_consultas, dtype=np.float32))
+    candidatos = normaliza_vetores(np.asarray(vetores_candidatos, dtype=np.float32))
+    m, n, _ = candidatos.shape
+    k = min(k, n)
+    if validos is None:
+        validos = np.ones((m, n), dtype=bool)
+
+    relevancias = np.einsum('mnd,md->mn', candidatos, consultas)
+    similaridades = candidatos @ candidatos.transpose(0, 2, 1)
+    disponiveis = validos.copy()
+    max_similaridades = np.full((m, n), -np.inf, dtype=np.float32)
+    selecionados = np.full((m, k), -1, dtype=np.int64)
+    linhas = np.arange(m)
+
+    for passo in range(k):
+        # O primeiro selecionado é sempre o mais relevante, como em `maximal_marginal_relevance` do LangChain.
+        if passo:
+            pontuacoes = lambda_mult * relevancias - (1 - lambda_mult) * max_similaridades
+        else:
+            pontuacoes = relevancias
+        pontuacoes = np.where(disponiveis, pontuacoes, -np.inf)
+        escolhidos = np.argmax(pontuacoes, axis=1)
+        existe = disponiveis[linhas, escolhidos]
+        selecionados[existe, passo] = escolhidos[existe]
+        disponiveis[linhas, escolhidos] = False
+        max_similaridades = np.maximum(max_similaridades, similaridades[linhas, escolhidos])
+    return selecionados
+
+
+def busca_mmr_em_lote(vector_store, consultas: list, k: int = 4, fetch_k: int = 20, lambda_mult: float = 0.5,
+                      vetores_consultas: list = None, posicoes: np.ndarray = None,
+                      parametros_busca: dict = None) -> list:
+    """
+    Recupera os documentos de várias consultas com uma única busca no FAISS, seguida do MMR vetorizado.
+
+    Os vetores dos candidatos são reconstruídos na própria busca (`search_and_reconstruct`), o que também
+    funciona para índices IVF mapeados em memória, sem a reconstrução individual de cada candidato. A exceção é
+    a busca restrita a `posicoes` em um índice IVF, que não combina o filtro com essa reconstrução: os
+    candidatos são buscados com o filtro e reconstruídos em seguida por `reconstroi_vetores`. No índice PQ sem
+    IVF, que não aceita o filtro, a busca restrita é feita por `busca_exaustiva_no_escopo`.
+
+    Parâmetros:
+    \n\t`vector_store (FAISS)`: Índice vetorial do corpus.
+    \n\t`consultas (list)`: Textos das consultas.
+    \n\t`k (int)`: Quantidade de documentos retornados por consulta (padrão: `4`).
+    \n\t`fetch_k (int)`: Quantidade de candidatos buscados por consulta antes do MMR (padrão: `20`).
+    \n\t`lambda_mult (float)`: Peso da relevância frente à diversidade, entre 0 e 1 (padrão: `0.5`).
+    \n\t`vetores_consultas (list)`: Embeddings já calculados das consultas (opcional).
+    \n\t`posicoes (np.ndarray)`: Restringe a busca aos vetores dessas posições, calculadas por
+    `IndiceMetadados.posicoes` (opcional).
+    \n\t`parametros_busca (dict)`: Parâmetros de busca do índice (`nprobe` e `ef_search`), aplicados apenas a
+    esta busca (opcional).
+
+    Retorno:
+    \n\t`list`: Lista com os documentos de cada consulta, na ordem das consultas.
+
+    Exemplo:
+    >>> busca_mmr_em_lote(vector_store, ['O que é limite?', 'Regra da cadeia'], k=5, fetch_k=200)
+    [[Document(...), ...], [Document(...), ...]]
+    """
+    if not consultas:
+        return []
+    if vetores_consultas is None:
+        vetores_consultas = vector_store.embeddings.embed_documents(list(consultas))
+    vetores_consultas = np.asarray(vetores_consultas, dtype=np.float32)
+    fetch_k = min(max(fetch_k, k), vector_store.index.ntotal if posicoes is None else len(posicoes))
+    if fetch_k == 0:
+        return [[] for _ in consultas]
+
+    index = vector_store.index
+    k_busca = min(k, fetch_k) if lambda_mult >= 1 else fetch_k
+    vetores_candidatos = None
+    if posicoes is not None and not aceita_seletor(index):
+        candidatos = busca_exaustiva_no_escopo(index, vetores_consultas, posicoes, k_busca)
+    elif lambda_mult >= 1 or (posicoes is not None and extrai_indice_ivf(index) is not None):
+        # Sem diversidade, o MMR se reduz aos vizinhos mais próximos e dispensa a reconstrução dos vetores. O
+        # IVF não combina o filtro com a reconstrução na busca, e os candidatos são reconstruídos depois.
+        _, candidatos = index.search(vetores_consultas, k_busca,
+                                     params=cria_parametros_busca(index, posicoes, parametros_busca))
+    else:
+        _, candidatos, vetores_candidatos = index.search_and_reconstruct(
+            vetores_consultas, fetch_k, params=cria_parametros_busca(index, posicoes, parametros_busca))
+
+    if lambda_mult >= 1:
+        selecionados = np.where(candidatos >= 0, np.arange(candidatos.shape[1]), -1)
+    else:
+        if vetores_candidatos is None:
+            vetores_candidatos = reconstroi_vetores(index, candidatos)
+        selecionados = mmr_vetorizado(vetores_consultas, vetores_candidatos, k, lambda_mult,
+                                      validos=candidatos >= 0)
+
+    resultados = []
+    for candidatos_consulta, selecionados_consulta in zip(candidatos, selecionados):
+        ids = [vector_store.index_to_docstore_id[int(candidatos_consulta[i])]
+               for i in selecionados_consulta if i >= 0]
+        documentos = [vector_store.docstore.search(doc_id) for doc_id in ids]
+        resultados.append([doc for doc in documentos if isinstance(doc, Document)])
+    return resultados
+
+
+def embute_consulta(vector_store, consulta: str, vetores_prontos: dict = None) -> list:
+    """
+    Retorna o embedding de uma consulta, aproveitando o vetor já calculado para ela, quando houver.
+
+    Parâmetros:
+    \n\t`vector_store (FAISS)`: Índice vetorial do corpus, cujo modelo de embedding é usado na falta do vetor.
+    \n\t`consulta (str)`: Texto da consulta.
+    \n\t`vetores_prontos (dict)`: Vetores já calculados, por texto da consulta; o vetor usado é removido
+    (opcional).
+
+    Retorno:
+    \n\t`list`: Vetor da consulta.
+
+    Exemplo:
+    >>> embute_consulta(vector_store, 'O que é limite?', {'O que é limite?': vetor}) is vetor
+    True
+    """
+    vetor = vetores_prontos.pop(consulta, None) if vetores_prontos else None
+    if vetor is None:
+        # A consulta passa pelo `embed_query`, que aproveita o cache de consultas.
+        vetor = vector_store.embeddings.embed_query(consulta)
+    return vetor
+
+
+class RecuperadorVetorial(BaseRetriever):
+    """
+    Recuperador vetorial que usa o MMR vetorizado de `busca_mmr_em_lote` no lugar da implementação genérica
+    do LangChain, mantendo o custo baixo mesmo com `fetch_k` na casa das centenas.
+
+    Com `search_type='similarity'`, retorna os `k` vizinhos mais próximos, sem MMR. Quando o dicionário
+    `escopo` restringe a busca a arquivos ou páginas, os vetores são filtrados pelo `indice_metadados` antes
+    da busca. O `escopo` pode ser alterado entre as consultas. Os `parametros_busca` (`nprobe` e `ef_search`)
+    são passados a cada busca, sem alterar o índice compartilhado. Uma consulta cujo embedding já foi
+    calculado (como o da consulta ao cache de respostas) é buscada com o vetor de `vetores_prontos`.
+
+    Exemplo:
+    >>> retriever = RecuperadorVetorial(vector_store=vector_store, search_kwargs={'k': 5, 'fetch_k': 200})
+    >>> retriever.get_relevant_documents('O que é limite?')
+    """
+
+    vector_store: Any
+    search_type: str = 'mmr'
+    search_kwargs: dict = Field(default_factory=dict)
+    indice_metadados: Any = None
+    escopo: dict = Field(default_factory=dict)
+    parametros_busca: dict = Field(default_factory=dict)
+    vetores_prontos: dict = Field(default_factory=dict)
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        """
+        Recupera os documentos mais relevantes e diversos para a consulta.
+
+        Parâmetros:
+        \n\t`query (str)`: Texto da consulta.
+        \n\t`run_manager (CallbackManagerForRetrieverRun)`: Gerenciador de callbacks do LangChain.
+
+        Retorno:
+        \n\t`List[Document]`: Os `k` documentos selecionados.
+        """
+        k = self.search_kwargs.get('k', 4)
+        posicoes = None
+        if self.indice_metadados is not None:
+            posicoes = self.indice_metadados.posicoes(self.escopo)
+        vetor = embute_consulta(self.vector_store, query, self.vetores_prontos)
+        if self.search_type == 'similarity':
+            return busca_mmr_em_lote(self.vector_store, [query], k, k, 1.0, vetores_consultas=[vetor],
+                                     posicoes=posicoes, parametros_busca=self.parametros_busca)[0]
+        return busca_mmr_em_lote(
+            self.vector_store,
+            [query],
+            k,
+            self.search_kwargs.get('fetch_k', 20),
+            self.search_kwargs.get('lambda_mult', 0.5),
+            vetores_consultas=[vetor],
+            posicoes=posicoes,
+            parametros_busca=self.parametros_busca
+        )[0]
+
+
+# RECUPERAÇÃO HÍBRIDA ========================
+
+def funde_rrf(listas: list, k: int = 60) -> list:
+    """
+    Combina listas ordenadas de `doc_id` pela fusão de postos recíprocos (Reciprocal Rank Fusion).
+
+    Cada documento recebe a soma de `1 / (k + posto)` sobre as listas em que aparece, o que dispensa
+    normalizar pontuações de escalas diferentes (BM25 e distância vetorial).
+
+    Parâmetros:
+    \n\t`listas (list)`: Listas de `doc_id`, cada uma do mais para o menos relevante.
+    \n\t`k (int)`: Constante que atenua o peso dos primeiros postos (padrão: `60`).
+
+    Retorno:
+    \n\t`list`: `doc_id` de todas as listas, do mais para o menos relevante.
+
+    Exemplo:
+    >>> funde_rrf([['a', 'b', 'c'], ['c', 'a']])
+    ['a', 'c', 'b']
+    """
+    pontuacoes = {}
+    for lista in listas:
+        for posto, doc_id in enumerate(lista, start=1):
+            pontuacoes[doc_id] = pontuacoes.get(doc_id, 0.0) + 1 / (k + posto)
+    return sorted(pontuacoes, key=pontuacoes.get, reverse=True)
+
+
+class RecuperadorHibrido(BaseRetriever):
+    """
+    Recuperador que combina a busca lexical (BM25) e a busca vetorial (FAISS) por fusão de postos recíprocos.
+
+    Com `search_type='bm25'`, apenas o índice lexical é consultado. Com `search_type='hibrido'`, consultas
+    curtas de palavras-chave cujos termos estão todos no vocabulário do índice são respondidas apenas pelo
+    BM25, sem o embedding da consulta; as demais consultam os dois índices e têm os resultados fundidos.
+    As duas buscas respeitam o `escopo`, os `parametros_busca` e os `vetores_prontos`, como em
+    `RecuperadorVetorial`.
+
+    Exemplo:
+    >>> retriever = RecuperadorHibrido(vector_store=vector_store, indice_bm25=indice_bm25,
+    ...                                search_kwargs={'k': 5, 'fetch_k': 20})
+    >>> retriever.get_relevant_documents('derivada parcial')
+    """
+
+    vector_store: Any
+    indice_bm25: Any
+    search_type: str = 'hibrido'
+    search_kwargs: dict = Field(default_factory=dict)
+    hibrido_kwargs: dict = Field(default_factory=dict)
+    indice_metadados: Any = None
+    escopo: dict = Field(default_factory=dict)
+    parametros_busca: dict = Field(default_factory=dict)
+    vetores_prontos: dict = Field(default_factory=dict)
+    estatisticas: dict = Field(default_factory=lambda: {'lexical': 0, 'hibrida': 0})
+
+    def e_consulta_lexical(self, consulta: str) -> bool:
+        """
+        Indica se a consulta é uma busca curta por palavras-chave que o índice lexical responde sozinho.
+
+        Parâmetros:
+        \n\t`consulta (str)`: Texto da consulta.
+
+        Retorno:
+        \n\t`bool`: `True` se a consulta pode ser respondida sem a busca vetorial.
+        """
+        if self.search_type == 'bm25':
+            return True
+        if not self.hibrido_kwargs.get('atalho_lexical', True) or '?' in consulta:
+            return False
+        termos = tokeniza_texto(consulta)
+        return len(termos) <= self.hibrido_kwargs.get('max_termos_atalho', 3) and \
+            self.indice_bm25.conhece_termos(termos)
+
+    def _busca_documentos(self, ids: list) -> list:
+        """
+        Lê do docstore do índice vetorial os documentos de uma lista de `doc_id`.
+
+        Parâmetros:
+        \n\t`ids (list)`: `doc_id` dos documentos.
+
+        Retorno:
+        \n\t`list`: Documentos encontrados, na ordem dos identificadores.
+        """
+        documentos = [self.vector_store.docstore.search(doc_id) for doc_id in ids]
+        return [doc for doc in documentos if isinstance(doc, Document)]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        """
+        Recupera os documentos mais relevantes para a consulta.
+
+        Parâmetros:
+        \n\t`query (str)`: Texto da consulta.
+        \n\t`run_manager (CallbackManagerForRetrieverRun)`: Gerenciador de callbacks do LangChain.
+
+        Retorno:
+        \n\t`List[Document]`: Os `k` documentos mais relevantes.
+        """
+        k = self.search_kwargs.get('k', 4)
+        fetch_k = max(self.search_kwargs.get('fetch_k', 20), k)
+        k1 = self.hibrido_kwargs.get('k1', 1.5)
+        b = self.hibrido_kwargs.get('b', 0.75)
+        ids_permitidos = posicoes = None
+        if self.indice_metadados is not None:
+            ids_permitidos = self.indice_metadados.ids(self.escopo)
+            posicoes = self.indice_metadados.posicoes(self.escopo)
+
+        if self.e_consulta_lexical(query):
+            self.estatisticas['lexical'] += 1
+            return self._busca_documentos(
+                [doc_id for doc_id, _ in self.indice_bm25.busca(query, k, k1, b, ids_permitidos)])
+
+        self.estatisticas['hibrida'] += 1
+        lexicos = [doc_id for doc_id, _ in self.indice_bm25.busca(query, fetch_k, k1, b, ids_permitidos)]
+        vetor = embute_consulta(self.vector_store, query, self.vetores_prontos)
+        densos = [doc.metadata['doc_id'] for doc in busca_mmr_em_lote(
+            self.vector_store, [query], fetch_k, fetch_k, 1.0, vetores_consultas=[vetor], posicoes=posicoes,
+            parametros_busca=self.parametros_busca)[0]]
+        ids = funde_rrf([densos, lexicos], self.hibrido_kwargs.get('rrf_k', 60))
+        return self._busca_documentos(ids[:k])
+
+
+# RERANQUEAMENTO ========================
+
+def pontua_sobreposicao_lexical(termos_consulta: list, texto: str) -> float:
+    """
+    Pontua um texto pela fração dos termos da consulta que ele contém.
+
+    Parâmetros:
+    \n\t`termos_consulta (list)`: Termos da consulta, gerados por `tokeniza_texto`.
+    \n\t`texto (str)`: Texto do documento.
+
+    Retorno:
+    \n\t`float`: Pontuação entre 0 e 1.
+
+    Exemplo:
+    >>> pontua_sobreposicao_lexical(['derivada', 'parcial'], 'A derivada de f...')
+    0.5
+    """
+    termos = set(termos_consulta)
+    if not termos:
+        return 0.0
+    return len(termos.intersection(tokeniza_texto(texto))) / len(termos)
+
+
+def carrega_cross_encoder(caminho: str):
+    """
+    Carrega, uma única vez por processo, um cross-encoder local para execução em CPU.
+
+    O modelo depende da biblioteca opcional `sentence-transformers`; se ela não estiver instalada ou o modelo
+    não puder ser lido, o reranqueamento usa apenas a pontuação lexical. Após o carregamento, um par de
+    aquecimento é pontuado para estimar o custo de cada par, usado no dimensionamento dos lotes.
+
+    Parâmetros:
+    \n\t`caminho (str)`: Caminho local do modelo.
+
+    Retorno:
+    \n\t`CrossEncoder | None`: O modelo carregado ou `None` caso não esteja disponível.
+
+    Exemplo:
+    >>> modelo = carrega_cross_encoder('modelos/ms-marco-MiniLM-L-6-v2')
+    """
+    with _LOCK_CROSS_ENCODERS:
+        if caminho not in _CROSS_ENCODERS:
+            try:
+                from sentence_transformers import CrossEncoder
+                modelo = CrossEncoder(caminho, device='cpu')
+                inicio = time.monotonic()
+                modelo.predict([('aquecimento', 'aquecimento')])
+                _CUSTOS_PAR_CROSS_ENCODERS[caminho] = time.monotonic() - inicio
+                _CROSS_ENCODERS[caminho] = modelo
+            except Exception as e:
+                print("Cross-encoder indisponível, usando apenas a pontuação lexical:", e)
+                _CROSS_ENCODERS[caminho] = None
+        return _CROSS_ENCODERS[caminho]
+
+
+class RecuperadorComReranqueamento(BaseRetriever):
+    """
+    Recuperador que reordena os documentos de outro recuperador com uma pontuação local, em CPU, e mantém
+    apenas os `top_n` melhores, reduzindo o contexto enviado ao modelo sem perder os trechos mais relevantes.
+    O recuperador base deve retornar um conjunto de candidatos maior que `top_n` (por exemplo, o `fetch_k` da
+    busca), para que o reranqueamento possa trazer trechos que a busca deixaria de fora.
+
+    O método `lexico` pontua a sobreposição de termos com a consulta; o método `cross_encoder` usa um modelo
+    local; `ambos` combina as duas pontuações. O cross-encoder é carregado na criação do recuperador, fora do
+    orçamento das consultas, e pontua os documentos na ordem do recuperador base, em lotes dimensionados pelo
+    custo medido de cada par para caber no tempo restante: os documentos não pontuados a tempo ficam depois
+    dos pontuados, na ordem original. Um lote que ainda assim ultrapasse o orçamento é contado em
+    `estatisticas['orcamento_excedido']`.
+
+    Exemplo:
+    >>> retriever = RecuperadorComReranqueamento(base_retriever=vector_store.as_retriever(),
+    ...                                          metodo='lexico', top_n=3)
+    >>> retriever.invoke('derivada parcial')
+    """
+
+    base_retriever: Any
+    metodo: str = 'lexico'
+    top_n: int = 3
+    orcamento_ms: float = 150
+    caminho_modelo: str = ''
+    tamanho_lote: int = 8
+    peso_lexico: float = 0.3
+    estatisticas: dict = Field(default_factory=lambda: {'consultas': 0, 'orcamento_esgotado': 0,
+                                                        'orcamento_excedido': 0, 'ultimo_ms': 0.0})
+
+    def __init__(self, **kwargs):
+        """
+        Parâmetros:
+        \n\t`**kwargs`: Campos do recuperador. Com um método que usa o cross-encoder, o modelo é carregado aqui.
+        """
+        super().__init__(**kwargs)
+        if self.metodo != 'lexico':
+            carrega_cross_encoder(self.caminho_modelo)
+
+    def _pontua_cross_encoder(self, query: str, documentos: list, limite: float) -> list:
+        """
+        Pontua os documentos com o cross-encoder até o fim do orçamento de tempo, em lotes de até
+        `tamanho_lote` pares, limitados pela quantidade de pares que o custo estimado permite no tempo restante.
+
+        Parâmetros:
+        \n\t`query (str)`: Texto da consulta.
+        \n\t`documentos (list)`: Documentos a pontuar, na ordem do recuperador base.
+        \n\t`limite (float)`: Instante (`time.monotonic`) em que o orçamento se esgota.
+
+        Retorno:
+        \n\t`list`: Pontuações dos documentos pontuados a tempo, na ordem dos documentos.
+        """
+        modelo = carrega_cross_encoder(self.caminho_modelo)
+        if modelo is None:
+            return []
+        pontuacoes = []
+        while len(pontuacoes) < len(documentos):
+            agora = time.monotonic()
+            custo_par = _CUSTOS_PAR_CROSS_ENCODERS.get(self.caminho_modelo, 0.0)
+            tamanho = self.tamanho_lote
+            if custo_par > 0:
+                tamanho = min(tamanho, int((limite - agora) / custo_par))
+            if tamanho < 1:
+                self.estatisticas['orcamento_esgotado'] += 1
+                break
+            lote = documentos[len(pontuacoes):len(pontuacoes) + tamanho]
+            pontuacoes.extend(float(pontuacao) for pontuacao in
+                              modelo.predict([(query, doc.page_content) for doc in lote]))
+            fim = time.monotonic()
+            # Média móvel do custo por par, que acompanha o tamanho dos trechos e a carga da máquina.
+            medido = (fim - agora) / len(lote)
+            _CUSTOS_PAR_CROSS_ENCODERS[self.caminho_modelo] = 0.7 * custo_par + 0.3 * medido if custo_par else medido
+            if fim > limite:
+                self.estatisticas['orcamento_excedido'] += 1
+                break
+        return pontuacoes
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        """
+        Recupera os documentos do recuperador base e mantém os `top_n` melhor pontuados.
+
+        Parâmetros:
+        \n\t`query (str)`: Texto da consulta.
+        \n\t`run_manager (CallbackManagerForRetrieverRun)`: Gerenciador de callbacks do LangChain.
+
+        Retorno:
+        \n\t`List[Document]`: Os documentos reordenados.
+        """
+        documentos = self.base_retriever.invoke(query, config={'callbacks': run_manager.get_child()})
+        inicio = time.monotonic()
+        limite = inicio + self.orcamento_ms / 1000
+
+        termos = tokeniza_texto(query)
+        lexicas = [pontua_sobreposicao_lexical(termos, doc.page_content) for doc in documentos]
+        if self.metodo == 'lexico':
+            pontuacoes = lexicas
+        else:
+            pontuacoes = self._pontua_cross_encoder(query, documentos, limite)
+            if pontuacoes and self.metodo == 'ambos':
+                # As pontuações do cross-encoder são levadas ao intervalo [0, 1] antes da combinação.
+                minimo, maximo = min(pontuacoes), max(pontuacoes)
+                escala = (maximo - minimo) or 1
+                pontuacoes = [(1 - self.peso_lexico) * (pontuacao - minimo) / escala + self.peso_lexico * lexica
+                              for pontuacao, lexica in zip(pontuacoes, lexicas)]
+            elif not pontuacoes:
+                pontuacoes = lexicas
+
+        ordem = sorted(range(len(pontuacoes)), key=lambda i: pontuacoes[i], reverse=True)
+        ordem += list(range(len(pontuacoes), len(documentos)))
+
+        self.estatisticas['consultas'] += 1
+        self.estatisticas['ultimo_ms'] = round((time.monotonic() - inicio) * 1000, 1)
+        return [documentos[i] for i in ordem[:self.top_n]]
+
+
+# MONTAGEM DO CONTEXTO ========================
+
+def obtem_codificador(modelo: str):
+    """
+    Retorna o tokenizador de um modelo da OpenAI, carregando-o uma única vez por processo.
+
+    Parâmetros:
+    \n\t`modelo (str)`: Nome do modelo.
+
+    Retorno:
+    \n\t`tiktoken.Encoding`: Tokenizador do modelo (ou `cl100k_base`, se o modelo não for conhecido).
+
+    Exemplo:
+    >>> len(obtem_codificador('gpt-4-turbo').encode('O que é limite?'))
+    6
+    """
+    if modelo not in _CODIFICADORES:
+        try:
+            _CODIFICADORES[modelo] = tiktoken.encoding_for_model(modelo)
+        except KeyError:
+            _CODIFICADORES[modelo] = tiktoken.get_encoding('cl100k_base')
+    return _CODIFICADORES[modelo]
+
+
+class RecuperadorComOrcamentoDeTokens(BaseRetriever):
+    """
+    Recuperador que limita, em tokens, o contexto enviado ao modelo.
+
+    Os documentos do recuperador base são incluídos em ordem de relevância até o orçamento se esgotar: o
+    documento que não cabe inteiro é truncado, se ainda couberem pelo menos `min_tokens_trecho` tokens, e os
+    demais são descartados. O orçamento é o menor entre `orcamento_tokens` e o espaço que sobra na janela do
+    modelo depois do prompt, do histórico da conversa e da reserva para a resposta.
+
+    O resultado da última montagem fica em `estatisticas`.
+
+    Exemplo:
+    >>> retriever = RecuperadorComOrcamentoDeTokens(base_retriever=vector_store.as_retriever(),
+    ...                                             modelo='gpt-4-turbo', orcamento_tokens=3000)
+    >>> retriever.invoke('O que é limite?')
+    >>> retriever.estatisticas
+    {'orcamento': 3000, 'tokens_recuperados': 3412, 'tokens_enviados': 2998, 'trechos_truncados': 1, 'trechos_descartados': 0}
+    """
+
+    base_retriever: Any
+    modelo: str = 'gpt-4-turbo'
+    orcamento_tokens: int = 3000
+    janela_modelo: int = 128000
+    reserva_resposta: int = 4096
+    min_tokens_trecho: int = 100
+    prompt: str = ''
+    memory: Any = None
+    estatisticas: dict = Field(default_factory=dict)
+
+    def calcula_orcamento(self) -> int:
+        """
+        Calcula quantos tokens de contexto ainda cabem na janela do modelo.
+
+        Retorno:
+        \n\t`int`: Orçamento de tokens do contexto.
+        """
+        codificador = obtem_codificador(self.modelo)
+        ocupados = len(codificador.encode(self.prompt, disallowed_special=()))
+        if self.memory is not None:
+            ocupados += len(codificador.encode(self.memory.buffer_as_str, disallowed_special=()))
+        disponiveis = self.janela_modelo - self.reserva_resposta - ocupados
+        return max(0, min(self.orcamento_tokens, disponiveis))
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        """
+        Recupera os documentos do recuperador base e os ajusta ao orçamento de tokens.
+
+        Parâmetros:
+        \n\t`query (str)`: Texto da consulta.
+        \n\t`run_manager (CallbackManagerForRetrieverRun)`: Gerenciador de callbacks do LangChain.
+
+        Retorno:
+        \n\t`List[Document]`: Os documentos que cabem no orçamento, em ordem de relevância.
+        """
+        documentos = self.base_retriever.invoke(query, config={'callbacks': run_manager.get_child()})
+        codificador = obtem_codificador(self.modelo)
+        orcamento = restante = self.calcula_orcamento()
+        estatisticas = {'orcamento': orcamento, 'tokens_recuperados': 0, 'tokens_enviados': 0,
+                        'trechos_truncados': 0, 'trechos_descartados': 0}
+
+        selecionados = []
+        for doc in documentos:
+            tokens = codificador.encode(doc.page_content, disallowed_special=())
+            estatisticas['tokens_recuperados'] += len(tokens)
+            if len(tokens) <= restante:
+                selecionados.append(doc)
+                restante -= len(tokens)
+            elif restante >= self.min_tokens_trecho:
+                selecionados.append(Document(
+                    page_content=codificador.decode(tokens[:restante]),
+                    metadata={**doc.metadata, 'truncado': True}
+                ))
+                estatisticas['trechos_truncados'] += 1
+                restante = 0
+            else:
+                estatisticas['trechos_descartados'] += 1
+        estatisticas['tokens_enviados'] = orcamento - restante
+        self.estatisticas = estatisticas
+        return selecionados
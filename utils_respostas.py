@@ -0,0 +1,201 @@
+# --- File: utils_respostas.py --- #
+
+# --- Libraries --- #
+import time  # Biblioteca para controle da validade das respostas.
+import hashlib  # Biblioteca para cálculo de hashes criptográficos.
+import threading  # Biblioteca para sincronização entre threads.
+from collections import OrderedDict  # Dicionário ordenado usado como fila LRU.
+
+import numpy as np  # Biblioteca para o cálculo da similaridade entre as perguntas.
+
+# --- Attributes --- #
+# Caches de respostas, compartilhados por todas as sessões do processo.
+_CACHES_RESPOSTAS = {}
+_LOCK_CACHES_RESPOSTAS = threading.Lock()
+
+
+# --- Methods --- #
+# CACHE SEMÂNTICO DE RESPOSTAS ========================
+
+def calcula_chave_contexto(fingerprint: str, prompt: str, modelo: str) -> str:
+    """
+    Calcula a chave que identifica o contexto de uma resposta: o corpus, o prompt e o modelo que a geraram.
+
+    Parâmetros:
+    \n\t`fingerprint (str)`: Impressão digital do corpus.
+    \n\t`prompt (str)`: Prompt base da cadeia de conversação.
+    \n\t`modelo (str)`: Modelo de chat que gerou a resposta.
+
+    Retorno:
+    \n\t`str`: Hash hexadecimal do contexto.
+
+    Exemplo:
+    >>> calcula_chave_contexto(fingerprint, get_config('prompt'), 'gpt-4-turbo')
+    '5e884898da28047151d0e56f8dc6292773603d0d6aabbdd62a11ef721d1542d8'
+    """
+    return hashlib.sha256(f'{fingerprint}\0{prompt}\0{modelo}'.encode('utf-8')).hexdigest()
+
+
+class CacheRespostas:
+    """
+    Cache semântico das respostas às primeiras perguntas das conversas.
+
+    Uma pergunta nova reaproveita a resposta (e os documentos de contexto) de uma pergunta anterior do mesmo
+    contexto (corpus, prompt e modelo) cujo embedding tenha similaridade de cosseno de pelo menos `limiar`.
+    As entradas expiram após `ttl_segundos` e, acima de `capacidade`, as menos usadas são descartadas.
+
+    Exemplo:
+    >>> cache = CacheRespostas(limiar=0.95)
+    >>> cache.grava(fingerprint, chave_contexto, vetor, 'O que é limite?', resposta)
+    >>> cache.busca(chave_contexto, vetor_pergunta_parecida)['answer']
+    'Vamos pensar juntos: o que acontece com f(x) quando x se aproxima de a?'
+    """
+
+    def __init__(self, limiar: float = 0.95, capacidade: int = 512, ttl_segundos: int = 86400):
+        """
+        Parâmetros:
+        \n\t`limiar (float)`: Similaridade de cosseno mínima para reaproveitar uma resposta (padrão: `0.95`).
+        \n\t`capacidade (int)`: Quantidade máxima de respostas mantidas (padrão: `512`).
+        \n\t`ttl_segundos (int)`: Validade de cada resposta, em segundos (padrão: `86400`). Se `0`, não expiram.
+        """
+        self.limiar = limiar
+        self.capacidade = capacidade
+        self.ttl_segundos = ttl_segundos
+        self.estatisticas = {'acertos': 0, 'faltas': 0, 'invalidadas': 0}
+        self._entradas = OrderedDict()
+        self._proximo_id = 0
+        self._lock = threading.Lock()
+
+    def _expirada(self, entrada: dict, agora: float) -> bool:
+        """
+        Indica se uma entrada passou da validade.
+
+        Parâmetros:
+        \n\t`entrada (dict)`: Entrada do cache.
+        \n\t`agora (float)`: Instante atual, em segundos.
+
+        Retorno:
+        \n\t`bool`: `True` se a entrada expirou.
+        """
+        return bool(self.ttl_segundos) and agora - entrada['criada_em'] > self.ttl_segundos
+
+    def busca(self, chave_contexto: str, vetor: list):
+        """
+        Busca a resposta da pergunta mais parecida do mesmo contexto.
+
+        Parâmetros:
+        \n\t`chave_contexto (str)`: Chave calculada por `calcula_chave_contexto`.
+        \n\t`vetor (list)`: Embedding da pergunta.
+
+        Retorno:
+        \n\t`dict | None`: Resposta armazenada, com as chaves `question`, `answer` e `source_documents`, ou
+        `None` caso nenhuma pergunta do contexto seja parecida o suficiente.
+        """
+        vetor = np.asarray(vetor, dtype=np.float32)
+        vetor /= np.linalg.norm(vetor) or 1
+        agora = time.time()
+        with self._lock:
+            for id_entrada in [id_entrada for id_entrada, entrada in self._entradas.items()
+                               if self._expirada(entrada, agora)]:
+                del self._entradas[id_entrada]
+            candidatos = [(id_entrada, entrada) for id_entrada, entrada in self._entradas.items()
+                          if entrada['chave_contexto'] == chave_contexto]
+            if candidatos:
+                similaridades = np.stack([entrada['vetor'] for _, entrada in candidatos]) @ vetor
+                melhor = int(np.argmax(similaridades))
+                if similaridades[melhor] >= self.limiar:
+                    id_entrada, entrada = candidatos[melhor]
+                    self._entradas.move_to_end(id_entrada)
+                    self.estatisticas['acertos'] += 1
+                    return entrada['resposta']
+            self.estatisticas['faltas'] += 1
+            return None
+
+    def grava(self, fingerprint: str, chave_contexto: str, vetor: list, pergunta: str, resposta: dict) -> None:
+        """
+        Grava a resposta de uma pergunta no cache.
+
+        Parâmetros:
+        \n\t`fingerprint (str)`: Impressão digital do corpus, usada na invalidação.
+        \n\t`chave_contexto (str)`: Chave calculada por `calcula_chave_contexto`.
+        \n\t`vetor (list)`: Embedding da pergunta.
+        \n\t`pergunta (str)`: Texto da pergunta.
+        \n\t`resposta (dict)`: Saída da cadeia de conversação.
+        """
+        vetor = np.asarray(vetor, dtype=np.float32)
+        vetor /= np.linalg.norm(vetor) or 1
+        with self._lock:
+            self._entradas[self._proximo_id] = {
+                'fingerprint': fingerprint,
+                'chave_contexto': chave_contexto,
+                'vetor': vetor,
+                'criada_em': time.time(),
+                'resposta': {
+                    'question': pergunta,
+                    'answer': resposta['answer'],
+                    'source_documents': resposta.get('source_documents', [])
+                }
+            }
+            self._proximo_id += 1
+            while len(self._entradas) > self.capacidade:
+                self._entradas.popitem(last=False)
+
+    def invalida(self, fingerprint: str) -> int:
+        """
+        Remove as respostas geradas a partir de um corpus.
+
+        Parâmetros:
+        \n\t`fingerprint (str)`: Impressão digital do corpus.
+
+        Retorno:
+        \n\t`int`: Quantidade de respostas removidas.
+        """
+        with self._lock:
+            ids = [id_entrada for id_entrada, entrada in self._entradas.items()
+                   if entrada['fingerprint'] == fingerprint]
+            for id_entrada in ids:
+                del self._entradas[id_entrada]
+            self.estatisticas['invalidadas'] += len(ids)
+            return len(ids)
+
+
+def obtem_cache_respostas(limiar: float = 0.95, capacidade: int = 512, ttl_segundos: int = 86400) -> CacheRespostas:
+    """
+    Retorna o cache de respostas do processo, criando-o na primeira chamada, para que as sessões de todos os
+    alunos aproveitem as respostas umas das outras.
+
+    Parâmetros:
+    \n\t`limiar (float)`: Similaridade de cosseno mínima para reaproveitar uma resposta (padrão: `0.95`).
+    \n\t`capacidade (int)`: Quantidade máxima de respostas mantidas (padrão: `512`).
+    \n\t`ttl_segundos (int)`: Validade de cada resposta, em segundos (padrão: `86400`).
+
+    Retorno:
+    \n\t`CacheRespostas`: O cache compartilhado.
+
+    Exemplo:
+    >>> cache = obtem_cache_respostas(**get_config('cache_respostas_kwargs'))
+    """
+    with _LOCK_CACHES_RESPOSTAS:
+        chave = (limiar, capacidade, ttl_segundos)
+        if chave not in _CACHES_RESPOSTAS:
+            _CACHES_RESPOSTAS[chave] = CacheRespostas(limiar, capacidade, ttl_segundos)
+        return _CACHES_RESPOSTAS[chave]
+
+
+def invalida_caches_respostas(fingerprint: str) -> int:
+    """
+    Remove, de todos os caches de respostas do processo, as respostas geradas a partir de um corpus.
+
+    Parâmetros:
+    \n\t`fingerprint (str)`: Impressão digital do corpus.
+
+    Retorno:
+    \n\t`int`: Quantidade de respostas removidas.
+
+    Exemplo:
+    >>> invalida_caches_respostas(fingerprint_anterior)
+    3
+    """
+    with _LOCK_CACHES_RESPOSTAS:
+        caches = list(_CACHES_RESPOSTAS.values())
+    return sum(cache.invalida(fingerprint) for cache in caches)